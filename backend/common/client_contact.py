@@ -0,0 +1,47 @@
+# The NotificationQueue message format, built from a booking by ConfirmAppointmentLambda,
+# HandleCancellationLambda, RescheduleBookingLambda and the reminder schedule alike, so NotificationLambda
+# finds the client's channels in the same place whichever Lambda sent the message.
+
+# Channels a booking's clientContact map can hold, as NotificationLambda reads them
+CONTACT_FIELDS = ('email', 'phone', 'messengerPsid')
+
+
+def client_contact(booking_item):
+    """
+    The booking's contact map ({email, phone, messengerPsid}, only the fields it has): clientContact
+    as stored by create-booking, completed from the older clientDetails map.
+    """
+    contact = dict(booking_item.get('clientContact') or {})
+    details = booking_item.get('clientDetails') or {}
+    for field in CONTACT_FIELDS:
+        if not contact.get(field) and details.get(field):
+            contact[field] = details[field]
+    return {field: value for field, value in contact.items() if field in CONTACT_FIELDS and value}
+
+
+def client_name(booking_item):
+    return booking_item.get('clientName') or (booking_item.get('clientDetails') or {}).get('name')
+
+
+def notification_message(booking_item, notification_type, message_details, version=None):
+    """
+    A NotificationLambda message for the booking. It carries the booking's clientContact, so the
+    client is notified on every channel they can be reached on; recipient stays the email for
+    consumers that only send email. Returns None when the booking has no contact at all.
+    """
+    contact = client_contact(booking_item)
+    if not contact:
+        return None
+    details = dict(message_details, clientName=client_name(booking_item))
+    if contact.get('email'):
+        details.setdefault('recipient', contact['email'])
+    message = {
+        "bookingId": booking_item['bookingId'],
+        "notificationType": notification_type,
+        "recipient": contact.get('email'),
+        "clientContact": contact,
+        "messageDetails": details,
+    }
+    if version is not None:
+        message["version"] = version
+    return message
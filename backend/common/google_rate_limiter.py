@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from decimal import Decimal
+
+from googleapiclient.errors import HttpError
+
+# GetAvailabilityLambda and GoogleCalendarSyncLambda draw from the same Google project and calendar quotas,
+# so both pace their calls through the same token buckets (shared in GoogleRateLimitTable when it is set)
+# and back off on Google's rate-limit errors.
+
+# Initialize logger
+logger = logging.getLogger()
+
+# 429 is always a rate limit. 403 only counts when Google gives one of these reasons;
+# other 403s (forbidden, dailyLimitExceeded, quotaExceeded) will not clear by retrying.
+RATE_LIMIT_STATUSES = (403, 429)
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+DEFAULT_METRICS_NAMESPACE = "AppointmentScheduling/GoogleApi"
+
+
+def _error_reasons(error):
+    try:
+        details = json.loads(error.content.decode('utf-8')).get('error', {})
+    except (ValueError, AttributeError):
+        return []
+    return [item.get('reason') for item in details.get('errors', [])]
+
+
+def is_rate_limit_error(error):
+    """True for Google API errors that mean "slow down": 429, or 403 with a rate limit reason."""
+    if not isinstance(error, HttpError) or error.resp.status not in RATE_LIMIT_STATUSES:
+        return False
+    return error.resp.status == 429 or any(reason in RATE_LIMIT_REASONS for reason in _error_reasons(error))
+
+
+class TokenBucket:
+    """
+    In-process token bucket refilled at rate_per_second up to capacity.
+    acquire() reserves tokens right away and returns how long the caller must wait for them,
+    so concurrent callers are queued fairly and no thread sleeps while holding the lock.
+    """
+
+    def __init__(self, rate_per_second, capacity=None, clock=time.monotonic):
+        self.rate_per_second = float(rate_per_second)
+        self.capacity = float(capacity if capacity is not None else rate_per_second)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.refilled_at = clock()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """Takes tokens (possibly going into debt) and returns the seconds to wait before using them."""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.refilled_at) * self.rate_per_second)
+            self.refilled_at = now
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate_per_second)
+
+
+class DynamoDBTokenBucket:
+    """
+    Token bucket shared by every container through one DynamoDB item
+    ({bucketId, tokens, refilledAt}), updated with an optimistic conditional put.
+    """
+
+    def __init__(self, table, bucket_id, rate_per_second, capacity=None, max_attempts=5, clock=time.time):
+        self.table = table
+        self.bucket_id = bucket_id
+        self.rate_per_second = float(rate_per_second)
+        self.capacity = float(capacity if capacity is not None else rate_per_second)
+        self.max_attempts = max_attempts
+        self.clock = clock
+
+    def reserve(self, tokens=1):
+        """
+        Reserves tokens in the shared bucket and returns the seconds to wait.
+        Gives up (returns 0) when the item keeps changing under us; the local bucket still applies.
+        """
+        for _ in range(self.max_attempts):
+            item = self.table.get_item(Key={'bucketId': self.bucket_id}, ConsistentRead=True).get('Item')
+            now = self.clock()
+            if item:
+                available = min(self.capacity, float(item['tokens']) + (now - float(item['refilledAt'])) * self.rate_per_second)
+                condition = {"ConditionExpression": "refilledAt = :previous",
+                             "ExpressionAttributeValues": {":previous": item['refilledAt']}}
+            else:
+                available = self.capacity
+                condition = {"ConditionExpression": "attribute_not_exists(bucketId)"}
+            remaining = available - tokens
+            try:
+                self.table.put_item(
+                    Item={'bucketId': self.bucket_id, 'tokens': Decimal(str(remaining)), 'refilledAt': Decimal(str(now))},
+                    **condition
+                )
+                return max(0.0, -remaining / self.rate_per_second)
+            except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+                continue
+        logger.warning(f"[GoogleRateLimiter] Contention on distributed bucket '{self.bucket_id}', continuing with the local bucket only.")
+        return 0.0
+
+
+class GoogleApiRateLimiter:
+    """
+    Paces Google API calls with a project-wide local bucket and an optional distributed bucket, and
+    retries rate-limited calls with exponential backoff and full jitter.
+    Google also limits each calendar on its own, so with a calendar_bucket_factory every calendarId
+    gets its own (local, distributed) pair, created on first use; a call waits for both the
+    project-wide and its calendar's buckets, and a busy calendar does not slow down the others.
+    Throttling is reported as CloudWatch metrics in Embedded Metric Format on stdout.
+    """
+
+    def __init__(self, local_bucket, distributed_bucket=None, max_retries=5, base_delay_seconds=0.5,
+                 max_delay_seconds=32.0, function_name="unknown", metrics_namespace=DEFAULT_METRICS_NAMESPACE,
+                 sleep=time.sleep, calendar_bucket_factory=None):
+        self.local_bucket = local_bucket
+        self.distributed_bucket = distributed_bucket
+        self.calendar_bucket_factory = calendar_bucket_factory
+        self.calendar_buckets = {}
+        self.calendar_buckets_lock = threading.Lock()
+        self.max_retries = max_retries
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.function_name = function_name
+        self.metrics_namespace = metrics_namespace
+        self.sleep = sleep
+
+    def buckets_for(self, calendar_id=None):
+        """The (local, distributed) bucket pairs a call to calendar_id must pass: project-wide first."""
+        buckets = [(self.local_bucket, self.distributed_bucket)]
+        if calendar_id is not None and self.calendar_bucket_factory:
+            with self.calendar_buckets_lock:
+                if calendar_id not in self.calendar_buckets:
+                    self.calendar_buckets[calendar_id] = self.calendar_bucket_factory(calendar_id)
+                buckets.append(self.calendar_buckets[calendar_id])
+        return buckets
+
+    def acquire(self, tokens=1, calendar_id=None):
+        """Blocks until tokens may be spent on calendar_id (or any calendar). Returns the seconds waited."""
+        wait_seconds = 0.0
+        for local_bucket, distributed_bucket in self.buckets_for(calendar_id):
+            wait_seconds = max(wait_seconds, local_bucket.reserve(tokens))
+            if distributed_bucket:
+                try:
+                    wait_seconds = max(wait_seconds, distributed_bucket.reserve(tokens))
+                except Exception as e:  # The shared bucket is best effort, never block Google calls on it
+                    logger.warning(f"[GoogleRateLimiter] Distributed bucket unavailable: {e}")
+        if wait_seconds > 0:
+            self.emit_metrics({"ThrottledRequests": (1, "Count"), "ThrottleWaitTime": (wait_seconds * 1000, "Milliseconds")})
+            self.sleep(wait_seconds)
+        return wait_seconds
+
+    def backoff(self, attempt):
+        """Sleeps before retry number attempt (0-based) after a rate limit error. Returns the delay."""
+        delay = random.uniform(0, min(self.max_delay_seconds, self.base_delay_seconds * (2 ** attempt)))
+        self.emit_metrics({"RateLimitRetries": (1, "Count")})
+        self.sleep(delay)
+        return delay
+
+    def execute(self, call, tokens=1, calendar_id=None):
+        """
+        Runs call() (one Google request worth tokens quota units, against calendar_id when it
+        targets one calendar) under the limiter.
+        Rate limit errors are retried up to max_retries times; the last one is re-raised.
+        """
+        attempt = 0
+        while True:
+            self.acquire(tokens, calendar_id)
+            try:
+                return call()
+            except HttpError as e:
+                if not is_rate_limit_error(e):
+                    raise
+                if attempt >= self.max_retries:
+                    self.emit_metrics({"RateLimitFailures": (1, "Count")})
+                    logger.error(f"[GoogleRateLimiter] Still rate limited after {attempt} retries, giving up.")
+                    raise
+                logger.warning(f"[GoogleRateLimiter] Rate limited by Google (HTTP {e.resp.status}), retry {attempt + 1}/{self.max_retries}.")
+                self.backoff(attempt)
+                attempt += 1
+
+    def emit_metrics(self, metrics):
+        """Writes {name: (value, unit)} as one EMF record."""
+        record = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": self.metrics_namespace,
+                    "Dimensions": [["FunctionName"]],
+                    "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit) in metrics.items()]
+                }]
+            },
+            "FunctionName": self.function_name
+        }
+        record.update({name: value for name, (value, _) in metrics.items()})
+        print(json.dumps(record), flush=True)
+
+
+def rate_limiter_from_env(function_name, dynamodb_resource=None):
+    """
+    Builds the limiter from environment variables:
+      GOOGLE_API_RATE_PER_SECOND (default 10) and GOOGLE_API_BURST (default = rate) for the project-wide buckets,
+      GOOGLE_API_CALENDAR_RATE_PER_SECOND (default 5) and GOOGLE_API_CALENDAR_BURST (default = rate)
+      for the buckets of each calendar,
+      GOOGLE_RATE_LIMIT_TABLE_NAME / GOOGLE_RATE_LIMIT_BUCKET_ID to share the buckets through DynamoDB
+      (a calendar's item is "<bucket id>#<calendarId>"),
+      GOOGLE_API_MAX_RETRIES (default 5) for rate limit retries.
+    The rates are per container for the local buckets and global for the distributed ones.
+    """
+    rate_per_second = float(os.environ.get('GOOGLE_API_RATE_PER_SECOND', 10))
+    burst = float(os.environ.get('GOOGLE_API_BURST', rate_per_second))
+    calendar_rate_per_second = float(os.environ.get('GOOGLE_API_CALENDAR_RATE_PER_SECOND', 5))
+    calendar_burst = float(os.environ.get('GOOGLE_API_CALENDAR_BURST', calendar_rate_per_second))
+    bucket_id = os.environ.get('GOOGLE_RATE_LIMIT_BUCKET_ID', 'google-calendar')
+    table = None
+    table_name = os.environ.get('GOOGLE_RATE_LIMIT_TABLE_NAME')
+    if table_name and dynamodb_resource is not None:
+        table = dynamodb_resource.Table(table_name)
+    distributed_bucket = DynamoDBTokenBucket(table, bucket_id, rate_per_second, burst) if table is not None else None
+
+    def calendar_buckets(calendar_id):
+        distributed = None
+        if table is not None:
+            distributed = DynamoDBTokenBucket(table, f"{bucket_id}#{calendar_id}", calendar_rate_per_second, calendar_burst)
+        return TokenBucket(calendar_rate_per_second, calendar_burst), distributed
+
+    return GoogleApiRateLimiter(
+        TokenBucket(rate_per_second, burst),
+        distributed_bucket,
+        max_retries=int(os.environ.get('GOOGLE_API_MAX_RETRIES', 5)),
+        function_name=function_name,
+        metrics_namespace=os.environ.get('GOOGLE_API_METRICS_NAMESPACE', DEFAULT_METRICS_NAMESPACE),
+        calendar_bucket_factory=calendar_buckets
+    )
@@ -0,0 +1,100 @@
+import logging
+from datetime import datetime, timedelta, timezone
+
+try:
+    from .client_contact import client_contact, notification_message
+except ImportError:  # Deployed flat in the Lambda package
+    from client_contact import client_contact, notification_message
+
+# ReminderScheduleTable's key layout. The Lambdas that confirm, move or cancel a booking write and delete
+# its reminder items, and ReminderSweeperLambda reads them back by bucket, so both sides use these helpers.
+
+# Initialize logger
+logger = logging.getLogger()
+
+# Reminder items are partitioned by the 5-minute bucket they are due in, so the sweeper reads
+# exactly one partition per run and never touches appointments that are not due.
+BUCKET_MINUTES = 5
+
+# notificationType -> how long before the appointment it is sent
+REMINDER_OFFSETS = {
+    "APPOINTMENT_REMINDER_24H": timedelta(hours=24),
+    "APPOINTMENT_REMINDER_2H": timedelta(hours=2),
+}
+
+# Items the sweeper missed (e.g. booking moved while the delete failed) expire a day after they were due
+REMINDER_TTL = timedelta(days=1)
+
+
+def _parse_iso(value):
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def bucket_for(moment):
+    """The bucket key of a datetime: its UTC time floored to BUCKET_MINUTES, e.g. '2024-09-01T09:55Z'."""
+    moment = moment.astimezone(timezone.utc)
+    floored = moment.replace(minute=moment.minute - moment.minute % BUCKET_MINUTES, second=0, microsecond=0)
+    return floored.strftime('%Y-%m-%dT%H:%MZ')
+
+
+def reminder_id(booking_id, notification_type):
+    return f"{booking_id}#{notification_type}"
+
+
+def reminder_keys(booking_id, start_time):
+    """Keys of every reminder of a booking starting at start_time. Computable without reading the table."""
+    start = _parse_iso(start_time)
+    return [{'bucket': bucket_for(start - offset), 'reminderId': reminder_id(booking_id, notification_type)}
+            for notification_type, offset in REMINDER_OFFSETS.items()]
+
+
+def build_reminder_items(booking_item, now=None):
+    """
+    Reminder items for a confirmed booking, skipping reminders that are already due
+    (a booking confirmed an hour before it starts gets no 2 hour reminder).
+    Each item carries the notification message the sweeper sends as is.
+    """
+    now = now or datetime.now(timezone.utc)
+    start_time = booking_item['proposedStartTime']
+    start = _parse_iso(start_time)
+    items = []
+    for notification_type, offset in REMINDER_OFFSETS.items():
+        remind_at = start - offset
+        if remind_at <= now:
+            continue
+        items.append({
+            'bucket': bucket_for(remind_at),
+            'reminderId': reminder_id(booking_item['bookingId'], notification_type),
+            'bookingId': booking_item['bookingId'],
+            'startTime': start_time,
+            'remindAt': remind_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'expiresAt': int((remind_at + REMINDER_TTL).timestamp()),
+            'notification': notification_message(booking_item, notification_type, {
+                "serviceName": booking_item.get('serviceName'),
+                "locationName": booking_item.get('locationName'),
+                "startTime": start_time
+            }, version=int(booking_item.get('version', 0)))
+        })
+    return items
+
+
+def schedule_reminders(reminder_table, booking_item, now=None):
+    """Writes the booking's pending reminders. Returns how many were scheduled."""
+    if not client_contact(booking_item):
+        logger.info(f"[ReminderSchedule] Booking {booking_item.get('bookingId')} has no client contact, no reminders scheduled.")
+        return 0
+    items = build_reminder_items(booking_item, now)
+    with reminder_table.batch_writer() as batch:
+        for item in items:
+            batch.put_item(Item=item)
+    logger.info(f"[ReminderSchedule] Scheduled {len(items)} reminder(s) for booking {booking_item['bookingId']}.")
+    return len(items)
+
+
+def cancel_reminders(reminder_table, booking_id, start_time):
+    """Deletes the booking's reminders for start_time (deleting reminders already sent is a no-op)."""
+    with reminder_table.batch_writer() as batch:
+        for key in reminder_keys(booking_id, start_time):
+            batch.delete_item(Key=key)
+    logger.info(f"[ReminderSchedule] Cancelled reminders of booking {booking_id} at {start_time}.")
@@ -0,0 +1,147 @@
+import unittest
+from unittest.mock import MagicMock
+import json
+
+from googleapiclient.errors import HttpError
+import httplib2
+
+from backend.common.google_rate_limiter import (
+    TokenBucket, DynamoDBTokenBucket, GoogleApiRateLimiter, is_rate_limit_error
+)
+
+
+def _http_error(status, reason):
+    content = json.dumps({"error": {"code": status, "errors": [{"reason": reason}]}}).encode('utf-8')
+    return HttpError(httplib2.Response({'status': status}), content)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+
+class InMemoryBucketTable:
+    """Single-item stand-in for the rate limit table honouring the bucket's conditional puts."""
+
+    def __init__(self):
+        self.item = None
+        self.meta = MagicMock()
+        self.meta.client.exceptions.ConditionalCheckFailedException = ConditionalCheckFailedException
+
+    def get_item(self, Key, ConsistentRead):
+        return {'Item': dict(self.item)} if self.item else {}
+
+    def put_item(self, Item, ConditionExpression, ExpressionAttributeValues=None):
+        if ConditionExpression == "attribute_not_exists(bucketId)":
+            if self.item is not None:
+                raise ConditionalCheckFailedException()
+        elif self.item is None or self.item['refilledAt'] != ExpressionAttributeValues[':previous']:
+            raise ConditionalCheckFailedException()
+        self.item = Item
+
+
+class TestGoogleRateLimiter(unittest.TestCase):
+
+    def test_token_bucket_allows_burst_then_queues_callers(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate_per_second=2, capacity=4, clock=clock)
+
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0.0] * 4)
+        self.assertEqual(bucket.reserve(), 0.5)
+        self.assertEqual(bucket.reserve(), 1.0)  # Queued behind the previous reservation
+        clock.now += 10
+        self.assertEqual(bucket.reserve(3), 0.0)  # Refilled up to capacity only
+
+    def test_distributed_bucket_is_shared_between_instances(self):
+        clock = FakeClock()
+        table = InMemoryBucketTable()
+        first = DynamoDBTokenBucket(table, 'google-calendar', rate_per_second=1, capacity=2, clock=clock)
+        second = DynamoDBTokenBucket(table, 'google-calendar', rate_per_second=1, capacity=2, clock=clock)
+
+        self.assertEqual(first.reserve(), 0.0)
+        self.assertEqual(second.reserve(), 0.0)
+        self.assertEqual(first.reserve(), 1.0)
+        self.assertEqual(float(table.item['tokens']), -1.0)
+
+    def test_rate_limit_errors_are_recognised(self):
+        self.assertTrue(is_rate_limit_error(_http_error(429, 'rateLimitExceeded')))
+        self.assertTrue(is_rate_limit_error(_http_error(403, 'userRateLimitExceeded')))
+        self.assertFalse(is_rate_limit_error(_http_error(403, 'forbidden')))
+        self.assertFalse(is_rate_limit_error(_http_error(404, 'notFound')))
+        self.assertFalse(is_rate_limit_error(ValueError("not an HttpError")))
+
+    def test_execute_retries_with_capped_jittered_backoff(self):
+        sleeps = []
+        limiter = GoogleApiRateLimiter(TokenBucket(1000), max_retries=4, base_delay_seconds=1, max_delay_seconds=3, sleep=sleeps.append)
+        limiter.emit_metrics = MagicMock()
+        call = MagicMock(side_effect=[_http_error(429, 'rateLimitExceeded')] * 4 + ["ok"])
+
+        self.assertEqual(limiter.execute(call), "ok")
+        self.assertEqual(call.call_count, 5)
+        for attempt, delay in enumerate(sleeps):
+            self.assertLessEqual(delay, min(3, 2 ** attempt))
+
+    def test_execute_does_not_retry_other_errors(self):
+        limiter = GoogleApiRateLimiter(TokenBucket(1000), sleep=lambda seconds: None)
+        call = MagicMock(side_effect=_http_error(403, 'forbidden'))
+
+        with self.assertRaises(HttpError):
+            limiter.execute(call)
+        self.assertEqual(call.call_count, 1)
+
+    def test_throttle_wait_is_reported(self):
+        sleeps = []
+        limiter = GoogleApiRateLimiter(TokenBucket(rate_per_second=1, capacity=1, clock=FakeClock()), sleep=sleeps.append)
+        limiter.emit_metrics = MagicMock()
+
+        limiter.acquire()
+        limiter.acquire()
+        self.assertEqual(sleeps, [1.0])
+        limiter.emit_metrics.assert_called_once_with({"ThrottledRequests": (1, "Count"), "ThrottleWaitTime": (1000.0, "Milliseconds")})
+
+    def test_a_busy_calendar_does_not_throttle_the_others_but_the_project_bucket_still_applies(self):
+        clock = FakeClock()
+        sleeps = []
+        limiter = GoogleApiRateLimiter(
+            TokenBucket(rate_per_second=4, capacity=4, clock=clock), sleep=sleeps.append,
+            calendar_bucket_factory=lambda calendar_id: (TokenBucket(rate_per_second=1, capacity=2, clock=clock), None)
+        )
+        limiter.emit_metrics = MagicMock()
+
+        self.assertEqual(limiter.acquire(2, calendar_id='busy@group.calendar.google.com'), 0.0)
+        self.assertEqual(limiter.acquire(1, calendar_id='busy@group.calendar.google.com'), 1.0)  # Its own bucket is empty
+        self.assertEqual(limiter.acquire(1, calendar_id='quiet@group.calendar.google.com'), 0.0)
+        self.assertEqual(limiter.acquire(1, calendar_id='other@group.calendar.google.com'), 0.25)  # Project bucket is empty
+        self.assertEqual(set(limiter.calendar_buckets), {'busy@group.calendar.google.com', 'quiet@group.calendar.google.com',
+                                                         'other@group.calendar.google.com'})
+
+    def test_each_calendar_has_its_own_distributed_bucket(self):
+        table = InMemoryBucketTable()
+        calendar_tables = {}
+
+        def calendar_buckets(calendar_id):
+            calendar_tables[calendar_id] = InMemoryBucketTable()
+            return TokenBucket(1000), DynamoDBTokenBucket(calendar_tables[calendar_id], f"google-calendar#{calendar_id}", 1, 1)
+
+        limiter = GoogleApiRateLimiter(TokenBucket(1000), DynamoDBTokenBucket(table, 'google-calendar', 1000), sleep=lambda s: None,
+                                       calendar_bucket_factory=calendar_buckets)
+        limiter.emit_metrics = MagicMock()
+
+        limiter.execute(lambda: "ok", calendar_id='a@group.calendar.google.com')
+        limiter.execute(lambda: "ok", calendar_id='b@group.calendar.google.com')
+        limiter.execute(lambda: "ok")  # Calls that target no calendar only use the project-wide buckets
+
+        self.assertEqual(table.item['bucketId'], 'google-calendar')
+        self.assertEqual({t.item['bucketId'] for t in calendar_tables.values()},
+                         {'google-calendar#a@group.calendar.google.com', 'google-calendar#b@group.calendar.google.com'})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
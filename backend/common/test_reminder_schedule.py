@@ -0,0 +1,61 @@
+import unittest
+from unittest.mock import MagicMock
+from datetime import datetime, timezone
+
+from backend.common.reminder_schedule import (
+    bucket_for, build_reminder_items, cancel_reminders, reminder_keys, schedule_reminders
+)
+
+
+class TestReminderSchedule(unittest.TestCase):
+
+    def _booking(self, **overrides):
+        booking = {
+            'bookingId': 'booking1',
+            'proposedStartTime': '2024-09-02T14:07:00Z',
+            'serviceName': 'Full Detail',
+            'locationName': 'Downtown',
+            'version': 2,
+            'clientDetails': {'name': 'Test Client', 'email': 'test@example.com'},
+        }
+        booking.update(overrides)
+        return booking
+
+    def test_bucket_keys_are_floored_to_five_minutes_in_utc(self):
+        self.assertEqual(bucket_for(datetime(2024, 9, 1, 9, 59, 59, tzinfo=timezone.utc)), "2024-09-01T09:55Z")
+        self.assertEqual(bucket_for(datetime.fromisoformat("2024-09-01T12:00:00+02:00")), "2024-09-01T10:00Z")
+
+    def test_reminders_are_written_into_their_due_buckets(self):
+        items = build_reminder_items(self._booking(), now=datetime(2024, 9, 1, 0, 0, tzinfo=timezone.utc))
+
+        self.assertEqual([(item['bucket'], item['reminderId']) for item in items], [
+            ("2024-09-01T14:05Z", "booking1#APPOINTMENT_REMINDER_24H"),
+            ("2024-09-02T12:05Z", "booking1#APPOINTMENT_REMINDER_2H"),
+        ])
+        notification = items[1]['notification']
+        self.assertEqual(notification['notificationType'], "APPOINTMENT_REMINDER_2H")
+        self.assertEqual(notification['version'], 2)
+        self.assertEqual(notification['messageDetails']['recipient'], "test@example.com")
+        self.assertEqual(items[1]['expiresAt'], int(datetime(2024, 9, 3, 12, 7, tzinfo=timezone.utc).timestamp()))
+        self.assertEqual([{k: item[k] for k in ('bucket', 'reminderId')} for item in items],
+                         reminder_keys('booking1', '2024-09-02T14:07:00Z'))
+
+    def test_reminders_already_due_are_not_scheduled(self):
+        items = build_reminder_items(self._booking(), now=datetime(2024, 9, 2, 11, 0, tzinfo=timezone.utc))
+        self.assertEqual([item['notification']['notificationType'] for item in items], ["APPOINTMENT_REMINDER_2H"])
+
+    def test_schedule_and_cancel_use_batch_writes(self):
+        table = MagicMock()
+        batch = table.batch_writer.return_value.__enter__.return_value
+
+        self.assertEqual(schedule_reminders(table, self._booking(proposedStartTime='2999-01-01T10:00:00Z')), 2)
+        self.assertEqual(batch.put_item.call_count, 2)
+        self.assertEqual(schedule_reminders(table, self._booking(clientDetails={})), 0)
+
+        cancel_reminders(table, 'booking1', '2999-01-01T10:00:00Z')
+        self.assertEqual([call[1]['Key'] for call in batch.delete_item.call_args_list],
+                         reminder_keys('booking1', '2999-01-01T10:00:00Z'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
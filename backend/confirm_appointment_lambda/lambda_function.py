@@ -9,6 +9,13 @@ logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
 import datetime
 
+try:
+    from ..common.reminder_schedule import schedule_reminders
+    from ..common.client_contact import client_contact, client_name, notification_message
+except ImportError:  # Deployed flat in the Lambda package
+    from reminder_schedule import schedule_reminders
+    from client_contact import client_contact, client_name, notification_message
+
 # Initialize Boto3 clients
 dynamodb = boto3.resource('dynamodb')
 sqs = boto3.client('sqs')
@@ -16,6 +23,7 @@ sqs = boto3.client('sqs')
 appointments_table_name = os.environ.get('APPOINTMENTS_TABLE_NAME')
 notification_sqs_url = os.environ.get('NOTIFICATION_SQS_URL')
 google_calendar_sync_sqs_url = os.environ.get('GOOGLE_CALENDAR_SYNC_SQS_URL')
+reminder_schedule_table_name = os.environ.get('REMINDER_SCHEDULE_TABLE_NAME') # Optional, enables 24h/2h reminders
 
 def lambda_handler(event, context):
     """
@@ -113,8 +121,8 @@ def lambda_handler(event, context):
             "locationId": booking_item.get("locationId"),
             "proposedStartTime": booking_item.get("proposedStartTime"),
             "proposedEndTime": booking_item.get("proposedEndTime"),
-            "clientName": booking_item.get("clientDetails", {}).get("name"), # Assuming clientDetails structure
-            "clientEmail": booking_item.get("clientDetails", {}).get("email") # Assuming clientDetails structure
+            "clientName": client_name(booking_item),
+            "clientEmail": client_contact(booking_item).get("email")
         }
         try:
             sqs.send_message(
@@ -128,26 +136,32 @@ def lambda_handler(event, context):
             # Potentially add to a dead-letter queue or retry mechanism for this SQS message later.
 
         # 6. Send a message to NOTIFICATION_SQS_URL
-        notification_message_body = {
-            "bookingId": booking_id,
-            "notificationType": "BOOKING_CONFIRMED",
-            "recipient": booking_item.get("clientDetails", {}).get("email"), # Or phone, depending on notification prefs
-            "messageDetails": {
-                "clientName": booking_item.get("clientDetails", {}).get("name"),
-                "serviceName": booking_item.get("serviceName", "the service"), # Placeholder if not available
-                "startTime": booking_item.get("proposedStartTime"),
-                "locationName": booking_item.get("locationName", "our location") # Placeholder
-            }
-        }
-        try:
-            sqs.send_message(
-                QueueUrl=notification_sqs_url,
-                MessageBody=json.dumps(notification_message_body)
-            )
-            logger.info(f"Sent message to Notification SQS for booking {booking_id}: {json.dumps(notification_message_body)}")
-        except Exception as e:
-            logger.error(f"Error sending message to Notification SQS for booking {booking_id}: {e}", exc_info=True)
-            # Non-critical error, booking is confirmed. Log it.
+        # Carries the booking's clientContact, so the client hears on every channel they gave us
+        notification_message_body = notification_message(booking_item, "BOOKING_CONFIRMED", {
+            "serviceName": booking_item.get("serviceName", "the service"), # Placeholder if not available
+            "startTime": booking_item.get("proposedStartTime"),
+            "locationName": booking_item.get("locationName", "our location") # Placeholder
+        })
+        if notification_message_body:
+            try:
+                sqs.send_message(
+                    QueueUrl=notification_sqs_url,
+                    MessageBody=json.dumps(notification_message_body)
+                )
+                logger.info(f"Sent message to Notification SQS for booking {booking_id}: {json.dumps(notification_message_body)}")
+            except Exception as e:
+                logger.error(f"Error sending message to Notification SQS for booking {booking_id}: {e}", exc_info=True)
+                # Non-critical error, booking is confirmed. Log it.
+        else:
+            logger.warning(f"No client contact found for booking {booking_id}, skipping confirmation notification.")
+
+        # 6b. Schedule the appointment reminders (swept by ReminderSweeperLambda)
+        if reminder_schedule_table_name:
+            try:
+                schedule_reminders(dynamodb.Table(reminder_schedule_table_name), confirmed_booking or booking_item)
+            except Exception as e:
+                logger.error(f"Error scheduling reminders for booking {booking_id}: {e}", exc_info=True)
+                # Non-critical error, booking is confirmed. Log it.
 
         # 7. Return success response
         logger.info(f"Booking {booking_id} confirmed successfully.")
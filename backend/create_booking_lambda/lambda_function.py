@@ -13,6 +13,9 @@ dynamodb = boto3.resource('dynamodb')
 appointments_table_name = os.environ.get('APPOINTMENTS_TABLE_NAME')
 services_table_name = os.environ.get('SERVICES_TABLE_NAME') # Used by get_service_details
 
+# Format of the booking's stored times: UTC, so LocationTimeIndex sorts them in time order
+BOOKING_TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
 def get_service_details(service_name, db_resource, table_name):
     # Placeholder: In a real scenario, this would query the ServicesTable.
     # For now, it returns a mock duration and buffer.
@@ -66,6 +69,8 @@ def lambda_handler(event, context):
         # Validate proposedStartTime format (basic check)
         try:
             start_time_dt = datetime.fromisoformat(proposedStartTime.replace('Z', '+00:00'))
+            if start_time_dt.tzinfo is None: # Times without an offset are taken as UTC
+                start_time_dt = start_time_dt.replace(tzinfo=timezone.utc)
         except ValueError:
             logger.warning(f"Invalid proposedStartTime format: {proposedStartTime}")
             return {
@@ -89,7 +94,9 @@ def lambda_handler(event, context):
         duration = timedelta(minutes=service_details['duration_minutes'])
         # Buffer is not added to the client's booking item's end time, it's for scheduling between appointments.
         end_time_dt = start_time_dt + duration
-        proposedEndTime_iso = end_time_dt.isoformat()
+        # Both times are stored in UTC, whatever offset the client sent
+        proposedStartTime_utc = start_time_dt.astimezone(timezone.utc).strftime(BOOKING_TIME_FORMAT)
+        proposedEndTime_utc = end_time_dt.astimezone(timezone.utc).strftime(BOOKING_TIME_FORMAT)
 
         booking_item = {
             'bookingId': bookingId,
@@ -100,8 +107,8 @@ def lambda_handler(event, context):
             'serviceDurationMinutes': service_details['duration_minutes'],
             'locationId': locationId,
             # 'locationName': body.get('locationName'), # Optional: Add if provided, or fetch based on locationId
-            'proposedStartTime': proposedStartTime,
-            'proposedEndTime': proposedEndTime_iso,
+            'proposedStartTime': proposedStartTime_utc,
+            'proposedEndTime': proposedEndTime_utc,
             'status': 'pending_confirmation', # Initial status
             'bookingChannel': body.get('bookingChannel', 'api'),
             'notes': body.get('notes'), # Optional
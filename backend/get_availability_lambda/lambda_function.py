@@ -2,18 +2,58 @@ import json
 import logging
 import os
 from datetime import datetime, timedelta, timezone # Ensure timezone is imported
-# boto3 might be used by other AWS SDK features if the lambda expands, but not directly for GCal.
-# For now, it's not strictly necessary for the described GCal logic.
-# import boto3 
+import boto3
+from boto3.dynamodb.conditions import Key, Attr
 
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+try:
+    from ..common.google_rate_limiter import rate_limiter_from_env, is_rate_limit_error
+except ImportError:  # Deployed flat in the Lambda package
+    from google_rate_limiter import rate_limiter_from_env, is_rate_limit_error
+
 # Initialize logger
 logger = logging.getLogger()
 logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
+# Initialize Boto3 clients
+dynamodb = boto3.resource('dynamodb')
+
+# When set, busy time is read from the table kept up to date by the inbound sync in
+# GoogleCalendarSyncLambda instead of calling FreeBusy on every request.
+BUSY_INTERVALS_TABLE_NAME = os.environ.get('BUSY_INTERVALS_TABLE_NAME')
+BUSY_INTERVALS_START_TIME_INDEX = "CalendarStartTimeIndex"
+
+# Paces FreeBusy calls (optionally shared with other Lambdas through DynamoDB) and retries rate limit errors
+google_rate_limiter = rate_limiter_from_env("GetAvailabilityLambda", dynamodb)
+# Seconds clients are asked to wait when Google keeps rate limiting after all retries
+RATE_LIMITED_RETRY_AFTER_SECONDS = int(os.environ.get("RATE_LIMITED_RETRY_AFTER_SECONDS", 5))
+
+
+def query_busy_intervals(calendar_id, start_datetime_dt, end_datetime_dt):
+    """
+    Returns the busy intervals ({'start', 'end'} ISO strings) of a calendar overlapping the window,
+    with one paginated Query on the start-time index. Only intervals that have not ended yet are
+    stored, so reading every interval starting before the window end stays cheap.
+    """
+    busy_table = dynamodb.Table(BUSY_INTERVALS_TABLE_NAME)
+    query_args = {
+        "IndexName": BUSY_INTERVALS_START_TIME_INDEX,
+        "KeyConditionExpression": Key('googleCalendarId').eq(calendar_id) & Key('startTime').lt(end_datetime_dt.strftime('%Y-%m-%dT%H:%M:%SZ')),
+        "FilterExpression": Attr('endTime').gt(start_datetime_dt.strftime('%Y-%m-%dT%H:%M:%SZ')),
+        "ProjectionExpression": "startTime, endTime"
+    }
+    busy_slots_raw = []
+    while True:
+        response = busy_table.query(**query_args)
+        busy_slots_raw.extend({"start": item['startTime'], "end": item['endTime']} for item in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return busy_slots_raw
+        query_args["ExclusiveStartKey"] = response['LastEvaluatedKey']
+
+
 def lambda_handler(event, context):
     logger.info(f"Received event: {json.dumps(event)}")
 
@@ -72,48 +112,62 @@ def lambda_handler(event, context):
                 "body": json.dumps({"error": "Invalid ISO time format. Use YYYY-MM-DDTHH:MM:SSZ."})
             }
 
-        # --- 2. Load Google Credentials ---
-        credentials_json_str = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS_JSON')
-        if not credentials_json_str:
-            logger.error("GOOGLE_APPLICATION_CREDENTIALS_JSON env var not set.")
-            return {"statusCode": 500, "body": json.dumps({"error": "Google credentials not configured."})}
+        if BUSY_INTERVALS_TABLE_NAME:
+            # --- 2. Read busy time synced from Google Calendar ---
+            busy_slots_raw = query_busy_intervals(calendar_id, start_datetime_dt, end_datetime_dt)
+            logger.info(f"Read {len(busy_slots_raw)} busy slots from {BUSY_INTERVALS_TABLE_NAME}.")
+        else:
+            # --- 2. Load Google Credentials ---
+            credentials_json_str = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS_JSON')
+            if not credentials_json_str:
+                logger.error("GOOGLE_APPLICATION_CREDENTIALS_JSON env var not set.")
+                return {"statusCode": 500, "body": json.dumps({"error": "Google credentials not configured."})}
         
-        try:
-            credentials_info = json.loads(credentials_json_str)
-            creds = service_account.Credentials.from_service_account_info(credentials_info)
-        except Exception as e:
-            logger.error(f"Error loading Google credentials: {e}")
-            return {"statusCode": 500, "body": json.dumps({"error": "Failed to load Google credentials."})}
+            try:
+                credentials_info = json.loads(credentials_json_str)
+                creds = service_account.Credentials.from_service_account_info(credentials_info)
+            except Exception as e:
+                logger.error(f"Error loading Google credentials: {e}")
+                return {"statusCode": 500, "body": json.dumps({"error": "Failed to load Google credentials."})}
 
-        # --- 3. Build Google Calendar Service ---
-        try:
-            service = build('calendar', 'v3', credentials=creds, cache_discovery=False)
-        except Exception as e: # Broad exception for build issues
-            logger.error(f"Failed to build Google Calendar service: {e}")
-            return {"statusCode": 500, "body": json.dumps({"error": "Failed to initialize Google Calendar service."})}
-
-        # --- 4. Prepare and Call FreeBusy API ---
-        freebusy_query_body = {
-            "timeMin": start_datetime_dt.isoformat(), # Use validated and timezone-aware dt objects
-            "timeMax": end_datetime_dt.isoformat(),
-            "items": [{"id": calendar_id}],
-            # "timeZone": "UTC" # timeMin/Max are already in UTC. FreeBusy respects this.
-        }
+            # --- 3. Build Google Calendar Service ---
+            try:
+                service = build('calendar', 'v3', credentials=creds, cache_discovery=False)
+            except Exception as e: # Broad exception for build issues
+                logger.error(f"Failed to build Google Calendar service: {e}")
+                return {"statusCode": 500, "body": json.dumps({"error": "Failed to initialize Google Calendar service."})}
+
+            # --- 4. Prepare and Call FreeBusy API ---
+            freebusy_query_body = {
+                "timeMin": start_datetime_dt.isoformat(), # Use validated and timezone-aware dt objects
+                "timeMax": end_datetime_dt.isoformat(),
+                "items": [{"id": calendar_id}],
+                # "timeZone": "UTC" # timeMin/Max are already in UTC. FreeBusy respects this.
+            }
         
-        logger.info(f"Querying FreeBusy for calendar {calendar_id} from {freebusy_query_body['timeMin']} to {freebusy_query_body['timeMax']}")
+            logger.info(f"Querying FreeBusy for calendar {calendar_id} from {freebusy_query_body['timeMin']} to {freebusy_query_body['timeMax']}")
         
-        try:
-            events_result = service.freebusy().query(body=freebusy_query_body).execute()
-        except HttpError as e:
-            logger.error(f"Google Calendar API HttpError: {e.content}")
-            error_details = json.loads(e.content.decode('utf-8')).get('error', {})
-            error_message = error_details.get('message', 'Unknown Google Calendar API error.')
-            if e.resp.status == 404:
-                 error_message = f"Calendar ID '{calendar_id}' not found or access denied."
-            return {"statusCode": e.resp.status, "body": json.dumps({"error": f"Google Calendar API error: {error_message}"})}
+            try:
+                events_result = google_rate_limiter.execute(lambda: service.freebusy().query(body=freebusy_query_body).execute(),
+                                                            calendar_id=calendar_id)
+            except HttpError as e:
+                if is_rate_limit_error(e):
+                    # Quota is exhausted for now; ask the client to retry instead of forwarding Google's 403/429
+                    logger.warning(f"Google Calendar API still rate limited for calendar {calendar_id} after retries.")
+                    return {
+                        "statusCode": 503,
+                        "headers": {"Content-Type": "application/json", "Retry-After": str(RATE_LIMITED_RETRY_AFTER_SECONDS)},
+                        "body": json.dumps({"error": "Availability is temporarily unavailable, please retry shortly."})
+                    }
+                logger.error(f"Google Calendar API HttpError: {e.content}")
+                error_details = json.loads(e.content.decode('utf-8')).get('error', {})
+                error_message = error_details.get('message', 'Unknown Google Calendar API error.')
+                if e.resp.status == 404:
+                     error_message = f"Calendar ID '{calendar_id}' not found or access denied."
+                return {"statusCode": e.resp.status, "body": json.dumps({"error": f"Google Calendar API error: {error_message}"})}
         
-        busy_slots_raw = events_result.get('calendars', {}).get(calendar_id, {}).get('busy', [])
-        logger.info(f"Received {len(busy_slots_raw)} busy slots from GCal.")
+            busy_slots_raw = events_result.get('calendars', {}).get(calendar_id, {}).get('busy', [])
+            logger.info(f"Received {len(busy_slots_raw)} busy slots from GCal.")
 
         # --- 5. Availability Logic ---
         available_slots_iso = []
@@ -0,0 +1,157 @@
+import logging
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest
+
+try:
+    from ..common.google_rate_limiter import is_rate_limit_error
+except ImportError:  # Deployed flat in the Lambda package
+    from google_rate_limiter import is_rate_limit_error
+
+# Initialize logger
+logger = logging.getLogger()
+
+# Google rejects batch requests with more than 50 sub-requests for the Calendar API.
+MAX_CALENDAR_BATCH_SIZE = 50
+
+# Statuses on delete that mean the event is already gone; treated as success.
+ALREADY_DELETED_STATUSES = (404, 410)
+
+
+def _build_sub_request(service, op):
+    """
+    Builds the googleapiclient HttpRequest for a single calendar operation.
+    An op is a dict with 'opId', 'bookingId', 'action', 'calendarId' and either
+    'eventBody' (CREATE_EVENT), 'eventId' and 'eventPatch' (UPDATE_EVENT) or 'eventId' (DELETE_EVENT).
+    """
+    if op['action'] == 'CREATE_EVENT':
+        return service.events().insert(calendarId=op['calendarId'], body=op['eventBody'])
+    if op['action'] == 'UPDATE_EVENT':
+        return service.events().patch(calendarId=op['calendarId'], eventId=op['eventId'], body=op['eventPatch'])
+    if op['action'] == 'DELETE_EVENT':
+        return service.events().delete(calendarId=op['calendarId'], eventId=op['eventId'])
+    raise ValueError(f"Unsupported calendar action: {op['action']}")
+
+
+def _split_into_waves(ops):
+    """
+    Splits ops so that each wave holds at most one op per booking.
+    Google does not guarantee the execution order of sub-requests inside a batch,
+    so the n-th action for a booking is only sent once its (n-1)-th action has completed.
+    """
+    waves = []
+    position_per_booking = {}
+    for op in ops:
+        position = position_per_booking.get(op['bookingId'], 0)
+        position_per_booking[op['bookingId']] = position + 1
+        if position == len(waves):
+            waves.append([])
+        waves[position].append(op)
+    return waves
+
+
+def _chunk_by_calendar(ops, max_batch_size):
+    """Groups ops by calendarId and yields (calendar_id, chunk) with at most max_batch_size ops each."""
+    ops_per_calendar = {}
+    for op in ops:
+        ops_per_calendar.setdefault(op['calendarId'], []).append(op)
+    for calendar_id, calendar_ops in ops_per_calendar.items():
+        for start in range(0, len(calendar_ops), max_batch_size):
+            yield calendar_id, calendar_ops[start:start + max_batch_size]
+
+
+def _result_from_response(op, response, exception):
+    if exception is None:
+        event_id = response.get('id') if isinstance(response, dict) else op.get('eventId')
+        return {"bookingId": op['bookingId'], "action": op['action'], "eventId": event_id, "error": None}
+
+    status = exception.resp.status if isinstance(exception, HttpError) else None
+    if op['action'] == 'DELETE_EVENT' and status in ALREADY_DELETED_STATUSES:
+        logger.info(f"[CalendarBatch] Event {op['eventId']} for booking {op['bookingId']} already deleted (HTTP {status}).")
+        return {"bookingId": op['bookingId'], "action": op['action'], "eventId": op['eventId'], "error": None}
+    return {"bookingId": op['bookingId'], "action": op['action'], "eventId": None, "error": exception}
+
+
+def _send_chunk(service, calendar_id, chunk, batch_uri, results):
+    """Sends one batch request and stores a result for every op of the chunk."""
+    ops_by_id = {op['opId']: op for op in chunk}
+
+    def callback(request_id, response, exception):
+        results[request_id] = _result_from_response(ops_by_id[request_id], response, exception)
+
+    batch = BatchHttpRequest(callback=callback, batch_uri=batch_uri)
+    for op in chunk:
+        batch.add(_build_sub_request(service, op), request_id=op['opId'])
+
+    logger.info(f"[CalendarBatch] Sending batch of {len(chunk)} request(s) to calendar '{calendar_id}'.")
+    try:
+        batch.execute()
+    except Exception as e:  # Transport or batch-level failure, every op in the chunk failed
+        logger.error(f"[CalendarBatch] Batch request to calendar '{calendar_id}' failed: {e}", exc_info=True)
+        for op in chunk:
+            results.setdefault(op['opId'], {"bookingId": op['bookingId'], "action": op['action'], "eventId": None, "error": e})
+
+
+def _send_chunk_rate_limited(service, calendar_id, chunk, batch_uri, results, rate_limiter):
+    """
+    Sends a chunk under the rate limiter: every sub-request costs one token of the project-wide
+    and of calendar_id's buckets, and sub-requests rejected with a rate limit error are re-sent
+    after a jittered backoff, up to max_retries times.
+    """
+    pending = chunk
+    attempt = 0
+    while True:
+        rate_limiter.acquire(len(pending), calendar_id)
+        _send_chunk(service, calendar_id, pending, batch_uri, results)
+        limited = [op for op in pending if op['opId'] in results and is_rate_limit_error(results[op['opId']]['error'])]
+        if not limited or attempt >= rate_limiter.max_retries:
+            return
+        logger.warning(f"[CalendarBatch] {len(limited)} request(s) to calendar '{calendar_id}' were rate limited, "
+                       f"retry {attempt + 1}/{rate_limiter.max_retries}.")
+        rate_limiter.backoff(attempt)
+        for op in limited:
+            del results[op['opId']]
+        pending = limited
+        attempt += 1
+
+
+def execute_calendar_ops(service, ops, batch_uri, max_batch_size=MAX_CALENDAR_BATCH_SIZE, rate_limiter=None):
+    """
+    Executes CREATE_EVENT / UPDATE_EVENT / DELETE_EVENT ops through Google API batch requests.
+    Ops are split by calendar and sent in batches of up to max_batch_size sub-requests,
+    preserving the order of ops that share a bookingId. With a rate_limiter, batches are paced
+    and rate-limited sub-requests are retried.
+
+    Returns a dict of opId -> {"bookingId", "action", "eventId", "error"}, where
+    "error" is None on success and the exception raised for that op otherwise.
+    """
+    max_batch_size = max(1, min(max_batch_size, MAX_CALENDAR_BATCH_SIZE))
+    results = {}
+    failed_bookings = set()
+
+    for wave in _split_into_waves(ops):
+        runnable_ops = []
+        for op in wave:
+            if op['bookingId'] in failed_bookings:
+                # Keep per-booking order: a later action must not overtake a failed earlier one.
+                results[op['opId']] = {
+                    "bookingId": op['bookingId'], "action": op['action'], "eventId": None,
+                    "error": RuntimeError(f"Skipped because an earlier action for booking {op['bookingId']} failed."),
+                }
+            else:
+                runnable_ops.append(op)
+
+        for calendar_id, chunk in _chunk_by_calendar(runnable_ops, max_batch_size):
+            if rate_limiter:
+                _send_chunk_rate_limited(service, calendar_id, chunk, batch_uri, results, rate_limiter)
+            else:
+                _send_chunk(service, calendar_id, chunk, batch_uri, results)
+
+        for op in runnable_ops:
+            if op['opId'] not in results:
+                results[op['opId']] = {"bookingId": op['bookingId'], "action": op['action'], "eventId": None,
+                                       "error": RuntimeError("No response received for batch sub-request.")}
+            if results[op['opId']]['error'] is not None:
+                failed_bookings.add(op['bookingId'])
+
+    return results
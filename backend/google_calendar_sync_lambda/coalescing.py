@@ -0,0 +1,91 @@
+import logging
+
+# Initialize logger
+logger = logging.getLogger()
+
+COALESCABLE_ACTIONS = ('CREATE_EVENT', 'UPDATE_EVENT', 'DELETE_EVENT')
+CANCELLATION_SOURCE = 'cancellation'  # 'source' of the DELETE_EVENT sent when a booking is cancelled
+RESCHEDULE_FIELDS = ('proposedStartTime', 'proposedEndTime')
+
+
+def coalesce_calendar_actions(entries):
+    """
+    Folds the calendar actions of one SQS batch per bookingId before anything is sent to Google.
+
+    entries is a list of (message_id, message_data) in arrival order. Rules, applied per booking:
+      * CREATE after a pending CREATE: the earlier create is superseded, only the latest is kept.
+      * DELETE after a pending CREATE: a DELETE without googleCalendarEventId refers to that
+        not-yet-created event, so the pair becomes a no-op. A DELETE that names an event and comes
+        from a cancellation drops the create and is kept. Any other DELETE that names an event (e.g.
+        reconciliation removing a stray event while recreating the booking's own) keeps both.
+      * DELETE after a DELETE of the same event: only one delete is kept.
+      * UPDATE after a pending CREATE: the new times are folded into the create.
+      * UPDATE after a pending UPDATE: only the latest is kept.
+      * DELETE after a pending UPDATE: the update is dropped, then the rules above apply to the delete.
+    Messages without a bookingId or with another action pass through unchanged.
+
+    Returns (kept_entries, coalesced_message_ids). Kept entries keep their original relative order;
+    coalesced messages need no further work and count as processed.
+    """
+    kept_per_booking = {}  # bookingId -> [(index, message_id, message_data)]
+    passthrough = []
+    coalesced_message_ids = []
+
+    for index, (message_id, message_data) in enumerate(entries):
+        booking_id = message_data.get('bookingId')
+        action = message_data.get('action')
+        if not booking_id or action not in COALESCABLE_ACTIONS:
+            passthrough.append((index, message_id, message_data))
+            continue
+
+        kept = kept_per_booking.setdefault(booking_id, [])
+        last_action = kept[-1][2].get('action') if kept else None
+
+        if action == 'UPDATE_EVENT':
+            if last_action == 'CREATE_EVENT':
+                create_index, create_id, create_data = kept.pop()
+                merged = dict(create_data, **{field: message_data[field] for field in RESCHEDULE_FIELDS if field in message_data})
+                kept.append((create_index, create_id, merged))
+                coalesced_message_ids.append(message_id)
+                logger.info(f"[Coalescing] UPDATE_EVENT {message_id} for booking {booking_id} folded into CREATE_EVENT {create_id}.")
+                continue
+            if last_action == 'UPDATE_EVENT':
+                superseded = kept.pop()
+                coalesced_message_ids.append(superseded[1])
+                logger.info(f"[Coalescing] UPDATE_EVENT {superseded[1]} for booking {booking_id} superseded by {message_id}.")
+            kept.append((index, message_id, message_data))
+            continue
+
+        if action == 'CREATE_EVENT':
+            if last_action == 'CREATE_EVENT':
+                superseded = kept.pop()
+                coalesced_message_ids.append(superseded[1])
+                logger.info(f"[Coalescing] CREATE_EVENT {superseded[1]} for booking {booking_id} superseded by {message_id}.")
+            kept.append((index, message_id, message_data))
+            continue
+
+        # DELETE_EVENT
+        if last_action == 'UPDATE_EVENT':
+            dropped = kept.pop()
+            coalesced_message_ids.append(dropped[1])
+            logger.info(f"[Coalescing] UPDATE_EVENT {dropped[1]} for booking {booking_id} dropped by DELETE_EVENT {message_id}.")
+            last_action = kept[-1][2].get('action') if kept else None
+        if last_action == 'CREATE_EVENT' and not message_data.get('googleCalendarEventId'):
+            cancelled = kept.pop()
+            coalesced_message_ids.extend([cancelled[1], message_id])
+            logger.info(f"[Coalescing] CREATE_EVENT {cancelled[1]} and DELETE_EVENT {message_id} for booking {booking_id} cancel out.")
+            continue
+        if last_action == 'CREATE_EVENT' and message_data.get('source') == CANCELLATION_SOURCE:
+            cancelled = kept.pop()
+            coalesced_message_ids.append(cancelled[1])
+            logger.info(f"[Coalescing] CREATE_EVENT {cancelled[1]} for booking {booking_id} dropped by DELETE_EVENT {message_id}.")
+        elif (last_action == 'DELETE_EVENT'
+              and kept[-1][2].get('googleCalendarEventId') == message_data.get('googleCalendarEventId')):
+            duplicate = kept.pop()
+            coalesced_message_ids.append(duplicate[1])
+            logger.info(f"[Coalescing] Duplicate DELETE_EVENT {duplicate[1]} for booking {booking_id} folded into {message_id}.")
+        kept.append((index, message_id, message_data))
+
+    kept_entries = passthrough + [entry for kept in kept_per_booking.values() for entry in kept]
+    kept_entries.sort(key=lambda entry: entry[0])
+    return [(message_id, message_data) for _, message_id, message_data in kept_entries], coalesced_message_ids
@@ -0,0 +1,334 @@
+import json
+import logging
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from datetime import datetime, timezone
+from email.parser import FeedParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Initialize logger
+logger = logging.getLogger()
+
+# Local, in-memory stand-in for the subset of the Google Calendar v3 REST API
+# used by GoogleCalendarSyncLambda. It speaks the same wire format as Google
+# (JSON resources and multipart/mixed batch requests), so the lambda can be
+# exercised end-to-end through googleapiclient without network access.
+# events.list supports paging and incremental sync: every change bumps a
+# per-server sequence number, deleted events stay behind as 'cancelled'
+# tombstones, and sync tokens encode (calendar epoch, sequence). Expiring a
+# calendar's tokens makes the next incremental request fail with 410.
+# Full listings also honour timeMin/timeMax and orderBy=startTime.
+# Rate limit errors can be injected to exercise backoff and retries.
+
+EVENTS_PATH_RE = re.compile(r'^/calendar/v3/calendars/(?P<calendar_id>[^/]+)/events(?:/(?P<event_id>[^/]+))?$')
+BATCH_PATH = '/batch/calendar/v3'
+
+
+class FakeCalendarServer:
+    """
+    Threaded HTTP server holding calendars and events in memory.
+    Usage:
+        with FakeCalendarServer() as server:
+            server.add_calendar("clinic@group.calendar.google.com")
+            os.environ['GOOGLE_CALENDAR_API_ROOT'] = server.root_url
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.calendars = {}  # calendarId -> {eventId: event resource}, cancelled events included
+        self.event_sequences = {}  # calendarId -> {eventId: sequence number of its last change}
+        self.sync_epochs = {}  # calendarId -> epoch; bumping it invalidates outstanding sync tokens
+        self.sequence = 0
+        self.injected_errors = []  # (status, reason) answered, in order, to the next API calls
+        self.request_log = []  # (method, path) of every HTTP request received, batch parts included
+        self.response_delay_seconds = 0  # Simulated per-HTTP-request latency
+        self.lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._thread = None
+
+    @property
+    def root_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"[FakeCalendarServer] Listening on {self.root_url}")
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    # --- Test helpers ---
+    def reset(self):
+        with self.lock:
+            self.calendars.clear()
+            self.event_sequences.clear()
+            self.sync_epochs.clear()
+            self.request_log.clear()
+            self.injected_errors.clear()
+        self.response_delay_seconds = 0
+
+    def add_calendar(self, calendar_id):
+        with self.lock:
+            self.calendars.setdefault(calendar_id, {})
+            self.event_sequences.setdefault(calendar_id, {})
+            self.sync_epochs.setdefault(calendar_id, 0)
+
+    def events(self, calendar_id):
+        """Live (not cancelled) events of a calendar."""
+        with self.lock:
+            return [event for event in self.calendars.get(calendar_id, {}).values() if event.get('status') != 'cancelled']
+
+    def add_event(self, calendar_id, start, end, summary="Blocked", **fields):
+        """
+        Adds an event as if staff created it in Google Calendar.
+        start/end are RFC3339 strings, or event time dicts such as {"date": "2024-09-01"} for all-day events.
+        """
+        start = {"dateTime": start} if isinstance(start, str) else start
+        end = {"dateTime": end} if isinstance(end, str) else end
+        body = {"summary": summary, "start": start, "end": end, **fields}
+        status, event = self.dispatch('POST', f"/calendar/v3/calendars/{urllib.parse.quote(calendar_id)}/events", body)
+        if status != 200:
+            raise ValueError(f"Could not add event to {calendar_id}: {event}")
+        return event
+
+    def update_event(self, calendar_id, event_id, **fields):
+        with self.lock:
+            event = self.calendars[calendar_id][event_id]
+            event.update(fields)
+            self._touch(calendar_id, event_id)
+            return event
+
+    def cancel_event(self, calendar_id, event_id):
+        status, _ = self.dispatch('DELETE', f"/calendar/v3/calendars/{urllib.parse.quote(calendar_id)}/events/{event_id}", None)
+        if status != 204:
+            raise ValueError(f"Could not cancel event {event_id} on {calendar_id}")
+
+    def fail_next_requests(self, count, status=429, reason='rateLimitExceeded'):
+        """Answers the next count API calls (batch parts included) with the given error."""
+        with self.lock:
+            self.injected_errors.extend([(status, reason)] * count)
+
+    def expire_sync_tokens(self, calendar_id):
+        """Makes every sync token issued for the calendar fail with 410 Gone."""
+        with self.lock:
+            self.sync_epochs[calendar_id] += 1
+
+    def http_requests(self):
+        """Top-level HTTP requests only (one per batch, one per single call)."""
+        with self.lock:
+            return [entry for entry in self.request_log if not entry[0].startswith('batch:')]
+
+    # --- API emulation, returns (status, body_dict_or_None) ---
+    def dispatch(self, method, raw_path, body):
+        parsed = urllib.parse.urlparse(raw_path)
+        match = EVENTS_PATH_RE.match(parsed.path)
+        if not match:
+            return 404, _error(404, 'notFound', f"Unknown path {parsed.path}")
+
+        calendar_id = urllib.parse.unquote(match.group('calendar_id'))
+        event_id = match.group('event_id')
+        event_id = urllib.parse.unquote(event_id) if event_id else None
+
+        with self.lock:
+            if self.injected_errors:
+                status, reason = self.injected_errors.pop(0)
+                return status, _error(status, reason, 'Rate Limit Exceeded')
+            if calendar_id not in self.calendars:
+                return 404, _error(404, 'notFound', 'Not Found')
+            calendar = self.calendars[calendar_id]
+
+            if method == 'POST' and event_id is None:
+                return self._insert_event(calendar_id, body)
+            if method == 'GET' and event_id is None:
+                return self._list_events(calendar_id, urllib.parse.parse_qs(parsed.query))
+            if method == 'GET' and event_id is not None:
+                if _is_live(calendar.get(event_id)):
+                    return 200, calendar[event_id]
+                return self._missing_event(calendar, event_id)
+            if method == 'PATCH' and event_id is not None:
+                if _is_live(calendar.get(event_id)):
+                    calendar[event_id].update({key: value for key, value in (body or {}).items() if key not in ('id', 'status')})
+                    self._touch(calendar_id, event_id)
+                    return 200, calendar[event_id]
+                return self._missing_event(calendar, event_id)
+            if method == 'DELETE' and event_id is not None:
+                if _is_live(calendar.get(event_id)):
+                    calendar[event_id]['status'] = 'cancelled'
+                    self._touch(calendar_id, event_id)
+                    return 204, None
+                return self._missing_event(calendar, event_id)
+
+        return 405, _error(405, 'methodNotAllowed', f"{method} not supported on {parsed.path}")
+
+    def _touch(self, calendar_id, event_id):
+        # Caller holds self.lock
+        self.sequence += 1
+        self.event_sequences[calendar_id][event_id] = self.sequence
+
+    def _insert_event(self, calendar_id, body):
+        event = dict(body or {})
+        if 'start' not in event or 'end' not in event:
+            return 400, _error(400, 'required', 'Missing start or end time.')
+        event['id'] = uuid.uuid4().hex
+        event['status'] = 'confirmed'
+        self.calendars[calendar_id][event['id']] = event
+        self._touch(calendar_id, event['id'])
+        return 200, event
+
+    def _missing_event(self, calendar, event_id):
+        if event_id in calendar:
+            return 410, _error(410, 'deleted', 'Resource has been deleted')
+        return 404, _error(404, 'notFound', 'Not Found')
+
+    def _list_events(self, calendar_id, query):
+        # Caller holds self.lock
+        sync_token = query.get('syncToken', [None])[0]
+        max_results = int(query.get('maxResults', ['250'])[0])
+        offset = int(query.get('pageToken', ['0'])[0])
+        sequences = self.event_sequences[calendar_id]
+        epoch = self.sync_epochs[calendar_id]
+
+        if sync_token:
+            token_epoch, token_sequence = (int(part) for part in sync_token.split(':'))
+            if token_epoch != epoch:
+                return 410, _error(410, 'fullSyncRequired', 'Sync token is no longer valid, a full sync is required.')
+            event_ids = [event_id for event_id, sequence in sequences.items() if sequence > token_sequence]
+        else:
+            show_deleted = query.get('showDeleted', ['false'])[0] == 'true'
+            time_min = _parse_time(query['timeMin'][0]) if 'timeMin' in query else None
+            time_max = _parse_time(query['timeMax'][0]) if 'timeMax' in query else None
+            event_ids = [
+                event_id for event_id, event in self.calendars[calendar_id].items()
+                if (show_deleted or _is_live(event))
+                and (time_min is None or _event_time(event['end']) > time_min)  # Google filters timeMin on the end time
+                and (time_max is None or _event_time(event['start']) < time_max)
+            ]
+
+        if query.get('orderBy', [None])[0] == 'startTime':
+            event_ids.sort(key=lambda event_id: (_event_time(self.calendars[calendar_id][event_id]['start']), sequences[event_id]))
+        else:
+            event_ids.sort(key=lambda event_id: sequences[event_id])
+        page = event_ids[offset:offset + max_results]
+        result = {"kind": "calendar#events", "items": [dict(self.calendars[calendar_id][event_id]) for event_id in page]}
+        if offset + max_results < len(event_ids):
+            result['nextPageToken'] = str(offset + max_results)
+        else:
+            result['nextSyncToken'] = f"{epoch}:{self.sequence}"
+        return 200, result
+
+
+def _parse_time(value):
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _event_time(event_time):
+    if event_time.get('dateTime'):
+        return _parse_time(event_time['dateTime'])
+    return datetime.fromisoformat(event_time['date']).replace(tzinfo=timezone.utc)
+
+
+def _is_live(event):
+    return event is not None and event.get('status') != 'cancelled'
+
+
+def _error(code, reason, message):
+    return {"error": {"code": code, "message": message, "errors": [{"domain": "global", "reason": reason, "message": message}]}}
+
+
+def _status_line(status):
+    reasons = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+               410: 'Gone', 429: 'Too Many Requests'}
+    return f"HTTP/1.1 {status} {reasons.get(status, 'Error')}"
+
+
+def _parse_batch_part(payload):
+    """Splits one application/http part into (method, path, json_body)."""
+    request_line, rest = payload.split('\n', 1)
+    method, path, _ = request_line.strip().split(' ', 2)
+    separator = '\r\n\r\n' if '\r\n\r\n' in rest else '\n\n'
+    body_text = rest.split(separator, 1)[1] if separator in rest else ''
+    body = json.loads(body_text) if body_text.strip() else None
+    return method, path, body
+
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            logger.debug(f"[FakeCalendarServer] {format % args}")
+
+        def _read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length).decode('utf-8') if length else ''
+
+        def _send(self, status, content_type, payload):
+            data = payload.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _handle(self):
+            raw_body = self._read_body()
+            with server.lock:
+                server.request_log.append((self.command, self.path))
+            if server.response_delay_seconds:
+                time.sleep(server.response_delay_seconds)
+            if urllib.parse.urlparse(self.path).path == BATCH_PATH and self.command == 'POST':
+                self._handle_batch(raw_body)
+                return
+            body = json.loads(raw_body) if raw_body.strip() else None
+            status, result = server.dispatch(self.command, self.path, body)
+            self._send(status, 'application/json; charset=UTF-8', json.dumps(result) if result is not None else '')
+
+        def _handle_batch(self, raw_body):
+            parser = FeedParser()
+            parser.feed(f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n{raw_body}")
+            message = parser.close()
+
+            boundary = f"batch_{uuid.uuid4().hex}"
+            chunks = []
+            for part in message.get_payload():
+                method, path, body = _parse_batch_part(part.get_payload())
+                with server.lock:
+                    server.request_log.append((f"batch:{method}", path))
+                status, result = server.dispatch(method, path, body)
+                content_id = part['Content-ID'].strip()
+                response_id = f"<response-{content_id[1:]}" if content_id.startswith('<') else content_id
+                result_text = json.dumps(result) if result is not None else ''
+                chunks.append(
+                    f"--{boundary}\r\n"
+                    f"Content-Type: application/http\r\n"
+                    f"Content-ID: {response_id}\r\n\r\n"
+                    f"{_status_line(status)}\r\n"
+                    f"Content-Type: application/json; charset=UTF-8\r\n"
+                    f"Content-Length: {len(result_text)}\r\n\r\n"
+                    f"{result_text}\r\n"
+                )
+            chunks.append(f"--{boundary}--\r\n")
+            self._send(200, f"multipart/mixed; boundary={boundary}", ''.join(chunks))
+
+        do_GET = _handle
+        do_POST = _handle
+        do_DELETE = _handle
+        do_PATCH = _handle
+        do_PUT = _handle
+
+    return Handler
@@ -0,0 +1,141 @@
+import logging
+from datetime import datetime, timedelta, timezone
+
+from googleapiclient.errors import HttpError
+
+# Initialize logger
+logger = logging.getLogger()
+
+# Google answers an expired or invalidated syncToken with 410 Gone; the client must do a full sync.
+FULL_SYNC_REQUIRED_STATUS = 410
+EVENTS_PAGE_SIZE = 250
+
+
+def to_utc_iso(event_time):
+    """
+    Converts a Google event time ({'dateTime': ...} or {'date': ...} for all-day events) to
+    'YYYY-MM-DDTHH:MM:SSZ', so busy intervals sort and compare correctly as strings.
+    All-day dates are taken as UTC midnight; the calendar's own time zone is not known here.
+    """
+    if event_time.get('dateTime'):
+        parsed = datetime.fromisoformat(event_time['dateTime'].replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+    else:
+        parsed = datetime.fromisoformat(event_time['date']).replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def busy_interval_from_event(calendar_id, location_id, event, now):
+    """
+    Builds the BusyIntervalsTable item for an event, or returns None when the event does not block time:
+    cancelled, marked 'free' (transparent), without usable times, or already over.
+    """
+    if event.get('status') == 'cancelled' or event.get('transparency') == 'transparent':
+        return None
+    try:
+        start_time = to_utc_iso(event['start'])
+        end_time = to_utc_iso(event['end'])
+    except (KeyError, ValueError):
+        logger.warning(f"[InboundSync] Event {event.get('id')} on {calendar_id} has no usable start/end, ignoring it.")
+        return None
+
+    end_dt = datetime.strptime(end_time, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+    if end_dt <= now:
+        return None
+    return {
+        "googleCalendarId": calendar_id,
+        "eventId": event['id'],
+        "locationId": location_id,
+        "startTime": start_time,
+        "endTime": end_time,
+        "expiresAt": int((end_dt + timedelta(days=1)).timestamp()),  # DynamoDB TTL
+        "updatedAt": now.isoformat()
+    }
+
+
+def _list_event_pages(service, calendar_id, sync_token, execute_request, page_size):
+    """Yields events.list pages; the last page carries nextSyncToken."""
+    list_args = {"calendarId": calendar_id, "singleEvents": True, "maxResults": page_size}
+    if sync_token:
+        list_args["syncToken"] = sync_token
+    page_token = None
+    while True:
+        if page_token:
+            list_args["pageToken"] = page_token
+        page = execute_request(service.events().list(**list_args))
+        yield page
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def _stored_event_ids(busy_table, calendar_id):
+    event_ids = set()
+    query_args = {
+        "KeyConditionExpression": "googleCalendarId = :calendar_id",
+        "ExpressionAttributeValues": {":calendar_id": calendar_id},
+        "ProjectionExpression": "eventId"
+    }
+    while True:
+        response = busy_table.query(**query_args)
+        event_ids.update(item['eventId'] for item in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return event_ids
+        query_args["ExclusiveStartKey"] = response['LastEvaluatedKey']
+
+
+def _apply_pages(service, busy_table, calendar_id, location_id, sync_token, execute_request, page_size, now, stats):
+    """Writes the listed changes to the busy table. Returns (nextSyncToken, eventIds seen)."""
+    seen_event_ids = set()
+    next_sync_token = None
+    with busy_table.batch_writer(overwrite_by_pkeys=['googleCalendarId', 'eventId']) as writer:
+        for page in _list_event_pages(service, calendar_id, sync_token, execute_request, page_size):
+            for event in page.get('items', []):
+                seen_event_ids.add(event['id'])
+                item = busy_interval_from_event(calendar_id, location_id, event, now)
+                if item:
+                    writer.put_item(Item=item)
+                    stats["upserted"] += 1
+                else:
+                    writer.delete_item(Key={"googleCalendarId": calendar_id, "eventId": event['id']})
+                    stats["removed"] += 1
+            next_sync_token = page.get('nextSyncToken', next_sync_token)
+    return next_sync_token, seen_event_ids
+
+
+def sync_calendar_busy_intervals(service, busy_table, calendar_id, location_id, sync_token, execute_request,
+                                 page_size=EVENTS_PAGE_SIZE, now=None):
+    """
+    Brings the busy intervals of one calendar up to date.
+    With a sync_token only the events changed since that token are listed (deleted ones come back as
+    'cancelled'). Without one, or when Google rejects the token with 410, every event is listed and
+    intervals stored for events that no longer exist are removed.
+
+    Returns (next_sync_token, stats) where stats counts upserted and removed intervals and
+    whether a full sync was done.
+    """
+    now = now or datetime.now(timezone.utc)
+    stats = {"upserted": 0, "removed": 0, "fullSync": not sync_token}
+
+    if sync_token:
+        try:
+            next_sync_token, _ = _apply_pages(service, busy_table, calendar_id, location_id, sync_token,
+                                              execute_request, page_size, now, stats)
+            return next_sync_token, stats
+        except HttpError as e:
+            if e.resp.status != FULL_SYNC_REQUIRED_STATUS:
+                raise
+            logger.warning(f"[InboundSync] Sync token for calendar {calendar_id} is no longer valid, running a full sync.")
+            stats["fullSync"] = True
+
+    stored_event_ids = _stored_event_ids(busy_table, calendar_id)
+    next_sync_token, seen_event_ids = _apply_pages(service, busy_table, calendar_id, location_id, None,
+                                                   execute_request, page_size, now, stats)
+    stale_event_ids = stored_event_ids - seen_event_ids
+    if stale_event_ids:
+        with busy_table.batch_writer() as writer:
+            for event_id in stale_event_ids:
+                writer.delete_item(Key={"googleCalendarId": calendar_id, "eventId": event_id})
+        stats["removed"] += len(stale_event_ids)
+    return next_sync_token, stats
@@ -3,7 +3,29 @@ import logging
 import os
 import boto3
 import datetime
-import uuid # For generating dummy event IDs
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import httplib2
+import google_auth_httplib2
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+try:
+    from .calendar_batch import execute_calendar_ops, MAX_CALENDAR_BATCH_SIZE, ALREADY_DELETED_STATUSES
+    from .coalescing import coalesce_calendar_actions
+    from .inbound_sync import sync_calendar_busy_intervals, to_utc_iso
+    from .reconciliation import reconcile_location, send_messages_in_batches, BOOKING_EVENT_PROPERTY
+    from ..common.google_rate_limiter import rate_limiter_from_env
+except ImportError:  # Deployed flat in the Lambda package
+    from calendar_batch import execute_calendar_ops, MAX_CALENDAR_BATCH_SIZE, ALREADY_DELETED_STATUSES
+    from coalescing import coalesce_calendar_actions
+    from inbound_sync import sync_calendar_busy_intervals, to_utc_iso
+    from reconciliation import reconcile_location, send_messages_in_batches, BOOKING_EVENT_PROPERTY
+    from google_rate_limiter import rate_limiter_from_env
 
 # Initialize logger
 logger = logging.getLogger()
@@ -11,60 +33,184 @@ logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
 # Initialize Boto3 clients
 dynamodb = boto3.resource('dynamodb')
+sqs = boto3.client('sqs')
 
 # Environment variables for table names
 APPOINTMENTS_TABLE_NAME = os.environ.get('APPOINTMENTS_TABLE_NAME')
 SERVICES_TABLE_NAME = os.environ.get('SERVICES_TABLE_NAME')
 LOCATIONS_TABLE_NAME = os.environ.get('LOCATIONS_TABLE_NAME')
+# Busy time read from the location calendars (inbound sync), queried by GetAvailabilityLambda
+BUSY_INTERVALS_TABLE_NAME = os.environ.get('BUSY_INTERVALS_TABLE_NAME')
+# Queue this Lambda consumes; reconciliation sends its corrective CREATE/DELETE messages here
+GOOGLE_CALENDAR_SYNC_SQS_URL = os.environ.get('GOOGLE_CALENDAR_SYNC_SQS_URL')
+RECONCILIATION_RANGE_DAYS = int(os.environ.get('RECONCILIATION_RANGE_DAYS', 365))
+# Bookings confirmed or moved more recently than this still have their own CREATE/UPDATE in flight
+# (5 receives x 5 minute visibility timeout on the sync queue), so reconciliation leaves them alone.
+RECONCILIATION_GRACE_MINUTES = int(os.environ.get('RECONCILIATION_GRACE_MINUTES', 30))
+
+# Google Calendar API settings. GOOGLE_CALENDAR_API_ROOT can point at a local fake server for offline testing.
+DEFAULT_GOOGLE_API_ROOT = "https://www.googleapis.com/"
+GOOGLE_CALENDAR_API_ROOT = os.environ.get('GOOGLE_CALENDAR_API_ROOT', DEFAULT_GOOGLE_API_ROOT)
+GOOGLE_CALENDAR_BATCH_SIZE = int(os.environ.get('GOOGLE_CALENDAR_BATCH_SIZE', MAX_CALENDAR_BATCH_SIZE))
+GOOGLE_CALENDAR_SCOPES = ['https://www.googleapis.com/auth/calendar']
+
+# Execution mode for a batch of SQS records:
+#   "batch" - all calendar writes in the batch are grouped into Google batch requests (default)
+#   "async" - records are processed concurrently (up to SYNC_MAX_CONCURRENCY), one API call per record,
+#             while records sharing a bookingId are still processed strictly in order
+SYNC_EXECUTION_MODE = os.environ.get('SYNC_EXECUTION_MODE', 'batch').lower()
+SYNC_MAX_CONCURRENCY = int(os.environ.get('SYNC_MAX_CONCURRENCY', 10))
+
+# Paces every Google call made by this container (optionally shared through DynamoDB) and retries rate limit errors
+google_rate_limiter = rate_limiter_from_env("GoogleCalendarSyncLambda", dynamodb)
+
+# Built once per container and reused across warm invocations
+_calendar_service = None
+_calendar_credentials = None
+_calendar_service_lock = threading.Lock()
+# httplib2.Http is not thread-safe, so each worker thread gets its own connection
+_thread_local = threading.local()
+
+
+# --- Google Calendar API Functions ---
+def get_calendar_service():
+    """
+    Returns a cached Google Calendar v3 service object.
+    Uses the service account in GOOGLE_APPLICATION_CREDENTIALS_JSON; when only a custom
+    GOOGLE_CALENDAR_API_ROOT is configured (local fake server), requests are sent unauthenticated.
+    """
+    global _calendar_service
+    if _calendar_service is not None:
+        return _calendar_service
+
+    with _calendar_service_lock:
+        if _calendar_service is None:
+            _calendar_service = _build_calendar_service()
+    return _calendar_service
+
+
+def _build_calendar_service():
+    global _calendar_credentials
+    client_options = {"api_endpoint": f"{GOOGLE_CALENDAR_API_ROOT}calendar/v3/"}
+    credentials_json_str = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS_JSON')
+    if credentials_json_str:
+        credentials_info = json.loads(credentials_json_str)
+        _calendar_credentials = service_account.Credentials.from_service_account_info(credentials_info, scopes=GOOGLE_CALENDAR_SCOPES)
+        return build('calendar', 'v3', credentials=_calendar_credentials, client_options=client_options, cache_discovery=False)
+    if GOOGLE_CALENDAR_API_ROOT != DEFAULT_GOOGLE_API_ROOT:
+        logger.warning(f"GOOGLE_APPLICATION_CREDENTIALS_JSON not set. Using unauthenticated requests against {GOOGLE_CALENDAR_API_ROOT}.")
+        return build('calendar', 'v3', http=httplib2.Http(), client_options=client_options, cache_discovery=False)
+    raise EnvironmentError("GOOGLE_APPLICATION_CREDENTIALS_JSON environment variable not set.")
+
+
+def execute_google_request(request, calendar_id=None):
+    """
+    Executes a googleapiclient request on an HTTP connection owned by the calling thread,
+    paced and retried by the shared Google rate limiter (and calendar_id's buckets, when given).
+    """
+    http = getattr(_thread_local, 'http', None)
+    if http is None:
+        if _calendar_credentials is not None:
+            http = google_auth_httplib2.AuthorizedHttp(_calendar_credentials, http=httplib2.Http())
+        else:
+            http = httplib2.Http()
+        _thread_local.http = http
+    return google_rate_limiter.execute(lambda: request.execute(http=http), calendar_id=calendar_id)
+
+
+def get_batch_uri():
+    return f"{GOOGLE_CALENDAR_API_ROOT}batch/calendar/v3"
+
+
+def build_event_body(event_title, event_description, start_time_iso, end_time_iso, booking_id=None):
+    event_body = {
+        "summary": event_title,
+        "description": event_description,
+        "start": {"dateTime": start_time_iso},
+        "end": {"dateTime": end_time_iso},
+    }
+    if booking_id:
+        # Marks the event as created for a booking (used by reconciliation to tell it apart from staff events)
+        event_body["extendedProperties"] = {"private": {BOOKING_EVENT_PROPERTY: booking_id}}
+    return event_body
+
 
-# --- Stubbed Google Calendar API Functions ---
-def stub_create_google_calendar_event(calendar_id, event_title, event_description, start_time_iso, end_time_iso):
+def create_google_calendar_event(calendar_id, event_title, event_description, start_time_iso, end_time_iso):
     """
-    Stub function to simulate creating a Google Calendar event.
-    Logs parameters and returns a dummy event ID.
+    Creates a single Google Calendar event and returns its event ID.
     """
-    logger.info(f"[STUB] Creating Google Calendar event in calendar '{calendar_id}'")
-    logger.info(f"[STUB] Event Title: {event_title}")
-    logger.info(f"[STUB] Event Description: {event_description}")
-    logger.info(f"[STUB] Start Time: {start_time_iso}")
-    logger.info(f"[STUB] End Time: {end_time_iso}")
-    
-    # Simulate API call delay (optional)
-    # import time
-    # time.sleep(0.1) 
-    
-    dummy_event_id = f"stub_event_{uuid.uuid4()}"
-    logger.info(f"[STUB] Google Calendar event created successfully. Event ID: {dummy_event_id}")
-    return dummy_event_id
+    logger.info(f"Creating Google Calendar event in calendar '{calendar_id}' from {start_time_iso} to {end_time_iso}")
+    event_body = build_event_body(event_title, event_description, start_time_iso, end_time_iso)
+    created_event = execute_google_request(get_calendar_service().events().insert(calendarId=calendar_id, body=event_body), calendar_id)
+    logger.info(f"Google Calendar event created successfully. Event ID: {created_event.get('id')}")
+    return created_event.get('id')
 
-def stub_delete_google_calendar_event(calendar_id, event_id):
+
+def delete_google_calendar_event(calendar_id, event_id):
     """
-    Stub function to simulate deleting a Google Calendar event.
-    Logs parameters and returns a success status.
+    Deletes a single Google Calendar event. An event that is already gone counts as deleted.
     """
-    logger.info(f"[STUB] Deleting Google Calendar event '{event_id}' from calendar '{calendar_id}'")
-    # Simulate API call delay (optional)
-    # import time
-    # time.sleep(0.1)
-    logger.info(f"[STUB] Google Calendar event '{event_id}' deleted successfully.")
+    logger.info(f"Deleting Google Calendar event '{event_id}' from calendar '{calendar_id}'")
+    try:
+        execute_google_request(get_calendar_service().events().delete(calendarId=calendar_id, eventId=event_id), calendar_id)
+    except HttpError as e:
+        if e.resp.status not in ALREADY_DELETED_STATUSES:
+            raise
+        logger.info(f"Google Calendar event '{event_id}' was already deleted (HTTP {e.resp.status}).")
+    logger.info(f"Google Calendar event '{event_id}' deleted successfully.")
     return True
-# --- End Stubbed Functions ---
+# --- End Google Calendar API Functions ---
 
-def handle_create_event_sqs(message_data):
+
+def fetch_location_calendar_id(location_id, booking_id, log_prefix):
+    """
+    Fetches the location item and returns (location_item, googleCalendarId).
+    """
+    try:
+        locations_table = dynamodb.Table(LOCATIONS_TABLE_NAME)
+        location_response = locations_table.get_item(Key={'locationId': location_id})
+        location_item = location_response.get('Item')
+        if not location_item:
+            logger.error(f"[{log_prefix}] Location {location_id} not found for bookingId: {booking_id}.")
+            raise ValueError(f"Location details not found for locationId: {location_id}")
+        google_calendar_id_for_location = location_item.get('googleCalendarId')
+        if not google_calendar_id_for_location:
+            logger.error(f"[{log_prefix}] googleCalendarId not configured for location {location_id} (booking {booking_id}).")
+            raise ValueError(f"googleCalendarId missing for location: {location_id}")
+    except Exception as e:
+        logger.error(f"[{log_prefix}] Error fetching location {location_id} for booking {booking_id}: {e}", exc_info=True)
+        raise
+    return location_item, google_calendar_id_for_location
+
+
+def prepare_create_event(message_data):
     """
-    Handles the CREATE_EVENT action from an SQS message.
+    Validates a CREATE_EVENT message and resolves the service and location it refers to.
+    Returns a calendar op dict: {"action", "bookingId", "calendarId", "eventBody"}, or None when the
+    booking is no longer confirmed (e.g. cancelled while the message was queued).
     """
     lambda_name = "GoogleCalendarSyncLambda"
     booking_id = message_data.get('bookingId')
-    logger.info(f"[{lambda_name}-CREATE_EVENT] Processing for bookingId: {booking_id}")
+    log_prefix = f"{lambda_name}-CREATE_EVENT"
+    logger.info(f"[{log_prefix}] Processing for bookingId: {booking_id}")
 
-    required_fields = ['serviceId', 'locationId', 'proposedStartTime', 'proposedEndTime', 
+    required_fields = ['serviceId', 'locationId', 'proposedStartTime', 'proposedEndTime',
                        'clientName', 'clientEmail'] # clientContact renamed to clientEmail for clarity
     for field in required_fields:
         if field not in message_data:
-            logger.error(f"[{lambda_name}-CREATE_EVENT] Missing required field '{field}' in message for bookingId: {booking_id}")
+            logger.error(f"[{log_prefix}] Missing required field '{field}' in message for bookingId: {booking_id}")
             raise ValueError(f"Missing required field: {field}")
 
+    try:
+        appointments_table = dynamodb.Table(APPOINTMENTS_TABLE_NAME)
+        booking_item = appointments_table.get_item(Key={'bookingId': booking_id}).get('Item') or {}
+    except Exception as e:
+        logger.error(f"[{log_prefix}] Error fetching booking {booking_id}: {e}", exc_info=True)
+        raise
+    if booking_item.get('status') != 'confirmed':
+        logger.info(f"[{log_prefix}] Booking {booking_id} is not confirmed (status: {booking_item.get('status')}). Nothing to create.")
+        return None
+
     service_id = message_data['serviceId']
     location_id = message_data['locationId']
     proposed_start_time = message_data['proposedStartTime']
@@ -79,29 +225,16 @@ def handle_create_event_sqs(message_data):
         service_response = services_table.get_item(Key={'serviceId': service_id})
         service_item = service_response.get('Item')
         if not service_item:
-            logger.error(f"[{lambda_name}-CREATE_EVENT] Service {service_id} not found for bookingId: {booking_id}.")
+            logger.error(f"[{log_prefix}] Service {service_id} not found for bookingId: {booking_id}.")
             raise ValueError(f"Service details not found for serviceId: {service_id}")
         service_name = service_item.get('serviceName', 'Unknown Service')
     except Exception as e:
-        logger.error(f"[{lambda_name}-CREATE_EVENT] Error fetching service {service_id} for booking {booking_id}: {e}", exc_info=True)
+        logger.error(f"[{log_prefix}] Error fetching service {service_id} for booking {booking_id}: {e}", exc_info=True)
         raise
 
     # 2. Fetch location details
-    try:
-        locations_table = dynamodb.Table(LOCATIONS_TABLE_NAME)
-        location_response = locations_table.get_item(Key={'locationId': location_id})
-        location_item = location_response.get('Item')
-        if not location_item:
-            logger.error(f"[{lambda_name}-CREATE_EVENT] Location {location_id} not found for bookingId: {booking_id}.")
-            raise ValueError(f"Location details not found for locationId: {location_id}")
-        location_name = location_item.get('locationName', 'Unknown Location')
-        google_calendar_id_for_location = location_item.get('googleCalendarId')
-        if not google_calendar_id_for_location:
-            logger.error(f"[{lambda_name}-CREATE_EVENT] googleCalendarId not configured for location {location_id} (booking {booking_id}).")
-            raise ValueError(f"googleCalendarId missing for location: {location_id}")
-    except Exception as e:
-        logger.error(f"[{lambda_name}-CREATE_EVENT] Error fetching location {location_id} for booking {booking_id}: {e}", exc_info=True)
-        raise
+    location_item, google_calendar_id_for_location = fetch_location_calendar_id(location_id, booking_id, log_prefix)
+    location_name = location_item.get('locationName', 'Unknown Location')
 
     # 3. Construct event details
     event_title = f"Appointment: {service_name} for {client_name}"
@@ -114,162 +247,548 @@ def handle_create_event_sqs(message_data):
         f"Booking ID: {booking_id}"
     )
 
-    # 4. Call (stubbed) Google Calendar API to create event
+    return {
+        "action": "CREATE_EVENT",
+        "bookingId": booking_id,
+        "calendarId": google_calendar_id_for_location,
+        "eventBody": build_event_body(event_title, event_description, proposed_start_time, proposed_end_time, booking_id),
+    }
+
+
+def resolve_event_and_location(message_data, log_prefix):
+    """
+    Returns (googleCalendarEventId, locationId, booking_item) for a message about an existing event.
+    Values missing from the message are read from the booking; booking_item is None when the
+    message was complete. googleCalendarEventId is None when the booking has no event.
+    """
+    booking_id = message_data.get('bookingId')
+    google_event_id = message_data.get('googleCalendarEventId')
+    location_id = message_data.get('locationId')
+    if google_event_id and location_id:
+        return google_event_id, location_id, None
+
+    if not booking_id:
+        missing_field = 'locationId' if google_event_id else 'googleCalendarEventId'
+        logger.error(f"[{log_prefix}] Missing required field '{missing_field}' and no bookingId to resolve it from.")
+        raise ValueError(f"Missing required field: {missing_field}")
     try:
-        google_event_id = stub_create_google_calendar_event(
-            calendar_id=google_calendar_id_for_location,
-            event_title=event_title,
-            event_description=event_description,
-            start_time_iso=proposed_start_time,
-            end_time_iso=proposed_end_time
-        )
-    except Exception as e: # Catch errors from the stub, though unlikely for a simple stub
-        logger.error(f"[{lambda_name}-CREATE_EVENT] Error creating Google Calendar event (stub) for booking {booking_id}: {e}", exc_info=True)
+        appointments_table = dynamodb.Table(APPOINTMENTS_TABLE_NAME)
+        booking_item = appointments_table.get_item(Key={'bookingId': booking_id}).get('Item') or {}
+    except Exception as e:
+        logger.error(f"[{log_prefix}] Error fetching booking {booking_id}: {e}", exc_info=True)
         raise
-
-    # 5. Update AppointmentsTable with googleCalendarEventId
-    if google_event_id:
-        try:
-            appointments_table = dynamodb.Table(APPOINTMENTS_TABLE_NAME)
-            updated_at = datetime.datetime.utcnow().isoformat()
-            appointments_table.update_item(
-                Key={'bookingId': booking_id},
-                UpdateExpression="SET googleCalendarEventId = :gcal_id, updatedAt = :ua",
-                ExpressionAttributeValues={
-                    ':gcal_id': google_event_id,
-                    ':ua': updated_at
-                }
-            )
-            logger.info(f"[{lambda_name}-CREATE_EVENT] Booking {booking_id} updated with googleCalendarEventId: {google_event_id}")
-        except Exception as e:
-            logger.error(f"[{lambda_name}-CREATE_EVENT] Error updating booking {booking_id} with googleCalendarEventId: {e}", exc_info=True)
-            # This is a critical error if the event was created but not linked. Consider retry or DLQ.
-            raise
-    else:
-        # Should not happen with the current stub, but good practice for real API
-        logger.error(f"[{lambda_name}-CREATE_EVENT] Failed to get googleCalendarEventId for booking {booking_id} from stub.")
-        raise Exception("Failed to obtain Google Calendar Event ID from stub.")
+    google_event_id = google_event_id or booking_item.get('googleCalendarEventId')
+    location_id = location_id or booking_item.get('locationId')
+    if google_event_id and not location_id:
+        logger.error(f"[{log_prefix}] Missing required field 'locationId' in message for bookingId: {booking_id}")
+        raise ValueError("Missing required field: locationId")
+    return google_event_id, location_id, booking_item
 
 
-def handle_delete_event_sqs(message_data):
+def prepare_delete_event(message_data):
     """
-    Handles the DELETE_EVENT action from an SQS message.
+    Validates a DELETE_EVENT message and resolves the calendar of its location.
+    When googleCalendarEventId or locationId is not in the message, they are read from the booking,
+    which covers bookings cancelled before their CREATE_EVENT was synced.
+    Returns a calendar op dict: {"action", "bookingId", "calendarId", "eventId"}, or None when
+    the booking has no Google Calendar event to delete.
     """
     lambda_name = "GoogleCalendarSyncLambda"
     booking_id = message_data.get('bookingId') # For logging
-    logger.info(f"[{lambda_name}-DELETE_EVENT] Processing for bookingId: {booking_id}")
+    log_prefix = f"{lambda_name}-DELETE_EVENT"
+    logger.info(f"[{log_prefix}] Processing for bookingId: {booking_id}")
 
-    required_fields = ['googleCalendarEventId', 'locationId']
-    for field in required_fields:
+    google_event_id_to_delete, location_id, _ = resolve_event_and_location(message_data, log_prefix)
+    if not google_event_id_to_delete:
+        logger.info(f"[{log_prefix}] Booking {booking_id} has no Google Calendar event. Nothing to delete.")
+        return None
+
+    _, google_calendar_id_for_location = fetch_location_calendar_id(location_id, booking_id, log_prefix)
+
+    return {
+        "action": "DELETE_EVENT",
+        "bookingId": booking_id,
+        "calendarId": google_calendar_id_for_location,
+        "eventId": google_event_id_to_delete,
+    }
+
+
+def prepare_update_event(message_data):
+    """
+    Validates an UPDATE_EVENT message (a rescheduled booking) and resolves the event to move.
+    Returns a calendar op dict: {"action", "bookingId", "calendarId", "eventId", "eventPatch"}, applied
+    with events.patch, or None when the booking is no longer confirmed.
+    A confirmed booking whose CREATE_EVENT has not been synced yet raises, so SQS retries the
+    update once the event exists.
+    """
+    lambda_name = "GoogleCalendarSyncLambda"
+    booking_id = message_data.get('bookingId')
+    log_prefix = f"{lambda_name}-UPDATE_EVENT"
+    logger.info(f"[{log_prefix}] Processing for bookingId: {booking_id}")
+
+    for field in ['bookingId', 'proposedStartTime', 'proposedEndTime']:
         if field not in message_data:
-            logger.error(f"[{lambda_name}-DELETE_EVENT] Missing required field '{field}' in message for bookingId: {booking_id}")
+            logger.error(f"[{log_prefix}] Missing required field '{field}' in message for bookingId: {booking_id}")
             raise ValueError(f"Missing required field: {field}")
 
-    google_event_id_to_delete = message_data['googleCalendarEventId']
-    location_id = message_data['locationId']
+    google_event_id, location_id, booking_item = resolve_event_and_location(message_data, log_prefix)
+    if not google_event_id:
+        if booking_item is not None and booking_item.get('status') != 'confirmed':
+            logger.info(f"[{log_prefix}] Booking {booking_id} is no longer confirmed. Nothing to update.")
+            return None
+        logger.warning(f"[{log_prefix}] Booking {booking_id} has no Google Calendar event yet, update will be retried.")
+        raise RuntimeError(f"Google Calendar event for booking {booking_id} not created yet.")
+
+    _, google_calendar_id_for_location = fetch_location_calendar_id(location_id, booking_id, log_prefix)
+
+    return {
+        "action": "UPDATE_EVENT",
+        "bookingId": booking_id,
+        "calendarId": google_calendar_id_for_location,
+        "eventId": google_event_id,
+        "eventPatch": {
+            "start": {"dateTime": message_data['proposedStartTime']},
+            "end": {"dateTime": message_data['proposedEndTime']},
+        },
+    }
 
-    # 1. Fetch location details for googleCalendarId
+
+def record_created_event(booking_id, google_event_id):
+    """
+    Links a created Google Calendar event to its booking in AppointmentsTable.
+    """
+    lambda_name = "GoogleCalendarSyncLambda"
+    if not google_event_id:
+        logger.error(f"[{lambda_name}-CREATE_EVENT] Failed to get googleCalendarEventId for booking {booking_id}.")
+        raise Exception("Failed to obtain Google Calendar Event ID.")
     try:
-        locations_table = dynamodb.Table(LOCATIONS_TABLE_NAME)
-        location_response = locations_table.get_item(Key={'locationId': location_id})
-        location_item = location_response.get('Item')
-        if not location_item:
-            logger.error(f"[{lambda_name}-DELETE_EVENT] Location {location_id} not found for bookingId: {booking_id}.")
-            raise ValueError(f"Location details not found for locationId: {location_id}")
-        google_calendar_id_for_location = location_item.get('googleCalendarId')
-        if not google_calendar_id_for_location:
-            logger.error(f"[{lambda_name}-DELETE_EVENT] googleCalendarId not configured for location {location_id} (booking {booking_id}).")
-            raise ValueError(f"googleCalendarId missing for location: {location_id}")
+        appointments_table = dynamodb.Table(APPOINTMENTS_TABLE_NAME)
+        updated_at = datetime.datetime.utcnow().isoformat()
+        appointments_table.update_item(
+            Key={'bookingId': booking_id},
+            UpdateExpression="SET googleCalendarEventId = :gcal_id, updatedAt = :ua",
+            ExpressionAttributeValues={
+                ':gcal_id': google_event_id,
+                ':ua': updated_at
+            }
+        )
+        logger.info(f"[{lambda_name}-CREATE_EVENT] Booking {booking_id} updated with googleCalendarEventId: {google_event_id}")
     except Exception as e:
-        logger.error(f"[{lambda_name}-DELETE_EVENT] Error fetching location {location_id} for booking {booking_id}: {e}", exc_info=True)
+        logger.error(f"[{lambda_name}-CREATE_EVENT] Error updating booking {booking_id} with googleCalendarEventId: {e}", exc_info=True)
+        # This is a critical error if the event was created but not linked. Consider retry or DLQ.
         raise
 
-    # 2. Call (stubbed) Google Calendar API to delete event
+
+def handle_create_event_sqs(message_data):
+    """
+    Handles the CREATE_EVENT action from an SQS message with a single (non-batched) API call.
+    """
+    op = prepare_create_event(message_data)
+    if op is None:
+        return
     try:
-        stub_delete_google_calendar_event(
-            calendar_id=google_calendar_id_for_location,
-            event_id=google_event_id_to_delete
-        )
-        logger.info(f"[{lambda_name}-DELETE_EVENT] Successfully processed delete for event {google_event_id_to_delete} in booking {booking_id}.")
-    except Exception as e: # Catch errors from the stub
-        logger.error(f"[{lambda_name}-DELETE_EVENT] Error deleting Google Calendar event (stub) {google_event_id_to_delete} for booking {booking_id}: {e}", exc_info=True)
+        created_event = execute_google_request(get_calendar_service().events().insert(calendarId=op['calendarId'], body=op['eventBody']),
+                                               op['calendarId'])
+        google_event_id = created_event.get('id')
+    except Exception as e:
+        logger.error(f"[GoogleCalendarSyncLambda-CREATE_EVENT] Error creating Google Calendar event for booking {op['bookingId']}: {e}", exc_info=True)
         raise
+    record_created_event(op['bookingId'], google_event_id)
 
 
-def lambda_handler(event, context):
+def handle_delete_event_sqs(message_data):
+    """
+    Handles the DELETE_EVENT action from an SQS message with a single (non-batched) API call.
     """
-    Main Lambda handler for Google Calendar synchronization from SQS.
-    Processes messages from an SQS queue.
+    op = prepare_delete_event(message_data)
+    if op is None:
+        return
+    try:
+        delete_google_calendar_event(calendar_id=op['calendarId'], event_id=op['eventId'])
+        logger.info(f"[GoogleCalendarSyncLambda-DELETE_EVENT] Successfully processed delete for event {op['eventId']} in booking {op['bookingId']}.")
+    except Exception as e:
+        logger.error(f"[GoogleCalendarSyncLambda-DELETE_EVENT] Error deleting Google Calendar event {op['eventId']} for booking {op['bookingId']}: {e}", exc_info=True)
+        raise
+
+
+def handle_update_event_sqs(message_data):
+    """
+    Handles the UPDATE_EVENT action from an SQS message with a single events.patch call.
+    """
+    op = prepare_update_event(message_data)
+    if op is None:
+        return
+    try:
+        execute_google_request(get_calendar_service().events().patch(calendarId=op['calendarId'], eventId=op['eventId'], body=op['eventPatch']),
+                               op['calendarId'])
+        logger.info(f"[GoogleCalendarSyncLambda-UPDATE_EVENT] Moved event {op['eventId']} for booking {op['bookingId']}.")
+    except Exception as e:
+        logger.error(f"[GoogleCalendarSyncLambda-UPDATE_EVENT] Error updating Google Calendar event {op['eventId']} for booking {op['bookingId']}: {e}", exc_info=True)
+        raise
+
+
+PREPARE_HANDLERS = {
+    'CREATE_EVENT': prepare_create_event,
+    'UPDATE_EVENT': prepare_update_event,
+    'DELETE_EVENT': prepare_delete_event,
+}
+
+SINGLE_HANDLERS = {
+    'CREATE_EVENT': handle_create_event_sqs,
+    'UPDATE_EVENT': handle_update_event_sqs,
+    'DELETE_EVENT': handle_delete_event_sqs,
+}
+
+
+def _record_message_id(record, index):
+    return record.get('messageId') or f"record-{index}"
+
+
+def decode_sqs_record(record):
+    """
+    Returns the decoded JSON body of an SQS record.
+    Raises ValueError for a missing body and json.JSONDecodeError for an invalid one.
     """
     lambda_name = "GoogleCalendarSyncLambda"
-    logger.info(f"Received SQS event for {lambda_name}: {json.dumps(event)}")
+    message_body_str = record.get('body')
+    if not message_body_str:
+        logger.error(f"[{lambda_name}] SQS record missing 'body'. Record: {record}")
+        raise ValueError("SQS record missing 'body'.")
+    logger.info(f"[{lambda_name}] Raw SQS message body: {message_body_str}")
+    return json.loads(message_body_str)
+
+
+def log_record_failure(error, message_body_str):
+    lambda_name = "GoogleCalendarSyncLambda"
+    if isinstance(error, json.JSONDecodeError):
+        logger.error(f"[{lambda_name}] Failed to decode JSON from SQS message body: {message_body_str}. Error: {error}", exc_info=True)
+    elif isinstance(error, ValueError): # For missing fields or data validation errors
+        logger.error(f"[{lambda_name}] Data validation error processing SQS message: {error}. Message body: {message_body_str}", exc_info=True)
+    else: # Catch-all for other unexpected errors during processing of a single message
+        logger.error(f"[{lambda_name}] Unexpected error processing SQS message: {error}. Message body: {message_body_str}", exc_info=True)
 
-    if not all([APPOINTMENTS_TABLE_NAME, SERVICES_TABLE_NAME, LOCATIONS_TABLE_NAME]):
-        logger.fatal(f"[{lambda_name}] Missing one or more critical environment variables for table names. Exiting.")
-        # This is a configuration error, returning error to SQS might cause infinite retries if not handled by DLQ.
-        # For Lambda, raising an exception after logging is often the best way to signal failure.
-        raise EnvironmentError("Missing critical table name environment variables.")
 
+def decode_sqs_records(records):
+    """
+    Decodes every SQS record. Returns (entries, failed_message_ids) where entries is a list of
+    (message_id, message_data) in arrival order.
+    """
+    entries = []
+    failed_message_ids = []
+    for index, record in enumerate(records):
+        message_id = _record_message_id(record, index)
+        try:
+            entries.append((message_id, decode_sqs_record(record)))
+        except Exception as e:
+            log_record_failure(e, record.get('body'))
+            failed_message_ids.append(message_id)
+    return entries, failed_message_ids
+
+
+def process_messages_batched(entries):
+    """
+    Validates every message first, then sends all inserts and deletes in the batch to Google
+    as batch requests (up to GOOGLE_CALENDAR_BATCH_SIZE sub-requests, split by calendar).
+    Returns (processed_messages, failed_message_ids).
+    """
+    lambda_name = "GoogleCalendarSyncLambda"
     processed_messages = 0
-    failed_messages = 0
+    failed_message_ids = []
+    pending_ops = []
 
-    for record in event.get('Records', []):
+    # 1. Validate every message, resolving the target calendar for each action
+    for message_id, message_data in entries:
         try:
-            message_body_str = record.get('body')
-            if not message_body_str:
-                logger.error(f"[{lambda_name}] SQS record missing 'body'. Record: {record}")
-                failed_messages += 1
-                continue 
-            
-            logger.info(f"[{lambda_name}] Raw SQS message body: {message_body_str}")
-            message_data = json.loads(message_body_str)
-            
             action = message_data.get('action')
             booking_id_log = message_data.get('bookingId', 'UnknownBookingID') # For logging before action dispatch
 
             logger.info(f"[{lambda_name}] Processing action '{action}' for bookingId: {booking_id_log}")
 
-            if action == 'CREATE_EVENT':
-                handle_create_event_sqs(message_data)
-            elif action == 'DELETE_EVENT':
-                handle_delete_event_sqs(message_data)
-            else:
+            prepare_handler = PREPARE_HANDLERS.get(action)
+            if prepare_handler is None:
                 logger.warning(f"[{lambda_name}] Unknown action '{action}' in SQS message for bookingId {booking_id_log}. Message: {json.dumps(message_data)}")
-                failed_messages += 1
+                failed_message_ids.append(message_id)
                 continue # Skip to next message
-            
+
+            op = prepare_handler(message_data)
+            if op is None: # Nothing to send to Google for this message
+                processed_messages += 1
+                continue
+            op['opId'] = message_id
+            pending_ops.append(op)
+        except Exception as e:
+            log_record_failure(e, json.dumps(message_data))
+            failed_message_ids.append(message_id)
+
+    # 2. Send all calendar writes as batch requests and map the results back to their messages
+    if pending_ops:
+        try:
+            results = execute_calendar_ops(get_calendar_service(), pending_ops, get_batch_uri(), GOOGLE_CALENDAR_BATCH_SIZE,
+                                           google_rate_limiter)
+        except Exception as e:
+            logger.error(f"[{lambda_name}] Failed to execute Google Calendar batch requests: {e}", exc_info=True)
+            results = {op['opId']: {"bookingId": op['bookingId'], "action": op['action'], "eventId": None, "error": e} for op in pending_ops}
+
+        for op in pending_ops:
+            result = results[op['opId']]
+            if result['error'] is not None:
+                logger.error(f"[{lambda_name}-{op['action']}] Google Calendar request failed for booking {op['bookingId']}: {result['error']}")
+                failed_message_ids.append(op['opId'])
+                continue
+            if op['action'] == 'CREATE_EVENT':
+                try:
+                    record_created_event(op['bookingId'], result['eventId'])
+                except Exception:
+                    failed_message_ids.append(op['opId'])
+                    continue
+            elif op['action'] == 'UPDATE_EVENT':
+                logger.info(f"[{lambda_name}-UPDATE_EVENT] Moved event {op['eventId']} for booking {op['bookingId']}.")
+            else:
+                logger.info(f"[{lambda_name}-DELETE_EVENT] Successfully processed delete for event {op['eventId']} in booking {op['bookingId']}.")
             processed_messages += 1
-            # If partial batch processing fails, SQS will retry the whole batch by default.
-            # Successful messages in a batch should ideally be idempotent or handled carefully.
-
-        except json.JSONDecodeError as e:
-            logger.error(f"[{lambda_name}] Failed to decode JSON from SQS message body: {message_body_str}. Error: {e}", exc_info=True)
-            failed_messages += 1
-        except ValueError as e: # For missing fields or data validation errors
-            logger.error(f"[{lambda_name}] Data validation error processing SQS message: {e}. Message body: {message_body_str}", exc_info=True)
-            failed_messages += 1
-        except Exception as e: # Catch-all for other unexpected errors during processing of a single message
-            logger.error(f"[{lambda_name}] Unexpected error processing SQS message: {e}. Message body: {message_body_str}", exc_info=True)
-            failed_messages += 1
-            # Depending on SQS configuration, this might lead to retries for the message.
-
-    logger.info(f"[{lambda_name}] Processing complete. Processed: {processed_messages}, Failed: {failed_messages}.")
-
-    # For SQS, if any message fails, you might want the Lambda invocation to fail to leverage SQS retry/DLQ.
-    # However, standard behavior is that if the handler completes without an exception, SQS considers the batch successful.
-    # To signal SQS to retry the entire batch (if ReportBatchItemFailures is not configured on the event source mapping),
-    # an exception should be raised if failed_messages > 0.
-    # If ReportBatchItemFailures is enabled, then failed messages are returned in a specific format.
-    # For simplicity here, we'll log failures. The SQS trigger configuration (batch size, retries, DLQ) is key.
-    
-    # This lambda currently doesn't return a body, which is fine for SQS triggers if no batch item failure reporting is used.
-    # If batch item failure reporting *is* used, the return value needs to be:
-    # { "batchItemFailures": [ { "itemIdentifier": "messageIdOfFailedMessage" }, ... ] }
-    # For now, assuming no batch item failure reporting or that DLQ handles persistent errors.
+
+    return processed_messages, failed_message_ids
+
+
+def process_message(message_data):
+    """
+    Processes one decoded message end-to-end with single API calls. Returns True on success.
+    """
+    lambda_name = "GoogleCalendarSyncLambda"
+    action = message_data.get('action')
+    booking_id_log = message_data.get('bookingId', 'UnknownBookingID')
+    logger.info(f"[{lambda_name}] Processing action '{action}' for bookingId: {booking_id_log}")
+
+    handler = SINGLE_HANDLERS.get(action)
+    if handler is None:
+        logger.warning(f"[{lambda_name}] Unknown action '{action}' in SQS message for bookingId {booking_id_log}. Message: {json.dumps(message_data)}")
+        return False
+    try:
+        handler(message_data)
+    except Exception as e:
+        log_record_failure(e, json.dumps(message_data))
+        return False
+    return True
+
+
+async def process_messages_async(entries, max_concurrency):
+    """
+    Processes messages concurrently on a bounded thread pool. Messages are chained per bookingId,
+    so actions for the same booking run one after another in arrival order, while independent
+    bookings overlap. If an action fails, later actions for that booking are not attempted
+    and are reported as failed so SQS redelivers them in order.
+    Returns (processed_messages, failed_message_ids).
+    """
+    lambda_name = "GoogleCalendarSyncLambda"
+    chains = {}  # bookingId (or messageId when absent) -> [(message_id, message_data)] in arrival order
+    for message_id, message_data in entries:
+        chain_key = message_data.get('bookingId') or message_id
+        chains.setdefault(chain_key, []).append((message_id, message_data))
+
+    max_concurrency = max(1, max_concurrency)
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        async def run_chain(chain):
+            outcomes = []
+            chain_failed = False
+            for message_id, message_data in chain:
+                if chain_failed:
+                    logger.warning(f"[{lambda_name}] Skipping message {message_id}: an earlier action for booking {message_data.get('bookingId')} failed.")
+                    outcomes.append((message_id, False))
+                    continue
+                async with semaphore:
+                    succeeded = await loop.run_in_executor(executor, process_message, message_data)
+                outcomes.append((message_id, succeeded))
+                chain_failed = not succeeded
+            return outcomes
+
+        chain_outcomes = await asyncio.gather(*(run_chain(chain) for chain in chains.values()))
+
+    processed_messages = 0
+    failed_message_ids = []
+    for outcomes in chain_outcomes:
+        for message_id, succeeded in outcomes:
+            if succeeded:
+                processed_messages += 1
+            else:
+                failed_message_ids.append(message_id)
+    return processed_messages, failed_message_ids
+
+
+# --- Inbound sync (Google Calendar -> BusyIntervalsTable) ---
+def is_inbound_sync_event(event):
+    """Inbound sync runs on the EventBridge schedule, or when invoked with {"action": "INBOUND_SYNC"}."""
+    return event.get('source') == 'aws.events' or event.get('action') == 'INBOUND_SYNC'
+
+
+def list_synced_locations(locations_table, location_ids=None):
+    """Returns the location items that have a Google Calendar, either the given ones or all of them (Scan)."""
+    if location_ids:
+        items = [locations_table.get_item(Key={'locationId': location_id}).get('Item') for location_id in location_ids]
+    else:
+        items = []
+        scan_args = {}
+        while True:
+            response = locations_table.scan(**scan_args)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return [item for item in items if item and item.get('googleCalendarId')]
+
+
+def save_calendar_sync_token(locations_table, location_id, sync_token):
+    locations_table.update_item(
+        Key={'locationId': location_id},
+        UpdateExpression="SET calendarSyncToken = :sync_token, calendarSyncedAt = :synced_at",
+        ExpressionAttributeValues={
+            ':sync_token': sync_token,
+            ':synced_at': datetime.datetime.utcnow().isoformat()
+        }
+    )
+
+
+def handle_inbound_sync(event):
+    """
+    Pulls the changes made on each location calendar since the last run (events.list with the
+    nextSyncToken stored on the location) into BUSY_INTERVALS_TABLE_NAME.
+    A location whose sync fails keeps its previous token and is retried on the next run.
+    """
+    lambda_name = "GoogleCalendarSyncLambda"
+    if not all([LOCATIONS_TABLE_NAME, BUSY_INTERVALS_TABLE_NAME]):
+        logger.fatal(f"[{lambda_name}] LOCATIONS_TABLE_NAME and BUSY_INTERVALS_TABLE_NAME are required for inbound sync.")
+        raise EnvironmentError("Missing table name environment variables for inbound sync.")
+
+    locations_table = dynamodb.Table(LOCATIONS_TABLE_NAME)
+    busy_table = dynamodb.Table(BUSY_INTERVALS_TABLE_NAME)
+    service = get_calendar_service()
+
+    synced_locations = []
+    failed_locations = []
+    for location in list_synced_locations(locations_table, event.get('locationIds')):
+        location_id = location['locationId']
+        calendar_id = location['googleCalendarId']
+        try:
+            next_sync_token, stats = sync_calendar_busy_intervals(
+                service, busy_table, calendar_id, location_id, location.get('calendarSyncToken'),
+                partial(execute_google_request, calendar_id=calendar_id)
+            )
+            save_calendar_sync_token(locations_table, location_id, next_sync_token)
+            synced_locations.append(location_id)
+            logger.info(f"[{lambda_name}] Inbound sync of calendar {calendar_id} for location {location_id} done: "
+                        f"{stats['upserted']} upserted, {stats['removed']} removed, full sync: {stats['fullSync']}.")
+        except Exception as e:
+            failed_locations.append(location_id)
+            logger.error(f"[{lambda_name}] Inbound sync of calendar {calendar_id} for location {location_id} failed: {e}", exc_info=True)
+
+    return {
+        "status": "completed",
+        "synced_locations": synced_locations,
+        "failed_locations": failed_locations
+    }
+
+
+# --- Reconciliation (AppointmentsTable <-> Google Calendar) ---
+def handle_reconciliation(event):
+    """
+    Finds drift between confirmed bookings and their calendar events, per location, and queues
+    corrective CREATE_EVENT / DELETE_EVENT messages on the sync queue.
+    Optional event fields: locationIds, rangeStart and rangeEnd (ISO 8601, default now .. now + RECONCILIATION_RANGE_DAYS).
+    """
+    lambda_name = "GoogleCalendarSyncLambda"
+    if not all([APPOINTMENTS_TABLE_NAME, LOCATIONS_TABLE_NAME, GOOGLE_CALENDAR_SYNC_SQS_URL]):
+        logger.fatal(f"[{lambda_name}] APPOINTMENTS_TABLE_NAME, LOCATIONS_TABLE_NAME and GOOGLE_CALENDAR_SYNC_SQS_URL are required for reconciliation.")
+        raise EnvironmentError("Missing environment variables for reconciliation.")
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    range_start = to_utc_iso({'dateTime': event.get('rangeStart') or now.isoformat()})
+    range_end = to_utc_iso({'dateTime': event.get('rangeEnd') or (now + datetime.timedelta(days=RECONCILIATION_RANGE_DAYS)).isoformat()})
+
+    appointments_table = dynamodb.Table(APPOINTMENTS_TABLE_NAME)
+    locations_table = dynamodb.Table(LOCATIONS_TABLE_NAME)
+    service = get_calendar_service()
+
+    reconciled_locations = {}
+    failed_locations = []
+    for location in list_synced_locations(locations_table, event.get('locationIds')):
+        location_id = location['locationId']
+        counts = {"CREATE_EVENT": 0, "DELETE_EVENT": 0}
+
+        def counted(messages):
+            for message in messages:
+                counts[message['action']] += 1
+                yield message
+
+        try:
+            messages = reconcile_location(service, appointments_table, location_id, location['googleCalendarId'],
+                                          range_start, range_end,
+                                          partial(execute_google_request, calendar_id=location['googleCalendarId']),
+                                          settled_before=now - datetime.timedelta(minutes=RECONCILIATION_GRACE_MINUTES))
+            sent, failed = send_messages_in_batches(sqs, GOOGLE_CALENDAR_SYNC_SQS_URL, counted(messages))
+            reconciled_locations[location_id] = {"creates": counts["CREATE_EVENT"], "deletes": counts["DELETE_EVENT"],
+                                                 "sent": sent, "failed": failed}
+            logger.info(f"[{lambda_name}] Reconciled location {location_id} from {range_start} to {range_end}: "
+                        f"{counts['CREATE_EVENT']} creates, {counts['DELETE_EVENT']} deletes queued ({failed} failed to send).")
+        except Exception as e:
+            failed_locations.append(location_id)
+            logger.error(f"[{lambda_name}] Reconciliation of location {location_id} failed: {e}", exc_info=True)
+
+    return {
+        "status": "completed",
+        "reconciled_locations": reconciled_locations,
+        "failed_locations": failed_locations
+    }
+
+
+def lambda_handler(event, context):
+    """
+    Main Lambda handler for Google Calendar synchronization.
+    {"action": "RECONCILE"} runs the reconciliation job and scheduled events run the inbound sync.
+    SQS batches are decoded, folded per booking, then processed in the configured SYNC_EXECUTION_MODE.
+    """
+    lambda_name = "GoogleCalendarSyncLambda"
+    if event.get('action') == 'RECONCILE':
+        logger.info(f"Received reconciliation event for {lambda_name}: {json.dumps(event)}")
+        return handle_reconciliation(event)
+    if is_inbound_sync_event(event):
+        logger.info(f"Received inbound sync event for {lambda_name}: {json.dumps(event)}")
+        return handle_inbound_sync(event)
+
+    logger.info(f"Received SQS event for {lambda_name}: {json.dumps(event)}")
+
+    if not all([APPOINTMENTS_TABLE_NAME, SERVICES_TABLE_NAME, LOCATIONS_TABLE_NAME]):
+        logger.fatal(f"[{lambda_name}] Missing one or more critical environment variables for table names. Exiting.")
+        # This is a configuration error, returning error to SQS might cause infinite retries if not handled by DLQ.
+        # For Lambda, raising an exception after logging is often the best way to signal failure.
+        raise EnvironmentError("Missing critical table name environment variables.")
+
+    entries, failed_message_ids = decode_sqs_records(event.get('Records', []))
+
+    # Fold CREATE/DELETE pairs and repeats for the same booking so they never reach Google
+    entries, coalesced_message_ids = coalesce_calendar_actions(entries)
+
+    if SYNC_EXECUTION_MODE == 'async':
+        processed_messages, mode_failed_message_ids = asyncio.run(process_messages_async(entries, SYNC_MAX_CONCURRENCY))
+    else:
+        processed_messages, mode_failed_message_ids = process_messages_batched(entries)
+    failed_message_ids.extend(mode_failed_message_ids)
+    # Coalesced messages are fully handled by folding and count as processed
+    processed_messages += len(coalesced_message_ids)
+
+    failed_messages = len(failed_message_ids)
+    logger.info(f"[{lambda_name}] Processing complete ({SYNC_EXECUTION_MODE} mode). Processed: {processed_messages} "
+                f"(coalesced: {len(coalesced_message_ids)}), Failed: {failed_messages}.")
+
+    # batchItemFailures is honoured when ReportBatchItemFailures is enabled on the event source mapping,
+    # so only the failed messages are retried; otherwise SQS ignores it and the DLQ handles persistent errors.
     return {
         "status": "completed",
         "processed_messages": processed_messages,
-        "failed_messages": failed_messages
+        "coalesced_messages": len(coalesced_message_ids),
+        "failed_messages": failed_messages,
+        "batchItemFailures": [{"itemIdentifier": message_id} for message_id in failed_message_ids]
     }
 
 
@@ -280,6 +799,15 @@ if __name__ == '__main__':
     os.environ['APPOINTMENTS_TABLE_NAME'] = "MockAppointmentsTable"
     os.environ['SERVICES_TABLE_NAME'] = "MockServicesTable"
     os.environ['LOCATIONS_TABLE_NAME'] = "MockLocationsTable"
+    APPOINTMENTS_TABLE_NAME = os.environ['APPOINTMENTS_TABLE_NAME']
+    SERVICES_TABLE_NAME = os.environ['SERVICES_TABLE_NAME']
+    LOCATIONS_TABLE_NAME = os.environ['LOCATIONS_TABLE_NAME']
+
+    # Run against a local fake Google Calendar server instead of the real API
+    from fake_calendar_server import FakeCalendarServer
+    fake_calendar_server = FakeCalendarServer().start()
+    fake_calendar_server.add_calendar("clinic_main_st@group.calendar.google.com")
+    GOOGLE_CALENDAR_API_ROOT = fake_calendar_server.root_url
 
     # Mock Boto3 resources/tables for local testing
     class MockDynamoDBTable:
@@ -418,59 +946,4 @@ if __name__ == '__main__':
 
     # Restore original boto3.resource
     boto3.resource = _original_boto3_resource
-        return {
-            "statusCode": 500,
-            "headers": {"Content-Type": "application/json"},
-            "body": json.dumps({"error": f"An internal server error occurred in {lambda_name}."})
-        }
-
-if __name__ == '__main__':
-    logging.basicConfig(level=logging.INFO)
-    
-    # Test events
-    test_event_create = {
-        "action": "create_event",
-        "data": {
-            "calendarId": "primary",
-            "eventBody": {
-                "summary": "Test Event from Lambda",
-                "description": "This is a test event.",
-                "start": {"dateTime": "2024-09-01T10:00:00-07:00", "timeZone": "America/Los_Angeles"},
-                "end": {"dateTime": "2024-09-01T11:00:00-07:00", "timeZone": "America/Los_Angeles"}
-            }
-        }
-    }
-    print("\n--- Testing create_event ---")
-    response = lambda_handler(test_event_create, {})
-    print(json.dumps(response, indent=2))
-
-    test_event_check = {
-        "action": "check_availability",
-        "data": {
-            "calendarId": "primary",
-            "timeMin": "2024-09-01T00:00:00Z",
-            "timeMax": "2024-09-02T00:00:00Z"
-        }
-    }
-    print("\n--- Testing check_availability ---")
-    response = lambda_handler(test_event_check, {})
-    print(json.dumps(response, indent=2))
-
-    test_event_delete = {
-        "action": "delete_event",
-        "data": {
-            "calendarId": "primary",
-            "eventId": "some_dummy_event_id_to_delete"
-        }
-    }
-    print("\n--- Testing delete_event ---")
-    response = lambda_handler(test_event_delete, {})
-    print(json.dumps(response, indent=2))
-
-    test_event_unknown = {
-        "action": "unknown_action",
-        "data": {}
-    }
-    print("\n--- Testing unknown_action ---")
-    response = lambda_handler(test_event_unknown, {})
-    print(json.dumps(response, indent=2))
+    fake_calendar_server.stop()
@@ -0,0 +1,241 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from boto3.dynamodb.conditions import Key, Attr
+
+try:
+    from .inbound_sync import to_utc_iso
+except ImportError:  # Deployed flat in the Lambda package
+    from inbound_sync import to_utc_iso
+
+# Initialize logger
+logger = logging.getLogger()
+
+# Private extended property holding the bookingId on every event created for a booking.
+BOOKING_EVENT_PROPERTY = 'bookingId'
+LOCATION_TIME_INDEX = 'LocationTimeIndex'
+EVENTS_PAGE_SIZE = 250
+# SQS accepts at most 10 entries per SendMessageBatch call.
+SQS_SEND_BATCH_SIZE = 10
+# Bookings are read one window at a time and sorted by UTC start in memory. LocationTimeIndex sorts
+# proposedStartTime as stored, and older bookings carry the client's offset ('...T10:00:00-04:00'),
+# so each window's query is widened by the largest UTC offset (UTC+14) on both sides.
+BOOKING_WINDOW = timedelta(days=1)
+MAX_UTC_OFFSET = timedelta(hours=14)
+
+
+def event_booking_id(event):
+    """
+    Returns the bookingId an event was created for, or None for events that do not belong to a booking
+    (e.g. time blocked by staff). Events created before the extended property was set are recognised
+    by the 'Booking ID: ...' line of their description.
+    """
+    private_properties = event.get('extendedProperties', {}).get('private', {})
+    if private_properties.get(BOOKING_EVENT_PROPERTY):
+        return private_properties[BOOKING_EVENT_PROPERTY]
+    description = event.get('description') or ''
+    if 'Booking ID: ' in description:
+        return description.rsplit('Booking ID: ', 1)[1].strip() or None
+    return None
+
+
+def _booking_start(booking):
+    return to_utc_iso({'dateTime': booking['proposedStartTime']})
+
+
+def _event_start(event):
+    return to_utc_iso(event['start'])
+
+
+def _changed_after(booking, settled_before):
+    """True when the booking was confirmed or moved after settled_before, so its own sync message may still be in flight."""
+    updated_at = booking.get('updatedAt')
+    if settled_before is None or not updated_at:
+        return False
+    try:
+        return datetime.fromisoformat(updated_at.replace('Z', '+00:00')) > settled_before
+    except ValueError:
+        return False
+
+
+def _query_confirmed_bookings(appointments_table, location_id, low, high):
+    """Yields the confirmed bookings whose stored proposedStartTime is BETWEEN low and high, page by page."""
+    query_args = {
+        "IndexName": LOCATION_TIME_INDEX,
+        "KeyConditionExpression": Key('locationId').eq(location_id) & Key('proposedStartTime').between(low, high),
+        "FilterExpression": Attr('status').eq('confirmed')
+    }
+    while True:
+        response = appointments_table.query(**query_args)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        query_args["ExclusiveStartKey"] = response['LastEvaluatedKey']
+
+
+def stream_confirmed_bookings(appointments_table, location_id, range_start, range_end, window=BOOKING_WINDOW):
+    """
+    Yields the confirmed bookings of a location starting in [range_start, range_end), ordered by their
+    UTC start. The range is read one window at a time, so only one window of bookings is held in memory.
+    """
+    def utc(value):
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+    def as_key(moment):
+        return moment.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    window_start, range_end_dt = utc(range_start), utc(range_end)
+    while window_start < range_end_dt:
+        window_end = min(window_start + window, range_end_dt)
+        low, high = as_key(window_start), as_key(window_end)
+        in_window = [booking for booking in _query_confirmed_bookings(appointments_table, location_id,
+                                                                      as_key(window_start - MAX_UTC_OFFSET),
+                                                                      as_key(window_end + MAX_UTC_OFFSET))
+                     if low <= _booking_start(booking) < high]
+        yield from sorted(in_window, key=_booking_start)
+        window_start = window_end
+
+
+def stream_booking_events(service, calendar_id, range_start, range_end, execute_request, page_size=EVENTS_PAGE_SIZE):
+    """
+    Yields the events of a calendar that belong to bookings and start in [range_start, range_end),
+    ordered by start time, one events.list page at a time.
+    """
+    list_args = {
+        "calendarId": calendar_id,
+        "timeMin": range_start,
+        "timeMax": range_end,
+        "singleEvents": True,
+        "orderBy": "startTime",
+        "maxResults": page_size
+    }
+    while True:
+        page = execute_request(service.events().list(**list_args))
+        for event in page.get('items', []):
+            # timeMin matches on the end time, so events already running at range_start are listed too
+            if event.get('status') != 'cancelled' and event_booking_id(event) and _event_start(event) >= range_start:
+                yield event
+        if not page.get('nextPageToken'):
+            return
+        list_args["pageToken"] = page['nextPageToken']
+
+
+def merge_join(bookings, events):
+    """
+    Merge-joins two streams sorted by start time. Yields (start_time, bookings, events) for each start time
+    present in either stream; only the items sharing one start time are held in memory.
+    """
+    booking_groups = groupby(bookings, key=_booking_start)
+    event_groups = groupby(events, key=_event_start)
+    booking_group = next(booking_groups, None)
+    event_group = next(event_groups, None)
+    while booking_group or event_group:
+        if event_group is None or (booking_group and booking_group[0] < event_group[0]):
+            yield booking_group[0], list(booking_group[1]), []
+            booking_group = next(booking_groups, None)
+        elif booking_group is None or event_group[0] < booking_group[0]:
+            yield event_group[0], [], list(event_group[1])
+            event_group = next(event_groups, None)
+        else:
+            yield booking_group[0], list(booking_group[1]), list(event_group[1])
+            booking_group = next(booking_groups, None)
+            event_group = next(event_groups, None)
+
+
+def diff_start_time_group(location_id, bookings, events, settled_before=None, find_booking=None):
+    """
+    Compares the bookings and events sharing a start time and returns the corrective messages:
+    CREATE_EVENT for a booking with no matching event, DELETE_EVENT for an event with no matching booking.
+    A booking matches the event named by its googleCalendarEventId, or an event created for it that was
+    never linked back to the booking. Bookings updated after settled_before get no CREATE_EVENT: the one
+    sent when they were confirmed or rescheduled may still be queued or retrying, and would duplicate it.
+    Likewise an unmatched event whose booking (loaded with find_booking(bookingId)) changed after
+    settled_before gets no DELETE_EVENT: a rescheduled booking's UPDATE_EVENT may still be on its way
+    to move that event.
+    """
+    unmatched_events = {event['id']: event for event in events}
+    messages = []
+    for booking in bookings:
+        event_id = booking.get('googleCalendarEventId')
+        if event_id in unmatched_events:
+            del unmatched_events[event_id]
+            continue
+        unlinked = [candidate_id for candidate_id, event in unmatched_events.items() if event_booking_id(event) == booking['bookingId']]
+        if unlinked:
+            del unmatched_events[unlinked[0]]
+            continue
+        if _changed_after(booking, settled_before):
+            logger.info(f"[Reconciliation] Booking {booking['bookingId']} changed at {booking['updatedAt']}, leaving its event to the pending sync.")
+            continue
+        client_details = booking.get("clientDetails", {})
+        messages.append({
+            "bookingId": booking['bookingId'],
+            "action": "CREATE_EVENT",
+            "serviceId": booking.get("serviceId"),
+            "locationId": location_id,
+            "proposedStartTime": booking.get("proposedStartTime"),
+            "proposedEndTime": booking.get("proposedEndTime"),
+            "clientName": client_details.get("name"),
+            "clientEmail": client_details.get("email")
+        })
+    for event_id, event in unmatched_events.items():
+        booking_id = event_booking_id(event)
+        if settled_before is not None and find_booking is not None and _changed_after(find_booking(booking_id) or {}, settled_before):
+            logger.info(f"[Reconciliation] Booking {booking_id} of event {event_id} changed recently, leaving the event to the pending sync.")
+            continue
+        messages.append({
+            "bookingId": booking_id,
+            "action": "DELETE_EVENT",
+            "locationId": location_id,
+            "googleCalendarEventId": event_id
+        })
+    return messages
+
+
+def reconcile_location(service, appointments_table, location_id, calendar_id, range_start, range_end, execute_request,
+                       settled_before=None):
+    """
+    Yields the corrective sync messages for one location over [range_start, range_end) (UTC, 'YYYY-MM-DDTHH:MM:SSZ').
+    Bookings updated after settled_before (a timezone-aware datetime) are not recreated yet, and their
+    stray events are not deleted yet.
+    Both sides are streamed in start-time order, so memory does not grow with the length of the range.
+    """
+    def find_booking(booking_id):
+        return appointments_table.get_item(Key={'bookingId': booking_id}).get('Item')
+
+    bookings = stream_confirmed_bookings(appointments_table, location_id, range_start, range_end)
+    events = stream_booking_events(service, calendar_id, range_start, range_end, execute_request)
+    for _, booking_group, event_group in merge_join(bookings, events):
+        for message in diff_start_time_group(location_id, booking_group, event_group, settled_before, find_booking):
+            yield message
+
+
+def send_messages_in_batches(sqs_client, queue_url, messages, batch_size=SQS_SEND_BATCH_SIZE):
+    """
+    Sends messages to SQS with SendMessageBatch, holding at most one batch in memory.
+    Returns (sent, failed) counts; entries rejected by SQS are logged and counted as failed.
+    """
+    sent = 0
+    failed = 0
+
+    def flush(batch):
+        response = sqs_client.send_message_batch(
+            QueueUrl=queue_url,
+            Entries=[{"Id": str(index), "MessageBody": json.dumps(message)} for index, message in enumerate(batch)]
+        )
+        for failure in response.get('Failed', []):
+            logger.error(f"[Reconciliation] SQS rejected {batch[int(failure['Id'])]}: {failure.get('Message')}")
+        return len(response.get('Successful', [])), len(response.get('Failed', []))
+
+    batch = []
+    for message in messages:
+        batch.append(message)
+        if len(batch) == batch_size:
+            batch_sent, batch_failed = flush(batch)
+            sent, failed, batch = sent + batch_sent, failed + batch_failed, []
+    if batch:
+        batch_sent, batch_failed = flush(batch)
+        sent, failed = sent + batch_sent, failed + batch_failed
+    return sent, failed
@@ -0,0 +1,599 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import json
+import os
+import time
+import datetime
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1') # boto3 clients are created at import time
+
+# Import the Lambda function to test
+from backend.google_calendar_sync_lambda import lambda_function
+from backend.google_calendar_sync_lambda.fake_calendar_server import FakeCalendarServer
+from backend.google_calendar_sync_lambda.inbound_sync import sync_calendar_busy_intervals
+from backend.common.google_rate_limiter import GoogleApiRateLimiter, TokenBucket
+
+CALENDAR_MAIN = "clinic_main_st@group.calendar.google.com"
+CALENDAR_UPTOWN = "uptown@group.calendar.google.com"
+
+
+class InMemoryBusyTable:
+    """Minimal stand-in for the BusyIntervalsTable resource (key: googleCalendarId + eventId)."""
+
+    def __init__(self):
+        self.items = {}
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def put_item(self, Item):
+        self.items[(Item['googleCalendarId'], Item['eventId'])] = Item
+
+    def delete_item(self, Key):
+        self.items.pop((Key['googleCalendarId'], Key['eventId']), None)
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues, **kwargs):
+        calendar_id = ExpressionAttributeValues[':calendar_id']
+        return {'Items': [item for (item_calendar, _), item in self.items.items() if item_calendar == calendar_id]}
+
+    def intervals(self, calendar_id):
+        return {item['eventId']: (item['startTime'], item['endTime'])
+                for (item_calendar, _), item in self.items.items() if item_calendar == calendar_id}
+
+
+class TestGoogleCalendarSyncLambda(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeCalendarServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.reset()
+        self.server.add_calendar(CALENDAR_MAIN)
+        self.server.add_calendar(CALENDAR_UPTOWN)
+
+        # Mock DynamoDB tables
+        self.mock_appointments_table = MagicMock()
+        self.mock_appointments_table.get_item.return_value = {'Item': {'status': 'confirmed'}}  # Unless a test says otherwise
+        self.mock_services_table = MagicMock()
+        self.mock_services_table.get_item.return_value = {'Item': {'serviceId': 'service123', 'serviceName': 'Full Detail'}}
+        self.mock_locations_table = MagicMock()
+        locations = {
+            'locationABC': {'locationId': 'locationABC', 'locationName': 'Main Street', 'googleCalendarId': CALENDAR_MAIN},
+            'locationUP': {'locationId': 'locationUP', 'locationName': 'Uptown', 'googleCalendarId': CALENDAR_UPTOWN},
+            'locationGONE': {'locationId': 'locationGONE', 'locationName': 'Closed', 'googleCalendarId': 'missing@group.calendar.google.com'},
+        }
+        self.mock_locations_table.get_item.side_effect = lambda Key: {'Item': locations.get(Key['locationId'])}
+        self.mock_locations_table.scan.side_effect = lambda **kwargs: {'Items': [dict(item) for item in locations.values()]}
+
+        def update_location(Key, UpdateExpression, ExpressionAttributeValues):
+            locations[Key['locationId']]['calendarSyncToken'] = ExpressionAttributeValues[':sync_token']
+        self.mock_locations_table.update_item.side_effect = update_location
+        self.locations = locations
+        self.busy_table = InMemoryBusyTable()
+        self.mock_sqs = MagicMock()
+        # No pacing and no real backoff sleeps; sleeps are recorded instead
+        self.backoff_sleeps = []
+        self.rate_limiter = GoogleApiRateLimiter(TokenBucket(10000), max_retries=3, sleep=self.backoff_sleeps.append)
+        self.rate_limiter.emit_metrics = MagicMock()
+        self.mock_sqs.send_message_batch.side_effect = lambda QueueUrl, Entries: {'Successful': [{'Id': entry['Id']} for entry in Entries]}
+        tables = {
+            'mock_appointments_table': self.mock_appointments_table,
+            'mock_services_table': self.mock_services_table,
+            'mock_locations_table': self.mock_locations_table,
+            'mock_busy_intervals_table': self.busy_table,
+        }
+        mock_dynamodb = MagicMock()
+        mock_dynamodb.Table.side_effect = lambda name: tables[name]
+
+        patchers = [
+            patch.object(lambda_function, 'dynamodb', mock_dynamodb),
+            patch.object(lambda_function, 'APPOINTMENTS_TABLE_NAME', 'mock_appointments_table'),
+            patch.object(lambda_function, 'SERVICES_TABLE_NAME', 'mock_services_table'),
+            patch.object(lambda_function, 'LOCATIONS_TABLE_NAME', 'mock_locations_table'),
+            patch.object(lambda_function, 'BUSY_INTERVALS_TABLE_NAME', 'mock_busy_intervals_table'),
+            patch.object(lambda_function, 'GOOGLE_CALENDAR_SYNC_SQS_URL', 'mock_sync_queue_url'),
+            patch.object(lambda_function, 'sqs', self.mock_sqs),
+            patch.object(lambda_function, 'google_rate_limiter', self.rate_limiter),
+            patch.object(lambda_function, 'GOOGLE_CALENDAR_API_ROOT', self.server.root_url),
+            patch.object(lambda_function, '_calendar_service', None),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _create_message(self, booking_id, location_id='locationABC'):
+        return {
+            "action": "CREATE_EVENT",
+            "bookingId": booking_id,
+            "serviceId": "service123",
+            "locationId": location_id,
+            "proposedStartTime": "2024-09-01T10:00:00Z",
+            "proposedEndTime": "2024-09-01T11:00:00Z",
+            "clientName": "John Doe",
+            "clientEmail": "john.doe@example.com"
+        }
+
+    def _sqs_event(self, messages):
+        return {"Records": [{"messageId": f"msg{i}", "body": json.dumps(message)} for i, message in enumerate(messages)]}
+
+    def _linked_event_ids(self):
+        return {
+            call[1]['Key']['bookingId']: call[1]['ExpressionAttributeValues'][':gcal_id']
+            for call in self.mock_appointments_table.update_item.call_args_list
+        }
+
+    def test_creates_are_batched_per_calendar(self):
+        messages = [self._create_message(f"booking{i}") for i in range(3)] + [self._create_message("bookingUp", 'locationUP')]
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+
+        self.assertEqual(response['processed_messages'], 4)
+        self.assertEqual(response['batchItemFailures'], [])
+        # One HTTP request per calendar
+        self.assertEqual(len(self.server.http_requests()), 2)
+        self.assertEqual(len(self.server.events(CALENDAR_MAIN)), 3)
+        self.assertEqual(len(self.server.events(CALENDAR_UPTOWN)), 1)
+
+        # Each booking is linked to the event created for it
+        linked = self._linked_event_ids()
+        self.assertEqual(set(linked), {"booking0", "booking1", "booking2", "bookingUp"})
+        for event in self.server.events(CALENDAR_MAIN):
+            booking_id = event['description'].rsplit('Booking ID: ', 1)[1]
+            self.assertEqual(linked[booking_id], event['id'])
+
+    def test_batches_are_capped_at_50_sub_requests(self):
+        messages = [self._create_message(f"booking{i}") for i in range(60)]
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+
+        self.assertEqual(response['processed_messages'], 60)
+        self.assertEqual(len(self.server.http_requests()), 2)
+        self.assertEqual(len(self.server.events(CALENDAR_MAIN)), 60)
+
+    def test_failed_sub_request_is_reported_for_its_message_only(self):
+        messages = [self._create_message("bookingOk"), self._create_message("bookingBad", 'locationGONE')]
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+
+        self.assertEqual(response['processed_messages'], 1)
+        self.assertEqual(response['batchItemFailures'], [{"itemIdentifier": "msg1"}])
+        self.assertEqual(set(self._linked_event_ids()), {"bookingOk"})
+
+    def test_delete_of_already_deleted_event_succeeds(self):
+        existing = lambda_function.create_google_calendar_event(CALENDAR_MAIN, "t", "d", "2024-09-01T10:00:00Z", "2024-09-01T11:00:00Z")
+        delete_message = {"action": "DELETE_EVENT", "bookingId": "booking1", "googleCalendarEventId": existing, "locationId": "locationABC"}
+
+        response = lambda_function.lambda_handler(self._sqs_event([delete_message]), {})
+        self.assertEqual(response['processed_messages'], 1)
+        self.assertEqual(self.server.events(CALENDAR_MAIN), [])
+
+        response = lambda_function.lambda_handler(self._sqs_event([delete_message]), {})
+        self.assertEqual(response['processed_messages'], 1)
+        self.assertEqual(response['batchItemFailures'], [])
+
+    def test_actions_for_same_booking_are_sent_in_order(self):
+        existing = lambda_function.create_google_calendar_event(CALENDAR_MAIN, "t", "d", "2024-09-01T10:00:00Z", "2024-09-01T11:00:00Z")
+        self.server.request_log.clear()
+        messages = [
+            {"action": "DELETE_EVENT", "bookingId": "booking1", "googleCalendarEventId": existing, "locationId": "locationABC"},
+            self._create_message("booking1"),
+            self._create_message("booking2"),
+        ]
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+
+        self.assertEqual(response['processed_messages'], 3)
+        # The second action for booking1 waits for the first, booking2 rides along in the first batch
+        self.assertEqual(len(self.server.http_requests()), 2)
+        self.assertEqual(len(self.server.events(CALENDAR_MAIN)), 2)
+
+    def test_invalid_messages_are_reported_as_failures(self):
+        event = {"Records": [
+            {"messageId": "bad-json", "body": "not json"},
+            {"messageId": "unknown", "body": json.dumps({"action": "SOMETHING", "bookingId": "b"})},
+            {"messageId": "missing-field", "body": json.dumps({"action": "CREATE_EVENT", "bookingId": "b"})},
+        ]}
+        response = lambda_function.lambda_handler(event, {})
+
+        self.assertEqual(response['processed_messages'], 0)
+        self.assertEqual([f['itemIdentifier'] for f in response['batchItemFailures']], ["bad-json", "unknown", "missing-field"])
+        self.assertEqual(self.server.http_requests(), [])
+
+
+    @patch.object(lambda_function, 'SYNC_EXECUTION_MODE', 'async')
+    @patch.object(lambda_function, 'SYNC_MAX_CONCURRENCY', 8)
+    def test_async_mode_processes_independent_records_concurrently(self):
+        self.server.response_delay_seconds = 0.2
+        messages = [self._create_message(f"booking{i}") for i in range(8)]
+
+        started = time.monotonic()
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(response['processed_messages'], 8)
+        self.assertEqual(response['batchItemFailures'], [])
+        self.assertEqual(len(self.server.events(CALENDAR_MAIN)), 8)
+        self.assertEqual(len(self._linked_event_ids()), 8)
+        # Sequential processing would take at least 8 * 0.2s
+        self.assertLess(elapsed, 0.8)
+
+    @patch.object(lambda_function, 'SYNC_EXECUTION_MODE', 'async')
+    @patch.object(lambda_function, 'SYNC_MAX_CONCURRENCY', 8)
+    def test_async_mode_keeps_per_booking_order(self):
+        existing = lambda_function.create_google_calendar_event(CALENDAR_MAIN, "t", "d", "2024-09-01T10:00:00Z", "2024-09-01T11:00:00Z")
+        self.server.request_log.clear()
+        self.server.response_delay_seconds = 0.1
+        messages = [
+            {"action": "DELETE_EVENT", "bookingId": "booking1", "googleCalendarEventId": existing, "locationId": "locationABC"},
+            self._create_message("booking1"),
+        ]
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+
+        self.assertEqual(response['processed_messages'], 2)
+        self.assertEqual([method for method, _ in self.server.request_log], ['DELETE', 'POST'])
+
+    @patch.object(lambda_function, 'SYNC_EXECUTION_MODE', 'async')
+    def test_async_mode_skips_later_actions_after_a_failure(self):
+        messages = [
+            {"action": "DELETE_EVENT", "bookingId": "booking1", "googleCalendarEventId": "evt1", "locationId": "locationUNKNOWN"},
+            self._create_message("booking1"),
+            self._create_message("booking2"),
+        ]
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+
+        self.assertEqual(response['processed_messages'], 1)
+        self.assertEqual(sorted(f['itemIdentifier'] for f in response['batchItemFailures']), ["msg0", "msg1"])
+        # Only booking2 reached Google
+        self.assertEqual(len(self.server.events(CALENDAR_MAIN)), 1)
+        self.assertEqual(set(self._linked_event_ids()), {"booking2"})
+
+
+    def test_create_then_delete_in_same_batch_is_a_no_op(self):
+        messages = [
+            self._create_message("booking1"),
+            {"action": "DELETE_EVENT", "bookingId": "booking1", "locationId": "locationABC"},
+        ]
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+
+        self.assertEqual(response['processed_messages'], 2)
+        self.assertEqual(response['coalesced_messages'], 2)
+        self.assertEqual(response['batchItemFailures'], [])
+        self.assertEqual(self.server.http_requests(), [])
+        self.mock_appointments_table.update_item.assert_not_called()
+
+    def test_repeated_creates_collapse_into_one(self):
+        messages = [self._create_message("booking1") for _ in range(3)]
+        messages[-1]['notes'] = "latest"
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+
+        self.assertEqual(response['processed_messages'], 3)
+        self.assertEqual(response['coalesced_messages'], 2)
+        events = self.server.events(CALENDAR_MAIN)
+        self.assertEqual(len(events), 1)
+        self.assertIn("Notes: latest", events[0]['description'])
+        self.assertEqual(self._linked_event_ids(), {"booking1": events[0]['id']})
+
+    def test_cancellation_delete_of_synced_event_drops_pending_create(self):
+        existing = lambda_function.create_google_calendar_event(CALENDAR_MAIN, "t", "d", "2024-09-01T10:00:00Z", "2024-09-01T11:00:00Z")
+        self.server.request_log.clear()
+        messages = [
+            self._create_message("booking1"),
+            {"action": "DELETE_EVENT", "bookingId": "booking1", "googleCalendarEventId": existing, "locationId": "locationABC",
+             "source": "cancellation"},
+        ]
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+
+        self.assertEqual(response['processed_messages'], 2)
+        self.assertEqual(response['coalesced_messages'], 1)
+        self.assertEqual(self.server.events(CALENDAR_MAIN), [])
+        self.assertEqual(len(self.server.http_requests()), 1)
+
+    def test_create_for_a_booking_no_longer_confirmed_is_skipped(self):
+        self.mock_appointments_table.get_item.return_value = {'Item': {'bookingId': 'booking1', 'status': 'cancelled'}}
+        response = lambda_function.lambda_handler(self._sqs_event([self._create_message("booking1")]), {})
+
+        self.assertEqual(response['processed_messages'], 1)
+        self.assertEqual(response['batchItemFailures'], [])
+        self.assertEqual(self.server.http_requests(), [])
+        self.mock_appointments_table.update_item.assert_not_called()
+
+    def test_reconciliation_delete_of_stray_event_keeps_the_corrective_create(self):
+        stray = lambda_function.create_google_calendar_event(CALENDAR_MAIN, "t", "d", "2024-09-01T10:00:00Z", "2024-09-01T11:00:00Z")
+        messages = [
+            self._create_message("booking1"),
+            {"action": "DELETE_EVENT", "bookingId": "booking1", "googleCalendarEventId": stray, "locationId": "locationABC"},
+        ]
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+
+        self.assertEqual(response['processed_messages'], 2)
+        self.assertEqual(response['coalesced_messages'], 0)
+        events = self.server.events(CALENDAR_MAIN)
+        self.assertEqual(len(events), 1)
+        self.assertNotEqual(events[0]['id'], stray)
+        self.assertEqual(self._linked_event_ids(), {"booking1": events[0]['id']})
+
+    def test_delete_without_event_id_is_resolved_from_booking(self):
+        existing = lambda_function.create_google_calendar_event(CALENDAR_MAIN, "t", "d", "2024-09-01T10:00:00Z", "2024-09-01T11:00:00Z")
+        self.mock_appointments_table.get_item.return_value = {
+            'Item': {'bookingId': 'booking1', 'locationId': 'locationABC', 'googleCalendarEventId': existing}
+        }
+        response = lambda_function.lambda_handler(self._sqs_event([{"action": "DELETE_EVENT", "bookingId": "booking1"}]), {})
+
+        self.assertEqual(response['processed_messages'], 1)
+        self.assertEqual(self.server.events(CALENDAR_MAIN), [])
+
+        # A booking that never got an event has nothing to delete
+        self.server.request_log.clear()
+        self.mock_appointments_table.get_item.return_value = {'Item': {'bookingId': 'booking2', 'locationId': 'locationABC'}}
+        response = lambda_function.lambda_handler(self._sqs_event([{"action": "DELETE_EVENT", "bookingId": "booking2"}]), {})
+        self.assertEqual(response['processed_messages'], 1)
+        self.assertEqual(self.server.http_requests(), [])
+
+    def _inbound_sync(self, location_ids=('locationABC',)):
+        return lambda_function.lambda_handler({"action": "INBOUND_SYNC", "locationIds": list(location_ids)}, {})
+
+    def test_inbound_sync_initial_run_stores_busy_intervals_and_token(self):
+        blocked = self.server.add_event(CALENDAR_MAIN, "2099-03-02T09:00:00+02:00", "2099-03-02T10:30:00+02:00")
+        self.server.add_event(CALENDAR_MAIN, "2099-03-02T12:00:00Z", "2099-03-02T13:00:00Z", transparency="transparent")
+        self.server.add_event(CALENDAR_MAIN, "2000-01-01T12:00:00Z", "2000-01-01T13:00:00Z")  # Already over
+        all_day = self.server.add_event(CALENDAR_MAIN, {"date": "2099-03-03"}, {"date": "2099-03-04"})
+
+        response = lambda_function.lambda_handler({"source": "aws.events", "detail-type": "Scheduled Event"}, {})
+
+        self.assertIn("locationABC", response['synced_locations'])
+        self.assertEqual(response['failed_locations'], ["locationGONE"])
+        self.assertEqual(self.busy_table.intervals(CALENDAR_MAIN), {
+            blocked['id']: ("2099-03-02T07:00:00Z", "2099-03-02T08:30:00Z"),
+            all_day['id']: ("2099-03-03T00:00:00Z", "2099-03-04T00:00:00Z"),
+        })
+        self.assertTrue(self.locations['locationABC']['calendarSyncToken'])
+        self.assertNotIn('calendarSyncToken', self.locations['locationGONE'])
+
+    def test_inbound_sync_fetches_only_changes_since_last_token(self):
+        kept = self.server.add_event(CALENDAR_MAIN, "2099-03-02T09:00:00Z", "2099-03-02T10:00:00Z")
+        moved = self.server.add_event(CALENDAR_MAIN, "2099-03-02T11:00:00Z", "2099-03-02T12:00:00Z")
+        removed = self.server.add_event(CALENDAR_MAIN, "2099-03-02T13:00:00Z", "2099-03-02T14:00:00Z")
+        self._inbound_sync()
+
+        self.server.update_event(CALENDAR_MAIN, moved['id'], start={"dateTime": "2099-03-02T15:00:00Z"}, end={"dateTime": "2099-03-02T16:00:00Z"})
+        self.server.cancel_event(CALENDAR_MAIN, removed['id'])
+        added = self.server.add_event(CALENDAR_MAIN, "2099-03-05T09:00:00Z", "2099-03-05T10:00:00Z")
+        self.server.request_log.clear()
+        self._inbound_sync()
+
+        requests = self.server.http_requests()
+        self.assertEqual(len(requests), 1)
+        self.assertIn("syncToken=", requests[0][1])
+        self.assertEqual(self.busy_table.intervals(CALENDAR_MAIN), {
+            kept['id']: ("2099-03-02T09:00:00Z", "2099-03-02T10:00:00Z"),
+            moved['id']: ("2099-03-02T15:00:00Z", "2099-03-02T16:00:00Z"),
+            added['id']: ("2099-03-05T09:00:00Z", "2099-03-05T10:00:00Z"),
+        })
+
+    def test_inbound_sync_falls_back_to_full_sync_on_410(self):
+        kept = self.server.add_event(CALENDAR_MAIN, "2099-03-02T09:00:00Z", "2099-03-02T10:00:00Z")
+        removed = self.server.add_event(CALENDAR_MAIN, "2099-03-02T13:00:00Z", "2099-03-02T14:00:00Z")
+        self._inbound_sync()
+        stale_token = self.locations['locationABC']['calendarSyncToken']
+
+        # Google purged the deletion from its change log, so only the full listing reveals it
+        self.server.cancel_event(CALENDAR_MAIN, removed['id'])
+        self.server.calendars[CALENDAR_MAIN].pop(removed['id'])
+        self.server.expire_sync_tokens(CALENDAR_MAIN)
+        response = self._inbound_sync()
+
+        self.assertEqual(response['synced_locations'], ["locationABC"])
+        self.assertEqual(set(self.busy_table.intervals(CALENDAR_MAIN)), {kept['id']})
+        self.assertNotEqual(self.locations['locationABC']['calendarSyncToken'], stale_token)
+
+    def test_inbound_sync_follows_pages(self):
+        created = [self.server.add_event(CALENDAR_MAIN, f"2099-03-0{day}T09:00:00Z", f"2099-03-0{day}T10:00:00Z") for day in range(1, 6)]
+        service = lambda_function.get_calendar_service()
+        next_sync_token, stats = sync_calendar_busy_intervals(
+            service, self.busy_table, CALENDAR_MAIN, 'locationABC', None, lambda_function.execute_google_request, page_size=2
+        )
+
+        self.assertTrue(next_sync_token)
+        self.assertEqual(stats, {"upserted": 5, "removed": 0, "fullSync": True})
+        self.assertEqual(len(self.server.http_requests()), 3)
+        self.assertEqual(set(self.busy_table.intervals(CALENDAR_MAIN)), {event['id'] for event in created})
+
+    def _confirmed_bookings(self, bookings, page_size=2):
+        """Serves bookings from the LocationTimeIndex query in pages of page_size."""
+        def query(**kwargs):
+            offset = kwargs.get('ExclusiveStartKey', {}).get('offset', 0)
+            response = {'Items': bookings[offset:offset + page_size]}
+            if offset + page_size < len(bookings):
+                response['LastEvaluatedKey'] = {'offset': offset + page_size}
+            return response
+        self.mock_appointments_table.query.side_effect = query
+
+    def _booking(self, booking_id, start, event_id=None):
+        booking = {"bookingId": booking_id, "locationId": "locationABC", "status": "confirmed", "serviceId": "service123",
+                   "proposedStartTime": start, "proposedEndTime": start.replace("T09:", "T10:"),
+                   "clientDetails": {"name": "Jane", "email": "jane@example.com"}}
+        if event_id:
+            booking["googleCalendarEventId"] = event_id
+        return booking
+
+    def _booking_event(self, booking_id, start):
+        return self.server.add_event(CALENDAR_MAIN, start, start.replace("T09:", "T10:"),
+                                     extendedProperties={"private": {"bookingId": booking_id}})
+
+    def _queued_messages(self):
+        return [json.loads(entry['MessageBody'])
+                for call in self.mock_sqs.send_message_batch.call_args_list for entry in call[1]['Entries']]
+
+    def test_reconciliation_queues_creates_and_deletes_for_drift(self):
+        in_sync = self._booking_event("bookingSynced", "2099-03-02T09:00:00Z")
+        unlinked = self._booking_event("bookingUnlinked", "2099-03-02T09:00:00Z")
+        orphan = self._booking_event("bookingCancelled", "2099-03-03T09:00:00Z")
+        self.server.add_event(CALENDAR_MAIN, "2099-03-03T09:00:00Z", "2099-03-03T10:00:00Z")  # Staff event, not ours
+        self.server.add_event(CALENDAR_MAIN, "2099-02-28T09:00:00Z", "2099-03-02T08:00:00Z",
+                              extendedProperties={"private": {"bookingId": "bookingBefore"}})  # Starts before the range
+        self.mock_appointments_table.get_item.side_effect = lambda Key: {
+            'Item': {'bookingId': Key['bookingId'], 'status': 'confirmed' if Key['bookingId'] == "bookingNeverSynced" else 'cancelled'}}
+        self._confirmed_bookings([
+            self._booking("bookingSynced", "2099-03-02T09:00:00Z", in_sync['id']),
+            self._booking("bookingUnlinked", "2099-03-02T09:00:00Z"),
+            self._booking("bookingNeverSynced", "2099-03-02T09:00:00Z"),
+            self._booking("bookingEventGone", "2099-03-04T09:00:00Z", "deletedEventId"),
+        ])
+
+        response = lambda_function.lambda_handler(
+            {"action": "RECONCILE", "locationIds": ["locationABC"], "rangeStart": "2099-03-01T00:00:00Z", "rangeEnd": "2099-04-01T00:00:00Z"}, {})
+
+        self.assertEqual(response['reconciled_locations']['locationABC'], {"creates": 2, "deletes": 1, "sent": 3, "failed": 0})
+        messages = self._queued_messages()
+        self.assertEqual([(m['action'], m['bookingId']) for m in messages], [
+            ("CREATE_EVENT", "bookingNeverSynced"),
+            ("DELETE_EVENT", "bookingCancelled"),
+            ("CREATE_EVENT", "bookingEventGone"),
+        ])
+        self.assertEqual(messages[1]['googleCalendarEventId'], orphan['id'])
+        self.assertEqual(messages[0]['clientEmail'], "jane@example.com")
+        self.assertNotIn(unlinked['id'], [m.get('googleCalendarEventId') for m in messages])
+
+        # The queued CREATE_EVENT is a valid sync message
+        self.mock_sqs.reset_mock()
+        sync_response = lambda_function.lambda_handler(self._sqs_event(messages[:1]), {})
+        self.assertEqual(sync_response['processed_messages'], 1)
+        self.assertIn("bookingNeverSynced", self._linked_event_ids())
+
+    def test_reconciliation_leaves_recently_confirmed_bookings_to_their_pending_sync(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        recent = self._booking("bookingJustConfirmed", "2099-03-02T09:00:00Z")
+        recent["updatedAt"] = (now - datetime.timedelta(minutes=2)).isoformat()
+        settled = self._booking("bookingSettled", "2099-03-02T09:00:00Z")
+        settled["updatedAt"] = (now - datetime.timedelta(hours=2)).isoformat()
+        self._confirmed_bookings([recent, settled])
+
+        response = lambda_function.lambda_handler(
+            {"action": "RECONCILE", "locationIds": ["locationABC"], "rangeStart": "2099-03-01T00:00:00Z", "rangeEnd": "2099-04-01T00:00:00Z"}, {})
+
+        self.assertEqual(response['reconciled_locations']['locationABC']['creates'], 1)
+        self.assertEqual([m['bookingId'] for m in self._queued_messages()], ["bookingSettled"])
+
+    def test_reconciliation_leaves_the_event_of_a_booking_being_rescheduled_to_its_pending_update(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        old_event = self._booking_event("bookingMoved", "2099-03-02T09:00:00Z")
+        moved = self._booking("bookingMoved", "2099-03-05T09:00:00Z", old_event['id'])  # UPDATE_EVENT still queued
+        moved["updatedAt"] = (now - datetime.timedelta(minutes=2)).isoformat()
+        stray = self._booking_event("bookingGone", "2099-03-02T09:00:00Z")
+        bookings = {"bookingMoved": moved, "bookingGone": {"bookingId": "bookingGone", "status": "cancelled",
+                                                           "updatedAt": (now - datetime.timedelta(days=1)).isoformat()}}
+        self.mock_appointments_table.get_item.side_effect = lambda Key: {'Item': bookings.get(Key['bookingId'])}
+        self._confirmed_bookings([moved])
+
+        response = lambda_function.lambda_handler(
+            {"action": "RECONCILE", "locationIds": ["locationABC"], "rangeStart": "2099-03-01T00:00:00Z", "rangeEnd": "2099-04-01T00:00:00Z"}, {})
+
+        self.assertEqual(response['reconciled_locations']['locationABC'], {"creates": 0, "deletes": 1, "sent": 1, "failed": 0})
+        self.assertEqual([m['googleCalendarEventId'] for m in self._queued_messages()], [stray['id']])
+
+    def test_reconciliation_matches_bookings_stored_with_a_utc_offset(self):
+        # Stored-string order ('05:30-04:00' < '09:00Z') is not start-time order (09:30Z > 09:00Z)
+        offset = self._booking_event("bookingOffset", "2099-03-02T09:30:00Z")
+        utc = self._booking_event("bookingUtc", "2099-03-02T09:00:00Z")
+        late = self._booking_event("bookingLateEvening", "2099-03-03T02:00:00Z")
+        self._confirmed_bookings([
+            self._booking("bookingOffset", "2099-03-02T05:30:00-04:00", offset['id']),
+            self._booking("bookingUtc", "2099-03-02T09:00:00Z", utc['id']),
+            self._booking("bookingLateEvening", "2099-03-02T22:00:00-04:00", late['id']),
+        ])
+
+        response = lambda_function.lambda_handler(
+            {"action": "RECONCILE", "locationIds": ["locationABC"], "rangeStart": "2099-03-01T00:00:00Z", "rangeEnd": "2099-04-01T00:00:00Z"}, {})
+
+        self.assertEqual(response['reconciled_locations']['locationABC'], {"creates": 0, "deletes": 0, "sent": 0, "failed": 0})
+
+    def test_reconciliation_sends_messages_in_sqs_sized_batches(self):
+        self._confirmed_bookings([self._booking(f"booking{i:02d}", f"2099-03-{i + 1:02d}T09:00:00Z") for i in range(23)], page_size=5)
+
+        response = lambda_function.lambda_handler(
+            {"action": "RECONCILE", "locationIds": ["locationABC"], "rangeStart": "2099-03-01T00:00:00Z", "rangeEnd": "2099-04-01T00:00:00Z"}, {})
+
+        self.assertEqual(response['reconciled_locations']['locationABC']['creates'], 23)
+        self.assertEqual([len(call[1]['Entries']) for call in self.mock_sqs.send_message_batch.call_args_list], [10, 10, 3])
+        self.assertEqual([m['bookingId'] for m in self._queued_messages()], [f"booking{i:02d}" for i in range(23)])
+
+    def test_events_created_for_bookings_carry_the_booking_id(self):
+        lambda_function.lambda_handler(self._sqs_event([self._create_message("booking1")]), {})
+        event = self.server.events(CALENDAR_MAIN)[0]
+        self.assertEqual(event['extendedProperties']['private']['bookingId'], "booking1")
+
+    def test_rate_limited_batch_sub_requests_are_retried(self):
+        self.server.fail_next_requests(2)  # First two sub-requests of the batch
+        messages = [self._create_message(f"booking{i}") for i in range(3)]
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+
+        self.assertEqual(response['processed_messages'], 3)
+        self.assertEqual(len(self.server.events(CALENDAR_MAIN)), 3)
+        self.assertEqual(len(self.server.http_requests()), 2)
+        self.assertEqual(len(self.backoff_sleeps), 1)
+        self.rate_limiter.emit_metrics.assert_any_call({"RateLimitRetries": (1, "Count")})
+
+    def test_single_requests_back_off_on_403_rate_limit_exceeded(self):
+        self.server.fail_next_requests(2, status=403, reason='userRateLimitExceeded')
+        event_id = lambda_function.create_google_calendar_event(CALENDAR_MAIN, "t", "d", "2024-09-01T10:00:00Z", "2024-09-01T11:00:00Z")
+
+        self.assertEqual([event['id'] for event in self.server.events(CALENDAR_MAIN)], [event_id])
+        self.assertEqual(len(self.backoff_sleeps), 2)
+
+    def test_rate_limit_failure_is_reported_after_max_retries(self):
+        self.server.fail_next_requests(10)
+        response = lambda_function.lambda_handler(self._sqs_event([self._create_message("booking1")]), {})
+
+        self.assertEqual(response['batchItemFailures'], [{"itemIdentifier": "msg0"}])
+        self.assertEqual(len(self.server.http_requests()), 4)  # First attempt + 3 retries
+
+    def _update_message(self, booking_id, start, end, event_id=None):
+        message = {"action": "UPDATE_EVENT", "bookingId": booking_id, "locationId": "locationABC",
+                   "proposedStartTime": start, "proposedEndTime": end}
+        if event_id:
+            message["googleCalendarEventId"] = event_id
+        return message
+
+    def test_update_event_moves_the_event_with_patch(self):
+        existing = lambda_function.create_google_calendar_event(CALENDAR_MAIN, "t", "d", "2024-09-01T10:00:00Z", "2024-09-01T11:00:00Z")
+        self.server.request_log.clear()
+        messages = [self._update_message("booking1", "2024-09-02T14:00:00Z", "2024-09-02T15:00:00Z", existing)]
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+
+        self.assertEqual(response['processed_messages'], 1)
+        self.assertEqual([entry[0] for entry in self.server.request_log], ["POST", "batch:PATCH"])
+        event = self.server.events(CALENDAR_MAIN)[0]
+        self.assertEqual((event['id'], event['start'], event['summary']), (existing, {"dateTime": "2024-09-02T14:00:00Z"}, "t"))
+        self.mock_appointments_table.update_item.assert_not_called()
+
+    def test_update_after_pending_create_is_folded_into_it(self):
+        messages = [self._create_message("booking1"), self._update_message("booking1", "2024-09-02T14:00:00Z", "2024-09-02T15:00:00Z")]
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+
+        self.assertEqual(response['processed_messages'], 2)
+        self.assertEqual(response['coalesced_messages'], 1)
+        events = self.server.events(CALENDAR_MAIN)
+        self.assertEqual([event['start'] for event in events], [{"dateTime": "2024-09-02T14:00:00Z"}])
+
+    def test_update_before_event_exists_is_retried(self):
+        self.mock_appointments_table.get_item.return_value = {'Item': {'bookingId': 'booking1', 'locationId': 'locationABC', 'status': 'confirmed'}}
+        messages = [self._update_message("booking1", "2024-09-02T14:00:00Z", "2024-09-02T15:00:00Z")]
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+        self.assertEqual(response['batchItemFailures'], [{"itemIdentifier": "msg0"}])
+
+        # Once the booking is cancelled there is nothing left to move
+        self.mock_appointments_table.get_item.return_value = {'Item': {'bookingId': 'booking1', 'locationId': 'locationABC', 'status': 'cancelled'}}
+        response = lambda_function.lambda_handler(self._sqs_event(messages), {})
+        self.assertEqual(response['processed_messages'], 1)
+        self.assertEqual(self.server.http_requests(), [])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -9,6 +9,13 @@ logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
 import datetime
 
+try:
+    from ..common.reminder_schedule import cancel_reminders
+    from ..common.client_contact import notification_message
+except ImportError:  # Deployed flat in the Lambda package
+    from reminder_schedule import cancel_reminders
+    from client_contact import notification_message
+
 # Initialize Boto3 clients
 dynamodb = boto3.resource('dynamodb')
 sqs = boto3.client('sqs')
@@ -16,6 +23,7 @@ sqs = boto3.client('sqs')
 appointments_table_name = os.environ.get('APPOINTMENTS_TABLE_NAME')
 notification_sqs_url = os.environ.get('NOTIFICATION_SQS_URL')
 google_calendar_sync_sqs_url = os.environ.get('GOOGLE_CALENDAR_SYNC_SQS_URL') # Added for Google Calendar integration
+reminder_schedule_table_name = os.environ.get('REMINDER_SCHEDULE_TABLE_NAME') # Optional, set when reminders are scheduled
 
 def lambda_handler(event, context):
     """
@@ -117,39 +125,37 @@ def lambda_handler(event, context):
                 "body": json.dumps({"error": "Failed to update booking status."})
             }
 
-        # 5. If synced with Google Calendar, send message to delete the event
+        # 5. If synced (or being synced) with Google Calendar, send message to delete the event.
+        # A confirmed booking without googleCalendarEventId may still have its CREATE_EVENT in the sync queue;
+        # the sync Lambda folds that pair into a no-op or resolves the event ID from the booking later.
         google_calendar_event_id = booking_item.get('googleCalendarEventId')
-        if google_calendar_event_id:
+        if google_calendar_event_id or current_status == 'confirmed':
             calendar_message_body = {
                 "bookingId": booking_id,
-                "googleCalendarEventId": google_calendar_event_id,
-                "action": "DELETE_EVENT" 
+                "locationId": booking_item.get('locationId'),
+                "action": "DELETE_EVENT",
+                "source": "cancellation" # Lets the sync Lambda drop a CREATE_EVENT still queued for this booking
             }
+            if google_calendar_event_id:
+                calendar_message_body["googleCalendarEventId"] = google_calendar_event_id
             try:
                 sqs.send_message(
                     QueueUrl=google_calendar_sync_sqs_url,
                     MessageBody=json.dumps(calendar_message_body)
                 )
-                logger.info(f"Sent message to Google Calendar Sync SQS for booking {booking_id} to delete event {google_calendar_event_id}: {json.dumps(calendar_message_body)}")
+                logger.info(f"Sent message to Google Calendar Sync SQS for booking {booking_id} to delete event {google_calendar_event_id or '(pending sync)'}: {json.dumps(calendar_message_body)}")
             except Exception as e:
                 logger.error(f"Error sending message to Google Calendar Sync SQS for booking {booking_id}: {e}", exc_info=True)
                 # Log error, but don't fail the whole cancellation if this SQS message fails.
                 # Consider a retry mechanism or dead-letter queue for this.
 
         # 6. Send a notification to the client about the cancellation
-        client_details = booking_item.get("clientDetails", {})
-        notification_message_body = {
-            "bookingId": booking_id,
-            "notificationType": "BOOKING_CANCELLED", # Or "BOOKING_REJECTED" if new_status logic is expanded
-            "recipient": client_details.get("email"), # Or phone, depending on notification preferences
-            "messageDetails": {
-                "clientName": client_details.get("name"),
-                "serviceName": booking_item.get("serviceName", "the service"), 
-                "startTime": booking_item.get("proposedStartTime"),
-                "reason": "Your booking has been cancelled." # Generic reason
-            }
-        }
-        if client_details.get("email"): # Only send if email is available
+        notification_message_body = notification_message(booking_item, "BOOKING_CANCELLED", { # Or "BOOKING_REJECTED" if new_status logic is expanded
+            "serviceName": booking_item.get("serviceName", "the service"),
+            "startTime": booking_item.get("proposedStartTime"),
+            "reason": "Your booking has been cancelled." # Generic reason
+        })
+        if notification_message_body: # Only send if the client can be reached on some channel
             try:
                 sqs.send_message(
                     QueueUrl=notification_sqs_url,
@@ -160,8 +166,14 @@ def lambda_handler(event, context):
                 logger.error(f"Error sending message to Notification SQS for booking {booking_id}: {e}", exc_info=True)
                 # Log error, but booking is already cancelled in DB.
         else:
-            logger.warning(f"No recipient email found for booking {booking_id}, skipping cancellation notification.")
+            logger.warning(f"No client contact found for booking {booking_id}, skipping cancellation notification.")
 
+        # 6b. Delete pending reminders (the sweeper also skips reminders of cancelled bookings)
+        if reminder_schedule_table_name and current_status == 'confirmed' and booking_item.get('proposedStartTime'):
+            try:
+                cancel_reminders(dynamodb.Table(reminder_schedule_table_name), booking_id, booking_item['proposedStartTime'])
+            except Exception as e:
+                logger.error(f"Error cancelling reminders for booking {booking_id}: {e}", exc_info=True)
 
         # 7. Return success response
         logger.info(f"Booking {booking_id} cancelled successfully.")
@@ -0,0 +1,77 @@
+import json
+import time
+from typing import Any, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field
+
+try:
+    from ..chat_history_store import estimate_tokens
+except ImportError:  # Run from the Lambda directory
+    from chat_history_store import estimate_tokens
+
+
+class ScriptExhaustedError(Exception):
+    """The agent asked the scripted model for more responses than the turn's script holds."""
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Offline stand-in for ChatOpenAI that replays a script instead of calling the API. Each LLM call
+    consumes one step: {"tool_calls": [{"name", "args"}]} asks for tools in the OpenAI tools format,
+    {"content": "..."} is a final answer. Every call is recorded in `calls` with its duration and
+    estimated input/output tokens (including the tool schemas sent with the request).
+    """
+
+    steps: List[dict] = Field(default_factory=list)
+    calls: List[dict] = Field(default_factory=list)
+    latency_ms: float = 0.0  # Simulated model latency per call
+
+    @property
+    def _llm_type(self):
+        return "scripted-fake"
+
+    def script(self, steps):
+        """Replaces the remaining steps, e.g. with the next turn's script."""
+        self.steps = [dict(step) for step in steps]
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        started = time.perf_counter()
+        if not self.steps:
+            raise ScriptExhaustedError(f"No scripted response left for LLM call {len(self.calls) + 1}.")
+        step = self.steps.pop(0)
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        call_number = len(self.calls) + 1
+        tool_calls = [
+            {"name": call["name"], "args": call.get("args", {}), "id": f"call_{call_number}_{index}"}
+            for index, call in enumerate(step.get("tool_calls", []))
+        ]
+        content = step.get("content", "")
+        input_tokens = sum(estimate_tokens(m.content if isinstance(m.content, str) else json.dumps(m.content)) for m in messages)
+        input_tokens += estimate_tokens(json.dumps(kwargs.get("tools", [])))
+        output_tokens = estimate_tokens(content + json.dumps([call["args"] for call in tool_calls]))
+        usage = {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+        additional_kwargs = {}
+        if tool_calls:
+            additional_kwargs["tool_calls"] = [
+                {"id": call["id"], "type": "function", "function": {"name": call["name"], "arguments": json.dumps(call["args"])}}
+                for call in tool_calls
+            ]
+        message = AIMessage(content=content, tool_calls=tool_calls, additional_kwargs=additional_kwargs, usage_metadata=usage)
+        self.calls.append({
+            "duration_ms": (time.perf_counter() - started) * 1000,
+            "tool_calls": len(tool_calls),
+            **usage,
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={
+            "token_usage": {"prompt_tokens": input_tokens, "completion_tokens": output_tokens, "total_tokens": usage["total_tokens"]}
+        })
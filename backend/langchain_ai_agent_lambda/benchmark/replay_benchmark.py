@@ -0,0 +1,195 @@
+"""
+Replays recorded booking conversations through the agent's lambda_handler with a scripted LLM and
+fixture tool backend, so agent latency can be measured offline without OpenAI or AWS.
+
+    python -m backend.langchain_ai_agent_lambda.benchmark.replay_benchmark [--repeat 5] [--llm-latency-ms 0] [--json]
+
+Per turn it reports total handler time split into LLM time, tool time (wall time covered by tool
+calls, which may overlap) and the remaining framework overhead (prompt building, agent loop, parsing,
+history), plus LLM calls, tool calls and tokens.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AGENT_VERBOSE', 'false')  # Console output of the executor would dominate the timings
+os.environ.pop('CHAT_HISTORY_TABLE_NAME', None)  # Histories stay in memory
+
+try:
+    from .. import lambda_function
+    from ..tool_backends import ToolBackend
+    from .fake_chat_model import ScriptedChatModel
+except ImportError:  # Run from the Lambda directory
+    import lambda_function
+    from tool_backends import ToolBackend
+    from benchmark.fake_chat_model import ScriptedChatModel
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversations.json")
+
+
+class FixtureToolBackend(ToolBackend):
+    """
+    Serves the corpus catalog and availability from memory. Every outermost call is recorded as a
+    (start, end) interval; tool time is the wall time they cover, so concurrent calls are not double counted.
+    """
+
+    def __init__(self, catalog, latency_ms=0.0):
+        self.catalog = catalog
+        self.latency_ms = latency_ms
+        self.bookings = 0
+        self.intervals = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _timed(self, call):
+        # Only the outermost call is timed; check_availability resolves names through list_services
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        started = time.perf_counter()
+        try:
+            if self.latency_ms and depth == 0:
+                time.sleep(self.latency_ms / 1000)
+            return call()
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                with self._lock:
+                    self.intervals.append((started, time.perf_counter()))
+
+    def tool_ms_since(self, index):
+        """Wall time in ms covered by the intervals recorded from index on."""
+        covered, current_start, current_end = 0.0, None, None
+        for start, end in sorted(self.intervals[index:]):
+            if current_end is None or start > current_end:
+                if current_end is not None:
+                    covered += current_end - current_start
+                current_start, current_end = start, end
+            else:
+                current_end = max(current_end, end)
+        if current_end is not None:
+            covered += current_end - current_start
+        return covered * 1000
+
+    def list_services(self):
+        return self._timed(lambda: list(self.catalog["services"]))
+
+    def list_locations(self):
+        return self._timed(lambda: list(self.catalog["locations"]))
+
+    def check_availability(self, *args, **kwargs):
+        return self._timed(lambda: ToolBackend.check_availability(self, *args, **kwargs))
+
+    def create_booking(self, *args, **kwargs):
+        return self._timed(lambda: ToolBackend.create_booking(self, *args, **kwargs))
+
+    def _availability(self, query_params):
+        return {"availableSlots": self.catalog["availability"].get(query_params["calendar_id"], [])}
+
+    def _create_booking(self, body):
+        with self._lock:
+            self.bookings += 1
+            booking_id = f"REPLAY{self.bookings:04d}"
+        return {"bookingId": booking_id, "bookingDetails": body}
+
+
+def replay_conversation(conversation, catalog, run, llm_latency_ms=0.0, tool_latency_ms=0.0):
+    """Replays one conversation on a freshly built runtime; returns one stats dict per turn."""
+    model = ScriptedChatModel(latency_ms=llm_latency_ms)
+    backend = FixtureToolBackend(catalog, latency_ms=tool_latency_ms)
+    runtime = lambda_function.build_agent_runtime(None, llm=model, tool_backend=backend)
+    lambda_function._agent_runtime = runtime
+    session_id = f"replay_{conversation['name']}_{run}"
+
+    turns = []
+    for number, turn in enumerate(conversation["turns"], start=1):
+        model.script(turn["llm"])
+        calls_before, intervals_before = len(model.calls), len(backend.intervals)
+        started = time.perf_counter()
+        response = lambda_function.lambda_handler({"body": json.dumps({"message": turn["user"], "session_id": session_id})}, None)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        calls = model.calls[calls_before:]
+        llm_ms = sum(call["duration_ms"] for call in calls)
+        tool_ms = backend.tool_ms_since(intervals_before)
+        turns.append({
+            "conversation": conversation["name"],
+            "turn": number,
+            "status": response["statusCode"],
+            "script_left": len(model.steps),  # Non-zero: the agent stopped earlier than recorded
+            "total_ms": total_ms,
+            "llm_ms": llm_ms,
+            "tool_ms": tool_ms,
+            "framework_ms": total_ms - llm_ms - tool_ms,
+            "llm_calls": len(calls),
+            "tool_calls": sum(call["tool_calls"] for call in calls),
+            "input_tokens": sum(call["input_tokens"] for call in calls),
+            "output_tokens": sum(call["output_tokens"] for call in calls),
+        })
+    if runtime["event_loop"] is not None:
+        runtime["event_loop"].close()
+    return turns
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(turns):
+    summary = {"turns": len(turns), "fast_path_turns": sum(1 for turn in turns if turn["llm_calls"] == 0)}
+    for field in ("total_ms", "framework_ms", "llm_ms", "tool_ms"):
+        values = [turn[field] for turn in turns]
+        summary[field] = {"mean": statistics.mean(values), "p50": _percentile(values, 0.5), "p95": _percentile(values, 0.95)}
+    for field in ("llm_calls", "tool_calls", "input_tokens", "output_tokens"):
+        summary[f"{field}_per_turn"] = statistics.mean(turn[field] for turn in turns)
+    return summary
+
+
+def print_report(turns, summary):
+    print(f"{'conversation':<22}{'turn':>5}{'total':>10}{'framework':>11}{'llm':>9}{'tool':>9}{'llm#':>6}{'tool#':>7}{'tok in':>8}{'tok out':>9}")
+    for turn in turns:
+        print(f"{turn['conversation']:<22}{turn['turn']:>5}{turn['total_ms']:>9.1f}ms{turn['framework_ms']:>9.1f}ms"
+              f"{turn['llm_ms']:>7.1f}ms{turn['tool_ms']:>7.1f}ms{turn['llm_calls']:>6}{turn['tool_calls']:>7}"
+              f"{turn['input_tokens']:>8}{turn['output_tokens']:>9}" + ("  (script left over)" if turn["script_left"] else ""))
+    print()
+    for field in ("total_ms", "framework_ms", "llm_ms", "tool_ms"):
+        stats = summary[field]
+        print(f"{field:<14} mean {stats['mean']:8.1f}  p50 {stats['p50']:8.1f}  p95 {stats['p95']:8.1f}")
+    print(f"{summary['turns']} turns, {summary['fast_path_turns']} answered without the LLM; per turn: "
+          f"{summary['llm_calls_per_turn']:.2f} LLM calls, {summary['tool_calls_per_turn']:.2f} tool calls, "
+          f"{summary['input_tokens_per_turn']:.0f} input / {summary['output_tokens_per_turn']:.0f} output tokens")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--repeat", type=int, default=3, help="Replays of the corpus; the first one includes warm-up")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated latency per LLM call")
+    parser.add_argument("--tool-latency-ms", type=float, default=0.0, help="Simulated latency per tool backend call")
+    parser.add_argument("--json", action="store_true", help="Print per-turn stats and the summary as JSON")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    turns = []
+    for run in range(args.repeat):
+        for conversation in corpus["conversations"]:
+            turns.extend(replay_conversation(conversation, corpus["catalog"], run, args.llm_latency_ms, args.tool_latency_ms))
+    summary = summarize(turns)
+
+    if args.json:
+        print(json.dumps({"turns": turns, "summary": summary}, indent=2))
+    else:
+        print_report(turns, summary)
+    return 0 if all(turn["status"] == 200 and not turn["script_left"] for turn in turns) else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
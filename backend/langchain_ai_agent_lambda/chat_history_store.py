@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import time
+
+from boto3.dynamodb.conditions import Key
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import SystemMessage, messages_from_dict, message_to_dict
+
+# Initialize logger
+logger = logging.getLogger()
+
+SUMMARY_SEQ = 0  # The running summary lives in the session's first item; messages start at 1
+DEFAULT_MAX_HISTORY_TOKENS = 2000
+DEFAULT_KEEP_RECENT_MESSAGES = 6
+DEFAULT_TTL_DAYS = 30
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token), enough to decide when to compact."""
+    return len(text or "") // 4 + 1
+
+
+def message_tokens(message):
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    return estimate_tokens(content)
+
+
+class DynamoDBChatMessageHistory(BaseChatMessageHistory):
+    """
+    Chat history of one session, stored as one DynamoDB item per message ({sessionId, seq}).
+    The session is loaded with a single Query, new messages are written as individual items,
+    and once the history grows past max_history_tokens the older messages are folded into a
+    running summary (seq 0) by summarizer(previous_summary, messages) and deleted.
+    Without a summarizer the history is never compacted.
+    """
+
+    def __init__(self, table, session_id, summarizer=None, max_history_tokens=DEFAULT_MAX_HISTORY_TOKENS,
+                 keep_recent_messages=DEFAULT_KEEP_RECENT_MESSAGES, ttl_days=DEFAULT_TTL_DAYS, clock=time.time):
+        self.table = table
+        self.session_id = session_id
+        self.summarizer = summarizer
+        self.max_history_tokens = max_history_tokens
+        self.keep_recent_messages = keep_recent_messages
+        self.ttl_seconds = ttl_days * 24 * 3600
+        self.clock = clock
+        self.summary = ""
+        self.summarized_through = SUMMARY_SEQ
+        self._entries = []  # (seq, message), oldest first
+        self._load()
+
+    def _load(self):
+        self.summary = ""
+        self.summarized_through = SUMMARY_SEQ
+        self._entries = []
+        query_kwargs = {"KeyConditionExpression": Key('sessionId').eq(self.session_id), "ConsistentRead": True}
+        items = []
+        while True:
+            response = self.table.query(**query_kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        for item in items:
+            seq = int(item['seq'])
+            if seq == SUMMARY_SEQ:
+                self.summary = item.get('summary', "")
+                self.summarized_through = int(item.get('summarizedThrough', SUMMARY_SEQ))
+            else:
+                self._entries.append((seq, messages_from_dict([json.loads(item['message'])])[0]))
+        # Messages already in the summary whose delete did not go through are ignored
+        self._entries = sorted((entry for entry in self._entries if entry[0] > self.summarized_through), key=lambda entry: entry[0])
+
+    @property
+    def messages(self):
+        history = [message for _, message in self._entries]
+        if self.summary:
+            return [SystemMessage(content=SUMMARY_PREFIX + self.summary)] + history
+        return history
+
+    def _next_seq(self):
+        return max([self.summarized_through] + [seq for seq, _ in self._entries]) + 1
+
+    def _expires_at(self):
+        return int(self.clock()) + self.ttl_seconds
+
+    def add_message(self, message):
+        self.add_messages([message])
+
+    def add_messages(self, messages):
+        """Writes only the new messages, then compacts if the history is over budget."""
+        for message in messages:
+            seq = self._next_seq()
+            item = {'sessionId': self.session_id, 'seq': seq, 'message': json.dumps(message_to_dict(message)), 'expiresAt': self._expires_at()}
+            try:
+                self.table.put_item(Item=item, ConditionExpression="attribute_not_exists(seq)")
+            except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+                # Another writer took this seq; pick up its messages and append after them
+                logger.warning(f"[ChatHistory] Session {self.session_id} was written concurrently, reloading before append.")
+                self._load()
+                seq = self._next_seq()
+                item['seq'] = seq
+                self.table.put_item(Item=item, ConditionExpression="attribute_not_exists(seq)")
+            self._entries.append((seq, message))
+        self.compact_if_needed()
+
+    def history_tokens(self):
+        return estimate_tokens(self.summary) + sum(message_tokens(message) for _, message in self._entries)
+
+    def compact_if_needed(self):
+        """Folds all but the keep_recent_messages newest messages into the summary. True if it compacted."""
+        if self.summarizer is None or self.history_tokens() <= self.max_history_tokens:
+            return False
+        if len(self._entries) <= self.keep_recent_messages:
+            return False
+        split = len(self._entries) - self.keep_recent_messages
+        to_fold, recent = self._entries[:split], self._entries[split:]
+        try:
+            summary = self.summarizer(self.summary, [message for _, message in to_fold])
+        except Exception as e:  # The full history is still stored; the next turn tries again
+            logger.error(f"[ChatHistory] Could not summarize session {self.session_id}: {e}", exc_info=True)
+            return False
+
+        summarized_through = to_fold[-1][0]
+        # The summary is written first, so a failed delete leaves only ignorable leftovers
+        self.table.put_item(Item={
+            'sessionId': self.session_id, 'seq': SUMMARY_SEQ, 'summary': summary,
+            'summarizedThrough': summarized_through, 'expiresAt': self._expires_at()
+        })
+        with self.table.batch_writer() as batch:
+            for seq, _ in to_fold:
+                batch.delete_item(Key={'sessionId': self.session_id, 'seq': seq})
+        logger.info(f"[ChatHistory] Compacted {len(to_fold)} messages of session {self.session_id} into the summary.")
+        self.summary = summary
+        self.summarized_through = summarized_through
+        self._entries = recent
+        return True
+
+    def clear(self):
+        with self.table.batch_writer() as batch:
+            for seq, _ in self._entries:
+                batch.delete_item(Key={'sessionId': self.session_id, 'seq': seq})
+            batch.delete_item(Key={'sessionId': self.session_id, 'seq': SUMMARY_SEQ})
+        self.summary = ""
+        self.summarized_through = SUMMARY_SEQ
+        self._entries = []
+
+
+def llm_summarizer(llm):
+    """A summarizer that asks llm to extend the running summary with the folded messages."""
+    def summarize(previous_summary, messages):
+        transcript = "\n".join(f"{message.type}: {message.content}" for message in messages)
+        instructions = ("Summarize this booking conversation in a few sentences. Keep every detail the assistant "
+                        "still needs: the service, location, dates and times discussed, offered slots, client name, "
+                        "contact details and any booking IDs.")
+        prompt = f"{instructions}\n\nCurrent summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+        return llm.invoke(prompt).content
+    return summarize
+
+
+def chat_history_factory_from_env(summarizer=None, dynamodb_resource=None):
+    """
+    CHAT_HISTORY_TABLE_NAME enables persistent histories (CHAT_HISTORY_MAX_TOKENS, CHAT_HISTORY_KEEP_RECENT,
+    CHAT_HISTORY_TTL_DAYS); returns a session_id -> history function, or None when the table is not set.
+    """
+    table_name = os.environ.get('CHAT_HISTORY_TABLE_NAME')
+    if not table_name:
+        return None
+    if dynamodb_resource is None:
+        import boto3
+        dynamodb_resource = boto3.resource('dynamodb')
+    table = dynamodb_resource.Table(table_name)
+    max_history_tokens = int(os.environ.get('CHAT_HISTORY_MAX_TOKENS', DEFAULT_MAX_HISTORY_TOKENS))
+    keep_recent_messages = int(os.environ.get('CHAT_HISTORY_KEEP_RECENT', DEFAULT_KEEP_RECENT_MESSAGES))
+    ttl_days = int(os.environ.get('CHAT_HISTORY_TTL_DAYS', DEFAULT_TTL_DAYS))
+
+    def get_history(session_id):
+        return DynamoDBChatMessageHistory(table, session_id, summarizer=summarizer, max_history_tokens=max_history_tokens,
+                                          keep_recent_messages=keep_recent_messages, ttl_days=ttl_days)
+    return get_history
@@ -0,0 +1,230 @@
+import re
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+# A window of acceptable appointment start times, both ends inclusive and timezone-aware.
+DateWindow = namedtuple('DateWindow', ['start', 'latest_start'])
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+MONTHS = ("january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november", "december")
+# Start-time ranges of the parts of the day, [from, until)
+DAY_PARTS = {
+    "first thing": (time(8), time(9)),
+    "after work": (time(17), time(21)),
+    "morning": (time(8), time(12)),
+    "afternoon": (time(12), time(17)),
+    "evening": (time(17), time(21)),
+    "tonight": (time(17), time(21)),
+}
+END_OF_DAY = time(23, 59)
+# Words that may surround a date without changing it ("anytime next week", "after work on wednesday")
+FILLER_WORDS = {
+    "any", "anytime", "time", "sometime", "on", "in", "at", "the", "this", "a", "day", "please", "maybe",
+    "how", "about", "is", "would", "be", "works", "good", "fine", "ok", "okay", "for", "me", "i", "can", "do",
+}
+# Phrases that exclude days or times; reading only the named day out of them gives the opposite window
+NEGATION = re.compile(r"\b(but|except|not|other\s+than|never)\b|n't\b")
+
+_WEEKDAY = r"(mon|tue|tues|wed|thu|thur|thurs|fri|sat|sun)(day|nesday|rsday|urday|sday)?"
+_MONTH = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*"
+_TIME = r"(\d{1,2})(?::(\d{2}))?\s*(am|pm)?"
+
+_PATTERNS = {
+    "iso_date": re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b"),
+    "slash_date": re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b"),
+    "month_day": re.compile(rf"\b{_MONTH}\s+(\d{{1,2}})(?:st|nd|rd|th)?(?:,?\s+(\d{{4}}))?\b"),
+    "day_month": re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?{_MONTH}(?:,?\s+(\d{{4}}))?\b"),
+    "relative_days": re.compile(r"\bin\s+(\d+|a|one|two|three)\s+(day|days|week|weeks)\b"),
+    "weekday": re.compile(rf"\b(this|next|coming)?\s*{_WEEKDAY}\b"),
+    "between": re.compile(rf"\b(?:between|from)\s+{_TIME}\s*(?:and|to|-)\s*{_TIME}"),
+    "range": re.compile(rf"(?<![\d/:-]){_TIME}\s*(?:-|to)\s*{_TIME}(?![\d/:-])"),
+    "after": re.compile(rf"\b(?:after|from)\s+{_TIME}"),
+    "before": re.compile(rf"\b(?:before|by|until)\s+{_TIME}"),
+    "at": re.compile(rf"\b(?:at|around)\s+{_TIME}\b"),
+    "clock": re.compile(r"\b(\d{1,2})(?::(\d{2}))?\s*(am|pm)\b|\b(\d{1,2}):(\d{2})\b"),
+}
+_SMALL_NUMBERS = {"a": 1, "one": 1, "two": 2, "three": 3}
+
+
+def _month_number(token):
+    return next(index for index, name in enumerate(MONTHS, start=1) if name.startswith(token[:3]))
+
+
+def _weekday_number(token):
+    return next(index for index, name in enumerate(WEEKDAYS) if name.startswith(token[:3]))
+
+
+def _clock(hour, minute, meridiem):
+    """A time from '2', '30', 'pm'; bare hours 1-7 are read as afternoon, since detailing centres are not open at 3am."""
+    hour, minute = int(hour), int(minute or 0)
+    if meridiem == "pm" and hour < 12:
+        hour += 12
+    elif meridiem == "am" and hour == 12:
+        hour = 0
+    elif meridiem is None and 1 <= hour <= 7:
+        hour += 12
+    if hour > 23 or minute > 59:
+        return None
+    return time(hour, minute)
+
+
+def _future_date(year, month, day, today):
+    """The date, in the next year when no year was given and it has already passed."""
+    try:
+        if year:
+            year = int(year)
+            return date(year + 2000 if year < 100 else year, month, day)
+        candidate = date(today.year, month, day)
+        return candidate if candidate >= today else date(today.year + 1, month, day)
+    except ValueError:
+        return None
+
+
+def _search(pattern, text, used):
+    """re.search that records the span of the match in used, so parse_date_window knows what was read."""
+    match = re.search(pattern, text) if isinstance(pattern, str) else pattern.search(text)
+    if match:
+        used.append(match.span())
+    return match
+
+
+def _day_range(text, today, used):
+    """(first, last) dates the phrase refers to, or None when it names no day."""
+    monday = today - timedelta(days=today.weekday())
+    if _search(r"\bday after tomorrow\b", text, used):
+        return today + timedelta(days=2), today + timedelta(days=2)
+    if _search(r"\btomorrow\b", text, used):
+        return today + timedelta(days=1), today + timedelta(days=1)
+    if _search(r"\b(today|tonight)\b", text, used):
+        return today, today
+    if _search(r"\bnext\s+weekend\b", text, used):
+        saturday = monday + timedelta(days=12)
+        return saturday, saturday + timedelta(days=1)
+    if _search(r"\b(this\s+)?weekend\b", text, used):
+        saturday = monday + timedelta(days=5)
+        return max(saturday, today), saturday + timedelta(days=1)
+    if _search(r"\bnext\s+week\b", text, used):
+        return monday + timedelta(days=7), monday + timedelta(days=13)
+    if _search(r"\bthis\s+week\b", text, used):
+        return today, monday + timedelta(days=6)
+
+    match = _search(_PATTERNS["iso_date"], text, used)
+    if match:
+        found = _future_date(match.group(1), int(match.group(2)), int(match.group(3)), today)
+        return (found, found) if found else None
+    match = _search(_PATTERNS["month_day"], text, used)
+    if match:
+        found = _future_date(match.group(3), _month_number(match.group(1)), int(match.group(2)), today)
+        return (found, found) if found else None
+    match = _search(_PATTERNS["day_month"], text, used)
+    if match:
+        found = _future_date(match.group(3), _month_number(match.group(2)), int(match.group(1)), today)
+        return (found, found) if found else None
+    match = _search(_PATTERNS["slash_date"], text, used)
+    if match:  # US order, month/day
+        found = _future_date(match.group(3), int(match.group(1)), int(match.group(2)), today)
+        return (found, found) if found else None
+
+    match = _search(_PATTERNS["relative_days"], text, used)
+    if match:
+        count = _SMALL_NUMBERS.get(match.group(1)) or int(match.group(1))
+        days = count * 7 if match.group(2).startswith("week") else count
+        return today + timedelta(days=days), today + timedelta(days=days)
+
+    match = _search(_PATTERNS["weekday"], text, used)
+    if match:
+        qualifier, weekday = match.group(1), _weekday_number(match.group(2))
+        if qualifier == "next":  # That day in the following Monday-to-Sunday week
+            found = monday + timedelta(days=7 + weekday)
+        elif qualifier == "this":  # That day in the current week, or the next one once it has passed
+            found = monday + timedelta(days=weekday)
+            if found < today:
+                found += timedelta(days=7)
+        else:  # "tuesday", "coming tuesday": the next one after today
+            found = today + timedelta(days=(weekday - today.weekday() - 1) % 7 + 1)
+        return found, found
+    return None
+
+
+def _clock_range(text, used):
+    """[from, until] start times from explicit clock times, or None."""
+    for name in ("between", "range"):
+        match = _PATTERNS[name].search(text)
+        if match:
+            start, end = _clock(*match.group(1, 2, 3)), _clock(*match.group(4, 5, 6) if match.group(6) else (*match.group(4, 5), match.group(3)))
+            if start and end and start < end:
+                used.append(match.span())
+                return start, end
+    match = _PATTERNS["after"].search(text)
+    if match and _clock(*match.group(1, 2, 3)):
+        used.append(match.span())
+        return _clock(*match.group(1, 2, 3)), END_OF_DAY
+    match = _PATTERNS["before"].search(text)
+    if match and _clock(*match.group(1, 2, 3)):
+        used.append(match.span())
+        return time(0), _clock(*match.group(1, 2, 3))
+    if _search(r"\b(noon|midday)\b", text, used):
+        return time(12), time(12)
+    match = _PATTERNS["at"].search(text)
+    exact = _clock(*match.group(1, 2, 3)) if match else None
+    if exact is None:
+        match = _PATTERNS["clock"].search(text)
+        if match:
+            exact = _clock(*match.group(1, 2, 3)) if match.group(1) else _clock(match.group(4), match.group(5), None)
+    if exact is not None:
+        used.append(match.span())
+        return exact, exact
+    return None
+
+
+def _time_range(text, used):
+    """[from, until] start times of the day the phrase asks for, or None for the whole day."""
+    day_parts = [(match, DAY_PARTS[match.group(1)]) for match in
+                 (re.search(rf"\b({part})s?\b", text) for part in DAY_PARTS) if match]
+    times = _clock_range(text, used)
+    if times is None and day_parts:
+        start, end = day_parts[0][1]
+        times = start, (datetime.combine(date.min, end) - timedelta(minutes=1)).time()
+    if times is not None:  # A part of the day next to a clock time ("tomorrow morning at 9") only confirms it
+        used.extend(match.span() for match, _ in day_parts[:1])
+    return times
+
+
+def _unread_words(text, used):
+    """The words of text outside every span in used that are not filler."""
+    for start, end in used:
+        text = text[:start] + " " * (end - start) + text[end:]
+    return [word for word in re.findall(r"[a-z0-9']+", text) if word not in FILLER_WORDS]
+
+
+def parse_date_window(phrase, now, tz):
+    """
+    Turns a date phrase ('next Tuesday afternoon', 'anytime next week', 'Aug 15th after 2pm', 'tomorrow at 10')
+    into a DateWindow in tz, or None when the phrase names no day or time or lies entirely in the past.
+    'next <weekday>' is that day in the following Monday-to-Sunday week; a time without a day means today.
+    Phrases with a negation ('any day but saturday') or words the patterns did not read ('friday or
+    saturday') also give None, so the caller asks for explicit dates instead of using a wrong window.
+    """
+    tz = ZoneInfo(tz) if isinstance(tz, str) else tz
+    local_now = now.astimezone(tz)
+    text = " ".join((phrase or "").lower().replace(",", " , ").split())
+    if NEGATION.search(text):
+        return None
+    used = []
+    days = _day_range(text, local_now.date(), used)
+    times = _time_range(text, used)
+    if days is None and times is None or _unread_words(text, used):
+        return None
+    first_day, last_day = days or (local_now.date(), local_now.date())
+    earliest, latest = times or (time(0), END_OF_DAY)
+
+    start = datetime.combine(first_day, earliest, tzinfo=tz)
+    latest_start = datetime.combine(last_day, latest, tzinfo=tz)
+    if latest_start < local_now:
+        return None
+    return DateWindow(max(start, local_now.replace(second=0, microsecond=0)), latest_start)
+
+
+def to_utc_iso(moment):
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
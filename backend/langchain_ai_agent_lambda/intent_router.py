@@ -0,0 +1,68 @@
+import logging
+import os
+import re
+
+# Initialize logger
+logger = logging.getLogger()
+
+GREETING = "GREETING"
+LIST_SERVICES = "LIST_SERVICES"
+LIST_LOCATIONS = "LIST_LOCATIONS"
+
+# Rules match the whole (normalized) message, so "hi, I need a full detail tomorrow" still goes to the agent.
+DEFAULT_RULES = (
+    (GREETING, r"(hi|hello|hey|hiya|howdy|good (morning|afternoon|evening))( there)?"),
+    (LIST_SERVICES, r"(what|which) (services|packages|options)( do you (have|offer|do))?"
+                    r"|what do you (offer|do)|(list( of)? |your )?(services|packages|prices)"
+                    r"|(can i see|show me)( the| your)? (services|packages|menu)"),
+    (LIST_LOCATIONS, r"where are you( guys)?( located| based)?|where is it|(what are |list )?(your )?(locations|addresses|address)"
+                     r"|(which|what) locations?( do you have)?|where can i (go|come)"),
+)
+MAX_ROUTED_LENGTH = 80  # Longer messages carry details the agent has to read
+DEFAULT_MIN_CONFIDENCE = 0.85
+
+
+def normalize_message(text):
+    """Lower-cases, drops punctuation and emoji, and collapses whitespace: ' Hi!! 👋 ' -> 'hi'."""
+    text = re.sub(r"[^\w\s']", " ", (text or "").lower())
+    text = re.sub(r"\b(please|thanks|thank you|pls|plz)\b", " ", text) if len(text.split()) > 1 else text
+    return " ".join(text.split())
+
+
+class IntentRouter:
+    """
+    Classifies messages the agent does not need to see. Compiled whole-message rules are tried first;
+    an optional local model (text -> (intent, confidence)) covers rephrasings above min_confidence.
+    route() returns None for everything else.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, model=None, min_confidence=DEFAULT_MIN_CONFIDENCE):
+        self.rules = [(intent, re.compile(rf"(?:{pattern})")) for intent, pattern in rules]
+        self.model = model
+        self.min_confidence = min_confidence
+
+    def route(self, text):
+        if not text or len(text) > MAX_ROUTED_LENGTH:
+            return None
+        normalized = normalize_message(text)
+        if not normalized:
+            return None
+        for intent, pattern in self.rules:
+            if pattern.fullmatch(normalized):
+                return intent
+        if self.model is not None:
+            try:
+                intent, confidence = self.model(normalized)
+            except Exception as e:
+                logger.warning(f"[IntentRouter] Local model failed, leaving the message to the agent: {e}")
+                return None
+            if intent and confidence >= self.min_confidence:
+                return intent
+        return None
+
+
+def intent_router_from_env(model=None):
+    """FAST_PATH_ENABLED (default true) enables the router; FAST_PATH_MIN_CONFIDENCE applies to the optional model."""
+    if os.environ.get('FAST_PATH_ENABLED', 'true').lower() != 'true':
+        return None
+    return IntentRouter(model=model, min_confidence=float(os.environ.get('FAST_PATH_MIN_CONFIDENCE', DEFAULT_MIN_CONFIDENCE)))
@@ -1,60 +1,157 @@
+import asyncio
 import json
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 # import boto3 # If needed for other AWS services like Secrets Manager for API key
 
+import httpx  # Installed with langchain-openai; one pooled client is reused by every warm invocation
 from langchain_openai import ChatOpenAI
-from langchain.agents import AgentExecutor, create_openai_tools_agent # Using a modern agent type
+from langchain.agents import AgentExecutor # The agent is composed as create_openai_tools_agent does, plus a prompt budget step
+from langchain.agents.format_scratchpad.openai_tools import format_to_openai_tool_messages
+from langchain.agents.output_parsers.openai_tools import OpenAIToolsAgentOutputParser
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from langchain_core.utils.function_calling import convert_to_openai_tool
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.tools import BaseTool, Tool # For creating custom tools
 from langchain_community.chat_message_histories import ChatMessageHistory # In-memory history for demo
 from langchain_core.runnables.history import RunnableWithMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.callbacks import BaseCallbackHandler
 
 # Pydantic might be needed for tool argument schemas if you define them formally
 from pydantic import BaseModel, Field
-from typing import Type # Required for args_schema type hint if using Pydantic v1 style
+from typing import Any, Optional, Type # Type is required for args_schema type hint if using Pydantic v1 style
+
+try:
+    from .chat_history_store import chat_history_factory_from_env, llm_summarizer
+except ImportError:  # Deployed flat in the Lambda package
+    from chat_history_store import chat_history_factory_from_env, llm_summarizer
+try:
+    from .tool_backends import ToolBackendError, messenger_psid_for_session, tool_backend_from_env
+except ImportError:  # Deployed flat in the Lambda package
+    from tool_backends import ToolBackendError, messenger_psid_for_session, tool_backend_from_env
+try:
+    from .tool_cache import current_session_id, stats_delta, tool_cache_from_env
+except ImportError:  # Deployed flat in the Lambda package
+    from tool_cache import current_session_id, stats_delta, tool_cache_from_env
+try:
+    from .intent_router import GREETING, LIST_LOCATIONS, LIST_SERVICES, intent_router_from_env
+except ImportError:  # Deployed flat in the Lambda package
+    from intent_router import GREETING, LIST_LOCATIONS, LIST_SERVICES, intent_router_from_env
+try:
+    from .prompt_budget import prompt_budget_from_env, prompt_token_log
+except ImportError:  # Deployed flat in the Lambda package
+    from prompt_budget import prompt_budget_from_env, prompt_token_log
+try:
+    from .messenger_stream import messenger_streamer_from_env
+except ImportError:  # Deployed flat in the Lambda package
+    from messenger_stream import messenger_streamer_from_env
 
 # Initialize logger
 logger = logging.getLogger()
 logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
-# --- Define Dummy Tools ---
+# --- Define Tools ---
+# With a tool backend (see tool_backends.py) the tools serve real catalog, availability and booking
+# data, in-process when the booking Lambdas are co-deployed; without one they return mock replies.
+MAX_SLOTS_LISTED = 8  # Slots beyond this are summarized as a count to keep tool output short
+
+def _format_services(services):
+    return "Available services are: " + ", ".join(
+        f"{s['serviceName']} ({int(s['durationMinutes'])} min)" if s.get('durationMinutes') else s['serviceName'] for s in services) + "."
+
+def _format_locations(locations):
+    def describe(location):
+        address = location.get('address')
+        if isinstance(address, dict):
+            address = address.get('street')
+        return f"{location['locationName']} ({address})" if address else location['locationName']
+    return "Our locations are: " + ", ".join(describe(l) for l in locations) + "."
+
+def _cached(tool, args, call):
+    """Backend call of a tool, memoized per session when the tool has a result cache."""
+    if tool.cache is None:
+        return call()
+    return tool.cache.get_or_call(tool.name, args, call)
+
 class GetServiceListTool(BaseTool):
     name = "GetServiceListTool"
     description = "Use this tool to list available detailing services."
+    backend: Optional[Any] = None
+    cache: Optional[Any] = None
     # args_schema: Type[BaseModel] = None # No args for this simple version
 
     def _run(self, *args, **kwargs):
         logger.info("GetServiceListTool called")
-        return "Available services are: Full Detail, Interior Clean, Exterior Wash, Wax & Polish."
+        if self.backend is None:
+            return "Available services are: Full Detail, Interior Clean, Exterior Wash, Wax & Polish."
+        try:
+            services = _cached(self, {}, self.backend.list_services)
+        except ToolBackendError as e:
+            return str(e)
+        return _format_services(services) if services else "No services are currently offered."
 
 class GetLocationListTool(BaseTool):
     name = "GetLocationListTool"
     description = "Use this tool to list detailing center locations."
+    backend: Optional[Any] = None
+    cache: Optional[Any] = None
+
     def _run(self, *args, **kwargs):
         logger.info("GetLocationListTool called")
-        return "Our locations are: Downtown (123 Main St) and Uptown (456 Central Ave)."
+        if self.backend is None:
+            return "Our locations are: Downtown (123 Main St) and Uptown (456 Central Ave)."
+        try:
+            locations = _cached(self, {}, self.backend.list_locations)
+        except ToolBackendError as e:
+            return str(e)
+        return _format_locations(locations) if locations else "No locations are currently open."
 
 class CheckAvailabilityArgs(BaseModel):
     service_name: str = Field(description="The name of the service.")
     location_name: str = Field(description="The name of the location.")
-    date_preference: str = Field(description="The user's preferred date or date range.")
+    date_preference: Optional[str] = Field(default=None, description="The client's own words for when they want to come (e.g., 'next Tuesday afternoon', 'anytime next week', 'Aug 15 after 2pm'). The tool works out the dates, so pass the phrase as-is instead of ISO times.")
+    date_start_iso: Optional[str] = Field(default=None, description="Only if date_preference cannot be used: the start of the desired date/time window in ISO 8601 format (e.g., '2024-08-15T00:00:00Z').")
+    date_end_iso: Optional[str] = Field(default=None, description="Only if date_preference cannot be used: the end of the desired date/time window in ISO 8601 format (e.g., '2024-08-15T23:59:59Z').")
 
 class CheckAvailabilityTool(BaseTool):
     name = "CheckAvailabilityTool"
-    description = "Use this tool to check for available appointment slots. Input should be the service name, location name, and desired date or date range."
+    description = "Use this tool to check for available appointment slots. Input should be the service name, location name, and the client's date preference in their own words (or an ISO 8601 start and end)."
     args_schema: type[BaseModel] = CheckAvailabilityArgs
+    backend: Optional[Any] = None
+    cache: Optional[Any] = None
 
-    def _run(self, service_name: str, location_name: str, date_preference: str):
-        logger.info(f"Tool CheckAvailabilityTool called with: service_name='{service_name}', location_name='{location_name}', date_preference='{date_preference}'")
-        if "Downtown" in location_name and "Full Detail" in service_name:
-            return f"For {service_name} at {location_name} on {date_preference}, available slots are: Tomorrow at 10:00 AM, Next Tuesday at 2:00 PM."
-        return f"Sorry, no slots found for {service_name} at {location_name} on {date_preference} with current mock."
+    def _run(self, service_name: str, location_name: str, date_preference: Optional[str] = None,
+             date_start_iso: Optional[str] = None, date_end_iso: Optional[str] = None):
+        logger.info(f"Tool CheckAvailabilityTool called with: service_name='{service_name}', location_name='{location_name}', date_preference='{date_preference}', window='{date_start_iso}'-'{date_end_iso}'")
+        if self.backend is None:
+            when = date_preference or f"between {date_start_iso} and {date_end_iso}"
+            if "Downtown" in location_name and "Full Detail" in service_name:
+                return f"For {service_name} at {location_name} {when}, available slots are: Tomorrow at 10:00 AM, Next Tuesday at 2:00 PM."
+            return f"Sorry, no slots found for {service_name} at {location_name} {when} with current mock."
+        try:
+            if not (date_start_iso and date_end_iso):
+                if not date_preference:
+                    return "Please provide the client's date preference (or an ISO start and end) to check availability."
+                # Worked out locally, so the LLM spends no reasoning on date math
+                date_start_iso, date_end_iso = self.backend.availability_window(service_name, location_name, date_preference)
+            slots = _cached(self, {"service_name": service_name, "location_name": location_name,
+                                   "date_start_iso": date_start_iso, "date_end_iso": date_end_iso},
+                            lambda: self.backend.check_availability(service_name, location_name, date_start_iso, date_end_iso))
+        except ToolBackendError as e:
+            return str(e)
+        if not slots:
+            return f"Unfortunately, there are no slots available for {service_name} at {location_name} between {date_start_iso} and {date_end_iso}."
+        listed = ", ".join(slots[:MAX_SLOTS_LISTED])
+        more = f" (and {len(slots) - MAX_SLOTS_LISTED} later slots)" if len(slots) > MAX_SLOTS_LISTED else ""
+        return f"Available start times for {service_name} at {location_name} (ISO 8601, UTC): {listed}{more}."
 
 class CreateProvisionalBookingArgs(BaseModel):
     service_name: str = Field(description="The specific name of the service being booked.")
     location_name: str = Field(description="The specific name of the location for the booking.")
-    date_time: str = Field(description="The confirmed date and time for the appointment in a clear format (e.g., 'Tomorrow at 10:00 AM' or 'August 15th at 2:00 PM').")
+    date_time: str = Field(description="The confirmed start time for the appointment in ISO 8601 format, exactly as returned by CheckAvailabilityTool (e.g., '2024-08-15T10:00:00+00:00').")
     client_name: str = Field(description="The name of the client making the booking.")
     client_contact: str = Field(description="The contact information for the client (e.g., email or phone number).")
 
@@ -62,74 +159,237 @@ class CreateProvisionalBookingTool(BaseTool):
     name = "CreateProvisionalBookingTool"
     description = "Use this tool to make a tentative booking after confirming all details with the user (service, location, date/time, client name, client contact)."
     args_schema: type[BaseModel] = CreateProvisionalBookingArgs
+    backend: Optional[Any] = None
+    cache: Optional[Any] = None
 
     def _run(self, service_name: str, location_name: str, date_time: str, client_name: str, client_contact: str):
         logger.info(f"Tool CreateProvisionalBookingTool called for {client_name} for {service_name} at {location_name} on {date_time} with contact {client_contact}")
-        # This would call the /bookings API endpoint in a real scenario.
-        return f"Provisional booking created for {client_name} for {service_name} at {location_name} on {date_time}. Booking ID: MOCK123. Staff will confirm shortly using {client_contact}."
+        if self.backend is None:
+            return f"Provisional booking created for {client_name} for {service_name} at {location_name} on {date_time}. Booking ID: MOCK123. Staff will confirm shortly using {client_contact}."
+        try:
+            result = self.backend.create_booking(service_name, location_name, date_time, client_name, client_contact, client_id=client_contact,
+                                                 messenger_psid=messenger_psid_for_session(current_session_id.get()))
+        except ToolBackendError as e:
+            return f"The booking could not be created: {e}"
+        if self.cache is not None:
+            self.cache.invalidate_session()  # The booked slot is gone; availability must be checked afresh
+        return f"Provisional booking created for {client_name} for {service_name} at {location_name} on {date_time}. Booking ID: {result.get('bookingId')}. Staff will confirm shortly using {client_contact}."
 
-# --- Lambda Handler ---
-def lambda_handler(event, context):
-    logger.info(f"Received event: {json.dumps(event)}")
+# --- Container-scoped initialization ---
+# Everything below is built once per container and reused by warm invocations: the prompt file,
+# the ChatOpenAI client with its keep-alive HTTP pool, the tool instances and the compiled agent.
+SYSTEM_PROMPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "system_prompt.txt")
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant specialized in booking car detailing appointments. Be polite and guide the user through the process."
+
+OPENAI_TIMEOUT_SECONDS = float(os.environ.get('OPENAI_TIMEOUT_SECONDS', '30'))
+OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', '2'))
+OPENAI_MAX_CONNECTIONS = int(os.environ.get('OPENAI_MAX_CONNECTIONS', '10'))
+AGENT_VERBOSE = os.environ.get('AGENT_VERBOSE', 'true').lower() == 'true'  # verbose=True for CloudWatch logs
+# The tool calls the LLM emits in one step run concurrently (AgentExecutor's async path gathers them)
+# on a bounded thread pool, so a step takes as long as its slowest tool call.
+AGENT_PARALLEL_TOOLS = os.environ.get('AGENT_PARALLEL_TOOLS', 'true').lower() == 'true'
+AGENT_TOOL_MAX_WORKERS = int(os.environ.get('AGENT_TOOL_MAX_WORKERS', '4'))
+# Stream the agent's tokens, so callers that pass stream_to get the reply sentence by sentence
+AGENT_STREAMING = os.environ.get('AGENT_STREAMING', 'true').lower() == 'true'
+AGENT_LLM_TAG = "agent_llm"  # Tags the agent loop's LLM calls; summarizer calls are not streamed to the user
+
+_agent_runtime = None
+_invocation_count = 0
 
+# In-memory chat histories of this container, per session_id; used when CHAT_HISTORY_TABLE_NAME is not set
+store = {}
+
+def get_session_history(session_id: str) -> ChatMessageHistory:
+    if session_id not in store:
+        store[session_id] = ChatMessageHistory()
+    return store[session_id]
+
+def load_system_prompt(path=SYSTEM_PROMPT_PATH):
     try:
-        # --- 1. Load System Prompt ---
-        try:
-            # Assuming system_prompt.txt is in the same directory as lambda_function.py
-            # For AWS Lambda, ensure this file is packaged with your deployment.
-            with open("system_prompt.txt", "r", encoding="utf-8") as f:
-                system_prompt_text = f.read()
-            logger.info("System prompt loaded successfully.")
-        except FileNotFoundError:
-            logger.error("system_prompt.txt not found. Using a default prompt.")
-            system_prompt_text = "You are a helpful assistant specialized in booking car detailing appointments. Be polite and guide the user through the process."
-        except Exception as e:
-            logger.error(f"Error reading system_prompt.txt: {e}")
-            system_prompt_text = "You are a helpful assistant. An error occurred loading detailed instructions."
+        # For AWS Lambda, ensure system_prompt.txt is packaged next to lambda_function.py.
+        with open(path, "r", encoding="utf-8") as f:
+            system_prompt_text = f.read()
+        logger.info("System prompt loaded successfully.")
+        return system_prompt_text
+    except FileNotFoundError:
+        logger.error("system_prompt.txt not found. Using a default prompt.")
+        return DEFAULT_SYSTEM_PROMPT
+    except Exception as e:
+        logger.error(f"Error reading system_prompt.txt: {e}")
+        return "You are a helpful assistant. An error occurred loading detailed instructions."
+
+def build_agent_runtime(openai_api_key, llm=None, tool_backend=None):
+    """
+    Builds the prompt, LLM client, tools and agent executor. Returns them in a dict together with
+    the time each step took, so cold-start cost shows up in the logs.
+    llm and tool_backend replace ChatOpenAI and the configured backend, e.g. for offline replays.
+    """
+    timings = {}
+    started = time.perf_counter()
+
+    system_prompt_text = load_system_prompt()
+    timings['prompt_ms'] = round((time.perf_counter() - started) * 1000, 1)
 
+    step_started = time.perf_counter()
+    http_client = None
+    event_loop = None
+    if AGENT_PARALLEL_TOOLS:
+        # One loop per container, so the async HTTP pool it owns survives between warm invocations
+        event_loop = asyncio.new_event_loop()
+        event_loop.set_default_executor(ThreadPoolExecutor(max_workers=AGENT_TOOL_MAX_WORKERS, thread_name_prefix="agent-tool"))
+    if llm is None:
+        limits = httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS)
+        http_client = httpx.Client(timeout=OPENAI_TIMEOUT_SECONDS, limits=limits)
+        http_async_client = httpx.AsyncClient(timeout=OPENAI_TIMEOUT_SECONDS, limits=limits) if event_loop is not None else None
+        llm = ChatOpenAI(temperature=0, openai_api_key=openai_api_key, http_client=http_client,
+                         http_async_client=http_async_client, max_retries=OPENAI_MAX_RETRIES, streaming=AGENT_STREAMING)
+    if tool_backend is None:
+        tool_backend = tool_backend_from_env()
+    tool_cache = tool_cache_from_env() if tool_backend is not None else None
+    tools = [GetServiceListTool(backend=tool_backend, cache=tool_cache), GetLocationListTool(backend=tool_backend, cache=tool_cache),
+             CheckAvailabilityTool(backend=tool_backend, cache=tool_cache), CreateProvisionalBookingTool(backend=tool_backend, cache=tool_cache)]
+    timings['llm_and_tools_ms'] = round((time.perf_counter() - step_started) * 1000, 1)
+
+    step_started = time.perf_counter()
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", system_prompt_text),
+        MessagesPlaceholder(variable_name="chat_history"),
+        ("human", "{input}"),
+        MessagesPlaceholder(variable_name="agent_scratchpad"),
+    ])
+    # Every LLM call of the agent loop sees the assembled prompt cut down to PROMPT_TOKEN_BUDGET
+    prompt_budget = prompt_budget_from_env()
+    agent = (
+        RunnablePassthrough.assign(agent_scratchpad=lambda x: format_to_openai_tool_messages(x["intermediate_steps"]))
+        | prompt
+        | RunnableLambda(prompt_budget)
+        | llm.bind(tools=[convert_to_openai_tool(tool) for tool in tools]).with_config(tags=[AGENT_LLM_TAG])
+        | OpenAIToolsAgentOutputParser()
+    )
+    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=AGENT_VERBOSE)
+    # Persistent, compacted histories in DynamoDB when configured; one Query loads a session per turn
+    history_factory = chat_history_factory_from_env(summarizer=llm_summarizer(llm)) or get_session_history
+    agent_with_chat_history = RunnableWithMessageHistory(
+        agent_executor,
+        history_factory,
+        input_messages_key="input",
+        history_messages_key="chat_history",
+    )
+    timings['agent_ms'] = round((time.perf_counter() - step_started) * 1000, 1)
+    timings['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    logger.info(f"[AgentInit] Agent runtime built: {json.dumps(timings)}")
+    return {
+        "system_prompt": system_prompt_text,
+        "http_client": http_client,
+        "send_http_client": http_client or httpx.Client(timeout=OPENAI_TIMEOUT_SECONDS),  # Messenger Send API calls
+        "event_loop": event_loop,
+        "llm": llm,
+        "history_factory": history_factory,
+        "prompt_budget": prompt_budget,
+        "intent_router": intent_router_from_env(),
+        "tool_backend": tool_backend,
+        "tool_cache": tool_cache,
+        "tools": tools,
+        "agent_executor": agent_executor,
+        "agent_with_chat_history": agent_with_chat_history,
+        "init_timings": timings,
+    }
+
+# --- Fast path ---
+# Replies to trivial intents recognized by the intent router, answered without the LLM.
+def _tool(runtime, name):
+    return next(tool for tool in runtime["tools"] if tool.name == name)
+
+FAST_PATH_REPLIES = {
+    GREETING: lambda runtime: "Hi! I can help you book a car detailing appointment. Which service are you interested in, and which location and time suit you?",
+    LIST_SERVICES: lambda runtime: _tool(runtime, "GetServiceListTool")._run() + " Which one would you like to book?",
+    LIST_LOCATIONS: lambda runtime: _tool(runtime, "GetLocationListTool")._run() + " Which one suits you best?",
+}
+
+def answer_fast_path(runtime, session_id, user_message):
+    """The reply to a message the router recognizes, recorded in the chat history; None for messages the agent must handle."""
+    router = runtime["intent_router"]
+    intent = router.route(user_message) if router is not None else None
+    if intent not in FAST_PATH_REPLIES:
+        return None, None
+    session_token = current_session_id.set(session_id)  # Catalog replies share the session's tool cache
+    try:
+        reply = FAST_PATH_REPLIES[intent](runtime)
+    finally:
+        current_session_id.reset(session_token)
+    try:
+        runtime["history_factory"](session_id).add_messages([HumanMessage(content=user_message), AIMessage(content=reply)])
+    except Exception as e:  # The reply is still correct; the agent just won't see this exchange
+        logger.error(f"[FastPath] Could not record the {intent} exchange for session_id '{session_id}': {e}", exc_info=True)
+    return intent, reply
 
-        # --- 2. Initialize LLM and Tools ---
+# --- Streaming to Messenger ---
+class MessengerStreamingCallback(BaseCallbackHandler):
+    """Forwards the agent LLM's tokens, the end of its final answer and tool starts to a MessengerReplyStreamer."""
+    run_inline = True  # Keeps tokens in order on the async path; the streamer only buffers and queues sends
+
+    def __init__(self, streamer):
+        self.streamer = streamer
+
+    def on_llm_new_token(self, token, *, tags=None, **kwargs):
+        if token and AGENT_LLM_TAG in (tags or []):
+            self.streamer.on_token(token)
+
+    def on_llm_end(self, response, *, tags=None, **kwargs):
+        # The agent LLM's call without tool calls is its final answer: send the rest of it now
+        if AGENT_LLM_TAG in (tags or []) and not _has_tool_calls(response):
+            self.streamer.end_reply()
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self.streamer.on_tool_start((serialized or {}).get("name") or kwargs.get("name"))
+
+
+def _has_tool_calls(llm_result):
+    for generations in llm_result.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            if message is not None and (getattr(message, "tool_calls", None) or message.additional_kwargs.get("tool_calls")):
+                return True
+    return False
+
+def get_agent_runtime():
+    """The container's agent runtime, built on first use. None when OPENAI_API_KEY is not set."""
+    global _agent_runtime
+    if _agent_runtime is None:
         openai_api_key = os.environ.get('OPENAI_API_KEY')
         if not openai_api_key:
+            return None
+        _agent_runtime = build_agent_runtime(openai_api_key)
+    return _agent_runtime
+
+# Build during the Lambda init phase when possible; a failure here is retried by the first invocation.
+if os.environ.get('OPENAI_API_KEY'):
+    try:
+        get_agent_runtime()
+    except Exception as e:
+        logger.error(f"[AgentInit] Could not build the agent runtime at import, will retry on first invocation: {e}", exc_info=True)
+
+# --- Lambda Handler ---
+def lambda_handler(event, context):
+    global _invocation_count
+    logger.info(f"Received event: {json.dumps(event)}")
+
+    _invocation_count += 1
+    cold_start = _invocation_count == 1
+    invocation_started = time.perf_counter()
+
+    try:
+        # --- 1. Get the container's agent (built once, reused while warm) ---
+        init_started = time.perf_counter()
+        runtime = get_agent_runtime()
+        if runtime is None:
             logger.error("OPENAI_API_KEY environment variable not set.")
             return {"statusCode": 500, "body": json.dumps({"error": "OpenAI API key not configured."})}
-        
-        llm = ChatOpenAI(temperature=0, openai_api_key=openai_api_key)
-        tools = [GetServiceListTool(), GetLocationListTool(), CheckAvailabilityTool(), CreateProvisionalBookingTool()]
-        logger.info("LLM and Tools initialized.")
-
-        # --- 3. Create Agent Prompt ---
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt_text),
-            MessagesPlaceholder(variable_name="chat_history"),
-            ("human", "{input}"),
-            MessagesPlaceholder(variable_name="agent_scratchpad"),
-        ])
-        logger.info("Agent prompt created.")
-
-        # --- 4. Create Agent ---
-        agent = create_openai_tools_agent(llm, tools, prompt)
-        agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True) # verbose=True for CloudWatch logs
-        logger.info("Agent and AgentExecutor created.")
-
-        # --- 5. Set up Chat History ---
-        # This is a simplified in-memory store for a single session per Lambda invocation.
-        # For production, you'd use DynamoDB, Redis, etc., and manage session_id across invocations.
-        store = {} 
-        def get_session_history(session_id: str) -> ChatMessageHistory:
-            if session_id not in store:
-                store[session_id] = ChatMessageHistory()
-            return store[session_id]
-
-        agent_with_chat_history = RunnableWithMessageHistory(
-            agent_executor,
-            get_session_history,
-            input_messages_key="input",
-            history_messages_key="chat_history",
-        )
-        logger.info("Agent with chat history configured.")
-
-        # --- 6. Process Input ---
+        init_ms = round((time.perf_counter() - init_started) * 1000, 1)
+        agent_with_chat_history = runtime["agent_with_chat_history"]
+
+        # --- 2. Process Input ---
         try:
             body = json.loads(event.get('body', '{}'))
         except json.JSONDecodeError:
@@ -145,29 +405,78 @@ def lambda_handler(event, context):
         
         logger.info(f"Processing message for session_id '{session_id}': '{user_message}'")
 
-        # --- 7. Invoke Agent ---
+        # With stream_to the reply is also sent to the user as it is generated; the typing indicator goes out now
+        streamer = messenger_streamer_from_env(body.get('stream_to'), runtime["send_http_client"])
+        if streamer is not None:
+            streamer.start()
+
+        # --- 3. Answer trivial intents without the LLM ---
+        intent, fast_reply = answer_fast_path(runtime, session_id, user_message)
+        if fast_reply is not None:
+            logger.info(f"[FastPath] Answered {intent} for session_id '{session_id}' in {round((time.perf_counter() - invocation_started) * 1000, 1)} ms without the agent.")
+            if streamer is not None:
+                streamer.finish(fast_reply)
+            return {
+                "statusCode": 200,
+                "headers": {"Content-Type": "application/json"},
+                "body": json.dumps({"reply": fast_reply, "session_id": session_id, "streamed": streamer is not None})
+            }
+
+        # --- 4. Invoke Agent ---
+        tool_cache = runtime["tool_cache"]
+        cache_stats_before = tool_cache.stats() if tool_cache is not None else None
+        agent_started = time.perf_counter()
+        session_token = current_session_id.set(session_id)  # Keys the tools' result cache
+        prompt_tokens = []
+        prompt_log_token = prompt_token_log.set(prompt_tokens)  # Filled by the prompt budget, one entry per LLM call
         try:
-            response = agent_with_chat_history.invoke(
-                {"input": user_message},
-                config={"configurable": {"session_id": session_id}},
-            )
+            agent_input = {"input": user_message}
+            agent_config = {"configurable": {"session_id": session_id}}
+            if streamer is not None:
+                agent_config["callbacks"] = [MessengerStreamingCallback(streamer)]
+            if runtime["event_loop"] is not None:
+                response = runtime["event_loop"].run_until_complete(agent_with_chat_history.ainvoke(agent_input, config=agent_config))
+            else:
+                response = agent_with_chat_history.invoke(agent_input, config=agent_config)
             ai_response = response.get("output", "Sorry, I encountered an issue processing your request.")
             logger.info(f"Agent response for session_id '{session_id}': '{ai_response}'")
         except Exception as e:
             logger.error(f"Error during agent invocation for session_id '{session_id}': {e}", exc_info=True)
             ai_response = "I'm having trouble connecting to my brain right now. Please try again in a moment."
+            if streamer is not None:
+                streamer.finish(ai_response)
             # Potentially return a 500 error here if the agent fails consistently
             return {
                 "statusCode": 500,
                 "headers": {"Content-Type": "application/json"},
-                "body": json.dumps({"reply": ai_response, "session_id": session_id, "error": "Agent execution failed."})
+                "body": json.dumps({"reply": ai_response, "session_id": session_id, "error": "Agent execution failed.",
+                                    "streamed": streamer is not None})
             }
-        
-        # --- 8. Return Response ---
+        finally:
+            current_session_id.reset(session_token)
+            prompt_token_log.reset(prompt_log_token)
+
+        timing = {
+            "cold_start": cold_start,
+            "init_ms": init_ms,
+            "container_init_ms": runtime["init_timings"]["total_ms"],
+            "agent_ms": round((time.perf_counter() - agent_started) * 1000, 1),
+            "total_ms": round((time.perf_counter() - invocation_started) * 1000, 1),
+        }
+        timing["llm_calls"] = len(prompt_tokens)
+        timing["prompt_tokens"] = [entry["prompt_tokens"] for entry in prompt_tokens]
+        timing["dropped_history_messages"] = max([entry["dropped_messages"] for entry in prompt_tokens], default=0)
+        if tool_cache is not None:
+            timing["tool_cache"] = stats_delta(cache_stats_before, tool_cache.stats())
+        if streamer is not None:
+            timing["stream"] = streamer.finish(ai_response)  # typing_ms and first_text_ms: time to first visible response
+        logger.info(f"[AgentTiming] {json.dumps(timing)}")
+
+        # --- 5. Return Response ---
         return {
             "statusCode": 200,
             "headers": {"Content-Type": "application/json"},
-            "body": json.dumps({"reply": ai_response, "session_id": session_id})
+            "body": json.dumps({"reply": ai_response, "session_id": session_id, "streamed": streamer is not None})
         }
 
     except Exception as e:
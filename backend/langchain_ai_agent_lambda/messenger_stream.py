@@ -0,0 +1,171 @@
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Initialize logger
+logger = logging.getLogger()
+
+DEFAULT_GRAPH_API_URL = "https://graph.facebook.com/v19.0"
+DEFAULT_SEND_TIMEOUT_SECONDS = 5
+MESSENGER_TEXT_LIMIT = 2000
+
+# Status shown while a tool runs, once per tool and turn
+TOOL_STATUS_MESSAGES = {
+    "CheckAvailabilityTool": "Checking availability…",
+    "CreateProvisionalBookingTool": "Creating your booking…",
+    "GetServiceListTool": "Looking up our services…",
+    "GetLocationListTool": "Looking up our locations…",
+}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+class SentenceChunker:
+    """
+    Cuts streamed text into sentence-sized messages: a chunk ends at a sentence end or line break once it
+    holds min_chars, or at the last space before max_chars when a sentence runs on.
+    """
+
+    def __init__(self, min_chars=40, max_chars=640):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+
+    def feed(self, text):
+        """Adds streamed text; returns the chunks that are complete."""
+        self.buffer += text
+        chunks = []
+        while True:
+            boundary = next((m for m in _SENTENCE_END.finditer(self.buffer) if self.min_chars <= m.start() <= self.max_chars), None)
+            if boundary is not None:
+                chunk, self.buffer = self.buffer[:boundary.start()], self.buffer[boundary.end():]
+            elif len(self.buffer) > self.max_chars:
+                cut = self.buffer.rfind(" ", 0, self.max_chars)
+                cut = cut if cut > 0 else self.max_chars
+                chunk, self.buffer = self.buffer[:cut], self.buffer[cut:].lstrip()
+            else:
+                return chunks
+            if chunk.strip():
+                chunks.append(chunk.strip())
+
+    def flush(self):
+        """The text left over at the end of the stream, if any."""
+        rest, self.buffer = self.buffer.strip(), ""
+        return [rest] if rest else []
+
+
+class MessengerSendClient:
+    """Send API client for replies inside the 24-hour window; http_client is a pooled httpx.Client."""
+
+    def __init__(self, page_access_token, http_client, graph_api_url=DEFAULT_GRAPH_API_URL, timeout_seconds=DEFAULT_SEND_TIMEOUT_SECONDS):
+        self.page_access_token = page_access_token
+        self.http_client = http_client
+        self.url = f"{graph_api_url}/me/messages"
+        self.timeout_seconds = timeout_seconds
+
+    def _post(self, payload):
+        response = self.http_client.post(self.url, params={"access_token": self.page_access_token}, json=payload, timeout=self.timeout_seconds)
+        if response.status_code >= 300:
+            raise RuntimeError(f"Send API returned {response.status_code}: {response.text}")
+
+    def send_text(self, recipient_id, text):
+        self._post({"recipient": {"id": recipient_id}, "messaging_type": "RESPONSE", "message": {"text": text[:MESSENGER_TEXT_LIMIT]}})
+
+    def sender_action(self, recipient_id, action):
+        self._post({"recipient": {"id": recipient_id}, "sender_action": action})
+
+
+class MessengerReplyStreamer:
+    """
+    Streams one agent turn to a Messenger user: the typing indicator goes out at once, streamed tokens
+    are sent as sentence-sized messages, and tool starts show a status line. Sends run in order on a
+    single background thread so the token stream is never blocked on the Send API.
+    """
+
+    def __init__(self, client, recipient_id, chunker=None, status_messages=TOOL_STATUS_MESSAGES, clock=time.perf_counter):
+        self.client = client
+        self.recipient_id = recipient_id
+        self.chunker = chunker or SentenceChunker()
+        self.status_messages = status_messages
+        self.clock = clock
+        self.started = clock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="messenger-send")
+        self.statuses_sent = set()
+        self.text_chunks = 0
+        self.reply_ended = False
+        self.typing_ms = None
+        self.first_text_ms = None
+
+    def _elapsed_ms(self):
+        return round((self.clock() - self.started) * 1000, 1)
+
+    def _submit(self, send, *args, is_reply_text=False):
+        def run():
+            try:
+                send(self.recipient_id, *args)
+            except Exception as e:  # The turn's full reply is still returned to the caller
+                logger.warning(f"[MessengerStream] Send to {self.recipient_id} failed: {e}")
+                return
+            if send == self.client.sender_action and self.typing_ms is None:
+                self.typing_ms = self._elapsed_ms()
+            if is_reply_text and self.first_text_ms is None:
+                self.first_text_ms = self._elapsed_ms()
+        self.executor.submit(run)
+
+    def start(self):
+        self._submit(self.client.sender_action, "typing_on")
+
+    def on_token(self, token):
+        self._send_chunks(self.chunker.feed(token))
+
+    def on_tool_start(self, tool_name):
+        status = self.status_messages.get(tool_name)
+        if status and tool_name not in self.statuses_sent:
+            self.statuses_sent.add(tool_name)
+            self._submit(self.client.send_text, status)
+            self._submit(self.client.sender_action, "typing_on")  # Sending a message clears the indicator
+
+    def _send_chunks(self, chunks):
+        for chunk in chunks:
+            self.text_chunks += 1
+            self._submit(self.client.send_text, chunk, is_reply_text=True)
+
+    def end_reply(self):
+        """
+        Sends the rest of the reply as soon as the LLM's final answer is complete, without waiting for
+        the chain to return (history writes, compaction). Tokens after this start a new reply.
+        """
+        rest = self.chunker.flush()
+        self._send_chunks(rest)
+        if rest or self.text_chunks:
+            self.reply_ended = True
+            self._submit(self.client.sender_action, "typing_off")
+
+    def finish(self, final_text=None):
+        """Sends what is left (or final_text when nothing was streamed, e.g. fast-path or error replies); returns timing stats."""
+        rest = self.chunker.flush()
+        if not self.text_chunks and not rest and final_text:
+            whole_reply = SentenceChunker(min_chars=MESSENGER_TEXT_LIMIT // 2, max_chars=MESSENGER_TEXT_LIMIT)
+            rest = whole_reply.feed(final_text) + whole_reply.flush()
+        self._send_chunks(rest)
+        if rest or not self.reply_ended:
+            self._submit(self.client.sender_action, "typing_off")
+        self.executor.shutdown(wait=True)
+        return {"typing_ms": self.typing_ms, "first_text_ms": self.first_text_ms, "messages": self.text_chunks, "total_ms": self._elapsed_ms()}
+
+
+def messenger_streamer_from_env(stream_to, http_client):
+    """
+    A streamer for a request's stream_to ({"channel": "messenger", "recipient_id": psid}) when
+    FB_PAGE_ACCESS_TOKEN is set; None otherwise, and the reply is only returned.
+    """
+    if not stream_to or stream_to.get("channel") != "messenger" or not stream_to.get("recipient_id"):
+        return None
+    page_access_token = os.environ.get('FB_PAGE_ACCESS_TOKEN')
+    if not page_access_token:
+        logger.warning("[MessengerStream] FB_PAGE_ACCESS_TOKEN not set, replying without streaming.")
+        return None
+    client = MessengerSendClient(page_access_token, http_client, graph_api_url=os.environ.get('FB_GRAPH_API_URL', DEFAULT_GRAPH_API_URL))
+    return MessengerReplyStreamer(client, stream_to["recipient_id"])
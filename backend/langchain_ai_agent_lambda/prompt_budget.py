@@ -0,0 +1,120 @@
+import contextvars
+import json
+import logging
+import os
+
+# Initialize logger
+logger = logging.getLogger()
+
+try:  # tiktoken ships with langchain-openai; package its encoding files and set TIKTOKEN_CACHE_DIR to avoid a download at cold start
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+DEFAULT_TOKEN_BUDGET = 6000
+DEFAULT_KEEP_RECENT_MESSAGES = 4
+DEFAULT_TOOL_OUTPUT_MAX_TOKENS = 300
+DEFAULT_ENCODING = "cl100k_base"
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and separators the chat format adds to every message
+
+# Prompt sizes of the LLM calls made during the current invocation; the handler sets a fresh list.
+prompt_token_log = contextvars.ContextVar('prompt_token_log', default=None)
+
+
+def _content_text(message):
+    return message.content if isinstance(message.content, str) else json.dumps(message.content)
+
+
+def _with_content(message, content):
+    copy = getattr(message, 'model_copy', None) or message.copy
+    return copy(update={"content": content})
+
+
+class PromptBudget:
+    """
+    Fits an assembled agent prompt (system, chat history, human input, scratchpad) into token_budget.
+    The system prompt, the input, the scratchpad and the keep_recent_messages newest history messages are
+    kept verbatim; tool outputs are truncated to tool_output_max_tokens; older history is dropped oldest
+    first, except a leading running summary. Counts use tiktoken when installed, else ~4 chars per token.
+    """
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, keep_recent_messages=DEFAULT_KEEP_RECENT_MESSAGES,
+                 tool_output_max_tokens=DEFAULT_TOOL_OUTPUT_MAX_TOKENS, encoding_name=DEFAULT_ENCODING):
+        self.token_budget = token_budget
+        self.keep_recent_messages = keep_recent_messages
+        self.tool_output_max_tokens = tool_output_max_tokens
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                logger.warning(f"[PromptBudget] Tokenizer {encoding_name} unavailable, estimating token counts: {e}")
+
+    def count_tokens(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text or "", disallowed_special=()))
+        return len(text or "") // 4 + 1
+
+    def message_tokens(self, message):
+        return self.count_tokens(_content_text(message)) + MESSAGE_OVERHEAD_TOKENS
+
+    def squash_tool_output(self, message):
+        text = _content_text(message)
+        if self.count_tokens(text) <= self.tool_output_max_tokens:
+            return message
+        if self.encoding is not None:
+            truncated = self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:self.tool_output_max_tokens])
+        else:
+            truncated = text[:self.tool_output_max_tokens * 4]
+        return _with_content(message, truncated + " …[truncated]")
+
+    def fit(self, messages):
+        """Returns (messages within budget, stats) for a prompt laid out as the agent prompt template lays it out."""
+        messages = [self.squash_tool_output(m) if m.type == "tool" else m for m in messages]
+        input_index = max((i for i, m in enumerate(messages) if m.type == "human"), default=len(messages) - 1)
+        head = messages[:1] if messages and messages[0].type == "system" else []
+        history = messages[len(head):input_index]
+        tail = messages[input_index:]  # The input and the agent scratchpad
+
+        summary = history[:1] if history and history[0].type == "system" else []  # Running summary from the chat history
+        history = history[len(summary):]
+        recent = history[-self.keep_recent_messages:] if self.keep_recent_messages else []
+        older = history[:len(history) - len(recent)]
+
+        used = sum(self.message_tokens(m) for m in head + summary + recent + tail)
+        kept_older = []
+        for message in reversed(older):
+            tokens = self.message_tokens(message)
+            if used + tokens > self.token_budget:
+                break
+            kept_older.insert(0, message)
+            used += tokens
+
+        fitted = head + summary + kept_older + recent + tail
+        stats = {
+            "prompt_tokens": used,
+            "budget": self.token_budget,
+            "dropped_messages": len(older) - len(kept_older),
+            "over_budget": used > self.token_budget,  # The protected messages alone exceed the budget
+        }
+        return fitted, stats
+
+    def __call__(self, prompt_value):
+        """Runnable step between the prompt template and the LLM: prompt value in, fitted messages out."""
+        messages, stats = self.fit(prompt_value.to_messages())
+        log = prompt_token_log.get()
+        if log is not None:
+            log.append(stats)
+        if stats["dropped_messages"] or stats["over_budget"]:
+            logger.info(f"[PromptBudget] {json.dumps(stats)}")
+        return messages
+
+
+def prompt_budget_from_env():
+    """PROMPT_TOKEN_BUDGET, PROMPT_KEEP_RECENT_MESSAGES, PROMPT_TOOL_OUTPUT_MAX_TOKENS and PROMPT_TOKENIZER_ENCODING configure the budget."""
+    return PromptBudget(
+        token_budget=int(os.environ.get('PROMPT_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET)),
+        keep_recent_messages=int(os.environ.get('PROMPT_KEEP_RECENT_MESSAGES', DEFAULT_KEEP_RECENT_MESSAGES)),
+        tool_output_max_tokens=int(os.environ.get('PROMPT_TOOL_OUTPUT_MAX_TOKENS', DEFAULT_TOOL_OUTPUT_MAX_TOKENS)),
+        encoding_name=os.environ.get('PROMPT_TOKENIZER_ENCODING', DEFAULT_ENCODING)
+    )
@@ -0,0 +1,128 @@
+import unittest
+from unittest.mock import MagicMock
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, message_to_dict
+
+from backend.langchain_ai_agent_lambda.chat_history_store import DynamoDBChatMessageHistory, SUMMARY_PREFIX
+
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+
+class FakeBatchWriter:
+    def __init__(self, table):
+        self.table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def delete_item(self, Key):
+        self.table.operations.append(("delete", Key['seq']))
+        self.table.items.pop((Key['sessionId'], Key['seq']), None)
+
+
+class FakeChatHistoryTable:
+    """In-memory chat history table that honours attribute_not_exists(seq) and logs every write in order."""
+
+    def __init__(self, page_size=2):
+        self.items = {}
+        self.operations = []
+        self.page_size = page_size
+        self.meta = MagicMock()
+        self.meta.client.exceptions.ConditionalCheckFailedException = ConditionalCheckFailedException
+
+    def query(self, KeyConditionExpression, ConsistentRead, ExclusiveStartKey=None):
+        session_id = KeyConditionExpression.get_expression()['values'][1]
+        items = [dict(item) for (session, _), item in sorted(self.items.items()) if session == session_id]
+        start = ExclusiveStartKey or 0
+        response = {'Items': items[start:start + self.page_size]}
+        if start + self.page_size < len(items):
+            response['LastEvaluatedKey'] = start + self.page_size
+        return response
+
+    def put_item(self, Item, ConditionExpression=None):
+        key = (Item['sessionId'], Item['seq'])
+        if ConditionExpression == "attribute_not_exists(seq)" and key in self.items:
+            raise ConditionalCheckFailedException()
+        self.operations.append(("put", Item['seq']))
+        self.items[key] = dict(Item)
+
+    def batch_writer(self):
+        return FakeBatchWriter(self)
+
+    def seqs(self, session_id="s1"):
+        return sorted(seq for session, seq in self.items if session == session_id)
+
+
+def _message_item(seq, message, session_id="s1"):
+    return {'sessionId': session_id, 'seq': seq, 'message': json.dumps(message_to_dict(message)), 'expiresAt': 0}
+
+
+class TestDynamoDBChatMessageHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.table = FakeChatHistoryTable()
+
+    def _history(self, **kwargs):
+        return DynamoDBChatMessageHistory(self.table, "s1", clock=lambda: 1000, **kwargs)
+
+    def test_a_seq_taken_by_another_writer_is_reloaded_and_appended_after(self):
+        first, second = self._history(), self._history()
+
+        first.add_message(HumanMessage(content="Hi, I need a full detail"))
+        second.add_message(AIMessage(content="Which location?"))  # Still believes seq 1 is free
+
+        self.assertEqual(self.table.seqs(), [1, 2])
+        self.assertEqual([m.content for m in second.messages], ["Hi, I need a full detail", "Which location?"])
+        self.assertEqual([m.content for m in self._history().messages], ["Hi, I need a full detail", "Which location?"])
+
+    def test_compaction_writes_the_summary_before_deleting_the_folded_messages(self):
+        summarizer = MagicMock(return_value="Client wants a full detail downtown.")
+        history = self._history(summarizer=summarizer, max_history_tokens=20, keep_recent_messages=2)
+
+        history.add_messages([HumanMessage(content="x" * 40), AIMessage(content="y" * 40), HumanMessage(content="z" * 40)])
+
+        self.assertEqual(summarizer.call_args.args[0], "")
+        self.assertEqual([m.content for m in summarizer.call_args.args[1]], ["x" * 40])
+        self.assertEqual(self.table.operations, [("put", 1), ("put", 2), ("put", 3), ("put", 0), ("delete", 1)])
+        self.assertEqual(self.table.items[("s1", 0)]['summarizedThrough'], 1)
+        self.assertEqual(self.table.seqs(), [0, 2, 3])
+        self.assertEqual(history.messages[0], SystemMessage(content=SUMMARY_PREFIX + "Client wants a full detail downtown."))
+        self.assertEqual([m.content for m in history.messages[1:]], ["y" * 40, "z" * 40])
+
+    def test_messages_already_in_the_summary_are_ignored_when_their_delete_was_lost(self):
+        self.table.items[("s1", 0)] = {'sessionId': "s1", 'seq': 0, 'summary': "Booked Tuesday.", 'summarizedThrough': 2}
+        for seq, content in [(1, "old question"), (2, "old answer"), (3, "And my booking ID?")]:
+            self.table.items[("s1", seq)] = _message_item(seq, HumanMessage(content=content))
+
+        history = self._history()
+        history.add_message(AIMessage(content="It is b-123."))
+
+        self.assertEqual([m.content for m in history.messages],
+                         [SUMMARY_PREFIX + "Booked Tuesday.", "And my booking ID?", "It is b-123."])
+        self.assertEqual(self.table.operations, [("put", 4)])
+
+    def test_a_failed_summary_keeps_the_full_history_and_is_retried_next_turn(self):
+        summarizer = MagicMock(side_effect=[RuntimeError("LLM timeout"), "Short summary."])
+        history = self._history(summarizer=summarizer, max_history_tokens=20, keep_recent_messages=1)
+
+        history.add_messages([HumanMessage(content="x" * 40), AIMessage(content="y" * 40)])
+
+        self.assertEqual(self.table.seqs(), [1, 2])
+        self.assertNotIn(("put", 0), self.table.operations)
+        self.assertEqual([m.content for m in history.messages], ["x" * 40, "y" * 40])
+
+        history.add_message(HumanMessage(content="z" * 40))
+
+        self.assertEqual(summarizer.call_count, 2)
+        self.assertEqual(self.table.seqs(), [0, 3])
+        self.assertEqual([m.content for m in history.messages], [SUMMARY_PREFIX + "Short summary.", "z" * 40])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
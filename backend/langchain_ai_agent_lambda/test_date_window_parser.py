@@ -0,0 +1,53 @@
+import unittest
+from datetime import datetime, timezone
+
+from backend.langchain_ai_agent_lambda.date_window_parser import parse_date_window, to_utc_iso
+
+
+class TestParseDateWindow(unittest.TestCase):
+
+    def setUp(self):
+        self.now = datetime(2024, 8, 28, 15, 0, tzinfo=timezone.utc)  # Wednesday, 11:00 in New York
+
+    def _window(self, phrase, tz="America/New_York"):
+        window = parse_date_window(phrase, self.now, tz)
+        return window and (to_utc_iso(window.start), to_utc_iso(window.latest_start))
+
+    def test_common_phrases_in_the_location_timezone(self):
+        cases = {
+            "next Tuesday afternoon": ("2024-09-03T16:00:00Z", "2024-09-03T20:59:00Z"),
+            "anytime next week": ("2024-09-02T04:00:00Z", "2024-09-09T03:59:00Z"),
+            "tomorrow at 10": ("2024-08-29T14:00:00Z", "2024-08-29T14:00:00Z"),
+            "this weekend": ("2024-08-31T04:00:00Z", "2024-09-02T03:59:00Z"),
+            "friday morning": ("2024-08-30T12:00:00Z", "2024-08-30T15:59:00Z"),
+            "Sept 5th between 10 and 2": ("2024-09-05T14:00:00Z", "2024-09-05T18:00:00Z"),
+            "9/3 after 3pm": ("2024-09-03T19:00:00Z", "2024-09-04T03:59:00Z"),
+            "in 2 days at 14:30": ("2024-08-30T18:30:00Z", "2024-08-30T18:30:00Z"),
+            "friday 9-11": ("2024-08-30T13:00:00Z", "2024-08-30T15:00:00Z"),
+            "first thing monday": ("2024-09-02T12:00:00Z", "2024-09-02T12:59:00Z"),
+            "after work on wednesday": ("2024-09-04T21:00:00Z", "2024-09-05T00:59:00Z"),
+            "tomorrow morning at 9": ("2024-08-29T13:00:00Z", "2024-08-29T13:00:00Z"),
+        }
+        for phrase, expected in cases.items():
+            with self.subTest(phrase=phrase):
+                self.assertEqual(self._window(phrase), expected)
+
+    def test_windows_start_no_earlier_than_now_and_past_dates_roll_forward(self):
+        self.assertEqual(self._window("today"), ("2024-08-28T15:00:00Z", "2024-08-29T03:59:00Z"))
+        self.assertEqual(self._window("Aug 15", tz="UTC"), ("2025-08-15T00:00:00Z", "2025-08-15T23:59:00Z"))
+        self.assertIsNone(self._window("this morning at 9"))  # Already over
+
+    def test_phrases_without_a_date_are_not_guessed(self):
+        for phrase in ["whenever works", "as soon as possible", ""]:
+            with self.subTest(phrase=phrase):
+                self.assertIsNone(self._window(phrase))
+
+    def test_negations_and_phrases_read_only_in_part_are_not_guessed(self):
+        for phrase in ["any day but saturday", "not friday", "can't do tuesday", "anything other than monday",
+                       "friday or saturday", "late friday afternoon"]:
+            with self.subTest(phrase=phrase):
+                self.assertIsNone(self._window(phrase))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
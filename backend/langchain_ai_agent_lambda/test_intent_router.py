@@ -0,0 +1,40 @@
+import unittest
+
+from backend.langchain_ai_agent_lambda.intent_router import (
+    GREETING, LIST_LOCATIONS, LIST_SERVICES, IntentRouter
+)
+
+
+class TestIntentRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.router = IntentRouter()
+
+    def test_trivial_messages_are_routed(self):
+        cases = {
+            "hi": GREETING,
+            "Hello there! 👋": GREETING,
+            "What services do you have?": LIST_SERVICES,
+            "services please": LIST_SERVICES,
+            "Where are you located?": LIST_LOCATIONS,
+            "locations": LIST_LOCATIONS,
+        }
+        for message, intent in cases.items():
+            with self.subTest(message=message):
+                self.assertEqual(self.router.route(message), intent)
+
+    def test_messages_with_details_go_to_the_agent(self):
+        for message in ["hi, I need a full detail tomorrow at Downtown", "cancel my booking ABC123 and rebook for friday",
+                        "I want to cancel my booking",
+                        "what services do you have at uptown on saturday afternoon for an SUV and a sedan", "thanks", ""]:
+            with self.subTest(message=message):
+                self.assertIsNone(self.router.route(message))
+
+    def test_local_model_is_used_above_its_confidence_threshold(self):
+        router = IntentRouter(model=lambda text: (LIST_SERVICES, 0.9) if "menu" in text else (GREETING, 0.5))
+        self.assertEqual(router.route("got a menu?"), LIST_SERVICES)
+        self.assertIsNone(router.route("yo what's up"))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import MagicMock
+
+from backend.langchain_ai_agent_lambda.messenger_stream import MessengerReplyStreamer, MessengerSendClient, SentenceChunker
+
+
+class TestSentenceChunker(unittest.TestCase):
+
+    def test_streamed_tokens_are_cut_at_sentence_ends(self):
+        chunker = SentenceChunker(min_chars=20, max_chars=80)
+        text = "Great choice! The Full Detail takes 3 hours. I have slots at 10:00 and 14:30 on Tuesday.\nWhich suits you?"
+        chunks = []
+        for start in range(0, len(text), 3):  # Token-sized pieces
+            chunks.extend(chunker.feed(text[start:start + 3]))
+        chunks.extend(chunker.flush())
+
+        self.assertEqual(chunks, ["Great choice! The Full Detail takes 3 hours.",
+                                  "I have slots at 10:00 and 14:30 on Tuesday.", "Which suits you?"])
+
+    def test_run_on_text_is_cut_at_a_space_before_max_chars(self):
+        chunker = SentenceChunker(min_chars=10, max_chars=30)
+        chunks = chunker.feed("one two three four five six seven eight nine ten") + chunker.flush()
+
+        self.assertTrue(all(len(chunk) <= 30 for chunk in chunks))
+        self.assertEqual(" ".join(chunks), "one two three four five six seven eight nine ten")
+
+
+class TestMessengerReplyStreamer(unittest.TestCase):
+
+    def setUp(self):
+        self.http_client = MagicMock()
+        self.http_client.post.return_value = MagicMock(status_code=200)
+        self.streamer = MessengerReplyStreamer(MessengerSendClient("token", self.http_client), "psid1",
+                                               chunker=SentenceChunker(min_chars=10, max_chars=200))
+
+    def _payloads(self):
+        return [call.kwargs["json"] for call in self.http_client.post.call_args_list]
+
+    def test_typing_status_and_reply_are_sent_in_order(self):
+        self.streamer.start()
+        self.streamer.on_tool_start("CheckAvailabilityTool")
+        self.streamer.on_tool_start("CheckAvailabilityTool")  # Parallel calls of one tool show one status
+        for token in ["Tuesday at 10:00 is free. ", "Shall I book it", "?"]:
+            self.streamer.on_token(token)
+        stats = self.streamer.finish("Tuesday at 10:00 is free. Shall I book it?")
+
+        self.assertEqual(self._payloads(), [
+            {"recipient": {"id": "psid1"}, "sender_action": "typing_on"},
+            {"recipient": {"id": "psid1"}, "messaging_type": "RESPONSE", "message": {"text": "Checking availability…"}},
+            {"recipient": {"id": "psid1"}, "sender_action": "typing_on"},
+            {"recipient": {"id": "psid1"}, "messaging_type": "RESPONSE", "message": {"text": "Tuesday at 10:00 is free."}},
+            {"recipient": {"id": "psid1"}, "messaging_type": "RESPONSE", "message": {"text": "Shall I book it?"}},
+            {"recipient": {"id": "psid1"}, "sender_action": "typing_off"},
+        ])
+        self.assertEqual(stats["messages"], 2)
+        self.assertIsNotNone(stats["typing_ms"])
+        self.assertIsNotNone(stats["first_text_ms"])
+
+    def test_the_reply_ends_when_the_final_answer_is_complete_not_when_the_turn_returns(self):
+        for token in ["Booked for Tuesday. ", "See you then"]:
+            self.streamer.on_token(token)
+        self.streamer.end_reply()
+        self.streamer.executor.submit(lambda: None).result()  # Wait for the queued sends
+
+        self.assertEqual(self._payloads()[-2:], [
+            {"recipient": {"id": "psid1"}, "messaging_type": "RESPONSE", "message": {"text": "See you then"}},
+            {"recipient": {"id": "psid1"}, "sender_action": "typing_off"},
+        ])
+        stats = self.streamer.finish("Booked for Tuesday. See you then")
+        self.assertEqual(len(self._payloads()), 3)  # Nothing is sent twice
+        self.assertEqual(stats["messages"], 2)
+
+    def test_unstreamed_replies_are_sent_whole_and_send_failures_do_not_raise(self):
+        self.http_client.post.return_value = MagicMock(status_code=400, text="error")
+        self.streamer.finish("Hi! Which service are you interested in?")
+        self.assertEqual(self._payloads()[0]["message"], {"text": "Hi! Which service are you interested in?"})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,76 @@
+import unittest
+from dataclasses import dataclass, replace
+
+from backend.langchain_ai_agent_lambda.prompt_budget import PromptBudget, prompt_token_log
+
+
+@dataclass
+class Message:
+    """Minimal chat message with the fields and copy method of LangChain messages."""
+    type: str
+    content: str
+
+    def model_copy(self, update):
+        return replace(self, **update)
+
+
+class PromptValue:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def to_messages(self):
+        return list(self.messages)
+
+
+def _prompt(history_turns, scratchpad=()):
+    messages = [Message("system", "You book car detailing appointments.")]
+    for turn in range(history_turns):
+        messages += [Message("human", f"question {turn} " + "words " * 40), Message("ai", f"answer {turn} " + "words " * 40)]
+    return messages + [Message("human", "Is Tuesday free?")] + list(scratchpad)
+
+
+class TestPromptBudget(unittest.TestCase):
+
+    def test_prompt_within_budget_is_unchanged(self):
+        budget = PromptBudget(token_budget=100000)
+        messages = _prompt(3)
+        fitted, stats = budget.fit(messages)
+        self.assertEqual(fitted, messages)
+        self.assertEqual(stats["dropped_messages"], 0)
+
+    def test_oldest_history_is_dropped_and_recent_turns_system_and_input_kept(self):
+        messages = _prompt(10)
+        budget = PromptBudget(keep_recent_messages=4)
+        budget.token_budget = sum(budget.message_tokens(m) for m in messages) // 2
+
+        fitted, stats = budget.fit(messages)
+
+        self.assertLessEqual(stats["prompt_tokens"], budget.token_budget)
+        self.assertGreater(stats["dropped_messages"], 0)
+        self.assertEqual(fitted[0], messages[0])
+        self.assertEqual(fitted[-5:], messages[-5:])  # Four recent history messages and the input
+        self.assertEqual(len(fitted), len(messages) - stats["dropped_messages"])
+        self.assertEqual(fitted[1:-5], messages[-5 - len(fitted[1:-5]):-5])  # The newest of the older messages survive
+
+    def test_running_summary_is_kept_and_tool_outputs_are_squashed(self):
+        summary = Message("system", "Summary of the earlier conversation: Jane wants a Full Detail.")
+        messages = _prompt(6, scratchpad=[Message("ai", ""), Message("tool", "slot " * 2000)])
+        messages.insert(1, summary)
+        budget = PromptBudget(token_budget=400, keep_recent_messages=2, tool_output_max_tokens=50)
+
+        log = []
+        token = prompt_token_log.set(log)
+        try:
+            fitted = budget(PromptValue(messages))
+        finally:
+            prompt_token_log.reset(token)
+
+        self.assertEqual(fitted[1], summary)
+        self.assertTrue(fitted[-1].content.endswith("…[truncated]"))
+        self.assertLessEqual(budget.count_tokens(fitted[-1].content), 60)
+        self.assertEqual(len(log), 1)
+        self.assertEqual(log[0]["prompt_tokens"], sum(budget.message_tokens(m) for m in fitted))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
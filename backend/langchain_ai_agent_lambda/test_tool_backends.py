@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import MagicMock
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from backend.langchain_ai_agent_lambda.tool_backends import (
+    InProcessToolBackend, ToolBackend, ToolBackendError, messenger_psid_for_session
+)
+
+
+def _table(items):
+    table = MagicMock()
+    table.scan.return_value = {'Items': items}
+    return table
+
+
+class TestInProcessToolBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.services_table = _table([
+            {'serviceId': 'svc1', 'serviceName': 'Full Detail', 'durationMinutes': Decimal(180), 'bufferMinutesBetweenAppointments': Decimal(30)},
+            {'serviceId': 'svc2', 'serviceName': 'Retired Service', 'isActive': False},
+        ])
+        self.locations_table = _table([
+            {'locationId': 'loc1', 'locationName': 'Downtown', 'googleCalendarId': 'downtown@group.calendar.google.com', 'timeZone': 'America/New_York'},
+            {'locationId': 'loc2', 'locationName': 'Uptown'},
+        ])
+        self.availability_handler = MagicMock(return_value={
+            "statusCode": 200, "body": json.dumps({"availableSlots": ["2024-08-15T10:00:00+00:00"]})})
+        self.create_booking_handler = MagicMock(return_value={
+            "statusCode": 201, "body": json.dumps({"bookingId": "booking1"})})
+        self.backend = InProcessToolBackend(self.services_table, self.locations_table,
+                                            self.availability_handler, self.create_booking_handler)
+
+    def test_availability_resolves_names_and_calls_the_handler_directly(self):
+        slots = self.backend.check_availability("full detail", "Downtown", "2024-08-15T00:00:00Z", "2024-08-15T23:59:59Z")
+
+        self.assertEqual(slots, ["2024-08-15T10:00:00+00:00"])
+        event = self.availability_handler.call_args[0][0]
+        self.assertEqual(event["queryStringParameters"], {
+            "calendar_id": "downtown@group.calendar.google.com",
+            "start_time_iso": "2024-08-15T00:00:00Z",
+            "end_time_iso": "2024-08-15T23:59:59Z",
+            "service_duration_minutes": "180",
+            "buffer_minutes_between_appointments": "30",
+        })
+
+    def test_inactive_or_unknown_entries_and_handler_errors_raise_tool_errors(self):
+        self.assertEqual([s['serviceName'] for s in self.backend.list_services()], ["Full Detail"])
+        with self.assertRaises(ToolBackendError):
+            self.backend.check_availability("Retired Service", "Downtown", "2024-08-15T00:00:00Z", "2024-08-15T23:59:59Z")
+        with self.assertRaises(ToolBackendError):
+            self.backend.check_availability("Full Detail", "Uptown", "2024-08-15T00:00:00Z", "2024-08-15T23:59:59Z")  # No calendar
+
+        self.availability_handler.return_value = {"statusCode": 400, "body": json.dumps({"error": "Invalid ISO time format."})}
+        with self.assertRaisesRegex(ToolBackendError, "Invalid ISO time format"):
+            self.backend.check_availability("Full Detail", "Downtown", "tomorrow", "later")
+
+    def test_date_preferences_become_windows_that_fit_the_service(self):
+        now = datetime(2024, 8, 28, 15, 0, tzinfo=timezone.utc)
+        self.assertEqual(self.backend.availability_window("Full Detail", "Downtown", "next tuesday afternoon", now=now),
+                         ("2024-09-03T16:00:00Z", "2024-09-04T00:29:00Z"))  # Last start 16:59 local plus 3.5 hours
+        with self.assertRaises(ToolBackendError):
+            self.backend.availability_window("Full Detail", "Downtown", "whenever", now=now)
+
+    def test_create_booking_builds_the_create_booking_request(self):
+        result = self.backend.create_booking("Full Detail", "downtown", "2024-08-15T10:00:00+00:00",
+                                             "Test Client", "test@example.com", client_id="test@example.com")
+
+        self.assertEqual(result["bookingId"], "booking1")
+        body = json.loads(self.create_booking_handler.call_args[0][0]["body"])
+        self.assertEqual(body["locationId"], "loc1")
+        self.assertEqual(body["clientContact"], {"email": "test@example.com"})
+        self.assertEqual(body["bookingChannel"], "ai_agent")
+
+        self.backend.create_booking("Full Detail", "downtown", "2024-08-15T10:00:00+00:00", "Test Client", "+15555550100",
+                                    client_id="+15555550100", messenger_psid=messenger_psid_for_session("fb_psid-1"))
+        body = json.loads(self.create_booking_handler.call_args[0][0]["body"])
+        self.assertEqual(body["clientContact"], {"phone": "+15555550100", "messengerPsid": "psid-1"})
+        self.assertIsNone(messenger_psid_for_session("web_session"))
+
+    def test_backends_must_provide_every_call(self):
+        class CatalogOnlyBackend(ToolBackend):
+            def list_services(self):
+                return []
+
+            def list_locations(self):
+                return []
+
+        with self.assertRaisesRegex(TypeError, "_availability"):
+            CatalogOnlyBackend()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
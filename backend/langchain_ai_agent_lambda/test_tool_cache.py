@@ -0,0 +1,54 @@
+import unittest
+from unittest.mock import MagicMock
+
+from backend.langchain_ai_agent_lambda.tool_cache import ToolResultCache, current_session_id, normalize_args, stats_delta
+
+
+class TestToolResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.cache = ToolResultCache({"GetServiceListTool": 3600, "CheckAvailabilityTool": 60}, clock=lambda: self.now)
+
+    def test_identical_calls_in_a_session_hit_until_the_ttl_expires(self):
+        call = MagicMock(return_value=["slot"])
+        args = {"service_name": "Full Detail", "location_name": "Downtown"}
+
+        self.cache.get_or_call("CheckAvailabilityTool", args, call, session_id="s1")
+        self.cache.get_or_call("CheckAvailabilityTool", {"location_name": " downtown", "service_name": "full  detail"}, call, session_id="s1")
+        self.cache.get_or_call("CheckAvailabilityTool", args, call, session_id="s2")  # Other session
+        self.now += 61
+        self.cache.get_or_call("CheckAvailabilityTool", args, call, session_id="s1")
+
+        self.assertEqual(call.call_count, 3)
+        self.assertEqual(self.cache.stats(), {"hits": {"CheckAvailabilityTool": 1}, "misses": {"CheckAvailabilityTool": 3}})
+
+    def test_uncached_tools_errors_and_invalidated_sessions_call_through(self):
+        booking = MagicMock(return_value="booked")
+        self.cache.get_or_call("CreateProvisionalBookingTool", {}, booking, session_id="s1")
+        self.cache.get_or_call("CreateProvisionalBookingTool", {}, booking, session_id="s1")
+        self.assertEqual(booking.call_count, 2)
+
+        failing = MagicMock(side_effect=RuntimeError("backend down"))
+        with self.assertRaises(RuntimeError):
+            self.cache.get_or_call("GetServiceListTool", {}, failing, session_id="s1")
+
+        services = MagicMock(return_value=["Full Detail"])
+        token = current_session_id.set("s1")
+        try:
+            before = self.cache.stats()
+            self.cache.get_or_call("GetServiceListTool", {}, services)
+            self.cache.get_or_call("GetServiceListTool", {}, services)
+            self.cache.invalidate_session()
+            self.cache.get_or_call("GetServiceListTool", {}, services)
+            self.assertEqual(stats_delta(before, self.cache.stats()), {"hits": 1, "misses": 2})
+        finally:
+            current_session_id.reset(token)
+        self.assertEqual(services.call_count, 2)
+
+    def test_args_are_normalized(self):
+        self.assertEqual(normalize_args({"b": "Two  Words ", "a": 1}), normalize_args({"a": 1, "b": "two words"}))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,259 @@
+import abc
+import importlib
+import json
+import logging
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+try:
+    from .date_window_parser import parse_date_window, to_utc_iso
+except ImportError:  # Deployed flat in the Lambda package
+    from date_window_parser import parse_date_window, to_utc_iso
+
+# Initialize logger
+logger = logging.getLogger()
+
+DEFAULT_HTTP_TIMEOUT_SECONDS = 10
+# Timezone of locations without a timeZone attribute, used to read the client's date phrases
+DEFAULT_LOCATION_TIMEZONE = os.environ.get('DEFAULT_LOCATION_TIMEZONE', 'UTC')
+# Sessions started by the Messenger webhook are 'fb_<senderId>'; the sender ID is the client's PSID
+MESSENGER_SESSION_PREFIX = "fb_"
+
+
+class ToolBackendError(Exception):
+    """A tool call that could not be served; the message is safe to hand back to the LLM."""
+
+
+def messenger_psid_for_session(session_id):
+    """The Messenger PSID of a webhook session, or None for sessions from other channels."""
+    if session_id and session_id.startswith(MESSENGER_SESSION_PREFIX):
+        return session_id[len(MESSENGER_SESSION_PREFIX):] or None
+    return None
+
+
+def _matches(item, name, name_field, id_field):
+    name = (name or "").strip().lower()
+    return name in ((item.get(name_field) or "").lower(), (item.get(id_field) or "").lower())
+
+
+class ToolBackend(abc.ABC):
+    """
+    The agent tools' view of the booking system: the catalog, availability and provisional bookings.
+    Subclasses provide the catalog and the two calls; names given by the LLM are resolved here.
+    """
+
+    @abc.abstractmethod
+    def list_services(self):
+        """The active services, as ServicesTable items."""
+
+    @abc.abstractmethod
+    def list_locations(self):
+        """The active locations, as LocationsTable items."""
+
+    @abc.abstractmethod
+    def _availability(self, query_params):
+        """The get-availability response body for the query parameters."""
+
+    @abc.abstractmethod
+    def _create_booking(self, body):
+        """The create-booking response body for the request body."""
+
+    def resolve_service(self, service_name):
+        service = next((s for s in self.list_services() if _matches(s, service_name, 'serviceName', 'serviceId')), None)
+        if service is None:
+            raise ToolBackendError(f"Unknown service '{service_name}'. Use GetServiceListTool to see the available services.")
+        return service
+
+    def resolve_location(self, location_name):
+        location = next((l for l in self.list_locations() if _matches(l, location_name, 'locationName', 'locationId')), None)
+        if location is None:
+            raise ToolBackendError(f"Unknown location '{location_name}'. Use GetLocationListTool to see our locations.")
+        return location
+
+    def check_availability(self, service_name, location_name, start_iso, end_iso):
+        """Available slot start times (ISO 8601) for the service at the location within the window."""
+        service = self.resolve_service(service_name)
+        location = self.resolve_location(location_name)
+        if not location.get('googleCalendarId'):
+            raise ToolBackendError(f"Online booking is not available for {location.get('locationName', location_name)} yet.")
+        return self._availability({
+            "calendar_id": location['googleCalendarId'],
+            "start_time_iso": start_iso,
+            "end_time_iso": end_iso,
+            "service_duration_minutes": str(int(service.get('durationMinutes', 60))),
+            "buffer_minutes_between_appointments": str(int(service.get('bufferMinutesBetweenAppointments', 0))),
+        }).get('availableSlots', [])
+
+    def availability_window(self, service_name, location_name, date_preference, now=None):
+        """
+        (start_iso, end_iso) for check_availability from the client's own words, read in the location's
+        timezone. The window runs to the latest acceptable start plus the service duration and buffer.
+        """
+        service = self.resolve_service(service_name)
+        location = self.resolve_location(location_name)
+        now = now or datetime.now(timezone.utc)
+        window = parse_date_window(date_preference, now, location.get('timeZone') or DEFAULT_LOCATION_TIMEZONE)
+        if window is None:
+            raise ToolBackendError(f"Could not work out a date from '{date_preference}'. Ask the client for a day, "
+                                   f"or pass date_start_iso and date_end_iso instead.")
+        slot_minutes = int(service.get('durationMinutes', 60)) + int(service.get('bufferMinutesBetweenAppointments', 0))
+        return to_utc_iso(window.start), to_utc_iso(window.latest_start + timedelta(minutes=slot_minutes))
+
+    def create_booking(self, service_name, location_name, start_iso, client_name, client_contact, client_id, messenger_psid=None):
+        """
+        Creates a provisional booking; returns the create-booking response ({bookingId, bookingDetails}).
+        messenger_psid is stored in clientContact too, so notifications also reach the client on Messenger.
+        """
+        service = self.resolve_service(service_name)
+        location = self.resolve_location(location_name)
+        contact = {"email": client_contact} if "@" in client_contact else {"phone": client_contact}
+        if messenger_psid:
+            contact["messengerPsid"] = messenger_psid
+        return self._create_booking({
+            "clientId": client_id,
+            "clientName": client_name,
+            "clientContact": contact,
+            "serviceName": service['serviceName'],
+            "locationId": location['locationId'],
+            "proposedStartTime": start_iso,
+            "bookingChannel": "ai_agent",
+        })
+
+
+def _handler_result(response, call_name):
+    """The decoded body of an API Gateway style response; non-2xx responses raise ToolBackendError."""
+    body = json.loads(response.get('body') or '{}')
+    if not 200 <= response.get('statusCode', 500) < 300:
+        logger.warning(f"[ToolBackend] {call_name} failed with {response.get('statusCode')}: {body}")
+        raise ToolBackendError(body.get('error') or f"{call_name} failed.")
+    return body
+
+
+def _load_lambda_module(lambda_dir):
+    """The lambda_function module of a co-deployed Lambda: backend.<dir> in the repo, <dir> when packaged."""
+    parent = (__package__ or "").rpartition('.')[0]
+    if parent:
+        return importlib.import_module(f"{parent}.{lambda_dir}.lambda_function")
+    return importlib.import_module(f"{lambda_dir}.lambda_function")
+
+
+class InProcessToolBackend(ToolBackend):
+    """
+    Serves the tools without leaving the agent's process: the catalog is read from the Services and
+    Locations tables, and availability and bookings call the co-deployed Lambdas' handlers directly,
+    so a tool call costs no API Gateway hop or second Lambda invocation.
+    """
+
+    def __init__(self, services_table, locations_table, availability_handler, create_booking_handler):
+        self.services_table = services_table
+        self.locations_table = locations_table
+        self.availability_handler = availability_handler
+        self.create_booking_handler = create_booking_handler
+
+    @staticmethod
+    def _scan_active(table):
+        items, scan_kwargs = [], {}
+        while True:
+            response = table.scan(**scan_kwargs)
+            items.extend(item for item in response.get('Items', []) if item.get('isActive', True))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def list_services(self):
+        return self._scan_active(self.services_table)
+
+    def list_locations(self):
+        return self._scan_active(self.locations_table)
+
+    def _availability(self, query_params):
+        return _handler_result(self.availability_handler({"queryStringParameters": query_params}, None), "Availability check")
+
+    def _create_booking(self, body):
+        return _handler_result(self.create_booking_handler({"body": json.dumps(body)}, None), "Booking")
+
+
+class HttpToolBackend(ToolBackend):
+    """Serves the tools through the public API (GET /services, /locations, /availability and POST /bookings)."""
+
+    def __init__(self, base_url, api_key=None, timeout=DEFAULT_HTTP_TIMEOUT_SECONDS):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def _request(self, method, path, query_params=None, body=None):
+        url = f"{self.base_url}{path}"
+        if query_params:
+            url += "?" + urllib.parse.urlencode(query_params)
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["x-api-key"] = self.api_key
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(url, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return {"statusCode": response.status, "body": response.read().decode('utf-8')}
+        except urllib.error.HTTPError as e:
+            return {"statusCode": e.code, "body": e.read().decode('utf-8')}
+        except (urllib.error.URLError, OSError) as e:
+            logger.error(f"[ToolBackend] {method} {path} failed: {e}")
+            raise ToolBackendError("The booking system could not be reached.")
+
+    def list_services(self):
+        return _handler_result(self._request("GET", "/services"), "Service list").get('services', [])
+
+    def list_locations(self):
+        return _handler_result(self._request("GET", "/locations"), "Location list").get('locations', [])
+
+    def _availability(self, query_params):
+        return _handler_result(self._request("GET", "/availability", query_params=query_params), "Availability check")
+
+    def _create_booking(self, body):
+        return _handler_result(self._request("POST", "/bookings", body=body), "Booking")
+
+
+def _http_backend_from_env():
+    base_url = os.environ.get('TOOL_API_BASE_URL')
+    if not base_url:
+        return None
+    return HttpToolBackend(base_url, api_key=os.environ.get('TOOL_API_KEY'),
+                           timeout=float(os.environ.get('TOOL_API_TIMEOUT_SECONDS', DEFAULT_HTTP_TIMEOUT_SECONDS)))
+
+
+def tool_backend_from_env(dynamodb_resource=None):
+    """
+    TOOL_BACKEND_MODE=inprocess (default) serves the tools from SERVICES_TABLE_NAME, LOCATIONS_TABLE_NAME and
+    the co-deployed availability and create-booking Lambdas; TOOL_BACKEND_MODE=http uses TOOL_API_BASE_URL.
+    In-process mode falls back to HTTP only when TOOL_API_BASE_URL is set. Returns None when neither is
+    available, and the tools keep their mock replies.
+    """
+    if os.environ.get('TOOL_BACKEND_MODE', 'inprocess').lower() == 'http':
+        return _http_backend_from_env()
+
+    services_table_name = os.environ.get('SERVICES_TABLE_NAME')
+    locations_table_name = os.environ.get('LOCATIONS_TABLE_NAME')
+    try:
+        if not (services_table_name and locations_table_name):
+            raise ValueError("SERVICES_TABLE_NAME and LOCATIONS_TABLE_NAME are required in-process")
+        availability_module = _load_lambda_module('get_availability_lambda')
+        create_booking_module = _load_lambda_module('create_booking_lambda')
+    except (ImportError, ValueError) as e:
+        http_backend = _http_backend_from_env()
+        if http_backend is not None:
+            logger.warning(f"[ToolBackend] In-process tool backend unavailable ({e}), using {http_backend.base_url}.")
+        else:
+            logger.warning(f"[ToolBackend] In-process tool backend unavailable ({e}) and TOOL_API_BASE_URL not set; tools use mock replies.")
+        return http_backend
+
+    if dynamodb_resource is None:
+        import boto3
+        dynamodb_resource = boto3.resource('dynamodb')
+    return InProcessToolBackend(
+        dynamodb_resource.Table(services_table_name),
+        dynamodb_resource.Table(locations_table_name),
+        availability_module.lambda_handler,
+        create_booking_module.lambda_handler
+    )
@@ -0,0 +1,112 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Initialize logger
+logger = logging.getLogger()
+
+# Session of the agent turn being processed; set by the handler so tools can key their cache entries.
+current_session_id = contextvars.ContextVar('current_session_id', default=None)
+
+# Seconds a tool result stays valid. The catalog rarely changes; availability goes stale quickly.
+# Tools without a TTL (e.g. CreateProvisionalBookingTool) are never cached.
+DEFAULT_TOOL_TTLS = {
+    "GetServiceListTool": 3600,
+    "GetLocationListTool": 3600,
+    "CheckAvailabilityTool": 60,
+}
+DEFAULT_MAX_ENTRIES = 1000
+
+
+def normalize_args(args):
+    """A stable key for tool arguments: sorted keys, strings trimmed, lower-cased and whitespace-collapsed."""
+    def normalize(value):
+        if isinstance(value, str):
+            return " ".join(value.split()).lower()
+        if isinstance(value, dict):
+            return {k: normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        return value
+    return json.dumps(normalize(args or {}), sort_keys=True, default=str)
+
+
+class ToolResultCache:
+    """
+    Memoizes tool results per (session, tool, normalized args) for the tool's TTL, within this container.
+    Only results are cached; calls that raise are retried next time. Bounded by max_entries (LRU).
+    """
+
+    def __init__(self, ttls=None, max_entries=DEFAULT_MAX_ENTRIES, clock=time.monotonic):
+        self.ttls = dict(DEFAULT_TOOL_TTLS if ttls is None else ttls)
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (expires_at, result)
+        self.hits = {}
+        self.misses = {}
+        self.lock = threading.Lock()  # Tool calls of one agent step may run on several threads
+
+    def get_or_call(self, tool_name, args, call, session_id=None):
+        """Returns the cached result of tool_name(args) for the session, or call() and caches it."""
+        ttl = self.ttls.get(tool_name)
+        session_id = session_id if session_id is not None else current_session_id.get()
+        if not ttl or session_id is None:
+            return call()
+        key = (session_id, tool_name, normalize_args(args))
+        now = self.clock()
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None and cached[0] > now:
+                self.entries.move_to_end(key)
+                self.hits[tool_name] = self.hits.get(tool_name, 0) + 1
+                return cached[1]
+            self.misses[tool_name] = self.misses.get(tool_name, 0) + 1
+
+        result = call()
+        with self.lock:
+            self.entries[key] = (self.clock() + ttl, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return result
+
+    def invalidate_session(self, session_id=None):
+        """Drops every cached result of the session, e.g. after it created a booking."""
+        session_id = session_id if session_id is not None else current_session_id.get()
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == session_id]:
+                del self.entries[key]
+
+    def stats(self):
+        """Cumulative hit and miss counters per tool, e.g. {'hits': {...}, 'misses': {...}}."""
+        with self.lock:
+            return {"hits": dict(self.hits), "misses": dict(self.misses)}
+
+
+def stats_delta(before, after):
+    """Hits and misses between two stats() snapshots, totalled over all tools."""
+    return {
+        counter: sum(after[counter].values()) - sum(before[counter].values())
+        for counter in ("hits", "misses")
+    }
+
+
+def tool_cache_from_env():
+    """
+    TOOL_CACHE_ENABLED (default true) enables the cache; TOOL_CACHE_TTLS overrides per-tool TTLs as JSON
+    (e.g. {"CheckAvailabilityTool": 30}); TOOL_CACHE_MAX_ENTRIES bounds it. Returns None when disabled.
+    """
+    if os.environ.get('TOOL_CACHE_ENABLED', 'true').lower() != 'true':
+        return None
+    ttls = dict(DEFAULT_TOOL_TTLS)
+    overrides = os.environ.get('TOOL_CACHE_TTLS')
+    if overrides:
+        try:
+            ttls.update({name: float(seconds) for name, seconds in json.loads(overrides).items()})
+        except (ValueError, AttributeError) as e:
+            logger.error(f"[ToolCache] Ignoring invalid TOOL_CACHE_TTLS: {e}")
+    return ToolResultCache(ttls, max_entries=int(os.environ.get('TOOL_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)))
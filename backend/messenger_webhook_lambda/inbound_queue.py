@@ -0,0 +1,112 @@
+import hashlib
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# Initialize logger
+logger = logging.getLogger()
+
+SQS_BATCH_LIMIT = 10  # Entries per SendMessageBatch call
+
+
+def normalize_messaging_events(body_json):
+    """
+    The text messages, quick replies and postbacks of a page webhook POST as queue events
+    ({senderId, pageId, messageId, text, timestamp}), oldest first. Echoes, delivery and read
+    receipts and attachments without text are dropped.
+    """
+    events = []
+    for entry in body_json.get('entry', []):
+        for messaging_event in entry.get('messaging', []):
+            sender_id = (messaging_event.get('sender') or {}).get('id')
+            message = messaging_event.get('message') or {}
+            postback = messaging_event.get('postback') or {}
+            if not sender_id or message.get('is_echo'):
+                continue
+            text = message.get('text') or postback.get('title')
+            if not text:
+                logger.info(f"Received non-message event or echo: {json.dumps(messaging_event)}")
+                continue
+            timestamp = messaging_event.get('timestamp') or entry.get('time') or 0
+            events.append({
+                "senderId": sender_id,
+                "pageId": (messaging_event.get('recipient') or {}).get('id') or entry.get('id'),
+                "messageId": message.get('mid') or postback.get('mid') or f"{sender_id}:{timestamp}",
+                "text": text,
+                "timestamp": timestamp,
+            })
+    # One POST can batch several entries; a sender's messages must reach the queue in the order they were sent
+    return sorted(events, key=lambda event: event["timestamp"])
+
+
+def deduplication_id(event):
+    """Facebook retries a webhook with the same message IDs, so the FIFO queue drops the resent copies."""
+    message_ids = event.get("messageIds") or [event["messageId"]]
+    return hashlib.sha256(",".join(message_ids).encode('utf-8')).hexdigest()
+
+
+def enqueue_events(sqs_client, queue_url, events):
+    """
+    Sends the events to the FIFO queue with the sender as MessageGroupId, so each sender's messages
+    are consumed in order. Returns the events that could not be queued.
+    """
+    failed = []
+    for start in range(0, len(events), SQS_BATCH_LIMIT):
+        batch = events[start:start + SQS_BATCH_LIMIT]
+        entries = [{
+            "Id": str(index),
+            "MessageBody": json.dumps(event),
+            "MessageGroupId": event["senderId"],
+            "MessageDeduplicationId": deduplication_id(event),
+        } for index, event in enumerate(batch)]
+        try:
+            response = sqs_client.send_message_batch(QueueUrl=queue_url, Entries=entries)
+        except Exception as e:
+            logger.error(f"[InboundQueue] SendMessageBatch of {len(batch)} events failed: {e}", exc_info=True)
+            failed.extend(batch)
+            continue
+        for failure in response.get('Failed', []):
+            logger.error(f"[InboundQueue] Event {batch[int(failure['Id'])]['messageId']} not queued: {failure.get('Code')} {failure.get('Message')}")
+            failed.append(batch[int(failure['Id'])])
+    return failed
+
+
+def records_by_sender(records):
+    """SQS records grouped by MessageGroupId (the sender), each group in queue order."""
+    groups = {}
+    for record in records:
+        group_id = (record.get('attributes') or {}).get('MessageGroupId') or record.get('messageId')
+        groups.setdefault(group_id, []).append(record)
+    return groups
+
+
+def process_in_sender_order(records, handle_event, max_workers, merge=None, has_time_left=None):
+    """
+    Runs handle_event(event) for every record: one sender's records one after another, different
+    senders in parallel. With merge, a sender's records in the batch are handled as one event,
+    merge(events). A failure stops that sender's group, and the message IDs of the failed record
+    and the ones after it are returned for batchItemFailures, so the retry keeps their order.
+    When has_time_left() turns False, no further record is started and the rest are returned the same way.
+    """
+    def run_group(group):
+        units = [group] if merge is not None else [[record] for record in group]
+        for index, unit in enumerate(units):
+            if has_time_left is not None and not has_time_left():
+                deferred_ids = [record['messageId'] for later in units[index:] for record in later]
+                logger.warning(f"[InboundQueue] Out of time, returning {len(deferred_ids)} records of the sender to the queue.")
+                return deferred_ids
+            try:
+                events = [json.loads(record['body']) for record in unit]
+                handle_event(events[0] if len(events) == 1 else merge(events))
+            except Exception as e:
+                failed_ids = [record['messageId'] for later in units[index:] for record in later]
+                logger.error(f"[InboundQueue] Record {unit[0].get('messageId')} failed, retrying {len(failed_ids)} "
+                             f"records of the sender: {e}", exc_info=True)
+                return failed_ids
+        return []
+
+    groups = list(records_by_sender(records).values())
+    if not groups:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(groups)))) as pool:
+        return [message_id for failed_ids in pool.map(run_group, groups) for message_id in failed_ids]
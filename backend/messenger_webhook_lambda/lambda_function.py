@@ -3,7 +3,19 @@ import os
 import logging
 import hmac
 import hashlib
+import urllib.error
+import urllib.request
 import boto3 # For invoking the Langchain agent Lambda
+from botocore.config import Config
+
+try:
+    from .inbound_queue import enqueue_events, normalize_messaging_events, process_in_sender_order
+except ImportError:  # Deployed flat in the Lambda package
+    from inbound_queue import enqueue_events, normalize_messaging_events, process_in_sender_order
+try:
+    from .message_coalescer import MESSAGE_SEPARATOR, coalesce_events, pending_message_buffer_from_env
+except ImportError:  # Deployed flat in the Lambda package
+    from message_coalescer import MESSAGE_SEPARATOR, coalesce_events, pending_message_buffer_from_env
 
 # Initialize logger
 logger = logging.getLogger()
@@ -13,6 +25,15 @@ logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 FB_APP_SECRET = os.environ.get('FB_APP_SECRET')
 FB_VERIFY_TOKEN = os.environ.get('FB_VERIFY_TOKEN') # Your predefined verify token
 LANGCHAIN_LAMBDA_NAME = os.environ.get('LANGCHAIN_LAMBDA_NAME')
+# Webhook POSTs are acknowledged once their messages are on this FIFO queue (MessageGroupId = sender);
+# the same Lambda consumes the queue and runs the agent, in order per sender and in parallel across senders.
+INBOUND_QUEUE_URL = os.environ.get('INBOUND_QUEUE_URL')
+CONSUMER_MAX_WORKERS = int(os.environ.get('CONSUMER_MAX_WORKERS', '5'))
+AGENT_INVOKE_TIMEOUT_SECONDS = int(os.environ.get('AGENT_INVOKE_TIMEOUT_SECONDS', '120'))
+TURN_SAFETY_MARGIN_SECONDS = 10  # Time to send the reply and return batchItemFailures after the agent answers
+# Replies the agent did not stream itself are sent through the Send API
+FB_PAGE_ACCESS_TOKEN = os.environ.get('FB_PAGE_ACCESS_TOKEN')
+FB_GRAPH_API_URL = os.environ.get('FB_GRAPH_API_URL', 'https://graph.facebook.com/v19.0')
 
 if not FB_APP_SECRET:
     logger.critical("FB_APP_SECRET environment variable not set.")
@@ -20,8 +41,17 @@ if not FB_VERIFY_TOKEN:
     logger.critical("FB_VERIFY_TOKEN environment variable not set.")
 if not LANGCHAIN_LAMBDA_NAME:
     logger.warning("LANGCHAIN_LAMBDA_NAME environment variable not set. Cannot invoke agent.")
+if not INBOUND_QUEUE_URL:
+    logger.critical("INBOUND_QUEUE_URL environment variable not set. Incoming messages cannot be queued.")
+
+# An agent turn is not retried by the client: a retry after a read timeout would run the turn twice
+lambda_client = boto3.client('lambda', config=Config(read_timeout=AGENT_INVOKE_TIMEOUT_SECONDS, retries={'total_max_attempts': 1}))
+sqs_client = boto3.client('sqs')
 
-lambda_client = boto3.client('lambda')
+# A sender's burst of messages becomes one agent turn: merged within a POST, and across POSTs
+# through the pending messages table (PENDING_MESSAGES_TABLE_NAME) once the sender goes quiet.
+# Without the table, a sender's records that arrive in the same queue batch are still merged.
+pending_messages = pending_message_buffer_from_env()
 
 def verify_signature(signature, payload_body, app_secret):
     if not signature:
@@ -46,9 +76,81 @@ def verify_signature(signature, payload_body, app_secret):
     
     return hmac.compare_digest(calculated_hash, expected_hash)
 
+def send_reply(recipient_id, text):
+    """Sends a reply through the Messenger Send API; failures are logged, since the turn itself succeeded."""
+    if not FB_PAGE_ACCESS_TOKEN:
+        logger.error(f"FB_PAGE_ACCESS_TOKEN not set, cannot reply to {recipient_id}.")
+        return
+    payload = {"recipient": {"id": recipient_id}, "messaging_type": "RESPONSE", "message": {"text": text[:2000]}}
+    request = urllib.request.Request(f"{FB_GRAPH_API_URL}/me/messages?access_token={FB_PAGE_ACCESS_TOKEN}",
+                                     data=json.dumps(payload).encode('utf-8'), headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=10):
+            pass
+    except (urllib.error.URLError, OSError) as e:
+        logger.error(f"Send API reply to {recipient_id} failed: {e}")
+
+def run_agent_turn(inbound):
+    """
+    Runs the agent for one queued message and delivers its reply. Raises when the agent Lambda could not
+    run the turn (throttled, crashed or timed out), so the message is retried; a reply the agent gave,
+    even an error reply, is final.
+    """
+    sender_id = inbound['senderId']
+    message_text = inbound['text']
+    buffered = None
+    if pending_messages is not None and 'version' in inbound:
+        buffered = pending_messages.take_when_quiet(sender_id, inbound['version'])
+        if buffered is None:
+            logger.info(f"[Coalescer] Message {inbound['messageId']} from sender {sender_id} is answered by a later turn.")
+            return
+        message_text = MESSAGE_SEPARATOR.join(message['text'] for message in buffered)
+    logger.info(f"[Coalescer] One agent turn for {len(buffered or inbound.get('messages') or [inbound])} messages from sender {sender_id}.")
+    payload = {
+        "body": json.dumps({ # Langchain Lambda expects a 'body' with 'message'
+            "message": message_text,
+            "session_id": f"fb_{sender_id}", # Create a session ID
+            "stream_to": {"channel": "messenger", "recipient_id": sender_id},
+        })
+    }
+    logger.info(f"Invoking Langchain agent Lambda '{LANGCHAIN_LAMBDA_NAME}' for message {inbound['messageId']} from sender {sender_id}")
+    response = lambda_client.invoke(FunctionName=LANGCHAIN_LAMBDA_NAME, InvocationType='RequestResponse', Payload=json.dumps(payload))
+    result = json.loads(response['Payload'].read() or b'{}')
+    if response.get('FunctionError'):
+        raise RuntimeError(f"Agent Lambda failed: {result}")
+    body = json.loads(result.get('body') or '{}')
+    if body.get('reply') and not body.get('streamed'):
+        send_reply(sender_id, body['reply'])
+    if buffered:
+        pending_messages.consume(sender_id, buffered)
+
+def handle_queue_records(event, context=None):
+    """
+    SQS batch from the inbound FIFO queue; failed senders' remaining records are returned as batchItemFailures.
+    A turn is only started while a whole agent invocation still fits in the Lambda's remaining time,
+    so the records left over are retried instead of being cut off by the timeout.
+    """
+    records = event.get('Records', [])
+    if not LANGCHAIN_LAMBDA_NAME:
+        logger.error("LANGCHAIN_LAMBDA_NAME not set, cannot invoke agent.")
+        return {"batchItemFailures": [{"itemIdentifier": record['messageId']} for record in records]}
+    merge = (lambda events: coalesce_events(events)[0]) if pending_messages is None else None
+    has_time_left = None
+    if hasattr(context, 'get_remaining_time_in_millis'):
+        needed_ms = (AGENT_INVOKE_TIMEOUT_SECONDS + TURN_SAFETY_MARGIN_SECONDS) * 1000
+        has_time_left = lambda: context.get_remaining_time_in_millis() > needed_ms
+    failed_message_ids = process_in_sender_order(records, run_agent_turn, CONSUMER_MAX_WORKERS, merge=merge,
+                                                 has_time_left=has_time_left)
+    logger.info(f"Processed {len(records)} queued messages, {len(failed_message_ids)} to retry.")
+    # Honoured when ReportBatchItemFailures is enabled on the event source mapping
+    return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failed_message_ids]}
+
 def lambda_handler(event, context):
     logger.info(f"Received event: {json.dumps(event)}")
 
+    if 'Records' in event:
+        return handle_queue_records(event, context)
+
     http_method = event.get('httpMethod', 'GET').upper()
 
     if http_method == 'GET':
@@ -93,48 +195,23 @@ def lambda_handler(event, context):
             return {'statusCode': 400, 'body': json.dumps({'error': 'Invalid JSON format'})}
 
         if body_json.get('object') == 'page': # Check if it's a page subscription event
-            for entry in body_json.get('entry', []):
-                for messaging_event in entry.get('messaging', []):
-                    if messaging_event.get('message') and not messaging_event['message'].get('is_echo'): # It's a message, not an echo
-                        sender_id = messaging_event['sender']['id']
-                        message_text = messaging_event['message'].get('text')
-                        
-                        if sender_id and message_text:
-                            logger.info(f"Received message from sender {sender_id}: '{message_text}'")
-                            
-                            # Placeholder: Invoke Langchain agent Lambda
-                            if LANGCHAIN_LAMBDA_NAME:
-                                try:
-                                    payload = {
-                                        "body": json.dumps({ # Langchain Lambda expects a 'body' with 'message'
-                                            "message": message_text,
-                                            "session_id": f"fb_{sender_id}" # Create a session ID
-                                        })
-                                    }
-                                    logger.info(f"Invoking Langchain agent Lambda '{LANGCHAIN_LAMBDA_NAME}' with payload: {json.dumps(payload)}")
-                                    # response = lambda_client.invoke( # This sends to Langchain lambda but doesn't wait and reply here.
-                                    #     FunctionName=LANGCHAIN_LAMBDA_NAME,
-                                    #     InvocationType='Event', # Asynchronous
-                                    #     Payload=json.dumps(payload)
-                                    # )
-                                    # For a direct reply, you might use 'RequestResponse' and process the response.
-                                    # For now, we assume the Langchain Lambda handles outbound messaging or another mechanism does.
-                                    # logger.info(f"Langchain agent Lambda invocation response: {response}")
-                                    
-                                    # If we want to send a reply back via Messenger API directly from here,
-                                    # we would need another function call here.
-                                    # For this task, just logging the intent.
-                                    logger.info("Placeholder: Logic to send AI response back to Messenger user would be here.")
-
-                                except Exception as e:
-                                    logger.error(f"Error invoking Langchain Lambda: {e}", exc_info=True)
-                            else:
-                                logger.warning("LANGCHAIN_LAMBDA_NAME not set, cannot invoke agent.")
-                        else:
-                            logger.info("Received message without sender_id or text.")
-                    else:
-                        logger.info(f"Received non-message event or echo: {json.dumps(messaging_event)}")
-            
+            events = coalesce_events(normalize_messaging_events(body_json))
+            if events:
+                if not INBOUND_QUEUE_URL:
+                    logger.error(f"INBOUND_QUEUE_URL not set, dropping {len(events)} messages.")
+                    return {'statusCode': 200, 'body': json.dumps({'status': 'queue_not_configured'})}
+                if pending_messages is not None:
+                    try:
+                        for inbound in events:
+                            inbound['version'] = pending_messages.add(inbound)
+                    except Exception as e:
+                        logger.error(f"Could not buffer incoming messages: {e}", exc_info=True)
+                        return {'statusCode': 500, 'body': json.dumps({'error': 'Messages could not be buffered'})}
+                failed = enqueue_events(sqs_client, INBOUND_QUEUE_URL, events)
+                if failed:
+                    # Facebook redelivers the POST; the events already queued are dropped by FIFO deduplication
+                    return {'statusCode': 500, 'body': json.dumps({'error': f'{len(failed)} of {len(events)} messages could not be queued'})}
+                logger.info(f"Queued {len(events)} messages from {len({event['senderId'] for event in events})} senders.")
             return {'statusCode': 200, 'body': json.dumps({'status': 'success'})}
         else:
             logger.info("Received POST request that is not a 'page' object event.")
@@ -0,0 +1,121 @@
+import logging
+import os
+import time
+from decimal import Decimal
+
+# Initialize logger
+logger = logging.getLogger()
+
+DEFAULT_WINDOW_SECONDS = 2.5  # Quiet time after a sender's last message before the agent runs
+DEFAULT_TTL_SECONDS = 24 * 3600
+MESSAGE_SEPARATOR = "\n"  # How a burst reads in the agent's input: one message per line
+
+
+def coalesce_events(events):
+    """
+    Merges each sender's events (of one webhook POST, or one queue batch) into one event, texts
+    joined in send order.
+    The merged event lists its parts in messages ({messageId, text}) and every message ID in
+    messageIds, so a resent POST deduplicates the same way.
+    """
+    merged = {}
+    for event in events:
+        parts = event.get("messages") or [{"messageId": event["messageId"], "text": event["text"]}]
+        current = merged.get(event["senderId"])
+        if current is None:
+            merged[event["senderId"]] = dict(event, messages=list(parts), messageIds=[part["messageId"] for part in parts])
+            continue
+        current["text"] += MESSAGE_SEPARATOR + event["text"]
+        current["messages"].extend(parts)
+        current["messageIds"].extend(part["messageId"] for part in parts)
+        current.update(messageId=event["messageId"], timestamp=event["timestamp"])
+    return list(merged.values())
+
+
+class PendingMessageBuffer:
+    """
+    Debounces a sender's messages across webhook POSTs. Each queued event appends its messages to
+    the sender's item ({senderId, messages, messageIds, version, lastReceivedAt, expiresAt}) and is
+    queued with the version it produced. The consumer waits until the sender has been quiet for
+    window_seconds; an event whose version has been overtaken is skipped, so only the burst's last
+    event runs the agent, once, on every message buffered so far.
+    """
+
+    def __init__(self, table, window_seconds=DEFAULT_WINDOW_SECONDS, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 clock=time.time, sleep=time.sleep):
+        self.table = table
+        self.window_seconds = window_seconds
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.sleep = sleep
+
+    def add(self, event):
+        """Buffers the event's messages; returns the sender's new version (the current one for a resent event)."""
+        messages = event.get("messages") or [{"messageId": event["messageId"], "text": event["text"]}]
+        message_ids = [message["messageId"] for message in messages]
+        now = self.clock()
+        try:
+            response = self.table.update_item(
+                Key={'senderId': event["senderId"]},
+                UpdateExpression=("SET messages = list_append(if_not_exists(messages, :empty), :new), "
+                                  "lastReceivedAt = :now, expiresAt = :expires ADD version :one, messageIds :ids"),
+                ConditionExpression="attribute_not_exists(messageIds) OR NOT contains(messageIds, :first_id)",
+                ExpressionAttributeValues={
+                    ':empty': [],
+                    ':new': messages,
+                    ':now': Decimal(str(round(now, 3))),
+                    ':expires': int(now) + self.ttl_seconds,
+                    ':one': 1,
+                    ':ids': set(message_ids),
+                    ':first_id': message_ids[0],
+                },
+                ReturnValues="UPDATED_NEW"
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            # Facebook resent the POST; queue it again in case the first attempt never reached the queue
+            item = self.table.get_item(Key={'senderId': event["senderId"]}, ConsistentRead=True).get('Item') or {}
+            logger.info(f"[Coalescer] Messages {message_ids} of sender {event['senderId']} already buffered.")
+            return int(item.get('version', 0))
+        return int(response['Attributes']['version'])
+
+    def take_when_quiet(self, sender_id, version):
+        """
+        The sender's buffered messages once no message has arrived for window_seconds, or None when a
+        later event (version) will take them, or they were already answered.
+        """
+        while True:
+            item = self.table.get_item(Key={'senderId': sender_id}, ConsistentRead=True).get('Item')
+            if not item or int(item.get('version', 0)) != version or not item.get('messages'):
+                return None
+            wait = float(item['lastReceivedAt']) + self.window_seconds - self.clock()
+            if wait <= 0:
+                return item['messages']
+            self.sleep(wait)
+
+    def consume(self, sender_id, messages):
+        """
+        Removes answered messages; messages buffered meanwhile stay for their own event. messageIds
+        keeps the answered IDs until the item expires, so late webhook retries are still recognized.
+        """
+        removals = ", ".join(f"messages[{index}]" for index in range(len(messages)))
+        self.table.update_item(
+            Key={'senderId': sender_id},
+            UpdateExpression=f"REMOVE {removals}",
+            ConditionExpression="size(messages) >= :count",
+            ExpressionAttributeValues={':count': len(messages)}
+        )
+
+
+def pending_message_buffer_from_env(dynamodb_resource=None):
+    """PENDING_MESSAGES_TABLE_NAME enables cross-POST debouncing (COALESCE_WINDOW_SECONDS, default 2.5); None otherwise."""
+    table_name = os.environ.get('PENDING_MESSAGES_TABLE_NAME')
+    if not table_name:
+        return None
+    if dynamodb_resource is None:
+        import boto3
+        dynamodb_resource = boto3.resource('dynamodb')
+    return PendingMessageBuffer(
+        dynamodb_resource.Table(table_name),
+        window_seconds=float(os.environ.get('COALESCE_WINDOW_SECONDS', DEFAULT_WINDOW_SECONDS)),
+        ttl_seconds=int(os.environ.get('PENDING_MESSAGES_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+    )
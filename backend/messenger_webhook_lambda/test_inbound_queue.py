@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import MagicMock
+import json
+import threading
+
+from backend.messenger_webhook_lambda.inbound_queue import enqueue_events, normalize_messaging_events, process_in_sender_order
+
+
+def _messaging(sender_id, text, timestamp, mid=None, **message):
+    return {"sender": {"id": sender_id}, "recipient": {"id": "page1"}, "timestamp": timestamp,
+            "message": dict({"mid": mid or f"m_{sender_id}_{timestamp}", "text": text}, **message)}
+
+
+def _record(message_id, sender_id, text):
+    return {"messageId": message_id, "attributes": {"MessageGroupId": sender_id},
+            "body": json.dumps({"senderId": sender_id, "text": text, "messageId": f"m_{message_id}"})}
+
+
+class TestWebhookHandOff(unittest.TestCase):
+
+    def test_events_are_normalized_in_send_order_without_echoes(self):
+        body = {"object": "page", "entry": [
+            {"id": "page1", "time": 3, "messaging": [_messaging("u1", "tomorrow?", 3)]},
+            {"id": "page1", "time": 2, "messaging": [
+                _messaging("u1", "hi", 1),
+                _messaging("page1", "Hello!", 2, is_echo=True),
+                {"sender": {"id": "u2"}, "recipient": {"id": "page1"}, "timestamp": 2, "delivery": {"mids": ["m_x"]}},
+                {"sender": {"id": "u2"}, "recipient": {"id": "page1"}, "timestamp": 2, "postback": {"mid": "m_pb", "title": "Book now"}},
+            ]},
+        ]}
+
+        events = normalize_messaging_events(body)
+
+        self.assertEqual([(e["senderId"], e["text"]) for e in events], [("u1", "hi"), ("u2", "Book now"), ("u1", "tomorrow?")])
+        self.assertEqual(events[1]["messageId"], "m_pb")
+
+    def test_events_are_queued_per_sender_and_failed_entries_are_returned(self):
+        sqs = MagicMock()
+        sqs.send_message_batch.side_effect = [{"Failed": [{"Id": "1", "Code": "InternalError"}]}, {}]
+        events = [{"senderId": f"u{i % 2}", "messageId": f"m_{i}", "text": "hi", "timestamp": i} for i in range(12)]
+
+        failed = enqueue_events(sqs, "queue-url", events)
+
+        self.assertEqual(sqs.send_message_batch.call_count, 2)  # 10 + 2
+        entries = sqs.send_message_batch.call_args_list[0].kwargs["Entries"]
+        self.assertEqual([entry["MessageGroupId"] for entry in entries[:3]], ["u0", "u1", "u0"])
+        self.assertEqual(len({entry["MessageDeduplicationId"] for entry in entries}), 10)
+        self.assertEqual(failed, [events[1]])
+
+        sqs.send_message_batch.side_effect = None
+        sqs.send_message_batch.return_value = {}
+        enqueue_events(sqs, "queue-url", events[:1])  # A webhook retry resends the same message ID
+        self.assertEqual(sqs.send_message_batch.call_args.kwargs["Entries"][0]["MessageDeduplicationId"],
+                         entries[0]["MessageDeduplicationId"])
+
+    def test_senders_run_in_parallel_and_a_failure_retries_the_rest_of_that_sender(self):
+        handled, lock = [], threading.Lock()
+
+        def handle(event):
+            if event["text"] == "boom":
+                raise RuntimeError("agent throttled")
+            with lock:
+                handled.append((event["senderId"], event["text"]))
+
+        records = [_record("1", "u1", "hi"), _record("2", "u2", "hello"), _record("3", "u1", "boom"),
+                   _record("4", "u2", "a detail"), _record("5", "u1", "tomorrow?")]
+
+        failed = process_in_sender_order(records, handle, max_workers=4)
+
+        self.assertEqual(failed, ["3", "5"])
+        self.assertEqual([text for sender, text in handled if sender == "u2"], ["hello", "a detail"])
+        self.assertEqual([text for sender, text in handled if sender == "u1"], ["hi"])
+
+    def test_records_are_not_started_once_time_runs_out(self):
+        handled = []
+        remaining = iter([True, True, False])
+
+        failed = process_in_sender_order([_record("1", "u1", "hi"), _record("2", "u1", "friday?"), _record("3", "u1", "at 10")],
+                                         lambda event: handled.append(event["text"]), max_workers=1,
+                                         has_time_left=lambda: next(remaining))
+
+        self.assertEqual(handled, ["hi", "friday?"])
+        self.assertEqual(failed, ["3"])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,108 @@
+import unittest
+from unittest.mock import MagicMock
+import json
+
+from backend.messenger_webhook_lambda.inbound_queue import process_in_sender_order
+from backend.messenger_webhook_lambda.message_coalescer import PendingMessageBuffer, coalesce_events
+
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+
+class InMemoryPendingTable:
+    """Stand-in for the pending messages table implementing the buffer's append, read and removal."""
+
+    def __init__(self):
+        self.items = {}
+        self.meta = MagicMock()
+        self.meta.client.exceptions.ConditionalCheckFailedException = ConditionalCheckFailedException
+
+    def get_item(self, Key, ConsistentRead=False):
+        item = self.items.get(Key['senderId'])
+        return {'Item': dict(item, messages=list(item['messages']))} if item else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, ConditionExpression=None, ReturnValues=None):
+        values = ExpressionAttributeValues
+        item = self.items.setdefault(Key['senderId'], {'senderId': Key['senderId'], 'messages': [], 'messageIds': set(), 'version': 0})
+        if UpdateExpression.startswith("REMOVE"):
+            if len(item['messages']) < values[':count']:
+                raise ConditionalCheckFailedException()
+            del item['messages'][:values[':count']]
+            return {}
+        if values[':first_id'] in item['messageIds']:
+            raise ConditionalCheckFailedException()
+        item['messages'].extend(values[':new'])
+        item['messageIds'] |= values[':ids']
+        item['version'] += values[':one']
+        item['lastReceivedAt'] = values[':now']
+        return {'Attributes': {'version': item['version']}}
+
+
+class FakeClock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def _event(sender_id, message_id, text):
+    return {"senderId": sender_id, "messageId": message_id, "text": text, "timestamp": 0}
+
+
+class TestMessageCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        self.table = InMemoryPendingTable()
+        self.clock = FakeClock()
+        self.buffer = PendingMessageBuffer(self.table, window_seconds=2.5, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_a_post_is_merged_per_sender_in_send_order(self):
+        merged = coalesce_events([_event("u1", "m1", "hi"), _event("u2", "m2", "hello"), _event("u1", "m3", "i want a detail")])
+
+        self.assertEqual([(event["senderId"], event["text"]) for event in merged], [("u1", "hi\ni want a detail"), ("u2", "hello")])
+        self.assertEqual(merged[0]["messageIds"], ["m1", "m3"])
+        self.assertEqual(coalesce_events([merged[0], _event("u1", "m4", "tomorrow?")])[0]["messageIds"], ["m1", "m3", "m4"])
+
+    def test_only_the_last_event_of_a_burst_runs_and_takes_every_message(self):
+        first = self.buffer.add(_event("u1", "m1", "hi"))
+        self.clock.now += 1
+        second = self.buffer.add(coalesce_events([_event("u1", "m2", "i want a detail"), _event("u1", "m3", "tomorrow?")])[0])
+        self.assertEqual(self.buffer.add(_event("u1", "m1", "hi")), second)  # Webhook retry is not appended again
+
+        self.assertIsNone(self.buffer.take_when_quiet("u1", first))
+        messages = self.buffer.take_when_quiet("u1", second)
+        self.assertEqual([message["text"] for message in messages], ["hi", "i want a detail", "tomorrow?"])
+        self.assertEqual(self.clock.now, 1003.5)  # Waited out the quiet window after the last message
+
+        self.buffer.consume("u1", messages)
+        self.assertIsNone(self.buffer.take_when_quiet("u1", second))  # A redelivered event finds nothing left
+
+    def test_messages_arriving_during_a_turn_are_kept_for_the_next_one(self):
+        version = self.buffer.add(_event("u1", "m1", "hi"))
+        self.clock.now += 3
+        taken = self.buffer.take_when_quiet("u1", version)
+        later = self.buffer.add(_event("u1", "m2", "tomorrow?"))
+        self.buffer.consume("u1", taken)
+
+        self.clock.now += 3
+        self.assertEqual([message["text"] for message in self.buffer.take_when_quiet("u1", later)], ["tomorrow?"])
+
+    def test_a_sender_records_in_one_queue_batch_are_one_turn(self):
+        handled = []
+        records = [{"messageId": message_id, "attributes": {"MessageGroupId": sender_id}, "body": json.dumps(_event(sender_id, f"m_{message_id}", text))}
+                   for message_id, sender_id, text in [("1", "u1", "hi"), ("2", "u2", "hello"), ("3", "u1", "tomorrow?")]]
+
+        failed = process_in_sender_order(records, handled.append, max_workers=1, merge=lambda events: coalesce_events(events)[0])
+
+        self.assertEqual(failed, [])
+        self.assertEqual(sorted(event["text"] for event in handled), ["hello", "hi\ntomorrow?"])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+# Initialize logger
+logger = logging.getLogger()
+
+# Provider limits per call: SES SendBulkEmail takes 50 destinations, a Graph API batch request
+# 50 Messenger sends. SNS has no batch call for phone numbers, so SMS chunks are published
+# one message per number, MAX_PARALLEL_SMS_PUBLISHES at a time.
+MAX_BULK_EMAIL_ENTRIES = 50
+MAX_PARALLEL_SMS_PUBLISHES = 10
+MAX_GRAPH_BATCH_REQUESTS = 50
+CHUNK_SIZES = {'email': MAX_BULK_EMAIL_ENTRIES, 'sms': MAX_PARALLEL_SMS_PUBLISHES, 'messenger': MAX_GRAPH_BATCH_REQUESTS}
+
+DEFAULT_CHANNEL_TIMEOUT_SECONDS = 10.0
+
+# The SES bulk API only substitutes template data, so rendering stays in the template registry and
+# SES uses a passthrough template: subject "{{subject}}", text part "{{{body}}}".
+PASSTHROUGH_TEMPLATE_DATA_KEYS = ('subject', 'body')
+
+
+class DeliveryTimeoutError(Exception):
+    """A channel did not answer in time. Its provider call may still deliver the message."""
+
+
+def group_for_bulk(messages):
+    """
+    Groups rendered messages by (channel, template) and yields (channel, template_key, chunk)
+    with chunks sized for the channel's bulk API. Each message is a dict with
+    'messageId', 'channel', 'templateKey', 'recipient', 'subject' and 'body'.
+    """
+    groups = {}
+    for message in messages:
+        groups.setdefault((message['channel'], message['templateKey']), []).append(message)
+    for (channel, template_key), group in groups.items():
+        chunk_size = CHUNK_SIZES.get(channel, MAX_PARALLEL_SMS_PUBLISHES)
+        for start in range(0, len(group), chunk_size):
+            yield channel, template_key, group[start:start + chunk_size]
+
+
+def _send_channel(send_batch, channel, chunks):
+    """Sends one channel's chunks in order (keeping that provider's call rate as before)."""
+    results = {}
+    for template_key, chunk in chunks:
+        try:
+            chunk_results = send_batch(chunk)
+        except Exception as e:  # The whole call failed, so does every message in it
+            logger.error(f"[BulkDelivery] {channel} batch for {template_key} failed ({len(chunk)} messages): {e}", exc_info=True)
+            chunk_results = {message['messageId']: str(e) for message in chunk}
+        results.update(chunk_results)
+        failed = sum(1 for message in chunk if chunk_results.get(message['messageId']) is not None)
+        logger.info(f"[BulkDelivery] Sent {channel} batch for {template_key}: {len(chunk) - failed} delivered, {failed} failed.")
+    return results
+
+
+def deliver_in_bulk(transport, messages, channel_timeouts=None):
+    """
+    Sends rendered messages through the transport's bulk calls, all channels at once (one worker
+    per channel). A channel that does not finish within its timeout (channel_timeouts[channel],
+    default DEFAULT_CHANNEL_TIMEOUT_SECONDS) is not waited for; its messages get a
+    DeliveryTimeoutError, since the call keeps running and may still deliver them.
+    Returns {messageId: error} with None for every delivered message.
+    """
+    channel_timeouts = channel_timeouts or {}
+    results = {}
+    chunks_per_channel = {}
+    for channel, template_key, chunk in group_for_bulk(messages):
+        chunks_per_channel.setdefault(channel, []).append((template_key, chunk))
+
+    senders = transport.senders()
+    for channel in [channel for channel in chunks_per_channel if channel not in senders]:
+        for _, chunk in chunks_per_channel.pop(channel):
+            for message in chunk:
+                results[message['messageId']] = f"Unsupported channel: {channel}"
+    if not chunks_per_channel:
+        return results
+
+    executor = ThreadPoolExecutor(max_workers=len(chunks_per_channel))
+    started_at = time.monotonic()
+    futures = {channel: executor.submit(_send_channel, senders[channel], channel, chunks)
+               for channel, chunks in chunks_per_channel.items()}
+    for channel, future in futures.items():
+        timeout = channel_timeouts.get(channel, DEFAULT_CHANNEL_TIMEOUT_SECONDS)
+        try:
+            results.update(future.result(timeout=max(0.0, started_at + timeout - time.monotonic())))
+        except FutureTimeoutError:
+            # The provider call keeps running in the background, so these messages may still go out
+            pending = [message for _, chunk in chunks_per_channel[channel] for message in chunk]
+            logger.error(f"[BulkDelivery] {channel} did not finish within {timeout}s, {len(pending)} message(s) left undetermined.")
+            for message in pending:
+                results[message['messageId']] = DeliveryTimeoutError(f"Timed out after {timeout}s")
+    executor.shutdown(wait=False)
+    return results
+
+
+class StubTransport:
+    """
+    Local transport with the same batch interface as AwsBulkTransport. Logs each message and,
+    with record_batches, keeps every batch in self.batches. Recipients in fail_recipients fail.
+    """
+
+    def __init__(self, fail_recipients=(), record_batches=False):
+        self.fail_recipients = set(fail_recipients)
+        self.record_batches = record_batches
+        self.batches = []
+
+    def senders(self):
+        return {'email': self.send_email_batch, 'sms': self.send_sms_batch, 'messenger': self.send_messenger_batch}
+
+    def _send_batch(self, channel, chunk):
+        if self.record_batches:
+            self.batches.append((channel, list(chunk)))
+        results = {}
+        for message in chunk:
+            logger.info(f"[STUB_NOTIFICATION] Sending {channel} notification to: {message['recipient']}")
+            logger.info(f"[STUB_NOTIFICATION] Subject: {message['subject']}")
+            logger.info(f"[STUB_NOTIFICATION] Body: {message['body']}")
+            failed = message['recipient'] in self.fail_recipients
+            results[message['messageId']] = "Stub delivery failure" if failed else None
+        return results
+
+    def send_email_batch(self, chunk):
+        return self._send_batch('email', chunk)
+
+    def send_sms_batch(self, chunk):
+        return self._send_batch('sms', chunk)
+
+    def send_messenger_batch(self, chunk):
+        return self._send_batch('messenger', chunk)
+
+
+class MessengerBatchSender:
+    """
+    Messenger replies through one Graph API batch request per chunk. Booking notifications may
+    reach users outside the 24 hour messaging window, so they are sent with the
+    CONFIRMED_EVENT_UPDATE message tag.
+    """
+
+    def __init__(self, page_access_token, graph_api_url="https://graph.facebook.com/v19.0", timeout_seconds=DEFAULT_CHANNEL_TIMEOUT_SECONDS):
+        self.page_access_token = page_access_token
+        self.graph_api_url = graph_api_url
+        self.timeout_seconds = timeout_seconds
+
+    def _post(self, form):
+        request = urllib.request.Request(self.graph_api_url, data=urllib.parse.urlencode(form).encode('utf-8'), method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout_seconds) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def send_messenger_batch(self, chunk):
+        batch = [{
+            "method": "POST",
+            "relative_url": "me/messages",
+            "body": urllib.parse.urlencode({
+                "recipient": json.dumps({"id": message['recipient']}),
+                "message": json.dumps({"text": message['body']}),
+                "messaging_type": "MESSAGE_TAG",
+                "tag": "CONFIRMED_EVENT_UPDATE"
+            })
+        } for message in chunk]
+        responses = self._post({"access_token": self.page_access_token, "batch": json.dumps(batch)})
+        # One response per request, in request order (null when Graph did not run it)
+        results = {}
+        for index, message in enumerate(chunk):
+            response = responses[index] if index < len(responses) else None
+            if response and response.get('code') == 200:
+                results[message['messageId']] = None
+            else:
+                results[message['messageId']] = f"Graph API error: {(response or {}).get('body', 'no response')}"
+        return results
+
+
+class AwsBulkTransport:
+    """
+    Email through SES v2 SendBulkEmail with the passthrough template, SMS through one SNS
+    Publish per phone number (run in parallel for a chunk), and Messenger through the optional
+    MessengerBatchSender.
+    """
+
+    def __init__(self, sesv2_client, sns_client, from_address, ses_template_name, messenger_sender=None):
+        self.sesv2 = sesv2_client
+        self.sns = sns_client
+        self.from_address = from_address
+        self.ses_template_name = ses_template_name
+        self.messenger_sender = messenger_sender
+        self.sms_executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_SMS_PUBLISHES, thread_name_prefix="sms-publish")
+
+    def senders(self):
+        senders = {'email': self.send_email_batch, 'sms': self.send_sms_batch}
+        if self.messenger_sender:
+            senders['messenger'] = self.messenger_sender.send_messenger_batch
+        return senders
+
+    def send_email_batch(self, chunk):
+        response = self.sesv2.send_bulk_email(
+            FromEmailAddress=self.from_address,
+            DefaultContent={"Template": {
+                "TemplateName": self.ses_template_name,
+                "TemplateData": json.dumps({key: "" for key in PASSTHROUGH_TEMPLATE_DATA_KEYS})
+            }},
+            BulkEmailEntries=[{
+                "Destination": {"ToAddresses": [message['recipient']]},
+                "ReplacementEmailContent": {"ReplacementTemplate": {
+                    "ReplacementTemplateData": json.dumps({key: message[key] for key in PASSTHROUGH_TEMPLATE_DATA_KEYS})
+                }}
+            } for message in chunk]
+        )
+        # Entry results come back in request order
+        results = {}
+        for message, entry in zip(chunk, response.get('BulkEmailEntryResults', [])):
+            if entry.get('Status') == 'SUCCESS':
+                results[message['messageId']] = None
+            else:
+                results[message['messageId']] = f"{entry.get('Status')}: {entry.get('Error', 'no details')}"
+        for message in chunk[len(results):]:
+            results[message['messageId']] = "No result returned by SES"
+        return results
+
+    def _publish_sms(self, message):
+        try:
+            self.sns.publish(
+                PhoneNumber=message['recipient'],
+                Message=message['body'],
+                MessageAttributes={"AWS.SNS.SMS.SMSType": {"DataType": "String", "StringValue": "Transactional"}}
+            )
+            return None
+        except Exception as e:
+            return str(e)
+
+    def send_sms_batch(self, chunk):
+        # Each text goes straight to its own phone number; nothing is fanned out through a topic
+        return dict(zip([message['messageId'] for message in chunk], self.sms_executor.map(self._publish_sms, chunk)))
+
+
+def transport_from_env():
+    """
+    NOTIFICATION_DELIVERY_MODE=aws sends through SES/SNS (SES_FROM_ADDRESS, SES_BULK_TEMPLATE_NAME)
+    and Messenger (FB_PAGE_ACCESS_TOKEN); anything else, including the default,
+    uses the stub transport.
+    """
+    if os.environ.get('NOTIFICATION_DELIVERY_MODE', 'stub') != 'aws':
+        return StubTransport()
+    import boto3
+    page_access_token = os.environ.get('FB_PAGE_ACCESS_TOKEN')
+    return AwsBulkTransport(
+        boto3.client('sesv2'),
+        boto3.client('sns'),
+        os.environ.get('SES_FROM_ADDRESS'),
+        os.environ.get('SES_BULK_TEMPLATE_NAME', 'NotificationPassthrough'),
+        MessengerBatchSender(page_access_token) if page_access_token else None
+    )
+
+
+def channel_timeouts_from_env():
+    """NOTIFICATION_CHANNEL_TIMEOUTS, a JSON map such as {"email": 10, "sms": 5, "messenger": 5}, in seconds."""
+    try:
+        return {channel: float(seconds) for channel, seconds in json.loads(os.environ.get('NOTIFICATION_CHANNEL_TIMEOUTS', '{}')).items()}
+    except (ValueError, AttributeError) as e:
+        logger.warning(f"[BulkDelivery] Ignoring invalid NOTIFICATION_CHANNEL_TIMEOUTS: {e}")
+        return {}
@@ -0,0 +1,108 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+
+# Initialize logger
+logger = logging.getLogger()
+
+DEFAULT_LRU_SIZE = 10000
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600  # Longer than any SQS redelivery or producer retry window
+
+
+def dedup_key(message_body):
+    """
+    Identity of a notification: (bookingId, notificationType, version). Producers that do not
+    version their messages get version 0, so each booking gets that notification at most once.
+    Returns None for messages without a bookingId, which are never deduplicated.
+    Callers claim one key per delivery channel by appending '#<channel>'.
+    """
+    booking_id = message_body.get('bookingId')
+    if not booking_id:
+        return None
+    return f"{booking_id}#{message_body.get('notificationType')}#{message_body.get('version', 0)}"
+
+
+class LruSet:
+    """Bounded set of recently seen keys; the least recently used key is evicted first."""
+
+    def __init__(self, capacity=DEFAULT_LRU_SIZE):
+        self.capacity = capacity
+        self.keys = OrderedDict()
+
+    def __contains__(self, key):
+        if key in self.keys:
+            self.keys.move_to_end(key)
+            return True
+        return False
+
+    def add(self, key):
+        self.keys[key] = True
+        self.keys.move_to_end(key)
+        if len(self.keys) > self.capacity:
+            self.keys.popitem(last=False)
+
+    def discard(self, key):
+        self.keys.pop(key, None)
+
+
+class NotificationDedupStore:
+    """
+    Claims notification keys before they are rendered and sent. The per-container LRU answers
+    repeats seen by this container without a DynamoDB call; the table ({dedupKey, expiresAt})
+    is the shared record, claimed with a conditional put and expired by TTL.
+    Without a table only the LRU applies.
+    """
+
+    def __init__(self, table=None, ttl_seconds=DEFAULT_TTL_SECONDS, lru_size=DEFAULT_LRU_SIZE, clock=time.time):
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.seen = LruSet(lru_size)
+        self.clock = clock
+
+    def claim(self, key):
+        """True if this is the first delivery of key, False for a duplicate."""
+        if key in self.seen:
+            return False
+        if self.table is not None:
+            now = int(self.clock())
+            try:
+                self.table.put_item(
+                    Item={'dedupKey': key, 'claimedAt': now, 'expiresAt': now + self.ttl_seconds},
+                    ConditionExpression="attribute_not_exists(dedupKey)"
+                )
+            except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+                self.seen.add(key)
+                return False
+            except Exception as e:  # Fail open: a possible duplicate beats a lost notification
+                logger.warning(f"[NotificationDedup] Could not claim {key} in DynamoDB, sending anyway: {e}")
+        self.seen.add(key)
+        return True
+
+    def release(self, key):
+        """Forgets a claim whose delivery failed, so the SQS retry can send it."""
+        self.seen.discard(key)
+        if self.table is not None:
+            try:
+                self.table.delete_item(Key={'dedupKey': key})
+            except Exception as e:
+                logger.error(f"[NotificationDedup] Could not release {key}; its retry will be dropped as a duplicate: {e}")
+
+
+def dedup_store_from_env(dynamodb_resource=None):
+    """
+    NOTIFICATION_DEDUP_TABLE_NAME enables the shared store (NOTIFICATION_DEDUP_TTL_SECONDS, default 7 days);
+    NOTIFICATION_DEDUP_LRU_SIZE sizes the in-memory front.
+    """
+    table_name = os.environ.get('NOTIFICATION_DEDUP_TABLE_NAME')
+    table = None
+    if table_name:
+        if dynamodb_resource is None:
+            import boto3
+            dynamodb_resource = boto3.resource('dynamodb')
+        table = dynamodb_resource.Table(table_name)
+    return NotificationDedupStore(
+        table,
+        ttl_seconds=int(os.environ.get('NOTIFICATION_DEDUP_TTL_SECONDS', DEFAULT_TTL_SECONDS)),
+        lru_size=int(os.environ.get('NOTIFICATION_DEDUP_LRU_SIZE', DEFAULT_LRU_SIZE))
+    )
@@ -1,104 +1,168 @@
 import json
 import logging
 import os
-# import boto3 # Not strictly needed for stubbed notifications
 
 # Initialize logger
 logger = logging.getLogger()
 logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
+try:
+    from .template_registry import DEFAULT_CHANNEL, DEFAULT_LOCALE, UnknownTemplateError, load_template_registry
+    from .bulk_delivery import DeliveryTimeoutError, channel_timeouts_from_env, deliver_in_bulk, transport_from_env
+    from .dedup_store import dedup_key, dedup_store_from_env
+    from .staff_digest import (STAFF_DIGEST_NOTIFICATION_TYPE, STAFF_DIGEST_TYPES, digest_details, digest_entry,
+                               staff_digest_from_env)
+except ImportError:  # Deployed flat in the Lambda package
+    from template_registry import DEFAULT_CHANNEL, DEFAULT_LOCALE, UnknownTemplateError, load_template_registry
+    from bulk_delivery import DeliveryTimeoutError, channel_timeouts_from_env, deliver_in_bulk, transport_from_env
+    from dedup_store import dedup_key, dedup_store_from_env
+    from staff_digest import (STAFF_DIGEST_NOTIFICATION_TYPE, STAFF_DIGEST_TYPES, digest_details, digest_entry,
+                              staff_digest_from_env)
+
 # APPOINTMENTS_TABLE_NAME = os.environ.get('APPOINTMENTS_TABLE_NAME') # Not used for now, as SQS message is self-contained
 
-# --- Stubbed Notification Sending Function ---
-def stub_send_notification(recipient_contact, subject, body):
+# Templates are compiled once per container (bundled directory, or NOTIFICATION_TEMPLATES_SOURCE=s3://bucket/prefix/)
+template_registry = load_template_registry()
+
+# Stub transport unless NOTIFICATION_DELIVERY_MODE=aws (SES bulk email / SNS batch publishes)
+notification_transport = transport_from_env()
+
+# Drops redeliveries of the same (bookingId, notificationType, version) before rendering
+dedup_store = dedup_store_from_env()
+
+# Channels a client is notified on when the message carries their clientContact map, and the
+# contact field each channel uses. Channels run concurrently, each with its own timeout.
+ENABLED_CHANNELS = [channel.strip() for channel in os.environ.get('NOTIFICATION_CHANNELS', 'email,sms,messenger').split(',') if channel.strip()]
+CONTACT_FIELDS = {'email': 'email', 'sms': 'phone', 'messenger': 'messengerPsid'}
+channel_timeouts = channel_timeouts_from_env()
+
+# Staff alerts are buffered per location and flushed as one digest per window (STAFF_DIGEST_TABLE_NAME)
+staff_digest = staff_digest_from_env()
+STAFF_DIGEST_RECIPIENT = os.environ.get('STAFF_DIGEST_RECIPIENT')
+
+# --- Notification Formatting Logic ---
+def resolve_deliveries(message_body, message_details):
     """
-    Stub function to simulate sending a notification.
-    Logs the recipient, subject, and body.
+    [(channel, recipient)] for a message. An explicit 'channel' sends on that channel only;
+    otherwise a clientContact map fans out to every enabled channel it has a contact for
+    (optionally narrowed by a 'channels' list); otherwise the recipient gets an email.
     """
-    logger.info(f"[STUB_NOTIFICATION] Sending notification to: {recipient_contact}")
-    logger.info(f"[STUB_NOTIFICATION] Subject: {subject}")
-    logger.info(f"[STUB_NOTIFICATION] Body: {body}")
-    # In a real scenario, this would use boto3 to send email via SES, SMS via SNS, or other methods.
-    return True # Simulate successful send
-
-# --- Notification Formatting and Dispatch Logic ---
-def format_and_send_notification(notification_type, message_details, booking_id_log_ctx):
+    recipient = message_details.get('recipient') or message_body.get('recipient')
+    if message_body.get('channel'):
+        return [(message_body['channel'], recipient)]
+    contact = message_body.get('clientContact') or message_details.get('clientContact')
+    if isinstance(contact, dict):
+        channels = [channel for channel in ENABLED_CHANNELS if channel in message_body.get('channels', ENABLED_CHANNELS)]
+        deliveries = [(channel, contact[CONTACT_FIELDS[channel]]) for channel in channels
+                      if contact.get(CONTACT_FIELDS.get(channel))]
+        if deliveries:
+            return deliveries
+    return [(DEFAULT_CHANNEL, recipient)]
+
+
+def render_notification(notification_type, message_details, booking_id_log_ctx, booking_id=None,
+                        channel=DEFAULT_CHANNEL, locale=DEFAULT_LOCALE, recipient=None):
     """
-    Formats notification content based on notificationType and calls the stub sender.
+    Renders the precompiled template for (notificationType, channel, locale).
+    Returns the outbound message (recipient, subject, body), or None if it cannot be sent.
+    Unknown notification types are rejected before any rendering.
     """
-    subject = ""
-    body = ""
-    recipient_contact = message_details.get('recipient') # General recipient field from SQS
+    if not template_registry.has_type(notification_type):
+        logger.warning(f"[{booking_id_log_ctx}] Unknown notification_type: {notification_type}. Cannot format message.")
+        return None
 
+    recipient_contact = recipient or message_details.get('recipient') # General recipient field from SQS
     if not recipient_contact:
         logger.error(f"[{booking_id_log_ctx}] Recipient contact missing in message_details. Cannot send notification.")
-        return False
-
-    client_name = message_details.get('clientName', 'Valued Client')
-    service_name = message_details.get('serviceName', 'your selected service')
-    start_time = message_details.get('startTime', 'the scheduled time')
-    location_name = message_details.get('locationName', 'our location')
-    # reason = message_details.get('reason', 'as per our records') # For cancellation/rejection
-
-    if notification_type == "BOOKING_CONFIRMED":
-        subject = f"Booking Confirmed: Your Appointment for {service_name}"
-        body = (
-            f"Dear {client_name},\n\n"
-            f"This email confirms your booking for {service_name} at {location_name} on {start_time}.\n\n"
-            f"We look forward to seeing you!\n\n"
-            f"Booking ID: {booking_id_log_ctx}"
-        )
-    elif notification_type == "BOOKING_CANCELLED":
-        subject = f"Booking Cancellation Notice: {service_name}"
-        body = (
-            f"Dear {client_name},\n\n"
-            f"This email confirms the cancellation of your booking for {service_name} at {location_name} scheduled for {start_time}.\n\n"
-            f"If you did not request this cancellation, or if you have any questions, please contact us.\n\n"
-            f"Booking ID: {booking_id_log_ctx}"
-        )
-    elif notification_type == "BOOKING_REJECTED":
-        rejection_reason = message_details.get('reason', "Unfortunately, we are unable to confirm your requested appointment at this time.")
-        subject = f"Regarding Your Booking Request for {service_name}"
-        body = (
-            f"Dear {client_name},\n\n"
-            f"Regarding your provisional booking request for {service_name} at {location_name} for {start_time}.\n\n"
-            f"{rejection_reason}\n\n"
-            f"Please contact us if you would like to discuss alternative options.\n\n"
-            f"Booking ID: {booking_id_log_ctx}"
-        )
-    elif notification_type == "PROVISIONAL_BOOKING_CREATED":
-        # Client notification
-        subject = f"Provisional Booking Received: {service_name}"
-        body = (
-            f"Dear {client_name},\n\n"
-            f"We have received your provisional booking request for {service_name} at {location_name} for {start_time}.\n"
-            f"Our team will review the details and confirm your appointment shortly.\n\n"
-            f"Booking ID: {booking_id_log_ctx}"
-        )
-        # Optional: Staff notification (can be added here or by sending another SQS message from originator)
-        # staff_recipient = "staff-alerts@example.com" # Example
-        # staff_subject = f"New Provisional Booking: {booking_id_log_ctx} for {service_name}"
-        # staff_body = f"A new provisional booking (ID: {booking_id_log_ctx}) for {service_name} by {client_name} ({recipient_contact}) at {location_name} for {start_time} requires review."
-        # stub_send_notification(staff_recipient, staff_subject, staff_body)
-        # logger.info(f"[{booking_id_log_ctx}] Staff notification also sent for PROVISIONAL_BOOKING_CREATED.")
-
-    else:
-        logger.warning(f"[{booking_id_log_ctx}] Unknown notification_type: {notification_type}. Cannot format message.")
-        return False
+        return None
+
+    details = dict(message_details)
+    details.setdefault('bookingId', booking_id)
+    try:
+        rendered = template_registry.render(notification_type, details, channel, locale)
+    except UnknownTemplateError as e:
+        logger.warning(f"[{booking_id_log_ctx}] {e}. Cannot format message.")
+        return None
+
+    return {"recipient": recipient_contact, "subject": rendered['subject'], "body": rendered['body']}
+
+
+def buffer_staff_alert(message_body, message_details, booking_id_log_ctx):
+    """Adds the booking to its location's staff digest. Best effort: the client notification goes out regardless."""
+    location_id = message_body.get('locationId') or message_details.get('locationId') or 'unknown'
+    try:
+        window = staff_digest.add(location_id, digest_entry(message_body, message_details))
+        logger.info(f"[{booking_id_log_ctx}] Staff alert buffered in digest {window} for location {location_id}.")
+    except Exception as e:
+        logger.error(f"[{booking_id_log_ctx}] Failed to buffer staff alert for location {location_id}: {e}", exc_info=True)
+
+
+def handle_staff_digest_flush(event):
+    """
+    Sends one summary per location for every closed digest window, in one bulk delivery,
+    and deletes the digests that were delivered. Undelivered digests, and bookings added to a digest
+    while it was being sent, are picked up by the next flush.
+    Triggered on a schedule (EventBridge) or with {"action": "FLUSH_STAFF_DIGESTS"}.
+    """
+    lambda_name = "NotificationLambda"
+    if staff_digest is None or not STAFF_DIGEST_RECIPIENT:
+        logger.warning(f"[{lambda_name}] Staff digests are not configured (STAFF_DIGEST_TABLE_NAME, STAFF_DIGEST_RECIPIENT). Nothing to flush.")
+        return {"status": "skipped", "flushed_digests": 0, "digested_entries": 0, "failed_digests": 0}
+
+    outbound_messages = []
+    for window in staff_digest.closed_windows():
+        for digest in staff_digest.pending_digests(window):
+            rendered = template_registry.render(STAFF_DIGEST_NOTIFICATION_TYPE,
+                                                digest_details(digest['locationId'], window, digest.get('entries', [])))
+            outbound_messages.append({
+                "messageId": f"{window}#{digest['locationId']}",
+                "channel": DEFAULT_CHANNEL,
+                "templateKey": (STAFF_DIGEST_NOTIFICATION_TYPE, DEFAULT_LOCALE),
+                "recipient": STAFF_DIGEST_RECIPIENT,
+                "subject": rendered['subject'],
+                "body": rendered['body'],
+                "window": window,
+                "locationId": digest['locationId'],
+                "entryCount": len(digest.get('entries', []))
+            })
 
-    return stub_send_notification(recipient_contact, subject, body)
+    flushed_digests = digested_entries = failed_digests = 0
+    delivery_results = deliver_in_bulk(notification_transport, outbound_messages)
+    for message in outbound_messages:
+        error = delivery_results.get(message['messageId'], "No delivery result")
+        if error is not None:
+            logger.error(f"[{lambda_name}] Staff digest {message['messageId']} failed: {error}")
+            failed_digests += 1
+            continue
+        if not staff_digest.delete(message['window'], message['locationId'], message['entryCount']):
+            logger.info(f"[{lambda_name}] Staff digest {message['messageId']} got new bookings while flushing, kept them for the next flush.")
+        flushed_digests += 1
+        digested_entries += message['entryCount']
+
+    logger.info(f"[{lambda_name}] Flushed {flushed_digests} staff digest(s) covering {digested_entries} booking(s), {failed_digests} failed.")
+    return {"status": "completed", "flushed_digests": flushed_digests, "digested_entries": digested_entries, "failed_digests": failed_digests}
 
 
 def lambda_handler(event, context):
     """
-    Handles incoming SQS messages to format and "send" notifications.
+    Handles incoming SQS messages to format and send notifications.
+    Each record is fanned out to its channels (see resolve_deliveries). Deliveries already claimed
+    are dropped as duplicates, the others are rendered, grouped by channel and template and sent
+    with the transport's bulk calls, every channel at once. Results are mapped back to their
+    records; failed deliveries release their claim, so a retry only resends the failed channels.
+    A channel that timed out keeps its claim and is not retried: its call may still deliver.
+    Staff-facing types are also buffered into per-location digests, flushed by scheduled events.
     """
     lambda_name = "NotificationLambda"
     logger.info(f"Received event for {lambda_name}: {json.dumps(event)}")
 
+    if event.get('action') == 'FLUSH_STAFF_DIGESTS' or event.get('source') == 'aws.events':
+        return handle_staff_digest_flush(event)
+
     processed_messages = 0
-    successful_sends = 0
-    failed_sends = 0
+    duplicate_messages = 0
+    failed_message_ids = []
+    outbound_messages = []
 
     for record in event.get('Records', []):
         message_id = record.get('messageId', 'UnknownMessageID')
@@ -109,7 +173,7 @@ def lambda_handler(event, context):
             message_body_str = record.get('body')
             if not message_body_str:
                 logger.warning(f"[{booking_id_log_ctx}] SQS record has no body. Skipping.")
-                failed_sends +=1
+                failed_message_ids.append(message_id)
                 continue
 
             message_body = json.loads(message_body_str)
@@ -128,32 +192,85 @@ def lambda_handler(event, context):
                     f"[{booking_id_log_ctx}] Missing 'notificationType' or 'messageDetails' (must be a dictionary) in message body. "
                     f"Message: {message_body_str}"
                 )
-                failed_sends += 1
+                failed_message_ids.append(message_id)
+                continue
+
+            notification_key = dedup_key(message_body)
+            if staff_digest is not None and notification_type in STAFF_DIGEST_TYPES:
+                # Claimed apart from the client deliveries, so retrying a failed channel does not re-add the booking
+                if not notification_key or dedup_store.claim(f"{notification_key}#staff"):
+                    buffer_staff_alert(message_body, message_details, booking_id_log_ctx)
+
+            # Claimed per channel, so channels that already went out are not resent on retry
+            deliveries = []
+            for channel, recipient in resolve_deliveries(message_body, message_details):
+                delivery_key = f"{notification_key}#{channel}" if notification_key else None
+                if delivery_key and not dedup_store.claim(delivery_key):
+                    logger.info(f"[{booking_id_log_ctx}] Duplicate notification {delivery_key}, already sent. Skipping.")
+                    continue
+                deliveries.append((channel, recipient, delivery_key))
+            if not deliveries:
+                duplicate_messages += 1
                 continue
-            
-            if format_and_send_notification(notification_type, message_details, booking_id_log_ctx):
-                successful_sends += 1
-            else:
-                failed_sends += 1
-            
+
             processed_messages += 1
+            locale = message_body.get('locale', DEFAULT_LOCALE)
+            for channel, recipient, delivery_key in deliveries:
+                outbound = render_notification(notification_type, message_details, booking_id_log_ctx,
+                                               booking_id=message_body.get('bookingId'), channel=channel, locale=locale,
+                                               recipient=recipient)
+                if outbound is None:
+                    if delivery_key:
+                        dedup_store.release(delivery_key)
+                    if message_id not in failed_message_ids:
+                        failed_message_ids.append(message_id)
+                    continue
+                outbound.update({"messageId": f"{message_id}:{channel}", "recordId": message_id, "channel": channel,
+                                 "templateKey": (notification_type, locale), "dedupKey": delivery_key})
+                outbound_messages.append(outbound)
 
         except json.JSONDecodeError as json_e:
             logger.error(f"[{booking_id_log_ctx}] Failed to parse JSON from SQS record body: {json_e}. Body was: {message_body_str}", exc_info=True)
-            failed_sends += 1
+            failed_message_ids.append(message_id)
         except Exception as e:
             logger.error(f"[{booking_id_log_ctx}] Unexpected error processing SQS record: {e}", exc_info=True)
-            failed_sends += 1
-            
-    logger.info(f"Finished processing. Total records processed in this invocation: {processed_messages}, Successful sends: {successful_sends}, Failed sends: {failed_sends}")
-    
-    # For SQS, Lambda's success/failure is for the batch. Individual message failures are logged.
-    # Configure DLQ on the SQS queue for persistent message failures.
+            failed_message_ids.append(message_id)
+
+    successful_sends = 0
+    channel_results = {}
+    delivery_results = deliver_in_bulk(notification_transport, outbound_messages, channel_timeouts)
+    for message in outbound_messages:
+        error = delivery_results.get(message['messageId'], "No delivery result")
+        counts = channel_results.setdefault(message['channel'], {"sent": 0, "failed": 0, "timed_out": 0})
+        if error is None:
+            successful_sends += 1
+            counts["sent"] += 1
+        elif isinstance(error, DeliveryTimeoutError):
+            # Releasing the claim would let the SQS retry send it a second time
+            counts["timed_out"] += 1
+            logger.warning(f"[MsgId: {message['recordId']}] {message['channel']} delivery to {message['recipient']} "
+                           f"timed out and may still arrive; not retried: {error}")
+        else:
+            counts["failed"] += 1
+            logger.error(f"[MsgId: {message['recordId']}] {message['channel']} delivery to {message['recipient']} failed: {error}")
+            if message['recordId'] not in failed_message_ids:
+                failed_message_ids.append(message['recordId'])
+            if message['dedupKey']:
+                dedup_store.release(message['dedupKey'])
+
+    failed_sends = len(failed_message_ids)
+    logger.info(f"Finished processing. Total records processed in this invocation: {processed_messages}, Successful sends: {successful_sends}, Failed sends: {failed_sends}, Duplicates dropped: {duplicate_messages}")
+
+    # batchItemFailures is honoured when ReportBatchItemFailures is enabled on the event source mapping,
+    # so only the failed messages are retried; otherwise the DLQ handles persistent failures.
     return {
         "status": "completed",
         "messages_processed_in_invocation": processed_messages,
         "successful_sends_in_invocation": successful_sends,
-        "failed_sends_in_invocation": failed_sends
+        "failed_sends_in_invocation": failed_sends,
+        "duplicates_dropped_in_invocation": duplicate_messages,
+        "channel_results_in_invocation": channel_results,
+        "batchItemFailures": [{"itemIdentifier": message_id} for message_id in failed_message_ids]
     }
 
 if __name__ == '__main__':
@@ -0,0 +1,131 @@
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from boto3.dynamodb.conditions import Key
+
+# Initialize logger
+logger = logging.getLogger()
+
+# Client notification types that also alert staff. Staff get one digest per location and window
+# instead of one message per booking; the client notification itself is still sent right away.
+STAFF_DIGEST_TYPES = ("PROVISIONAL_BOOKING_CREATED",)
+STAFF_DIGEST_NOTIFICATION_TYPE = "STAFF_PROVISIONAL_DIGEST"
+
+DEFAULT_WINDOW_MINUTES = 5
+DEFAULT_LOOKBACK_WINDOWS = 3  # Closed windows retried by every flush
+DIGEST_TTL = timedelta(days=1)  # Digests that never flushed are dropped after a day
+
+
+def window_for(moment, window_minutes=DEFAULT_WINDOW_MINUTES):
+    """The window key of a datetime: its UTC time floored to window_minutes, e.g. '2024-09-01T09:55Z'."""
+    moment = moment.astimezone(timezone.utc)
+    minutes = moment.hour * 60 + moment.minute
+    floored = moment.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(minutes=minutes - minutes % window_minutes)
+    return floored.strftime('%Y-%m-%dT%H:%MZ')
+
+
+def digest_entry(message_body, message_details):
+    return {
+        "bookingId": message_body.get('bookingId'),
+        "clientName": message_details.get('clientName'),
+        "serviceName": message_details.get('serviceName'),
+        "locationName": message_details.get('locationName'),
+        "startTime": message_details.get('startTime'),
+    }
+
+
+def digest_details(location_id, window, entries):
+    """Template values of a digest: the booking count and one line per booking."""
+    lines = [f"- {entry.get('startTime') or 'time not set'}: {entry.get('serviceName') or 'service not set'} "
+             f"for {entry.get('clientName') or 'unknown client'} (Booking ID: {entry.get('bookingId')})"
+             for entry in entries]
+    location_name = next((entry['locationName'] for entry in entries if entry.get('locationName')), location_id)
+    return {"count": str(len(entries)), "locationName": location_name, "windowStart": window, "bookingList": "\n".join(lines)}
+
+
+class StaffDigestBuffer:
+    """
+    Buffers staff-facing entries in one DynamoDB item per (window, locationId), appended with a
+    single UpdateItem. Windows are the partition key, so a flush queries only the closed windows.
+    """
+
+    def __init__(self, table, window_minutes=DEFAULT_WINDOW_MINUTES, clock=time.time):
+        self.table = table
+        self.window_minutes = window_minutes
+        self.clock = clock
+
+    def _now(self):
+        return datetime.fromtimestamp(self.clock(), timezone.utc)
+
+    def add(self, location_id, entry):
+        now = self._now()
+        window = window_for(now, self.window_minutes)
+        self.table.update_item(
+            Key={'window': window, 'locationId': location_id},
+            UpdateExpression="SET entries = list_append(if_not_exists(entries, :empty), :entry), "
+                             "expiresAt = if_not_exists(expiresAt, :expires_at) ADD entryCount :one",
+            ExpressionAttributeValues={
+                ':empty': [],
+                ':entry': [entry],
+                ':expires_at': int((now + DIGEST_TTL).timestamp()),
+                ':one': 1
+            }
+        )
+        return window
+
+    def closed_windows(self, lookback=DEFAULT_LOOKBACK_WINDOWS):
+        """The lookback windows before the current one, oldest first."""
+        now = self._now()
+        return [window_for(now - timedelta(minutes=self.window_minutes * offset), self.window_minutes)
+                for offset in range(lookback, 0, -1)]
+
+    def pending_digests(self, window):
+        """Yields the buffered digest items of a window, read consistently so no acknowledged entry is missed."""
+        query_kwargs = {"KeyConditionExpression": Key('window').eq(window), "ConsistentRead": True}
+        while True:
+            response = self.table.query(**query_kwargs)
+            yield from response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def delete(self, window, location_id, flushed_count):
+        """
+        Deletes a flushed digest unless entries were appended after it was read. Then only the
+        flushed_count entries that were sent are removed, and the new ones wait for the next flush.
+        Returns True when the digest was deleted.
+        """
+        key = {'window': window, 'locationId': location_id}
+        try:
+            self.table.delete_item(Key=key, ConditionExpression="entryCount = :flushed",
+                                   ExpressionAttributeValues={':flushed': flushed_count})
+            return True
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            pass
+        try:
+            self.table.update_item(
+                Key=key,
+                UpdateExpression=f"REMOVE {', '.join(f'entries[{index}]' for index in range(flushed_count))} "
+                                 f"ADD entryCount :sent",
+                ConditionExpression="entryCount > :flushed",
+                ExpressionAttributeValues={':flushed': flushed_count, ':sent': -flushed_count}
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            logger.warning(f"[StaffDigest] Digest {window}#{location_id} was already removed by another flush.")
+        return False
+
+
+def staff_digest_from_env(dynamodb_resource=None):
+    """STAFF_DIGEST_TABLE_NAME enables the digest (STAFF_DIGEST_WINDOW_MINUTES, default 5); returns None otherwise."""
+    table_name = os.environ.get('STAFF_DIGEST_TABLE_NAME')
+    if not table_name:
+        return None
+    if dynamodb_resource is None:
+        import boto3
+        dynamodb_resource = boto3.resource('dynamodb')
+    return StaffDigestBuffer(
+        dynamodb_resource.Table(table_name),
+        window_minutes=int(os.environ.get('STAFF_DIGEST_WINDOW_MINUTES', DEFAULT_WINDOW_MINUTES))
+    )
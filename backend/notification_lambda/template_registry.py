@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+from string import Template
+
+# Initialize logger
+logger = logging.getLogger()
+
+# Template sets are JSON files named <channel>/<locale>.json, mapping notificationType to
+# {"subject": ..., "body": ..., "defaults": {...}}. Placeholders use string.Template syntax ($clientName).
+BUNDLED_TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+DEFAULT_CHANNEL = 'email'
+DEFAULT_LOCALE = 'en'
+
+# Values used when a message does not carry the field, shared by every template
+DEFAULT_DETAILS = {
+    "clientName": "Valued Client",
+    "serviceName": "your selected service",
+    "startTime": "the scheduled time",
+    "locationName": "our location",
+    "bookingId": "N/A",
+}
+
+
+class UnknownTemplateError(KeyError):
+    """No template is registered for the requested notificationType (in any channel or locale)."""
+
+
+class CompiledTemplate:
+    """Subject and body parsed once; render() only substitutes values."""
+
+    def __init__(self, subject, body, defaults=None):
+        self.subject = Template(subject)
+        self.body = Template(body)
+        self.defaults = dict(DEFAULT_DETAILS, **(defaults or {}))
+
+    def render(self, details):
+        values = dict(self.defaults)
+        values.update({key: value for key, value in details.items() if value is not None})
+        return {"subject": self.subject.safe_substitute(values), "body": self.body.safe_substitute(values)}
+
+
+class TemplateRegistry:
+    """
+    Compiled notification templates keyed by (notificationType, channel, locale).
+    Lookups fall back from a regional locale to its language ('es-MX' -> 'es') and then to DEFAULT_LOCALE;
+    the resolved template is memoised per key, so repeated renders cost a dict lookup and a substitution.
+    """
+
+    def __init__(self, template_sets):
+        """template_sets: {(channel, locale): {notificationType: {"subject", "body", "defaults"}}}"""
+        self.templates = {}
+        for (channel, locale), templates in template_sets.items():
+            for notification_type, spec in templates.items():
+                self.templates[(notification_type, channel, locale)] = CompiledTemplate(
+                    spec.get('subject', ''), spec['body'], spec.get('defaults'))
+        self.notification_types = frozenset(key[0] for key in self.templates)
+        self._resolved = {}
+        logger.info(f"[TemplateRegistry] Compiled {len(self.templates)} template(s) for {len(self.notification_types)} notification type(s).")
+
+    @classmethod
+    def from_directory(cls, directory=BUNDLED_TEMPLATES_DIR):
+        template_sets = {}
+        for channel in sorted(os.listdir(directory)):
+            channel_dir = os.path.join(directory, channel)
+            if not os.path.isdir(channel_dir):
+                continue
+            for file_name in sorted(os.listdir(channel_dir)):
+                if file_name.endswith('.json'):
+                    with open(os.path.join(channel_dir, file_name), encoding='utf-8') as template_file:
+                        template_sets[(channel, file_name[:-len('.json')])] = json.load(template_file)
+        return cls(template_sets)
+
+    @classmethod
+    def from_s3(cls, s3_client, bucket, prefix=''):
+        """Loads <prefix><channel>/<locale>.json objects from S3 (or any client with the same two calls)."""
+        template_sets = {}
+        list_args = {"Bucket": bucket, "Prefix": prefix}
+        while True:
+            response = s3_client.list_objects_v2(**list_args)
+            for s3_object in response.get('Contents', []):
+                key = s3_object['Key']
+                relative_key = key[len(prefix):]
+                if relative_key.count('/') != 1 or not relative_key.endswith('.json'):
+                    continue
+                channel, file_name = relative_key.split('/')
+                body = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+                template_sets[(channel, file_name[:-len('.json')])] = json.loads(body)
+            if not response.get('IsTruncated'):
+                break
+            list_args['ContinuationToken'] = response['NextContinuationToken']
+        return cls(template_sets)
+
+    def has_type(self, notification_type):
+        return notification_type in self.notification_types
+
+    def get(self, notification_type, channel=DEFAULT_CHANNEL, locale=DEFAULT_LOCALE):
+        key = (notification_type, channel, locale)
+        template = self._resolved.get(key)
+        if template is None:
+            if not self.has_type(notification_type):
+                raise UnknownTemplateError(f"Unknown notification type: {notification_type}")
+            for candidate_locale in (locale, locale.split('-')[0], DEFAULT_LOCALE):
+                template = self.templates.get((notification_type, channel, candidate_locale))
+                if template is not None:
+                    break
+            else:
+                raise UnknownTemplateError(f"No {channel} template for notification type {notification_type}")
+            self._resolved[key] = template
+        return template
+
+    def render(self, notification_type, details, channel=DEFAULT_CHANNEL, locale=DEFAULT_LOCALE):
+        """Returns {"subject", "body"}. Raises UnknownTemplateError for types or channels without a template."""
+        return self.get(notification_type, channel, locale).render(details)
+
+
+def load_template_registry(source=None, s3_client=None):
+    """
+    Builds the registry from NOTIFICATION_TEMPLATES_SOURCE: "s3://bucket/prefix/" or a directory path.
+    Defaults to the templates bundled with the Lambda.
+    """
+    source = source or os.environ.get('NOTIFICATION_TEMPLATES_SOURCE') or BUNDLED_TEMPLATES_DIR
+    if source.startswith('s3://'):
+        bucket, _, prefix = source[len('s3://'):].partition('/')
+        if s3_client is None:
+            import boto3
+            s3_client = boto3.client('s3')
+        return TemplateRegistry.from_s3(s3_client, bucket, prefix)
+    return TemplateRegistry.from_directory(source)
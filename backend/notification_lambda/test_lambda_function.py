@@ -0,0 +1,389 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import io
+import json
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+
+# Import the Lambda function to test
+from backend.notification_lambda import lambda_function
+from backend.notification_lambda.template_registry import TemplateRegistry, UnknownTemplateError
+from backend.notification_lambda.bulk_delivery import AwsBulkTransport, MessengerBatchSender, StubTransport, deliver_in_bulk
+from backend.notification_lambda.dedup_store import NotificationDedupStore
+from backend.notification_lambda.staff_digest import StaffDigestBuffer
+from backend.common.client_contact import notification_message
+from backend.common.reminder_schedule import build_reminder_items
+
+
+class FakeS3:
+    """Minimal S3 stand-in serving template sets from a dict of key -> JSON object."""
+
+    def __init__(self, objects):
+        self.objects = objects
+
+    def list_objects_v2(self, Bucket, Prefix, **kwargs):
+        return {"Contents": [{"Key": key} for key in self.objects if key.startswith(Prefix)], "IsTruncated": False}
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(json.dumps(self.objects[Key]).encode('utf-8'))}
+
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+
+class InMemoryDedupTable:
+    """Stand-in for the dedup table honouring attribute_not_exists puts."""
+
+    def __init__(self):
+        self.items = {}
+        self.put_calls = 0
+        self.meta = MagicMock()
+        self.meta.client.exceptions.ConditionalCheckFailedException = ConditionalCheckFailedException
+
+    def put_item(self, Item, ConditionExpression):
+        self.put_calls += 1
+        if Item['dedupKey'] in self.items:
+            raise ConditionalCheckFailedException()
+        self.items[Item['dedupKey']] = Item
+
+    def delete_item(self, Key):
+        self.items.pop(Key['dedupKey'], None)
+
+
+class InMemoryDigestTable:
+    """Stand-in for the staff digest table supporting the buffer's append, query, conditional delete and trim."""
+
+    def __init__(self):
+        self.items = {}
+        self.meta = MagicMock()
+        self.meta.client.exceptions.ConditionalCheckFailedException = ConditionalCheckFailedException
+        self.after_query = None
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, ConditionExpression=None):
+        key = (Key['window'], Key['locationId'])
+        if UpdateExpression.startswith("REMOVE"):  # Trim of the entries a flush sent
+            flushed = ExpressionAttributeValues[':flushed']
+            if key not in self.items or self.items[key]['entryCount'] <= flushed:
+                raise ConditionalCheckFailedException()
+            self.items[key] = dict(self.items[key], entries=self.items[key]['entries'][flushed:],
+                                   entryCount=self.items[key]['entryCount'] - flushed)
+            return
+        item = self.items.setdefault(key, dict(Key, entries=[], entryCount=0))
+        item['entries'] = item['entries'] + ExpressionAttributeValues[':entry']
+        item['entryCount'] += ExpressionAttributeValues[':one']
+
+    def query(self, KeyConditionExpression, ConsistentRead):
+        window = KeyConditionExpression.get_expression()['values'][1]
+        items = [dict(item) for (item_window, _), item in sorted(self.items.items()) if item_window == window]
+        if items and self.after_query:
+            self.after_query()
+        return {'Items': items}
+
+    def delete_item(self, Key, ConditionExpression, ExpressionAttributeValues):
+        key = (Key['window'], Key['locationId'])
+        if self.items[key]['entryCount'] != ExpressionAttributeValues[':flushed']:
+            raise ConditionalCheckFailedException()
+        del self.items[key]
+
+
+class TestNotificationLambda(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = StubTransport(record_batches=True)
+        self.dedup_table = InMemoryDedupTable()
+        patchers = [
+            patch.object(lambda_function, 'notification_transport', self.transport),
+            patch.object(lambda_function, 'dedup_store', NotificationDedupStore(self.dedup_table, ttl_seconds=60, clock=lambda: 1000)),
+            patch.object(lambda_function, 'staff_digest', None),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _sent(self):
+        return [(channel, message['recipient'], message['subject'], message['body'])
+                for channel, chunk in self.transport.batches for message in chunk]
+
+    def _record(self, body, message_id='msg-1'):
+        return {"messageId": message_id, "body": json.dumps(body)}
+
+    def test_bundled_templates_render_with_defaults(self):
+        response = lambda_function.lambda_handler({"Records": [self._record({
+            "bookingId": "booking123",
+            "notificationType": "BOOKING_CONFIRMED",
+            "messageDetails": {"recipient": "client@example.com", "serviceName": "Teeth Cleaning", "startTime": "2024-10-15 at 2:00 PM"}
+        })]}, {})
+
+        self.assertEqual(response['successful_sends_in_invocation'], 1)
+        [(channel, recipient, subject, body)] = self._sent()
+        self.assertEqual(channel, "email")
+        self.assertEqual(recipient, "client@example.com")
+        self.assertEqual(subject, "Booking Confirmed: Your Appointment for Teeth Cleaning")
+        self.assertIn("Dear Valued Client,", body)
+        self.assertIn("at our location on 2024-10-15 at 2:00 PM", body)
+        self.assertTrue(body.endswith("Booking ID: booking123"))
+
+    def test_channel_is_taken_from_the_message(self):
+        lambda_function.lambda_handler({"Records": [self._record({
+            "bookingId": "booking123",
+            "notificationType": "BOOKING_CANCELLED",
+            "channel": "sms",
+            "locale": "fr-CA",  # No French templates bundled, falls back to English
+            "messageDetails": {"recipient": "+15555550100", "serviceName": "Checkup", "startTime": "Nov 1"}
+        })]}, {})
+
+        self.assertEqual(self._sent(), [("sms", "+15555550100", "", "Cancelled: Checkup at our location on Nov 1. Ref booking123")])
+
+    def test_unknown_type_fails_without_rendering(self):
+        with patch.object(lambda_function.template_registry, 'render') as mock_render:
+            response = lambda_function.lambda_handler({"Records": [self._record({
+                "bookingId": "bookingXYZ", "notificationType": "SOME_NEW_UNHANDLED_TYPE",
+                "messageDetails": {"recipient": "client@example.com"}
+            })]}, {})
+
+        self.assertEqual(response['failed_sends_in_invocation'], 1)
+        mock_render.assert_not_called()
+        self.assertEqual(response['batchItemFailures'], [{"itemIdentifier": "msg-1"}])
+        self.assertEqual(self.transport.batches, [])
+
+    def test_registry_resolves_locales_and_loads_from_s3(self):
+        registry = TemplateRegistry.from_s3(FakeS3({
+            "templates/email/en.json": {"GREETING": {"subject": "Hi", "body": "Hello $clientName"}},
+            "templates/email/es.json": {"GREETING": {"subject": "Hola", "body": "Hola $clientName"}},
+            "templates/README.txt": "ignored",
+        }), "bucket", "templates/")
+
+        self.assertEqual(registry.render("GREETING", {"clientName": "Ana"}, locale="es-MX")['body'], "Hola Ana")
+        self.assertEqual(registry.render("GREETING", {"clientName": None}, locale="de")['body'], "Hello Valued Client")
+        self.assertIs(registry.get("GREETING", locale="es-MX"), registry.get("GREETING", locale="es"))
+        with self.assertRaises(UnknownTemplateError):
+            registry.render("GREETING", {}, channel="sms")
+        with self.assertRaises(UnknownTemplateError):
+            registry.render("UNKNOWN", {})
+
+    def test_records_are_sent_in_bulk_per_channel_and_template(self):
+        records = [self._record({
+            "bookingId": f"booking{index}",
+            "notificationType": "BOOKING_CONFIRMED",
+            "messageDetails": {"recipient": f"client{index}@example.com"}
+        }, message_id=f"email-{index}") for index in range(60)]
+        records += [self._record({
+            "bookingId": f"sms-booking{index}", "notificationType": "BOOKING_CONFIRMED", "channel": "sms",
+            "messageDetails": {"recipient": f"+1555555{index:04d}"}
+        }, message_id=f"sms-{index}") for index in range(3)]
+        self.transport.fail_recipients = {"client7@example.com"}
+
+        response = lambda_function.lambda_handler({"Records": records}, {})
+
+        self.assertEqual(sorted((channel, len(chunk)) for channel, chunk in self.transport.batches), [("email", 10), ("email", 50), ("sms", 3)])
+        self.assertEqual(response['successful_sends_in_invocation'], 62)
+        self.assertEqual(response['batchItemFailures'], [{"itemIdentifier": "email-7"}])
+
+    def test_aws_transport_maps_provider_results_back_to_messages(self):
+        sesv2, sns = MagicMock(), MagicMock()
+        sesv2.send_bulk_email.return_value = {"BulkEmailEntryResults": [
+            {"Status": "SUCCESS", "MessageId": "ses-1"}, {"Status": "MESSAGE_REJECTED", "Error": "Address blacklisted"}]}
+
+        def publish(PhoneNumber, **kwargs):
+            if PhoneNumber == "+15555550100":
+                raise RuntimeError("InternalError")
+            return {"MessageId": "sns-1"}
+        sns.publish.side_effect = publish
+        transport = AwsBulkTransport(sesv2, sns, "bookings@example.com", "NotificationPassthrough")
+
+        def message(message_id, channel, recipient):
+            return {"messageId": message_id, "channel": channel, "templateKey": ("BOOKING_CONFIRMED", "en"),
+                    "recipient": recipient, "subject": "Confirmed", "body": f"Body for {recipient}"}
+
+        results = deliver_in_bulk(transport, [
+            message("m1", "email", "a@example.com"), message("m2", "email", "b@example.com"),
+            message("m3", "sms", "+15555550100"), message("m4", "sms", "+15555550101"), message("m5", "push", "device")])
+
+        self.assertEqual(results["m1"], None)
+        self.assertIn("MESSAGE_REJECTED", results["m2"])
+        self.assertIn("InternalError", results["m3"])
+        self.assertEqual(results["m4"], None)
+        self.assertEqual(results["m5"], "Unsupported channel: push")
+        entries = sesv2.send_bulk_email.call_args[1]['BulkEmailEntries']
+        self.assertEqual(json.loads(entries[1]['ReplacementEmailContent']['ReplacementTemplate']['ReplacementTemplateData']),
+                         {"subject": "Confirmed", "body": "Body for b@example.com"})
+        # Every text is published to its own phone number, never to a shared topic
+        self.assertEqual(sorted((call.kwargs['PhoneNumber'], call.kwargs['Message']) for call in sns.publish.call_args_list),
+                         [("+15555550100", "Body for +15555550100"), ("+15555550101", "Body for +15555550101")])
+        self.assertFalse(sns.publish_batch.called)
+
+    def test_duplicate_notifications_are_dropped_before_rendering(self):
+        confirmed = {"bookingId": "booking1", "notificationType": "BOOKING_CONFIRMED", "messageDetails": {"recipient": "client@example.com"}}
+        rescheduled = dict(confirmed, notificationType="BOOKING_RESCHEDULED", version=2)
+        response = lambda_function.lambda_handler({"Records": [
+            self._record(confirmed, "m1"), self._record(confirmed, "m2"),  # Redelivered within the batch
+            self._record(rescheduled, "m3"), self._record(dict(rescheduled, version=3), "m4")
+        ]}, {})
+
+        self.assertEqual(response['successful_sends_in_invocation'], 3)
+        self.assertEqual(response['duplicates_dropped_in_invocation'], 1)
+        self.assertEqual(response['batchItemFailures'], [])
+        self.assertEqual(self.dedup_table.items["booking1#BOOKING_RESCHEDULED#2#email"]['expiresAt'], 1060)
+        puts_after_first_batch = self.dedup_table.put_calls
+
+        # Another container already sent it: the conditional put rejects the claim
+        lambda_function.dedup_store.seen.discard("booking1#BOOKING_CONFIRMED#0#email")
+        with patch.object(lambda_function.template_registry, 'render') as mock_render:
+            response = lambda_function.lambda_handler({"Records": [self._record(confirmed, "m5"), self._record(rescheduled, "m6")]}, {})
+        self.assertEqual(response['duplicates_dropped_in_invocation'], 2)
+        mock_render.assert_not_called()
+        self.assertEqual(self.dedup_table.put_calls, puts_after_first_batch + 1)  # m6 answered by the in-memory front
+
+    def test_failed_delivery_releases_the_claim_for_the_retry(self):
+        record = self._record({"bookingId": "booking1", "notificationType": "BOOKING_CONFIRMED",
+                               "messageDetails": {"recipient": "client@example.com"}}, "m1")
+        self.transport.fail_recipients = {"client@example.com"}
+        response = lambda_function.lambda_handler({"Records": [record]}, {})
+        self.assertEqual(response['batchItemFailures'], [{"itemIdentifier": "m1"}])
+        self.assertEqual(self.dedup_table.items, {})
+
+        self.transport.fail_recipients = set()
+        response = lambda_function.lambda_handler({"Records": [record]}, {})
+        self.assertEqual(response['successful_sends_in_invocation'], 1)
+        self.assertIn("booking1#BOOKING_CONFIRMED#0#email", self.dedup_table.items)
+
+    def test_staff_alerts_are_flushed_as_one_digest_per_location(self):
+        self.now = 1725271260  # 2024-09-02T10:01:00Z
+        digest_table = InMemoryDigestTable()
+        buffer = StaffDigestBuffer(digest_table, window_minutes=5, clock=lambda: self.now)
+
+        with patch.object(lambda_function, 'staff_digest', buffer), \
+                patch.object(lambda_function, 'STAFF_DIGEST_RECIPIENT', 'staff@example.com'):
+            records = [self._record({
+                "bookingId": f"booking{index}", "notificationType": "PROVISIONAL_BOOKING_CREATED",
+                "locationId": "loc-a" if index < 3 else "loc-b",
+                "messageDetails": {"recipient": f"client{index}@example.com", "clientName": f"Client {index}",
+                                   "serviceName": "Full Detail", "locationName": "Downtown" if index < 3 else "Uptown",
+                                   "startTime": f"2024-09-03T1{index}:00:00Z"}
+            }, message_id=f"m{index}") for index in range(4)]
+            response = lambda_function.lambda_handler({"Records": records}, {})
+            self.assertEqual(response['successful_sends_in_invocation'], 4)  # Clients are notified right away
+            self.assertEqual(sorted(digest_table.items), [("2024-09-02T10:00Z", "loc-a"), ("2024-09-02T10:00Z", "loc-b")])
+
+            # The window is still open
+            self.assertEqual(lambda_function.lambda_handler({"source": "aws.events"}, {})['flushed_digests'], 0)
+
+            self.now += 300
+            self.transport.batches.clear()
+            response = lambda_function.lambda_handler({"action": "FLUSH_STAFF_DIGESTS"}, {})
+
+        self.assertEqual((response['flushed_digests'], response['digested_entries']), (2, 4))
+        self.assertEqual(digest_table.items, {})
+        [(channel, recipient, subject, body), _] = self._sent()
+        self.assertEqual((channel, recipient, subject), ("email", "staff@example.com", "3 new provisional booking(s) at Downtown"))
+        self.assertIn("- 2024-09-03T12:00:00Z: Full Detail for Client 2 (Booking ID: booking2)", body)
+
+    def test_bookings_added_to_a_digest_while_it_is_flushed_are_kept_for_the_next_flush(self):
+        self.now = 1725271260  # 2024-09-02T10:01:00Z
+        digest_table = InMemoryDigestTable()
+        buffer = StaffDigestBuffer(digest_table, window_minutes=5, clock=lambda: self.now)
+        buffer.add("loc-a", {"bookingId": "booking1", "serviceName": "Full Detail"})
+        self.now += 300
+
+        def late_write():  # A slow writer still appending to the closed window
+            digest_table.after_query = None
+            digest_table.update_item(Key={'window': "2024-09-02T10:00Z", 'locationId': "loc-a"}, UpdateExpression="SET",
+                                     ExpressionAttributeValues={':entry': [{"bookingId": "booking2"}], ':one': 1})
+        digest_table.after_query = late_write
+
+        with patch.object(lambda_function, 'staff_digest', buffer), \
+                patch.object(lambda_function, 'STAFF_DIGEST_RECIPIENT', 'staff@example.com'):
+            first = lambda_function.lambda_handler({"action": "FLUSH_STAFF_DIGESTS"}, {})
+            self.assertEqual(digest_table.items[("2024-09-02T10:00Z", "loc-a")]['entries'], [{"bookingId": "booking2"}])
+            second = lambda_function.lambda_handler({"action": "FLUSH_STAFF_DIGESTS"}, {})
+
+        self.assertEqual((first['flushed_digests'], first['digested_entries']), (1, 1))
+        self.assertEqual((second['flushed_digests'], second['digested_entries']), (1, 1))
+        self.assertEqual(digest_table.items, {})
+        bodies = [body for _, _, _, body in self._sent()]
+        self.assertIn("booking1", bodies[0])
+        self.assertIn("booking2", bodies[1])
+        self.assertNotIn("booking1", bodies[1])
+
+    def test_client_contact_fans_out_to_every_enabled_channel(self):
+        record = self._record({
+            "bookingId": "booking1", "notificationType": "BOOKING_CONFIRMED",
+            "clientContact": {"email": "client@example.com", "phone": "+15555550100", "messengerPsid": "psid-1"},
+            "messageDetails": {"serviceName": "Full Detail", "startTime": "Sep 2"}
+        })
+        self.transport.fail_recipients = {"+15555550100"}
+        response = lambda_function.lambda_handler({"Records": [record]}, {})
+
+        self.assertEqual(sorted((channel, recipient) for channel, recipient, _, _ in self._sent()),
+                         [("email", "client@example.com"), ("messenger", "psid-1"), ("sms", "+15555550100")])
+        self.assertEqual(response['channel_results_in_invocation'],
+                         {"email": {"sent": 1, "failed": 0, "timed_out": 0}, "sms": {"sent": 0, "failed": 1, "timed_out": 0},
+                          "messenger": {"sent": 1, "failed": 0, "timed_out": 0}})
+        self.assertEqual(response['batchItemFailures'], [{"itemIdentifier": "msg-1"}])
+
+        # The SQS retry only resends the channel that failed
+        self.transport.fail_recipients = set()
+        self.transport.batches.clear()
+        response = lambda_function.lambda_handler({"Records": [record]}, {})
+        self.assertEqual([(channel, recipient) for channel, recipient, _, _ in self._sent()], [("sms", "+15555550100")])
+        self.assertEqual(response['batchItemFailures'], [])
+
+    def test_producer_messages_fan_out_to_the_booking_contact_channels(self):
+        # As create-booking stores a booking made by the agent in a Messenger session
+        booking = {"bookingId": "booking1", "clientName": "Test Client", "serviceName": "Full Detail",
+                   "proposedStartTime": "2099-09-02T10:00:00Z", "version": 2,
+                   "clientContact": {"phone": "+15555550100", "messengerPsid": "psid-1"}}
+        reminder = build_reminder_items(booking, now=datetime(2099, 9, 1, 0, 0, tzinfo=timezone.utc))[0]['notification']
+        legacy = notification_message({"bookingId": "booking2", "clientDetails": {"name": "Old Client", "email": "old@example.com"}},
+                                      "BOOKING_CONFIRMED", {"serviceName": "Full Detail", "startTime": "Sep 2"})
+
+        lambda_function.lambda_handler({"Records": [self._record(reminder, 'msg-1'), self._record(legacy, 'msg-2')]}, {})
+
+        self.assertEqual(sorted((channel, recipient) for channel, recipient, _, _ in self._sent()),
+                         [("email", "old@example.com"), ("messenger", "psid-1"), ("sms", "+15555550100")])
+
+    def test_slow_channel_times_out_without_stalling_the_others_and_is_not_resent(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.transport.send_sms_batch = lambda chunk: release.wait(5) and {}
+        record = self._record({
+            "bookingId": "booking1", "notificationType": "BOOKING_CONFIRMED",
+            "clientContact": {"email": "client@example.com", "phone": "+15555550100"},
+            "messageDetails": {}
+        })
+
+        with patch.object(lambda_function, 'channel_timeouts', {"sms": 0.05}):
+            started_at = time.monotonic()
+            response = lambda_function.lambda_handler({"Records": [record]}, {})
+
+        self.assertLess(time.monotonic() - started_at, 2)
+        self.assertEqual(response['channel_results_in_invocation'],
+                         {"email": {"sent": 1, "failed": 0, "timed_out": 0}, "sms": {"sent": 0, "failed": 0, "timed_out": 1}})
+        # The SMS call may still deliver, so its claim is kept and the record is not retried
+        self.assertIn("booking1#BOOKING_CONFIRMED#0#email", self.dedup_table.items)
+        self.assertIn("booking1#BOOKING_CONFIRMED#0#sms", self.dedup_table.items)
+        self.assertEqual(response['batchItemFailures'], [])
+
+    def test_messenger_sends_one_graph_batch_per_chunk(self):
+        sender = MessengerBatchSender("page-token")
+        graph_response = MagicMock()
+        graph_response.__enter__.return_value.read.return_value = json.dumps([{"code": 200, "body": "{}"}, None]).encode('utf-8')
+
+        with patch('urllib.request.urlopen', return_value=graph_response) as mock_urlopen:
+            results = sender.send_messenger_batch([
+                {"messageId": "m1", "recipient": "psid-1", "body": "Confirmed"},
+                {"messageId": "m2", "recipient": "psid-2", "body": "Confirmed"}])
+
+        self.assertEqual(results["m1"], None)
+        self.assertIn("no response", results["m2"])
+        form = dict(urllib.parse.parse_qsl(mock_urlopen.call_args[0][0].data.decode('utf-8')))
+        batch = json.loads(form['batch'])
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(dict(urllib.parse.parse_qsl(batch[1]['body']))['tag'], "CONFIRMED_EVENT_UPDATE")
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
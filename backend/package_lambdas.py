@@ -0,0 +1,89 @@
+"""
+Builds one deployment zip per Lambda directory, with the backend/common modules the Lambda imports
+copied next to its lambda_function.py, where their flat-import fallback finds them.
+
+    python -m backend.package_lambdas [--output-dir build] [--with-dependencies] [notification_lambda ...]
+
+Tests, the replay benchmark and caches are left out. --with-dependencies also installs the Lambda's
+requirements.txt into the zip with pip; otherwise they have to come from a layer.
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+COMMON_DIR = os.path.join(BACKEND_DIR, "common")
+EXCLUDED_DIRS = {"__pycache__", ".pytest_cache", "benchmark"}
+# 'from ..common.client_contact import' in a Lambda, 'from .client_contact import' inside common
+COMMON_IMPORT = re.compile(r"^\s*from \.\.common\.(\w+) import", re.MULTILINE)
+SIBLING_IMPORT = re.compile(r"^\s*from \.(\w+) import", re.MULTILINE)
+
+
+def lambda_dirs():
+    return sorted(name for name in os.listdir(BACKEND_DIR)
+                  if name.endswith("_lambda") and os.path.isfile(os.path.join(BACKEND_DIR, name, "lambda_function.py")))
+
+
+def _source_files(directory):
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if d not in EXCLUDED_DIRS)
+        for file_name in sorted(files):
+            if not (file_name.startswith("test_") or file_name.endswith((".pyc", ".pyo"))):
+                yield os.path.join(root, file_name)
+
+
+def common_modules(lambda_dir):
+    """The backend/common modules a Lambda imports, including the ones they import in turn."""
+    pending = set()
+    for path in _source_files(lambda_dir):
+        if path.endswith(".py"):
+            with open(path, encoding="utf-8") as f:
+                pending.update(COMMON_IMPORT.findall(f.read()))
+    modules = set()
+    while pending:
+        module = pending.pop()
+        if module in modules:
+            continue
+        modules.add(module)
+        with open(os.path.join(COMMON_DIR, f"{module}.py"), encoding="utf-8") as f:
+            pending.update(SIBLING_IMPORT.findall(f.read()))
+    return sorted(modules)
+
+
+def package_lambda(name, output_dir, with_dependencies=False):
+    """Writes output_dir/<name>.zip and returns its path."""
+    lambda_dir = os.path.join(BACKEND_DIR, name)
+    with tempfile.TemporaryDirectory() as staging_dir:
+        for path in _source_files(lambda_dir):
+            target = os.path.join(staging_dir, os.path.relpath(path, lambda_dir))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(path, target)
+        for module in common_modules(lambda_dir):
+            shutil.copy2(os.path.join(COMMON_DIR, f"{module}.py"), staging_dir)
+        requirements = os.path.join(lambda_dir, "requirements.txt")
+        if with_dependencies and os.path.isfile(requirements):
+            subprocess.run([sys.executable, "-m", "pip", "install", "--quiet", "-r", requirements, "--target", staging_dir],
+                           check=True)
+        return shutil.make_archive(os.path.join(output_dir, name), "zip", staging_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("lambdas", nargs="*", help="Lambda directories to package (default: all)")
+    parser.add_argument("--output-dir", default="build", help="Where the zips are written")
+    parser.add_argument("--with-dependencies", action="store_true", help="pip install each requirements.txt into its zip")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name in args.lambdas or lambda_dirs():
+        path = package_lambda(name, args.output_dir, args.with_dependencies)
+        common = common_modules(os.path.join(BACKEND_DIR, name))
+        print(f"{path}" + (f" (with common: {', '.join(common)})" if common else ""))
+
+
+if __name__ == "__main__":
+    main()
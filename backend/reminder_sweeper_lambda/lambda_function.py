@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import boto3
+from boto3.dynamodb.conditions import Key
+
+# Initialize logger
+logger = logging.getLogger()
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+
+from datetime import datetime, timedelta, timezone
+
+try:
+    from ..common.reminder_schedule import BUCKET_MINUTES, bucket_for
+except ImportError:  # Deployed flat in the Lambda package
+    from reminder_schedule import BUCKET_MINUTES, bucket_for
+
+# Initialize Boto3 clients
+dynamodb = boto3.resource('dynamodb')
+sqs = boto3.client('sqs')
+
+REMINDER_SCHEDULE_TABLE_NAME = os.environ.get('REMINDER_SCHEDULE_TABLE_NAME')
+APPOINTMENTS_TABLE_NAME = os.environ.get('APPOINTMENTS_TABLE_NAME')
+NOTIFICATION_SQS_URL = os.environ.get('NOTIFICATION_SQS_URL')
+# Earlier buckets swept on every run, so reminders survive a late or failed run
+# (sent reminders are deleted, and the notification dedup drops any resend)
+REMINDER_SWEEP_LOOKBACK_BUCKETS = int(os.environ.get('REMINDER_SWEEP_LOOKBACK_BUCKETS', 2))
+
+SQS_SEND_BATCH_SIZE = 10  # SendMessageBatch limit
+BATCH_GET_SIZE = 100  # BatchGetItem limit
+
+
+def buckets_to_sweep(now, lookback=REMINDER_SWEEP_LOOKBACK_BUCKETS):
+    """Bucket keys from the oldest lookback bucket up to the current one."""
+    return [bucket_for(now - timedelta(minutes=BUCKET_MINUTES * offset)) for offset in range(lookback, -1, -1)]
+
+
+def query_bucket(reminder_table, bucket):
+    """Yields the reminder items of one bucket, page by page."""
+    query_kwargs = {"KeyConditionExpression": Key('bucket').eq(bucket)}
+    while True:
+        response = reminder_table.query(**query_kwargs)
+        yield response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def current_bookings(booking_ids):
+    """
+    {bookingId: (status, proposedStartTime)} for the given bookings, read with BatchGetItem.
+    Bookings missing from the result are left out; unprocessed keys are retried once.
+    """
+    bookings = {}
+    booking_ids = list(booking_ids)
+    for start in range(0, len(booking_ids), BATCH_GET_SIZE):
+        request = {APPOINTMENTS_TABLE_NAME: {
+            'Keys': [{'bookingId': booking_id} for booking_id in booking_ids[start:start + BATCH_GET_SIZE]],
+            'ProjectionExpression': 'bookingId, #status, proposedStartTime',
+            'ExpressionAttributeNames': {'#status': 'status'}
+        }}
+        for _ in range(2):
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response.get('Responses', {}).get(APPOINTMENTS_TABLE_NAME, []):
+                bookings[item['bookingId']] = (item.get('status'), item.get('proposedStartTime'))
+            request = response.get('UnprocessedKeys')
+            if not request:
+                break
+    return bookings
+
+
+def is_still_due(reminder, bookings):
+    """A reminder is sent only while its booking is confirmed at the time it was scheduled for."""
+    if bookings is None:
+        return True
+    if reminder['bookingId'] not in bookings:
+        return False
+    status, start_time = bookings[reminder['bookingId']]
+    return status == 'confirmed' and start_time == reminder['startTime']
+
+
+def send_reminders(reminders):
+    """Sends reminder notifications with SendMessageBatch. Returns the reminders that were accepted."""
+    accepted = []
+    for start in range(0, len(reminders), SQS_SEND_BATCH_SIZE):
+        batch = reminders[start:start + SQS_SEND_BATCH_SIZE]
+        try:
+            response = sqs.send_message_batch(
+                QueueUrl=NOTIFICATION_SQS_URL,
+                Entries=[{"Id": str(index), "MessageBody": json.dumps(reminder['notification'])} for index, reminder in enumerate(batch)]
+            )
+        except Exception as e:
+            logger.error(f"[ReminderSweeper] Failed to send {len(batch)} reminder(s): {e}", exc_info=True)
+            continue
+        for failure in response.get('Failed', []):
+            logger.error(f"[ReminderSweeper] SQS rejected reminder {batch[int(failure['Id'])]['reminderId']}: {failure.get('Message')}")
+        accepted.extend(batch[int(success['Id'])] for success in response.get('Successful', []))
+    return accepted
+
+
+def sweep_bucket(reminder_table, bucket):
+    """Sends the due reminders of a bucket and deletes them. Returns (sent, skipped, failed) counts."""
+    sent = skipped = failed = 0
+    for page in query_bucket(reminder_table, bucket):
+        if not page:
+            continue
+        bookings = current_bookings({reminder['bookingId'] for reminder in page}) if APPOINTMENTS_TABLE_NAME else None
+        due = [reminder for reminder in page if is_still_due(reminder, bookings)]
+        stale = [reminder for reminder in page if not is_still_due(reminder, bookings)]
+        accepted = send_reminders(due)
+        # Sent and stale reminders are done; failed ones stay for the next run
+        with reminder_table.batch_writer() as batch:
+            for reminder in accepted + stale:
+                batch.delete_item(Key={'bucket': reminder['bucket'], 'reminderId': reminder['reminderId']})
+        sent, skipped, failed = sent + len(accepted), skipped + len(stale), failed + len(due) - len(accepted)
+    return sent, skipped, failed
+
+
+def lambda_handler(event, context):
+    """
+    Handles scheduled events (every BUCKET_MINUTES) for the ReminderSweeperLambda.
+    Queries only the current reminder bucket (plus a short lookback) and fans the due
+    reminders out to the notification queue, so the cost follows the number of reminders due.
+    """
+    lambda_name = "ReminderSweeperLambda"
+    logger.info(f"Received event for {lambda_name}: {json.dumps(event)}")
+
+    if not all([REMINDER_SCHEDULE_TABLE_NAME, NOTIFICATION_SQS_URL]):
+        logger.fatal(f"[{lambda_name}] Missing one or more environment variables: REMINDER_SCHEDULE_TABLE_NAME, NOTIFICATION_SQS_URL.")
+        raise EnvironmentError("Missing reminder sweeper environment variables.")
+
+    reminder_table = dynamodb.Table(REMINDER_SCHEDULE_TABLE_NAME)
+    now = datetime.now(timezone.utc)
+    totals = {"sent": 0, "skipped": 0, "failed": 0}
+    failed_buckets = []
+
+    for bucket in buckets_to_sweep(now):
+        try:
+            sent, skipped, failed = sweep_bucket(reminder_table, bucket)
+        except Exception as e:
+            logger.error(f"[{lambda_name}] Sweeping bucket {bucket} failed: {e}", exc_info=True)
+            failed_buckets.append(bucket)
+            continue
+        totals["sent"] += sent
+        totals["skipped"] += skipped
+        totals["failed"] += failed
+        if sent or skipped or failed:
+            logger.info(f"[{lambda_name}] Bucket {bucket}: {sent} sent, {skipped} stale skipped, {failed} failed.")
+
+    logger.info(f"[{lambda_name}] Sweep complete: {totals['sent']} reminders sent, {totals['skipped']} skipped, {totals['failed']} failed.")
+    return dict(status="completed", failed_buckets=failed_buckets, **totals)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    print(buckets_to_sweep(datetime.now(timezone.utc)))
@@ -0,0 +1,118 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import json
+import os
+from datetime import datetime, timezone
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1') # boto3 clients are created at import time
+
+# Import the Lambda function to test
+from backend.reminder_sweeper_lambda import lambda_function
+
+
+class FakeReminderTable:
+    """Reminder table holding items per bucket; query returns pages of page_size items."""
+
+    def __init__(self, items, page_size=2):
+        self.items = {(item['bucket'], item['reminderId']): item for item in items}
+        self.page_size = page_size
+        self.queried_buckets = []
+        self.batch = MagicMock()
+        self.batch.delete_item.side_effect = lambda Key: self.items.pop((Key['bucket'], Key['reminderId']))
+
+    def query(self, KeyConditionExpression, ExclusiveStartKey=None):
+        bucket = KeyConditionExpression.get_expression()['values'][1]
+        self.queried_buckets.append(bucket)
+        matching = sorted((item for item in self.items.values() if item['bucket'] == bucket), key=lambda item: item['reminderId'])
+        if ExclusiveStartKey:
+            matching = [item for item in matching if item['reminderId'] > ExclusiveStartKey['reminderId']]
+        response = {'Items': matching[:self.page_size]}
+        if len(matching) > self.page_size:
+            response['LastEvaluatedKey'] = {'bucket': bucket, 'reminderId': matching[self.page_size - 1]['reminderId']}
+        return response
+
+    def batch_writer(self):
+        writer = MagicMock()
+        writer.__enter__.return_value = self.batch
+        return writer
+
+
+def _reminder(booking_id, bucket, start_time='2024-09-02T12:00:00Z'):
+    return {
+        'bucket': bucket,
+        'reminderId': f"{booking_id}#APPOINTMENT_REMINDER_2H",
+        'bookingId': booking_id,
+        'startTime': start_time,
+        'notification': {"bookingId": booking_id, "notificationType": "APPOINTMENT_REMINDER_2H", "version": 0,
+                         "messageDetails": {"recipient": f"{booking_id}@example.com"}}
+    }
+
+
+class TestReminderSweeperLambda(unittest.TestCase):
+
+    def setUp(self):
+        self.now = datetime(2024, 9, 2, 10, 1, tzinfo=timezone.utc)
+        self.table = FakeReminderTable([
+            _reminder('booking1', '2024-09-02T10:00Z'),
+            _reminder('booking2', '2024-09-02T10:00Z'),
+            _reminder('booking3', '2024-09-02T10:00Z'),
+            _reminder('moved', '2024-09-02T10:00Z'),
+            _reminder('late', '2024-09-02T09:50Z'),
+            _reminder('future', '2024-09-02T10:05Z'),
+        ])
+        self.bookings = {
+            'booking1': 'confirmed', 'booking2': 'confirmed', 'booking3': 'cancelled', 'late': 'confirmed', 'future': 'confirmed'
+        }
+        self.mock_dynamodb = MagicMock()
+        self.mock_dynamodb.Table.return_value = self.table
+        self.mock_dynamodb.batch_get_item.side_effect = self._batch_get_item
+        self.mock_sqs = MagicMock()
+        self.mock_sqs.send_message_batch.side_effect = lambda QueueUrl, Entries: {"Successful": [{"Id": entry["Id"]} for entry in Entries]}
+
+        mock_datetime = MagicMock(wraps=datetime)
+        mock_datetime.now.return_value = self.now
+        patchers = [
+            patch.object(lambda_function, 'dynamodb', self.mock_dynamodb),
+            patch.object(lambda_function, 'sqs', self.mock_sqs),
+            patch.object(lambda_function, 'datetime', mock_datetime),
+            patch.object(lambda_function, 'REMINDER_SCHEDULE_TABLE_NAME', 'mock_reminder_table'),
+            patch.object(lambda_function, 'APPOINTMENTS_TABLE_NAME', 'mock_appointments_table'),
+            patch.object(lambda_function, 'NOTIFICATION_SQS_URL', 'mock_notification_sqs_url'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _batch_get_item(self, RequestItems):
+        keys = RequestItems['mock_appointments_table']['Keys']
+        items = [{'bookingId': key['bookingId'], 'status': self.bookings[key['bookingId']], 'proposedStartTime': '2024-09-02T12:00:00Z'}
+                 for key in keys if key['bookingId'] in self.bookings]
+        items += [{'bookingId': 'moved', 'status': 'confirmed', 'proposedStartTime': '2024-09-03T12:00:00Z'}] if {'bookingId': 'moved'} in keys else []
+        return {'Responses': {'mock_appointments_table': items}}
+
+    def _sent_booking_ids(self):
+        return sorted(json.loads(entry['MessageBody'])['bookingId']
+                      for call in self.mock_sqs.send_message_batch.call_args_list for entry in call[1]['Entries'])
+
+    def test_only_due_buckets_are_queried_and_swept(self):
+        response = lambda_function.lambda_handler({"source": "aws.events"}, {})
+
+        # The current bucket holds two pages
+        self.assertEqual(self.table.queried_buckets, ["2024-09-02T09:50Z", "2024-09-02T09:55Z", "2024-09-02T10:00Z", "2024-09-02T10:00Z"])
+        self.assertEqual(self._sent_booking_ids(), ["booking1", "booking2", "late"])
+        self.assertEqual((response['sent'], response['skipped'], response['failed']), (3, 2, 0))  # Cancelled and moved bookings skipped
+        self.assertEqual(list(self.table.items), [('2024-09-02T10:05Z', 'future#APPOINTMENT_REMINDER_2H')])
+
+    def test_rejected_reminders_stay_for_the_next_run(self):
+        self.mock_sqs.send_message_batch.side_effect = lambda QueueUrl, Entries: {
+            "Successful": [{"Id": entry["Id"]} for entry in Entries if 'booking1' not in entry['MessageBody']],
+            "Failed": [{"Id": entry["Id"], "Message": "throttled"} for entry in Entries if 'booking1' in entry['MessageBody']]}
+
+        response = lambda_function.lambda_handler({"source": "aws.events"}, {})
+
+        self.assertEqual(response['failed'], 1)
+        self.assertIn(('2024-09-02T10:00Z', 'booking1#APPOINTMENT_REMINDER_2H'), self.table.items)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,220 @@
+import json
+import logging
+import os
+import boto3
+from botocore.exceptions import ClientError
+
+# Initialize logger
+logger = logging.getLogger()
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+try:
+    from ..common.reminder_schedule import cancel_reminders, schedule_reminders
+    from ..common.client_contact import notification_message
+except ImportError:  # Deployed flat in the Lambda package
+    from reminder_schedule import cancel_reminders, schedule_reminders
+    from client_contact import notification_message
+
+# Initialize Boto3 clients
+dynamodb = boto3.resource('dynamodb')
+sqs = boto3.client('sqs')
+
+appointments_table_name = os.environ.get('APPOINTMENTS_TABLE_NAME')
+notification_sqs_url = os.environ.get('NOTIFICATION_SQS_URL')
+google_calendar_sync_sqs_url = os.environ.get('GOOGLE_CALENDAR_SYNC_SQS_URL')
+reminder_schedule_table_name = os.environ.get('REMINDER_SCHEDULE_TABLE_NAME') # Optional, set when reminders are scheduled
+
+# Bookings that can still be moved
+RESCHEDULABLE_STATUSES = ['pending_confirmation', 'confirmed']
+# Format create_booking_lambda stores booking times in; conditional updates and reconciliation compare them as strings.
+# Bookings created before it normalized times may still hold the client's offset.
+BOOKING_TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def _json_default(value):
+    # DynamoDB returns numbers (e.g. version) as Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _response(status_code, body):
+    return {
+        "statusCode": status_code,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps(body, default=_json_default)
+    }
+
+
+def _parse_iso(value):
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def to_booking_time(moment):
+    return moment.astimezone(timezone.utc).strftime(BOOKING_TIME_FORMAT)
+
+
+def compute_new_end_time(booking_item, new_start_dt):
+    """Keeps the booking's current length; falls back to serviceDurationMinutes."""
+    try:
+        duration = _parse_iso(booking_item['proposedEndTime']) - _parse_iso(booking_item['proposedStartTime'])
+    except (KeyError, ValueError):
+        duration = timedelta(minutes=int(booking_item.get('serviceDurationMinutes', 60)))
+    return to_booking_time(new_start_dt + duration)
+
+
+def move_booking(appointments_table, booking_item, new_start_time, new_end_time):
+    """
+    Moves the booking's times in one conditional update. The condition fails if the booking was
+    cancelled or moved by someone else since it was read, so concurrent changes cannot interleave.
+    Each move bumps the booking's version. Returns the updated booking.
+    """
+    response = appointments_table.update_item(
+        Key={'bookingId': booking_item['bookingId']},
+        UpdateExpression=(
+            "SET proposedStartTime = :new_start, proposedEndTime = :new_end, previousStartTime = :old_start, "
+            "updatedAt = :updated_at, #version = if_not_exists(#version, :zero) + :one"
+        ),
+        ConditionExpression="#status IN (:pending, :confirmed) AND proposedStartTime = :old_start",
+        ExpressionAttributeNames={'#status': 'status', '#version': 'version'},
+        ExpressionAttributeValues={
+            ':new_start': new_start_time,
+            ':new_end': new_end_time,
+            ':old_start': booking_item['proposedStartTime'],
+            ':updated_at': datetime.now(timezone.utc).isoformat(),
+            ':pending': 'pending_confirmation',
+            ':confirmed': 'confirmed',
+            ':zero': 0,
+            ':one': 1
+        },
+        ReturnValues="ALL_NEW"
+    )
+    return response.get('Attributes', {})
+
+
+def lambda_handler(event, context):
+    """
+    Handles incoming requests for the RescheduleBookingLambda.
+    Triggered by API Gateway (e.g., POST /bookings/{id}/reschedule with {"proposedStartTime": "..."}).
+    Moves the booking in place, then sends one UPDATE_EVENT to the calendar sync queue and moves the
+    reminders (confirmed bookings only), and sends one BOOKING_RESCHEDULED notification.
+    """
+    lambda_name = "RescheduleBookingLambda"
+    logger.info(f"Received event for {lambda_name}: {json.dumps(event)}")
+
+    if not all([appointments_table_name, notification_sqs_url, google_calendar_sync_sqs_url]):
+        logger.error("Missing one or more environment variables: APPOINTMENTS_TABLE_NAME, NOTIFICATION_SQS_URL, GOOGLE_CALENDAR_SYNC_SQS_URL")
+        return _response(500, {"error": f"Configuration error in {lambda_name}."})
+
+    appointments_table = dynamodb.Table(appointments_table_name)
+
+    try:
+        # 1. Extract bookingId and the new start time
+        booking_id = (event.get('pathParameters') or {}).get('id')
+        if not booking_id:
+            logger.warning("Booking ID not found in event pathParameters.")
+            return _response(400, {"error": "Missing booking ID in request path."})
+
+        try:
+            body = json.loads(event.get('body') or '{}')
+        except json.JSONDecodeError:
+            return _response(400, {"error": "Invalid JSON format in request body."})
+        new_start_time = body.get('proposedStartTime')
+        if not new_start_time:
+            return _response(400, {"error": "Missing required field: proposedStartTime"})
+        try:
+            new_start_dt = _parse_iso(new_start_time)
+        except ValueError:
+            logger.warning(f"Invalid proposedStartTime format: {new_start_time}")
+            return _response(400, {"error": "Invalid proposedStartTime format. Please use ISO 8601 format (e.g., YYYY-MM-DDTHH:MM:SSZ)."})
+        # Stored in UTC like the times create_booking_lambda writes, whatever offset the client sent
+        new_start_time = to_booking_time(new_start_dt)
+
+        logger.info(f"Attempting to reschedule booking {booking_id} to {new_start_time}")
+
+        # 2. Fetch and validate the booking
+        try:
+            booking_item = appointments_table.get_item(Key={'bookingId': booking_id}).get('Item')
+        except Exception as e:
+            logger.error(f"Error fetching booking {booking_id} from DynamoDB: {e}", exc_info=True)
+            return _response(500, {"error": "Failed to fetch booking details."})
+
+        if not booking_item:
+            logger.warning(f"Booking {booking_id} not found.")
+            return _response(404, {"error": f"Booking {booking_id} not found."})
+
+        current_status = booking_item.get('status')
+        if current_status not in RESCHEDULABLE_STATUSES:
+            logger.warning(f"Booking {booking_id} has status '{current_status}' and cannot be rescheduled.")
+            return _response(409, {"error": f"Booking {booking_id} cannot be rescheduled. Current status: {current_status}."})
+
+        if booking_item.get('proposedStartTime') == new_start_time:
+            return _response(200, {"message": f"Booking {booking_id} is already scheduled at {new_start_time}.", "booking": booking_item})
+
+        # 3. Move the booking atomically
+        new_end_time = compute_new_end_time(booking_item, new_start_dt)
+        try:
+            rescheduled_booking = move_booking(appointments_table, booking_item, new_start_time, new_end_time)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                logger.warning(f"Booking {booking_id} changed while being rescheduled.")
+                return _response(409, {"error": f"Booking {booking_id} was changed concurrently. Please retry."})
+            logger.error(f"Error rescheduling booking {booking_id} in DynamoDB: {e}", exc_info=True)
+            return _response(500, {"error": "Failed to reschedule booking."})
+        logger.info(f"Booking {booking_id} moved from {booking_item['proposedStartTime']} to {new_start_time}.")
+
+        # 4. Move the Google Calendar event of a confirmed booking (a pending booking has none yet)
+        if current_status == 'confirmed':
+            calendar_message_body = {
+                "bookingId": booking_id,
+                "action": "UPDATE_EVENT",
+                "locationId": booking_item.get('locationId'),
+                "proposedStartTime": new_start_time,
+                "proposedEndTime": new_end_time
+            }
+            if booking_item.get('googleCalendarEventId'):
+                calendar_message_body["googleCalendarEventId"] = booking_item['googleCalendarEventId']
+            try:
+                sqs.send_message(QueueUrl=google_calendar_sync_sqs_url, MessageBody=json.dumps(calendar_message_body))
+                logger.info(f"Sent message to Google Calendar Sync SQS for booking {booking_id}: {json.dumps(calendar_message_body)}")
+            except Exception as e:
+                logger.error(f"Error sending message to Google Calendar Sync SQS for booking {booking_id}: {e}", exc_info=True)
+                # The booking is already moved; reconciliation recreates the event at the new time if this is lost.
+
+            # Move the reminders with the booking; the new version keeps them apart from the old ones
+            if reminder_schedule_table_name:
+                try:
+                    reminder_table = dynamodb.Table(reminder_schedule_table_name)
+                    cancel_reminders(reminder_table, booking_id, booking_item['proposedStartTime'])
+                    schedule_reminders(reminder_table, rescheduled_booking)
+                except Exception as e:
+                    logger.error(f"Error moving reminders for booking {booking_id}: {e}", exc_info=True)
+                    # The sweeper skips reminders whose start time no longer matches the booking.
+
+        # 5. Notify the client once about the new time
+        notification_message_body = notification_message(booking_item, "BOOKING_RESCHEDULED", {
+            "serviceName": booking_item.get("serviceName", "the service"),
+            "previousStartTime": booking_item.get("proposedStartTime"),
+            "startTime": new_start_time
+        }, version=int(rescheduled_booking.get('version', 0)))
+        if notification_message_body:
+            try:
+                sqs.send_message(QueueUrl=notification_sqs_url, MessageBody=json.dumps(notification_message_body))
+                logger.info(f"Sent message to Notification SQS for booking {booking_id}: {json.dumps(notification_message_body)}")
+            except Exception as e:
+                logger.error(f"Error sending message to Notification SQS for booking {booking_id}: {e}", exc_info=True)
+        else:
+            logger.warning(f"No client contact found for booking {booking_id}, skipping reschedule notification.")
+
+        return _response(200, {
+            "message": f"Booking {booking_id} rescheduled successfully.",
+            "booking": rescheduled_booking
+        })
+
+    except Exception as e:  # Catch-all for any other unexpected errors
+        logger.error(f"Unexpected error in {lambda_name}: {e}", exc_info=True)
+        return _response(500, {"error": f"An internal server error occurred in {lambda_name}."})
@@ -0,0 +1,139 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import json
+import os
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1') # boto3 clients are created at import time
+
+# Import the Lambda function to test
+from backend.reschedule_booking_lambda import lambda_function
+
+
+class TestRescheduleBookingLambda(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_appointments_table = MagicMock()
+        mock_dynamodb = MagicMock()
+        mock_dynamodb.Table.return_value = self.mock_appointments_table
+        self.mock_sqs = MagicMock()
+
+        patchers = [
+            patch.object(lambda_function, 'dynamodb', mock_dynamodb),
+            patch.object(lambda_function, 'sqs', self.mock_sqs),
+            patch.object(lambda_function, 'appointments_table_name', 'mock_appointments_table'),
+            patch.object(lambda_function, 'notification_sqs_url', 'mock_notification_sqs_url'),
+            patch.object(lambda_function, 'google_calendar_sync_sqs_url', 'mock_google_calendar_sqs_url'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _booking(self, **overrides):
+        booking = {
+            'bookingId': 'booking1',
+            'status': 'confirmed',
+            'googleCalendarEventId': 'gcal_event_123',
+            'locationId': 'location1',
+            'serviceName': 'Full Detail',
+            'proposedStartTime': '2024-09-01T10:00:00Z',
+            'proposedEndTime': '2024-09-01T13:00:00Z',
+            'clientDetails': {'name': 'Test Client', 'email': 'test@example.com'},
+        }
+        booking.update(overrides)
+        self.mock_appointments_table.get_item.return_value = {'Item': booking}
+        self.mock_appointments_table.update_item.side_effect = lambda **kwargs: {'Attributes': {
+            **booking,
+            'proposedStartTime': kwargs['ExpressionAttributeValues'][':new_start'],
+            'proposedEndTime': kwargs['ExpressionAttributeValues'][':new_end'],
+            'version': Decimal(1),
+        }}
+        return booking
+
+    def _event(self, body, booking_id='booking1'):
+        return {"pathParameters": {"id": booking_id}, "body": json.dumps(body)}
+
+    def _sent_messages(self, queue_url):
+        return [json.loads(call[1]['MessageBody']) for call in self.mock_sqs.send_message.call_args_list
+                if call[1]['QueueUrl'] == queue_url]
+
+    def test_confirmed_booking_is_moved_with_one_update_and_one_notification(self):
+        self._booking()
+        response = lambda_function.lambda_handler(self._event({"proposedStartTime": "2024-09-02T16:00:00+02:00"}), {})
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(json.loads(response['body'])['booking']['version'], 1)
+
+        update_kwargs = self.mock_appointments_table.update_item.call_args[1]
+        # Stored in UTC with a Z like the other booking times, keeping the same length
+        self.assertEqual(update_kwargs['ExpressionAttributeValues'][':new_start'], "2024-09-02T14:00:00Z")
+        self.assertEqual(update_kwargs['ExpressionAttributeValues'][':new_end'], "2024-09-02T17:00:00Z")
+        self.assertEqual(update_kwargs['ExpressionAttributeValues'][':old_start'], "2024-09-01T10:00:00Z")
+        self.assertIn("proposedStartTime = :old_start", update_kwargs['ConditionExpression'])
+
+        self.assertEqual(self._sent_messages('mock_google_calendar_sqs_url'), [{
+            "bookingId": "booking1",
+            "action": "UPDATE_EVENT",
+            "locationId": "location1",
+            "proposedStartTime": "2024-09-02T14:00:00Z",
+            "proposedEndTime": "2024-09-02T17:00:00Z",
+            "googleCalendarEventId": "gcal_event_123"
+        }])
+        notifications = self._sent_messages('mock_notification_sqs_url')
+        self.assertEqual(len(notifications), 1)
+        self.assertEqual(notifications[0]['notificationType'], "BOOKING_RESCHEDULED")
+        self.assertEqual(notifications[0]['version'], 1)
+        self.assertEqual(notifications[0]['messageDetails']['previousStartTime'], "2024-09-01T10:00:00Z")
+
+    def test_pending_booking_is_moved_without_calendar_update(self):
+        self._booking(status='pending_confirmation', googleCalendarEventId=None)
+        response = lambda_function.lambda_handler(self._event({"proposedStartTime": "2024-09-02T14:00:00Z"}), {})
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(self._sent_messages('mock_google_calendar_sqs_url'), [])
+        self.assertEqual(len(self._sent_messages('mock_notification_sqs_url')), 1)
+
+    def test_cancelled_booking_cannot_be_rescheduled(self):
+        self._booking(status='cancelled')
+        response = lambda_function.lambda_handler(self._event({"proposedStartTime": "2024-09-02T14:00:00Z"}), {})
+
+        self.assertEqual(response['statusCode'], 409)
+        self.mock_appointments_table.update_item.assert_not_called()
+        self.mock_sqs.send_message.assert_not_called()
+
+    def test_concurrent_change_is_reported_as_conflict(self):
+        self._booking()
+        self.mock_appointments_table.update_item.side_effect = ClientError(
+            {"Error": {"Code": "ConditionalCheckFailedException", "Message": "The conditional request failed"}}, "UpdateItem")
+        response = lambda_function.lambda_handler(self._event({"proposedStartTime": "2024-09-02T14:00:00Z"}), {})
+
+        self.assertEqual(response['statusCode'], 409)
+        self.mock_sqs.send_message.assert_not_called()
+
+    def test_confirmed_booking_moves_its_reminders(self):
+        self._booking(proposedStartTime='2999-09-01T10:00:00Z', proposedEndTime='2999-09-01T13:00:00Z')
+        mock_reminder_table = MagicMock()
+        batch = mock_reminder_table.batch_writer.return_value.__enter__.return_value
+        lambda_function.dynamodb.Table.side_effect = lambda name: mock_reminder_table if name == 'mock_reminder_table' else self.mock_appointments_table
+
+        with patch.object(lambda_function, 'reminder_schedule_table_name', 'mock_reminder_table'):
+            response = lambda_function.lambda_handler(self._event({"proposedStartTime": "2999-09-02T14:00:00Z"}), {})
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual([call[1]['Key']['bucket'] for call in batch.delete_item.call_args_list], ["2999-08-31T10:00Z", "2999-09-01T08:00Z"])
+        written = [call[1]['Item'] for call in batch.put_item.call_args_list]
+        self.assertEqual([item['bucket'] for item in written], ["2999-09-01T14:00Z", "2999-09-02T12:00Z"])
+        self.assertEqual(written[0]['notification']['version'], 1)
+
+    def test_invalid_requests(self):
+        self._booking()
+        self.assertEqual(lambda_function.lambda_handler(self._event({}), {})['statusCode'], 400)
+        self.assertEqual(lambda_function.lambda_handler(self._event({"proposedStartTime": "next tuesday"}), {})['statusCode'], 400)
+        self.mock_appointments_table.get_item.return_value = {}
+        self.assertEqual(lambda_function.lambda_handler(self._event({"proposedStartTime": "2024-09-02T14:00:00Z"}), {})['statusCode'], 404)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
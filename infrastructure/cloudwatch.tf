@@ -96,6 +96,28 @@ resource "aws_cloudwatch_log_group" "google_calendar_sync_lambda_logs" {
   }
 }
 
+resource "aws_cloudwatch_log_group" "reschedule_booking_lambda_logs" {
+  name              = "/aws/lambda/RescheduleBookingLambda"
+  retention_in_days = 14
+
+  tags = {
+    Name        = "RescheduleBookingLambda-LogGroup"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+  }
+}
+
+resource "aws_cloudwatch_log_group" "reminder_sweeper_lambda_logs" {
+  name              = "/aws/lambda/ReminderSweeperLambda"
+  retention_in_days = 14
+
+  tags = {
+    Name        = "ReminderSweeperLambda-LogGroup"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+  }
+}
+
 resource "aws_cloudwatch_log_group" "notification_lambda_logs" {
   name              = "/aws/lambda/NotificationLambda"
   retention_in_days = 14
@@ -107,6 +129,30 @@ resource "aws_cloudwatch_log_group" "notification_lambda_logs" {
   }
 }
 
+# --- EventBridge Schedules ---
+
+# Runs GoogleCalendarSyncLambda's inbound sync, which copies each location's Google Calendar
+# busy time (including events staff add in Google directly) into BusyIntervalsTable
+resource "aws_cloudwatch_event_rule" "google_calendar_inbound_sync_schedule" {
+  name                = "GoogleCalendarInboundSyncSchedule"
+  description         = "Triggers the GoogleCalendarSyncLambda inbound sync every 5 minutes."
+  schedule_expression = "rate(5 minutes)"
+}
+
+resource "aws_cloudwatch_event_target" "google_calendar_inbound_sync_target" {
+  rule  = aws_cloudwatch_event_rule.google_calendar_inbound_sync_schedule.name
+  arn   = aws_lambda_function.google_calendar_sync_lambda.arn
+  input = jsonencode({ action = "INBOUND_SYNC" })
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_google_calendar_inbound_sync" {
+  statement_id  = "AllowExecutionFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.google_calendar_sync_lambda.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.google_calendar_inbound_sync_schedule.arn
+}
+
 # --- CloudWatch Alarms (Placeholder Note) ---
 # IMPORTANT: Comprehensive monitoring and alerting are crucial for a production system.
 # This initial setup does not define specific CloudWatch Alarms.
@@ -150,3 +150,211 @@ resource "aws_dynamodb_table" "locations_table" {
     Project     = "ClientRegistration"
   }
 }
+
+# --- Busy Intervals Table ---
+# Busy time read from each location's Google Calendar by the inbound sync in GoogleCalendarSyncLambda.
+# GetAvailabilityLambda queries it by calendar and start time instead of calling FreeBusy per request.
+resource "aws_dynamodb_table" "busy_intervals_table" {
+  name         = "BusyIntervalsTable"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "googleCalendarId"
+  range_key    = "eventId" # Google event ID, so changed or cancelled events overwrite/delete their interval
+
+  attribute {
+    name = "googleCalendarId"
+    type = "S"
+  }
+  attribute {
+    name = "eventId"
+    type = "S"
+  }
+  attribute {
+    name = "startTime" # UTC, "YYYY-MM-DDTHH:MM:SSZ"
+    type = "S"
+  }
+
+  # Local Secondary Index for querying a calendar's busy intervals by start time.
+  local_secondary_index {
+    name            = "CalendarStartTimeIndex"
+    range_key       = "startTime"
+    projection_type = "ALL"
+  }
+
+  # Intervals expire a day after they end
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "BusyIntervalsTable"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+  }
+}
+
+# --- Google API Rate Limit Table ---
+# Optional token bucket shared by all Lambdas calling Google APIs (GOOGLE_RATE_LIMIT_TABLE_NAME),
+# one item per bucket: {bucketId, tokens, refilledAt}.
+resource "aws_dynamodb_table" "google_rate_limit_table" {
+  name         = "GoogleRateLimitTable"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "bucketId"
+
+  attribute {
+    name = "bucketId"
+    type = "S"
+  }
+
+  tags = {
+    Name        = "GoogleRateLimitTable"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+  }
+}
+
+# --- Notification Dedup Table ---
+# Notifications already sent by NotificationLambda (NOTIFICATION_DEDUP_TABLE_NAME), keyed by
+# "<bookingId>#<notificationType>#<version>" and claimed with a conditional put.
+resource "aws_dynamodb_table" "notification_dedup_table" {
+  name         = "NotificationDedupTable"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "dedupKey"
+
+  attribute {
+    name = "dedupKey"
+    type = "S"
+  }
+
+  # Claims expire after NOTIFICATION_DEDUP_TTL_SECONDS (default 7 days)
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "NotificationDedupTable"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+  }
+}
+
+# --- Reminder Schedule Table ---
+# Pending appointment reminders, partitioned by the 5-minute bucket they are due in
+# ("YYYY-MM-DDTHH:MMZ"). Written on confirm/reschedule, deleted on cancel/reschedule,
+# and read one bucket at a time by ReminderSweeperLambda.
+resource "aws_dynamodb_table" "reminder_schedule_table" {
+  name         = "ReminderScheduleTable"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "bucket"
+  range_key    = "reminderId" # "<bookingId>#<notificationType>"
+
+  attribute {
+    name = "bucket"
+    type = "S"
+  }
+  attribute {
+    name = "reminderId"
+    type = "S"
+  }
+
+  # Reminders that were never swept expire a day after they were due
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "ReminderScheduleTable"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+  }
+}
+
+# --- Staff Digest Table ---
+# Staff-facing alerts buffered by NotificationLambda (STAFF_DIGEST_TABLE_NAME): one item per
+# digest window ("YYYY-MM-DDTHH:MMZ") and location, flushed as a single summary message.
+resource "aws_dynamodb_table" "staff_digest_table" {
+  name         = "StaffDigestTable"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "window"
+  range_key    = "locationId"
+
+  attribute {
+    name = "window"
+    type = "S"
+  }
+  attribute {
+    name = "locationId"
+    type = "S"
+  }
+
+  # Digests that could not be flushed are dropped after a day
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "StaffDigestTable"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+  }
+}
+
+# --- Chat History Table ---
+# Conversation memory of LangchainAIAgentLambda (CHAT_HISTORY_TABLE_NAME): one item per message
+# ({sessionId, seq}) plus a running summary at seq 0 that older messages are compacted into.
+resource "aws_dynamodb_table" "chat_history_table" {
+  name         = "ChatHistoryTable"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "sessionId"
+  range_key    = "seq"
+
+  attribute {
+    name = "sessionId"
+    type = "S"
+  }
+  attribute {
+    name = "seq"
+    type = "N"
+  }
+
+  # Idle conversations expire (CHAT_HISTORY_TTL_DAYS, default 30)
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "ChatHistoryTable"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+  }
+}
+
+# --- Pending Messages Table ---
+# Messenger messages waiting for their agent turn, one item per sender (PENDING_MESSAGES_TABLE_NAME).
+# MessengerWebhookLambda appends each burst here and runs the agent once the sender has been quiet.
+resource "aws_dynamodb_table" "pending_messages_table" {
+  name         = "PendingMessagesTable"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "senderId"
+
+  attribute {
+    name = "senderId"
+    type = "S"
+  }
+
+  # Idle senders' items expire (PENDING_MESSAGES_TTL_SECONDS, default 1 day)
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "PendingMessagesTable"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+  }
+}
@@ -80,10 +80,83 @@ resource "aws_iam_role_policy_attachment" "lambda_logging_attachment" {
   policy_arn = aws_iam_policy.lambda_logging_policy.arn
 }
 
-# Placeholder comment for additional permissions for lambda_execution_role
-# Specific permissions for services like DynamoDB, SQS, SNS, Secrets Manager,
-# and Google Calendar API will be added/refined here as individual policies
-# or by updating the main role's inline policies once requirements are clearer.
+# --- IAM Policy for the Application Lambdas (DynamoDB, SQS, SES, SNS, Lambda) ---
+# Covers the tables, queues and services the Lambdas in lambda_placeholders.tf use.
+# Secrets Manager access for the Google credentials is still to be added.
+resource "aws_iam_policy" "lambda_execution_app_policy" {
+  name        = "lambda_execution_app_policy"
+  description = "Allows the application Lambdas to use their DynamoDB tables, SQS queues, SES, SNS and the agent Lambda."
+
+  policy = jsonencode({
+    Version   = "2012-10-17",
+    Statement = [
+      {
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem",
+          "dynamodb:UpdateItem",
+          "dynamodb:DeleteItem",
+          "dynamodb:Query",
+          "dynamodb:Scan",
+          "dynamodb:BatchGetItem",
+          "dynamodb:BatchWriteItem",
+          "dynamodb:TransactWriteItems"
+        ],
+        Effect   = "Allow",
+        Resource = flatten([
+          for table in [
+            aws_dynamodb_table.appointments_table,
+            aws_dynamodb_table.services_table,
+            aws_dynamodb_table.locations_table,
+            aws_dynamodb_table.busy_intervals_table,
+            aws_dynamodb_table.google_rate_limit_table,
+            aws_dynamodb_table.notification_dedup_table,
+            aws_dynamodb_table.reminder_schedule_table,
+            aws_dynamodb_table.staff_digest_table,
+            aws_dynamodb_table.chat_history_table,
+            aws_dynamodb_table.pending_messages_table
+          ] : [table.arn, "${table.arn}/index/*"] # Allow access to GSIs
+        ])
+      },
+      {
+        Action = [
+          "sqs:SendMessage",
+          "sqs:SendMessageBatch",
+          "sqs:ReceiveMessage",
+          "sqs:DeleteMessage",
+          "sqs:GetQueueAttributes"
+        ],
+        Effect   = "Allow",
+        Resource = [
+          aws_sqs_queue.notification_queue.arn,
+          aws_sqs_queue.google_calendar_sync_queue.arn,
+          aws_sqs_queue.messenger_inbound_queue.arn
+        ]
+      },
+      {
+        Action   = "ses:SendBulkEmail",
+        Effect   = "Allow",
+        Resource = "*" # Restrict to the sending identity and template once they are managed here
+      },
+      {
+        Action   = "sns:Publish",
+        Effect   = "Allow",
+        Resource = "*" # SMS is published to phone numbers, which have no ARN
+      },
+      {
+        Action   = "lambda:InvokeFunction",
+        Effect   = "Allow",
+        Resource = aws_lambda_function.langchain_ai_agent_lambda.arn # Invoked by MessengerWebhookLambda
+      }
+    ]
+  })
+}
+
+# --- Attach Application Policy to General Lambda Execution Role ---
+resource "aws_iam_role_policy_attachment" "lambda_execution_app_attachment" {
+  role       = aws_iam_role.lambda_execution_role.name
+  policy_arn = aws_iam_policy.lambda_execution_app_policy.arn
+}
 
 # --- IAM Role for API Gateway to Invoke Lambda Functions ---
 resource "aws_iam_role" "api_gateway_invoke_lambda_role" {
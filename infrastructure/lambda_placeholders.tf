@@ -15,6 +15,12 @@ resource "aws_lambda_function" "langchain_ai_agent_lambda" {
 
   description = "Placeholder for Langchain AI Agent Lambda. Handles AI-driven interactions."
 
+  environment {
+    variables = {
+      CHAT_HISTORY_TABLE_NAME = aws_dynamodb_table.chat_history_table.name
+    }
+  }
+
   tags = {
     Name        = "LangchainAIAgentLambda"
     Environment = "dev"
@@ -53,6 +59,13 @@ resource "aws_lambda_function" "get_availability_lambda" {
 
   description = "Placeholder for Get Availability Lambda. Retrieves available slots."
 
+  environment {
+    variables = {
+      BUSY_INTERVALS_TABLE_NAME    = aws_dynamodb_table.busy_intervals_table.name
+      GOOGLE_RATE_LIMIT_TABLE_NAME = aws_dynamodb_table.google_rate_limit_table.name
+    }
+  }
+
   tags = {
     Name        = "GetAvailabilityLambda"
     Environment = "dev"
@@ -72,6 +85,15 @@ resource "aws_lambda_function" "handle_cancellation_lambda" {
 
   description = "Placeholder for Handle Cancellation Lambda. Processes booking cancellations."
 
+  environment {
+    variables = {
+      APPOINTMENTS_TABLE_NAME      = aws_dynamodb_table.appointments_table.name
+      NOTIFICATION_SQS_URL         = aws_sqs_queue.notification_queue.url
+      GOOGLE_CALENDAR_SYNC_SQS_URL = aws_sqs_queue.google_calendar_sync_queue.url
+      REMINDER_SCHEDULE_TABLE_NAME = aws_dynamodb_table.reminder_schedule_table.name
+    }
+  }
+
   tags = {
     Name        = "HandleCancellationLambda"
     Environment = "dev"
@@ -91,6 +113,15 @@ resource "aws_lambda_function" "confirm_appointment_lambda" {
 
   description = "Placeholder for Confirm Appointment Lambda. Confirms appointments."
 
+  environment {
+    variables = {
+      APPOINTMENTS_TABLE_NAME      = aws_dynamodb_table.appointments_table.name
+      NOTIFICATION_SQS_URL         = aws_sqs_queue.notification_queue.url
+      GOOGLE_CALENDAR_SYNC_SQS_URL = aws_sqs_queue.google_calendar_sync_queue.url
+      REMINDER_SCHEDULE_TABLE_NAME = aws_dynamodb_table.reminder_schedule_table.name
+    }
+  }
+
   tags = {
     Name        = "ConfirmAppointmentLambda"
     Environment = "dev"
@@ -148,6 +179,17 @@ resource "aws_lambda_function" "google_calendar_sync_lambda" {
 
   description = "Placeholder for Google Calendar Sync Lambda. Synchronizes bookings with Google Calendar."
 
+  environment {
+    variables = {
+      APPOINTMENTS_TABLE_NAME      = aws_dynamodb_table.appointments_table.name
+      SERVICES_TABLE_NAME          = aws_dynamodb_table.services_table.name
+      LOCATIONS_TABLE_NAME         = aws_dynamodb_table.locations_table.name
+      BUSY_INTERVALS_TABLE_NAME    = aws_dynamodb_table.busy_intervals_table.name
+      GOOGLE_RATE_LIMIT_TABLE_NAME = aws_dynamodb_table.google_rate_limit_table.name
+      GOOGLE_CALENDAR_SYNC_SQS_URL = aws_sqs_queue.google_calendar_sync_queue.url
+    }
+  }
+
   tags = {
     Name        = "GoogleCalendarSyncLambda"
     Environment = "dev"
@@ -155,6 +197,89 @@ resource "aws_lambda_function" "google_calendar_sync_lambda" {
   }
 }
 
+# Consumes the calendar sync queue; only the failed messages of a batch are retried
+resource "aws_lambda_event_source_mapping" "google_calendar_sync_queue_mapping" {
+  event_source_arn        = aws_sqs_queue.google_calendar_sync_queue.arn
+  function_name           = aws_lambda_function.google_calendar_sync_lambda.arn
+  batch_size              = 10
+  function_response_types = ["ReportBatchItemFailures"]
+}
+
+# --- Placeholder for Reschedule Booking Lambda ---
+resource "aws_lambda_function" "reschedule_booking_lambda" {
+  function_name = "RescheduleBookingLambda"
+  filename      = "placeholder.zip"
+  source_code_hash = filebase64sha256("placeholder.zip")
+
+  role    = aws_iam_role.lambda_execution_role.arn
+  handler = "lambda_function.lambda_handler"
+  runtime = "python3.9"
+
+  description = "Placeholder for Reschedule Booking Lambda. Moves a booking to a new time."
+
+  environment {
+    variables = {
+      APPOINTMENTS_TABLE_NAME      = aws_dynamodb_table.appointments_table.name
+      NOTIFICATION_SQS_URL         = aws_sqs_queue.notification_queue.url
+      GOOGLE_CALENDAR_SYNC_SQS_URL = aws_sqs_queue.google_calendar_sync_queue.url
+      REMINDER_SCHEDULE_TABLE_NAME = aws_dynamodb_table.reminder_schedule_table.name
+    }
+  }
+
+  tags = {
+    Name        = "RescheduleBookingLambda"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+  }
+}
+
+# --- Placeholder for Reminder Sweeper Lambda ---
+resource "aws_lambda_function" "reminder_sweeper_lambda" {
+  function_name = "ReminderSweeperLambda"
+  filename      = "placeholder.zip"
+  source_code_hash = filebase64sha256("placeholder.zip")
+
+  role    = aws_iam_role.lambda_execution_role.arn
+  handler = "lambda_function.lambda_handler"
+  runtime = "python3.9"
+
+  description = "Placeholder for Reminder Sweeper Lambda. Sends the appointment reminders due in the current 5-minute bucket."
+
+  environment {
+    variables = {
+      APPOINTMENTS_TABLE_NAME      = aws_dynamodb_table.appointments_table.name
+      REMINDER_SCHEDULE_TABLE_NAME = aws_dynamodb_table.reminder_schedule_table.name
+      NOTIFICATION_SQS_URL         = aws_sqs_queue.notification_queue.url
+    }
+  }
+
+  tags = {
+    Name        = "ReminderSweeperLambda"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+  }
+}
+
+# Runs the sweeper once per reminder bucket
+resource "aws_cloudwatch_event_rule" "reminder_sweeper_schedule" {
+  name                = "ReminderSweeperSchedule"
+  description         = "Triggers ReminderSweeperLambda every 5 minutes."
+  schedule_expression = "rate(5 minutes)"
+}
+
+resource "aws_cloudwatch_event_target" "reminder_sweeper_target" {
+  rule = aws_cloudwatch_event_rule.reminder_sweeper_schedule.name
+  arn  = aws_lambda_function.reminder_sweeper_lambda.arn
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_reminder_sweeper" {
+  statement_id  = "AllowExecutionFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.reminder_sweeper_lambda.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.reminder_sweeper_schedule.arn
+}
+
 # --- Placeholder for Notification Lambda ---
 resource "aws_lambda_function" "notification_lambda" {
   function_name = "NotificationLambda"
@@ -167,6 +292,14 @@ resource "aws_lambda_function" "notification_lambda" {
 
   description = "Placeholder for Notification Lambda. Sends notifications (email, SMS) to clients."
 
+  environment {
+    variables = {
+      APPOINTMENTS_TABLE_NAME       = aws_dynamodb_table.appointments_table.name
+      NOTIFICATION_DEDUP_TABLE_NAME = aws_dynamodb_table.notification_dedup_table.name
+      STAFF_DIGEST_TABLE_NAME       = aws_dynamodb_table.staff_digest_table.name
+    }
+  }
+
   tags = {
     Name        = "NotificationLambda"
     Environment = "dev"
@@ -174,9 +307,78 @@ resource "aws_lambda_function" "notification_lambda" {
   }
 }
 
+# Consumes the notification queue; only the failed messages of a batch are retried
+resource "aws_lambda_event_source_mapping" "notification_queue_mapping" {
+  event_source_arn        = aws_sqs_queue.notification_queue.arn
+  function_name           = aws_lambda_function.notification_lambda.arn
+  batch_size              = 10
+  function_response_types = ["ReportBatchItemFailures"]
+}
+
+# Flushes NotificationLambda's staff digests once per digest window
+resource "aws_cloudwatch_event_rule" "staff_digest_flush_schedule" {
+  name                = "StaffDigestFlushSchedule"
+  description         = "Triggers NotificationLambda to flush closed staff digest windows every 5 minutes."
+  schedule_expression = "rate(5 minutes)"
+}
+
+resource "aws_cloudwatch_event_target" "staff_digest_flush_target" {
+  rule  = aws_cloudwatch_event_rule.staff_digest_flush_schedule.name
+  arn   = aws_lambda_function.notification_lambda.arn
+  input = jsonencode({ action = "FLUSH_STAFF_DIGESTS" })
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_staff_digest_flush" {
+  statement_id  = "AllowExecutionFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.notification_lambda.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.staff_digest_flush_schedule.arn
+}
+
+# --- Placeholder for Messenger Webhook Lambda ---
+resource "aws_lambda_function" "messenger_webhook_lambda" {
+  function_name = "MessengerWebhookLambda"
+  filename      = "placeholder.zip"
+  source_code_hash = filebase64sha256("placeholder.zip")
+
+  role    = aws_iam_role.lambda_execution_role.arn
+  handler = "lambda_function.lambda_handler"
+  runtime = "python3.9"
+  timeout = 900
+
+  description = "Placeholder for Messenger Webhook Lambda. Queues incoming Messenger messages and runs the agent for them."
+
+  environment {
+    variables = {
+      INBOUND_QUEUE_URL           = aws_sqs_queue.messenger_inbound_queue.url
+      LANGCHAIN_LAMBDA_NAME       = aws_lambda_function.langchain_ai_agent_lambda.function_name
+      PENDING_MESSAGES_TABLE_NAME = aws_dynamodb_table.pending_messages_table.name
+    }
+  }
+
+  tags = {
+    Name        = "MessengerWebhookLambda"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+  }
+}
+
+# Consumes the inbound queue; only a failed sender's remaining messages are retried.
+# One sender's turns run one after another, so batch_size x the 120s agent timeout must stay under
+# the 900s Lambda timeout; the handler also stops starting turns when time runs low.
+resource "aws_lambda_event_source_mapping" "messenger_inbound_queue_mapping" {
+  event_source_arn        = aws_sqs_queue.messenger_inbound_queue.arn
+  function_name           = aws_lambda_function.messenger_webhook_lambda.arn
+  batch_size              = 7
+  function_response_types = ["ReportBatchItemFailures"]
+}
+
 # Note: The `aws_iam_role.lambda_execution_role.arn` is referenced from 'iam.tf'.
 # Ensure 'iam.tf' is applied first or that this ARN is correctly resolvable.
 # The 'placeholder.zip' file needs to exist at the root of your Terraform project
 # or in a location accessible by Terraform during planning/applying.
+# `python -m backend.package_lambdas` builds the real packages (build/<lambda_dir>.zip), with the
+# backend/common modules each Lambda imports copied next to its lambda_function.py.
 # You can create a dummy zip file: `echo "placeholder" > placeholder.txt; zip placeholder.zip placeholder.txt`
 # This helps in validating the Terraform configuration before actual code is ready.
@@ -0,0 +1,11 @@
+# Terraform configuration for Amazon SES
+
+# --- Notification Passthrough Template ---
+# NotificationLambda renders subjects and bodies itself (templates/<channel>/<locale>.json) and sends
+# email with SES SendBulkEmail, which only accepts stored templates. This template passes the
+# rendered text through unchanged; triple braces keep SES from HTML-escaping the body.
+resource "aws_ses_template" "notification_passthrough" {
+  name    = "NotificationPassthrough"
+  subject = "{{subject}}"
+  text    = "{{{body}}}"
+}
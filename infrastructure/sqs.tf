@@ -75,3 +75,72 @@ resource "aws_sqs_queue" "notification_dlq" {
     Type        = "Standard-DLQ"
   }
 }
+
+# --- Google Calendar Sync Queue (Standard) ---
+# CREATE_EVENT, UPDATE_EVENT and DELETE_EVENT messages for GoogleCalendarSyncLambda, sent by the
+# booking Lambdas and by reconciliation. The Lambda writes each batch as Google batch requests.
+resource "aws_sqs_queue" "google_calendar_sync_queue" {
+  name                       = "GoogleCalendarSyncQueue"
+  visibility_timeout_seconds = 180 # Covers a batch of calendar writes, including rate-limit backoff
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.google_calendar_sync_dlq.arn
+    maxReceiveCount     = 5
+  })
+
+  tags = {
+    Name        = "GoogleCalendarSyncQueue"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+    Type        = "Standard"
+  }
+}
+
+# --- Google Calendar Sync Dead Letter Queue (Standard) ---
+resource "aws_sqs_queue" "google_calendar_sync_dlq" {
+  name = "GoogleCalendarSyncDLQ"
+
+  tags = {
+    Name        = "GoogleCalendarSyncDLQ"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+    Type        = "Standard-DLQ"
+  }
+}
+
+# --- Messenger Inbound Queue (FIFO) ---
+# Messages received by the Messenger webhook, one message group per sender. The webhook returns
+# as soon as they are queued; MessengerWebhookLambda consumes the queue and runs the agent, so a
+# sender's messages are answered in order while different senders are served in parallel.
+resource "aws_sqs_queue" "messenger_inbound_queue" {
+  name                        = "MessengerInboundQueue.fifo"
+  fifo_queue                  = true
+  deduplication_scope         = "messageGroup"
+  fifo_throughput_limit       = "perMessageGroupId" # High-throughput FIFO: the limit applies per sender
+  visibility_timeout_seconds  = 900                 # Covers a batch of agent turns, each up to AGENT_INVOKE_TIMEOUT_SECONDS
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.messenger_inbound_dlq.arn
+    maxReceiveCount     = 3
+  })
+
+  tags = {
+    Name        = "MessengerInboundQueue"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+    Type        = "FIFO"
+  }
+}
+
+# --- Messenger Inbound Dead Letter Queue (FIFO) ---
+resource "aws_sqs_queue" "messenger_inbound_dlq" {
+  name       = "MessengerInboundDLQ.fifo"
+  fifo_queue = true
+
+  tags = {
+    Name        = "MessengerInboundDLQ"
+    Environment = "dev"
+    Project     = "ClientRegistration"
+    Type        = "FIFO-DLQ"
+  }
+}